@@ -0,0 +1,78 @@
+"""
+Measures the latency of FractionAllocMap allocations with the EVENLY strategy
+over various device counts and fragmentation states of the devices.
+
+Usage: python scripts/benchmarks/bench_fraction_alloc_map.py [--rounds 200] [--seed 0]
+"""
+
+from decimal import Decimal
+import random
+import timeit
+
+import click
+
+from ai.backend.common.types import DeviceId, SlotName, SlotTypes
+from ai.backend.agent.exception import InsufficientResource
+from ai.backend.agent.resources import (
+    AllocationStrategy,
+    DeviceSlotInfo,
+    FractionAllocMap,
+)
+
+slot_name = SlotName('cuda.shares')
+quantum = Decimal('0.01')
+
+
+def create_alloc_map(num_devices: int, fragmentation: str, rng: random.Random) -> FractionAllocMap:
+    alloc_map = FractionAllocMap(
+        device_slots={
+            DeviceId(f'cuda{idx}'): DeviceSlotInfo(SlotTypes.COUNT, slot_name, Decimal(1))
+            for idx in range(num_devices)
+        },
+        allocation_strategy=AllocationStrategy.EVENLY,
+        quantum_size=quantum,
+    )
+    for dev_id in alloc_map.device_slots:
+        if fragmentation == 'empty':
+            used = Decimal(0)
+        elif fragmentation == 'partial':
+            used = Decimal(rng.randint(0, 50)) * quantum
+        elif fragmentation == 'fragmented':
+            used = Decimal(rng.randint(40, 97)) * quantum
+        else:
+            raise ValueError(fragmentation)
+        alloc_map.allocations[slot_name][dev_id] = used
+    return alloc_map
+
+
+@click.command()
+@click.option('--rounds', type=int, default=200)
+@click.option('--seed', type=int, default=0)
+def main(rounds, seed):
+    print(f'{"devices":>8} {"state":>11} {"request":>8} {"usec/alloc":>11}')
+    for num_devices in (2, 4, 8, 16, 32, 64):
+        for fragmentation in ('empty', 'partial', 'fragmented'):
+            rng = random.Random(seed)
+            alloc_map = create_alloc_map(num_devices, fragmentation, rng)
+            total_free = sum(
+                alloc_map.device_slots[dev_id].amount - used
+                for dev_id, used in alloc_map.allocations[slot_name].items()
+            )
+            # a request spanning about a half of the free amount
+            request = max(quantum, (total_free / 2).quantize(quantum))
+            snapshot = dict(alloc_map.allocations[slot_name])
+
+            def run():
+                try:
+                    alloc_map.allocate({slot_name: request})
+                except InsufficientResource:
+                    pass
+                alloc_map.allocations[slot_name].update(snapshot)
+
+            elapsed = timeit.timeit(run, number=rounds)
+            print(f'{num_devices:>8} {fragmentation:>11} {request:>8} '
+                  f'{elapsed / rounds * 1e6:>11.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""
+Measures the time to build the kernel runner mounts of many kernels in
+``mount_krunner()`` with the memoized mount plans and with the plans resolved
+again for every kernel as before (scanning the runner artifacts and
+resolving the package resources of each file).
+
+Usage: python scripts/benchmarks/bench_mount_krunner.py [--kernels 200] [--rounds 5]
+"""
+
+import asyncio
+from pathlib import Path
+import tempfile
+import time
+from unittest.mock import MagicMock
+
+import click
+
+from ai.backend.common.types import ResourceSlot
+from ai.backend.agent.agent import krunner_mount_plan_cache
+from ai.backend.agent.docker.agent import DockerKernelCreationContext
+from ai.backend.agent.resources import KernelResourceSpec
+
+
+def create_context(local_config, idx: int, distro: str) -> DockerKernelCreationContext:
+    return DockerKernelCreationContext(
+        f'kernel-{idx}',  # type: ignore
+        {
+            'image': {
+                'canonical': 'index.docker.io/lablup/python:3.8',
+                'registry': {'name': 'index.docker.io'},
+                'labels': {'ai.backend.base-distro': distro},
+            },
+            'internal_data': None,
+        },  # type: ignore
+        local_config,
+        {},
+        set(),
+        Path('/tmp/agent.sock'),
+        asyncio.Lock(),
+        MagicMock(),
+    )
+
+
+async def mount_all(ctxs, uncached: bool) -> float:
+    started = time.perf_counter()
+    for ctx in ctxs:
+        if uncached:
+            krunner_mount_plan_cache.clear()
+        resource_spec = KernelResourceSpec(
+            container_id='',
+            slots=ResourceSlot(),
+            allocations={},
+            scratch_disk_size=0,
+            mounts=[],
+        )
+        await ctx.mount_krunner(resource_spec, {})
+    return time.perf_counter() - started
+
+
+@click.command()
+@click.option('--kernels', 'num_kernels', type=int, default=200)
+@click.option('--rounds', type=int, default=5)
+def main(num_kernels, rounds):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        local_config = {
+            'container': {
+                'scratch-root': Path(tmpdir),
+                'sandbox-type': 'docker',
+                'krunner-volumes': {
+                    'alpine3.8': 'backendai-krunner.v1.alpine3.8',
+                    'static-gnu': 'backendai-krunner.v2.static-gnu',
+                },
+            },
+        }
+        distros = ['ubuntu20.04', 'alpine3.8', 'centos8.0']
+        ctxs = [
+            create_context(local_config, idx, distros[idx % len(distros)])
+            for idx in range(num_kernels)
+        ]
+        DockerKernelCreationContext.prepare_krunner_mount_plans(local_config)
+
+        print(f'{"case":>10} {"msec/mount-all":>15} {"usec/kernel":>12}')
+        for name, uncached in [('uncached', True), ('cached', False)]:
+            elapsed = min(
+                asyncio.run(mount_all(ctxs, uncached))
+                for _ in range(rounds)
+            )
+            print(f'{name:>10} {elapsed * 1e3:>15.2f} {elapsed / num_kernels * 1e6:>12.1f}')
+
+
+if __name__ == '__main__':
+    main()
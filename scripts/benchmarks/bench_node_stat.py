@@ -0,0 +1,87 @@
+"""
+Compares the node-level CPU/memory/network sampling via psutil
+with the procfs snapshot reader used by the intrinsic compute plugins.
+
+With ``--cores``, both read a synthetic ``/proc/stat`` to emulate a host with many cores.
+
+Usage: python scripts/benchmarks/bench_node_stat.py [--cores 256] [--rounds 2000]
+"""
+
+from decimal import Decimal
+from pathlib import Path
+import shutil
+import tempfile
+import timeit
+
+import click
+import psutil
+
+from ai.backend.agent.docker.procfs import ProcSnapshot
+
+
+def sample_psutil():
+    _cstat = psutil.cpu_times(True)
+    q = Decimal('0.000')
+    per_core = {
+        str(idx): (Decimal(c.user + c.system) * 1000).quantize(q)
+        for idx, c in enumerate(_cstat)
+    }
+    sum(per_core.values(), Decimal(0))
+    _mstat = psutil.virtual_memory()
+    Decimal(_mstat.total - _mstat.available)
+    _nstat = psutil.net_io_counters()
+    Decimal(_nstat.bytes_recv)
+    Decimal(_nstat.bytes_sent)
+
+
+def sample_procfs(snapshot: ProcSnapshot):
+    snapshot.read()
+    per_core = {
+        str(cpu_id): cpu_used
+        for cpu_id, cpu_used in snapshot.iter_cpu_used()
+    }
+    snapshot.total_cpu_used
+    snapshot.mem_total - snapshot.mem_available
+    per_core
+
+
+def create_fake_procfs(root: Path, num_cores: int) -> None:
+    (root / 'net').mkdir()
+    with open('/proc/stat') as f:
+        real_stat = f.read().splitlines()
+    lines = ['cpu  1000 0 100 10000 0 0 0 0 0 0']
+    lines.extend(
+        f'cpu{idx} {123456 + idx} 0 {2345 + idx} 987654 12 0 3 0 0 0'
+        for idx in range(num_cores)
+    )
+    lines.extend(line for line in real_stat if not line.startswith('cpu'))
+    (root / 'stat').write_text('\n'.join(lines) + '\n')
+    shutil.copy('/proc/meminfo', root / 'meminfo')
+    shutil.copy('/proc/net/dev', root / 'net' / 'dev')
+
+
+@click.command()
+@click.option('--cores', type=int, default=None,
+              help='The number of cores to emulate.')
+@click.option('--rounds', type=int, default=2000)
+def main(cores, rounds):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        if cores is not None:
+            create_fake_procfs(Path(tmpdir), cores)
+            psutil.PROCFS_PATH = tmpdir
+            snapshot = ProcSnapshot(Path(tmpdir))
+        else:
+            snapshot = ProcSnapshot()
+        try:
+            sample_procfs(snapshot)
+            t_procfs = timeit.timeit(lambda: sample_procfs(snapshot), number=rounds)
+            t_psutil = timeit.timeit(sample_psutil, number=rounds)
+        finally:
+            snapshot.close()
+    print(f'{snapshot.num_cpus} cores, {rounds} rounds')
+    print(f'psutil: {t_psutil / rounds * 1e6:10.1f} us/sample')
+    print(f'procfs: {t_procfs / rounds * 1e6:10.1f} us/sample')
+
+
+if __name__ == '__main__':
+    main()
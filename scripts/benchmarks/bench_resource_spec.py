@@ -0,0 +1,96 @@
+"""
+Measures the time to restore the resource specs of many kernels from their
+config directories, as the agent does when it restarts, using the text format
+(resource.txt) and the binary format (resource.msgpack).
+
+Usage: python scripts/benchmarks/bench_resource_spec.py [--kernels 500] [--mounts 2] [--rounds 5]
+"""
+
+from decimal import Decimal
+from pathlib import Path
+import tempfile
+import timeit
+
+import click
+
+from ai.backend.common.types import (
+    DeviceId,
+    DeviceName,
+    MountPermission,
+    MountTypes,
+    ResourceSlot,
+    SlotName,
+)
+from ai.backend.agent.resources import (
+    KernelResourceSpec,
+    Mount,
+    read_resource_spec,
+    resource_spec_binary_filename,
+)
+
+
+def create_resource_spec(idx: int, num_mounts: int) -> KernelResourceSpec:
+    return KernelResourceSpec(
+        container_id=f'{idx:064x}',
+        slots=ResourceSlot({'cpu': '4', 'mem': '17179869184', 'cuda.shares': '1.5'}),
+        allocations={
+            DeviceName('cpu'): {
+                SlotName('cpu'): {DeviceId(str(cpu)): Decimal(1) for cpu in range(4)},
+            },
+            DeviceName('mem'): {
+                SlotName('mem'): {DeviceId('root'): Decimal(17179869184)},
+            },
+            DeviceName('cuda'): {
+                SlotName('cuda.shares'): {DeviceId('0'): Decimal('1.0'), DeviceId('1'): Decimal('0.5')},
+            },
+        },
+        scratch_disk_size=0,
+        mounts=[
+            Mount(
+                MountTypes.BIND,
+                Path(f'/vfroot/local/vfolder-{idx}-{m}'),
+                Path(f'/home/work/vfolder-{m}'),
+                MountPermission.READ_WRITE,
+            )
+            for m in range(num_mounts)
+        ],
+    )
+
+
+def read_text_spec(config_dir: Path) -> KernelResourceSpec:
+    with open(config_dir / 'resource.txt', 'r') as f:
+        return KernelResourceSpec.read_from_file(f)
+
+
+@click.command()
+@click.option('--kernels', 'num_kernels', type=int, default=500)
+@click.option('--mounts', 'num_mounts', type=int, default=2)
+@click.option('--rounds', type=int, default=5)
+def main(num_kernels, num_mounts, rounds):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        config_dirs = []
+        for idx in range(num_kernels):
+            config_dir = Path(tmpdir) / f'kernel-{idx}' / 'config'
+            config_dir.mkdir(parents=True)
+            spec = create_resource_spec(idx, num_mounts)
+            (config_dir / 'resource.txt').write_text(spec.write_to_string())
+            (config_dir / resource_spec_binary_filename).write_bytes(spec.write_to_bytes())
+            config_dirs.append(config_dir)
+        text_data = [(d / 'resource.txt').read_text() for d in config_dirs]
+        binary_data = [(d / resource_spec_binary_filename).read_bytes() for d in config_dirs]
+
+        cases = [
+            ('parse text', lambda: [KernelResourceSpec.read_from_string(t) for t in text_data]),
+            ('parse binary', lambda: [KernelResourceSpec.read_from_bytes(b) for b in binary_data]),
+            ('restore text', lambda: [read_text_spec(d) for d in config_dirs]),
+            ('restore binary', lambda: [read_resource_spec(d) for d in config_dirs]),
+        ]
+        print(f'{"case":>15} {"msec/restore-all":>17} {"usec/kernel":>12}')
+        for name, func in cases:
+            elapsed = min(timeit.repeat(func, number=1, repeat=rounds))
+            print(f'{name:>15} {elapsed * 1e3:>17.2f} {elapsed / num_kernels * 1e6:>12.1f}')
+        print(f'size per kernel: text {len(text_data[0])} bytes, binary {len(binary_data[0])} bytes')
+
+
+if __name__ == '__main__':
+    main()
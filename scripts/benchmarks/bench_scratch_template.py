@@ -0,0 +1,66 @@
+"""
+Measures the time to populate the work directories of new kernels with the runner
+dotfiles by resolving and copying each file as before and by instantiating
+the prebuilt scratch template.
+
+Usage: python scripts/benchmarks/bench_scratch_template.py [--kernels 200] [--rounds 5] [--root DIR]
+"""
+
+import os
+from pathlib import Path
+import pkg_resources
+import shutil
+import tempfile
+import time
+
+import click
+
+from ai.backend.agent.docker.scratch_template import ScratchTemplate, template_files
+
+
+def clone_dotfiles(work_dir: Path) -> None:
+    # the per-kernel copies used before the scratch template
+    (work_dir / '.jupyter' / 'custom').mkdir(parents=True, exist_ok=True)
+    for name, rel_path in template_files:
+        src_path = Path(pkg_resources.resource_filename('ai.backend.runner', name))
+        shutil.copy(src_path.resolve(), work_dir / rel_path)
+    os.chown(work_dir, os.getuid(), os.getgid())
+    for rel_path in ['.jupyter', '.jupyter/custom', *(p for _, p in template_files)]:
+        os.chown(work_dir / rel_path, os.getuid(), os.getgid())
+
+
+@click.command()
+@click.option('--kernels', 'num_kernels', type=int, default=200)
+@click.option('--rounds', type=int, default=5)
+@click.option('--root', type=click.Path(file_okay=False), default=None,
+              help='The directory to create the scratch directories in (default: a temporary directory)')
+def main(num_kernels, rounds, root):
+    with tempfile.TemporaryDirectory(dir=root) as tmpdir:
+        scratch_root = Path(tmpdir)
+        template = ScratchTemplate(scratch_root / '.template')
+        template.build()
+        owner = (os.getuid(), os.getgid())
+        cases = [
+            ('copy', clone_dotfiles),
+            ('template', lambda work_dir: template.instantiate(work_dir, owner)),
+        ]
+        print(f'{"case":>10} {"msec/populate-all":>18} {"usec/kernel":>12}')
+        for name, func in cases:
+            elapsed = None
+            for r in range(rounds):
+                work_dirs = [scratch_root / f'{name}-{r}-{idx}' / 'work' for idx in range(num_kernels)]
+                for work_dir in work_dirs:
+                    work_dir.mkdir(parents=True)
+                started = time.perf_counter()
+                for work_dir in work_dirs:
+                    func(work_dir)
+                t = time.perf_counter() - started
+                elapsed = t if elapsed is None else min(elapsed, t)
+                for work_dir in work_dirs:
+                    shutil.rmtree(work_dir.parent)
+            print(f'{name:>10} {elapsed * 1e3:>18.2f} {elapsed / num_kernels * 1e6:>12.1f}')
+        print('clone methods:', {dev: m.value for dev, m in template.clone_methods.items()})
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,280 @@
+"""
+Replays synthetic or recorded allocate/free traces against the alloc maps
+to compare the allocation strategies under churn.
+
+A synthetic trace has Poisson arrivals and lognormal lifetimes with the request
+sizes drawn from a weighted mix (e.g., fractional GPU shares).
+A trace is stored as JSON lines of the following events ordered by time:
+
+    {"time": 0.52, "op": "alloc", "id": 0, "amount": "0.25"}
+    {"time": 7.31, "op": "free", "id": 0}
+
+For each strategy, the same trace is replayed and the followings are reported:
+
+* ops/s: the number of allocate/free calls processed per second of wall-clock time
+* p50/p99: the latency of allocate calls in microseconds
+* reject: the ratio of rejected allocations
+* frag: the ratio of allocations rejected although the total free amount was enough
+* util: the average utilization of all devices sampled upon each arrival
+* evenness: the average Jain's fairness index of the per-device usage sampled
+  upon each arrival (1.0 means that all devices are equally used)
+
+Usage: python scripts/benchmarks/simulate_alloc_map.py [--map fraction|discrete] [--devices 8]
+           [--arrival-rate 2.0] [--lifetime-mu 1.5] [--lifetime-sigma 1.0] [--duration 3600]
+           [--sizes 0.1:4,0.25:3,0.5:3,1:2,2:1] [--strategy evenly ...] [--seed 0]
+           [--record trace.jsonl | --trace trace.jsonl]
+"""
+
+from decimal import Decimal
+import json
+import random
+import statistics
+import time
+from typing import (
+    Any,
+    Dict,
+    Iterator,
+    List,
+    Mapping,
+    Sequence,
+    Tuple,
+)
+
+import click
+
+from ai.backend.common.types import DeviceId, SlotName, SlotTypes
+from ai.backend.agent.exception import InsufficientResource, ResourceError
+from ai.backend.agent.resources import (
+    AbstractAllocMap,
+    AllocationStrategy,
+    DeviceSlotInfo,
+    DeviceTopology,
+    DiscretePropertyAllocMap,
+    FractionAllocMap,
+)
+
+default_sizes = {
+    'fraction': '0.1:4,0.25:3,0.5:3,1:2,2:1',
+    'discrete': '1:4,2:2,4:1',
+}
+supported_strategies = {
+    'fraction': ('fill', 'evenly'),
+    'discrete': ('fill', 'evenly', 'topology'),
+}
+
+
+def parse_sizes(value: str) -> List[Tuple[Decimal, float]]:
+    sizes = []
+    for item in value.split(','):
+        amount, _, weight = item.partition(':')
+        sizes.append((Decimal(amount), float(weight or 1)))
+    return sizes
+
+
+def generate_trace(
+    rng: random.Random,
+    duration: float,
+    arrival_rate: float,
+    lifetime_mu: float,
+    lifetime_sigma: float,
+    sizes: Sequence[Tuple[Decimal, float]],
+) -> List[Dict[str, Any]]:
+    amounts = [amount for amount, _ in sizes]
+    weights = [weight for _, weight in sizes]
+    events = []
+    now = 0.0
+    alloc_id = 0
+    while True:
+        now += rng.expovariate(arrival_rate)
+        if now >= duration:
+            break
+        amount = rng.choices(amounts, weights)[0]
+        lifetime = rng.lognormvariate(lifetime_mu, lifetime_sigma)
+        events.append({'time': now, 'op': 'alloc', 'id': alloc_id, 'amount': str(amount)})
+        events.append({'time': now + lifetime, 'op': 'free', 'id': alloc_id})
+        alloc_id += 1
+    return events
+
+
+def read_trace(path: str) -> Iterator[Dict[str, Any]]:
+    with open(path, 'r') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def create_alloc_map(
+    kind: str,
+    strategy: AllocationStrategy,
+    num_devices: int,
+    num_numa_nodes: int,
+) -> Tuple[AbstractAllocMap, SlotName]:
+    device_ids = [DeviceId(str(idx)) for idx in range(num_devices)]
+    alloc_map: AbstractAllocMap
+    if kind == 'fraction':
+        slot_name = SlotName('cuda.shares')
+        alloc_map = FractionAllocMap(
+            device_slots={
+                dev_id: DeviceSlotInfo(SlotTypes.COUNT, slot_name, Decimal(1))
+                for dev_id in device_ids
+            },
+            allocation_strategy=strategy,
+            quantum_size=Decimal('0.01'),
+        )
+    elif kind == 'discrete':
+        slot_name = SlotName('cuda.device')
+        alloc_map = DiscretePropertyAllocMap(
+            device_slots={
+                dev_id: DeviceSlotInfo(SlotTypes.COUNT, slot_name, Decimal(1))
+                for dev_id in device_ids
+            },
+            allocation_strategy=strategy,
+            device_topology={
+                dev_id: DeviceTopology(
+                    numa_node=idx * num_numa_nodes // num_devices,
+                    cache_domain=idx * num_numa_nodes // num_devices,
+                    core=idx,
+                )
+                for idx, dev_id in enumerate(device_ids)
+            },
+        )
+    else:
+        raise ValueError(kind)
+    return alloc_map, slot_name
+
+
+def jain_index(values: Sequence[Decimal]) -> float:
+    total = sum(values)
+    square_sum = sum(v * v for v in values)
+    if square_sum == 0:
+        return 1.0
+    return float(total * total / (len(values) * square_sum))
+
+
+def percentile(sorted_values: Sequence[float], ratio: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * ratio))]
+
+
+def replay(
+    alloc_map: AbstractAllocMap,
+    slot_name: SlotName,
+    events: Sequence[Mapping[str, Any]],
+) -> Mapping[str, float]:
+    slot_allocs = alloc_map.allocations[slot_name]
+    capacity = sum(info.amount for info in alloc_map.device_slots.values())
+    active: Dict[Any, Mapping[SlotName, Mapping[DeviceId, Decimal]]] = {}
+    latencies: List[float] = []
+    elapsed = 0.0
+    num_ops = 0
+    num_rejected = 0
+    num_fragmented = 0
+    utilizations: List[float] = []
+    evenness_scores: List[float] = []
+    for ev in events:
+        if ev['op'] == 'alloc':
+            used = list(slot_allocs.values())
+            utilizations.append(float(sum(used) / capacity))
+            evenness_scores.append(jain_index(used))
+            amount = Decimal(ev['amount'])
+            begin = time.perf_counter()
+            try:
+                result = alloc_map.allocate({slot_name: amount})
+            except ResourceError as e:
+                latency = time.perf_counter() - begin
+                num_rejected += 1
+                if isinstance(e, InsufficientResource) and capacity - sum(used) >= amount:
+                    num_fragmented += 1
+            else:
+                latency = time.perf_counter() - begin
+                active[ev['id']] = result
+            latencies.append(latency)
+            elapsed += latency
+        elif ev['op'] == 'free':
+            result = active.pop(ev['id'], None)
+            if result is None:
+                # the allocation was rejected
+                continue
+            begin = time.perf_counter()
+            alloc_map.free(result)
+            elapsed += time.perf_counter() - begin
+        else:
+            raise ValueError(f"unknown trace op: {ev['op']}")
+        num_ops += 1
+    latencies.sort()
+    num_allocs = len(latencies)
+    return {
+        'allocs': num_allocs,
+        'ops_per_sec': num_ops / elapsed if elapsed > 0 else 0.0,
+        'p50': percentile(latencies, 0.5) * 1e6,
+        'p99': percentile(latencies, 0.99) * 1e6,
+        'reject': num_rejected / num_allocs if num_allocs else 0.0,
+        'frag': num_fragmented / num_allocs if num_allocs else 0.0,
+        'util': statistics.fmean(utilizations) if utilizations else 0.0,
+        'evenness': statistics.fmean(evenness_scores) if evenness_scores else 1.0,
+    }
+
+
+@click.command()
+@click.option('--map', 'kind', type=click.Choice(['fraction', 'discrete']), default='fraction',
+              help='The type of alloc map to simulate.')
+@click.option('--devices', 'num_devices', type=int, default=8,
+              help='The number of devices.')
+@click.option('--numa-nodes', 'num_numa_nodes', type=int, default=2,
+              help='The number of NUMA nodes the devices are spread over (for the topology strategy).')
+@click.option('--arrival-rate', type=float, default=2.0,
+              help='The average number of allocation requests per second.')
+@click.option('--lifetime-mu', type=float, default=1.5,
+              help='The mu parameter of the lognormal lifetime distribution in seconds.')
+@click.option('--lifetime-sigma', type=float, default=1.0,
+              help='The sigma parameter of the lognormal lifetime distribution.')
+@click.option('--duration', type=float, default=3600.0,
+              help='The simulated duration in seconds.')
+@click.option('--sizes', type=str, default=None,
+              help='The requested amounts and their weights as "amount:weight,...".')
+@click.option('--strategy', 'strategies', type=click.Choice(['fill', 'evenly', 'topology']),
+              multiple=True, help='The strategies to compare (default: all supported ones).')
+@click.option('--seed', type=int, default=0)
+@click.option('--record', type=click.Path(dir_okay=False, writable=True), default=None,
+              help='Write the generated synthetic trace to the given path.')
+@click.option('--trace', type=click.Path(exists=True, dir_okay=False), default=None,
+              help='Replay the recorded trace instead of generating a synthetic one.')
+def main(
+    kind, num_devices, num_numa_nodes,
+    arrival_rate, lifetime_mu, lifetime_sigma, duration, sizes,
+    strategies, seed, record, trace,
+):
+    if trace is not None:
+        events = list(read_trace(trace))
+    else:
+        rng = random.Random(seed)
+        events = generate_trace(
+            rng, duration, arrival_rate, lifetime_mu, lifetime_sigma,
+            parse_sizes(sizes or default_sizes[kind]),
+        )
+        if record is not None:
+            with open(record, 'w') as f:
+                for ev in events:
+                    f.write(json.dumps(ev) + '\n')
+    # replay the events in the order of time
+    events.sort(key=lambda ev: (ev['time'], ev['op'] == 'free'))
+    if not strategies:
+        strategies = supported_strategies[kind]
+    print(f'{"strategy":>9} {"allocs":>7} {"ops/s":>9} {"p50(us)":>8} {"p99(us)":>8} '
+          f'{"reject":>7} {"frag":>7} {"util":>6} {"evenness":>8}')
+    for strategy_name in strategies:
+        if strategy_name not in supported_strategies[kind]:
+            print(f'{strategy_name:>9} (not supported by the {kind} alloc map)')
+            continue
+        strategy = AllocationStrategy[strategy_name.upper()]
+        alloc_map, slot_name = create_alloc_map(kind, strategy, num_devices, num_numa_nodes)
+        stats = replay(alloc_map, slot_name, events)
+        print(f'{strategy_name:>9} {stats["allocs"]:>7} {stats["ops_per_sec"]:>9.0f} '
+              f'{stats["p50"]:>8.1f} {stats["p99"]:>8.1f} '
+              f'{stats["reject"]:>7.2%} {stats["frag"]:>7.2%} '
+              f'{stats["util"]:>6.1%} {stats["evenness"]:>8.3f}')
+
+
+if __name__ == '__main__':
+    main()
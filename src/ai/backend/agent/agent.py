@@ -4,6 +4,7 @@ from abc import ABCMeta, abstractmethod
 import asyncio
 from collections import defaultdict
 from decimal import Decimal
+from functools import partial
 from io import BytesIO, SEEK_END
 import json
 import logging
@@ -60,7 +61,10 @@ from ai.backend.common.types import (
     AutoPullBehavior,
     ContainerId,
     KernelId,
+    MetricKey,
     SessionId,
+    DeviceId,
+    DeviceModelInfo,
     DeviceName,
     SlotName,
     HardwareMetadata,
@@ -103,7 +107,8 @@ from ai.backend.common.plugin.monitor import ErrorPluginContext, StatsPluginCont
 from ai.backend.common.service_ports import parse_service_ports
 from . import __version__ as VERSION
 from .defs import ipc_base_path
-from .exception import ResourceError
+from .exception import ResourceError, UnsupportedBaseDistroError
+from .exporter import MetricExporter
 from .kernel import (
     AbstractKernel,
     KernelFeatures,
@@ -114,9 +119,13 @@ from .resources import (
     AbstractComputeDevice,
     AbstractComputePlugin,
     AbstractAllocMap,
+    DiscretePropertyAllocMap,
     KernelResourceSpec,
     Mount,
+    get_requested_slots,
 )
+from .scheduler import PeriodicTask
+from .stages import StageGraph
 from .stats import (
     StatContext, StatModes,
 )
@@ -153,6 +162,53 @@ DEAD_STATUS_SET = frozenset([
 
 KernelObjectType = TypeVar('KernelObjectType', bound=AbstractKernel)
 
+# The resolved krunner mount plans per backend, base distro, and sandbox type
+krunner_mount_plan_cache: LRUCache = LRUCache(maxsize=64)
+
+
+@attr.s(auto_attribs=True, slots=True, frozen=True)
+class KrunnerMount:
+    type: MountTypes
+    source: Union[str, Path]
+    target: str
+
+
+@attr.s(auto_attribs=True, slots=True, frozen=True)
+class KrunnerMountPlan:
+    arch: str
+    mounts: Sequence[KrunnerMount]
+
+
+def resolve_krunner_info(
+    local_config: Mapping[str, Any],
+    distro: str,
+) -> Tuple[str, str, str, str, str]:
+    """
+    Return the CPU architecture, the matched krunner distro, the libc style,
+    the krunner volume name, and the krunner Python version for the given base distro.
+    """
+    matched_distro, krunner_volume = match_distro_data(
+        local_config['container']['krunner-volumes'], distro)
+    matched_libc_style = 'glibc'
+    if distro.startswith('alpine'):
+        matched_libc_style = 'musl'
+    krunner_pyver = '3.6'  # fallback
+    if m := re.search(r'^([a-z-]+)(\d+(\.\d+)*)?$', matched_distro):
+        matched_distro_pkgname = m.group(1).replace('-', '_')
+        try:
+            krunner_pyver = Path(pkg_resources.resource_filename(
+                f'ai.backend.krunner.{matched_distro_pkgname}',
+                f'krunner-python.{matched_distro}.txt',
+            )).read_text().strip()
+        except FileNotFoundError:
+            pass
+    log.debug('selected krunner: {}', matched_distro)
+    log.debug('selected libc style: {}', matched_libc_style)
+    log.debug('krunner volume: {}', krunner_volume)
+    log.debug('krunner python: {}', krunner_pyver)
+    arch = get_arch_name()
+    return arch, matched_distro, matched_libc_style, krunner_volume, krunner_pyver
+
 
 class AbstractKernelCreationContext(aobject, Generic[KernelObjectType]):
     kspec_version: int
@@ -228,8 +284,9 @@ class AbstractKernelCreationContext(aobject, Generic[KernelObjectType]):
     async def apply_accelerator_allocation(self, computer, device_alloc) -> None:
         raise NotImplementedError
 
+    @classmethod
     @abstractmethod
-    def resolve_krunner_filepath(self, filename) -> Path:
+    def resolve_krunner_filepath(cls, filename) -> Path:
         """
         Return matching krunner path object for given filename.
         """
@@ -272,27 +329,129 @@ class AbstractKernelCreationContext(aobject, Generic[KernelObjectType]):
     def get_krunner_info(self) -> Tuple[str, str, str, str, str]:
         image_labels = self.kernel_config['image']['labels']
         distro = image_labels.get('ai.backend.base-distro', 'ubuntu16.04')
-        matched_distro, krunner_volume = match_distro_data(
-            self.local_config['container']['krunner-volumes'], distro)
-        matched_libc_style = 'glibc'
-        if distro.startswith('alpine'):
-            matched_libc_style = 'musl'
-        krunner_pyver = '3.6'  # fallback
-        if m := re.search(r'^([a-z-]+)(\d+(\.\d+)*)?$', matched_distro):
-            matched_distro_pkgname = m.group(1).replace('-', '_')
+        return resolve_krunner_info(self.local_config, distro)
+
+    @classmethod
+    @cached(
+        cache=krunner_mount_plan_cache,
+        key=lambda cls, local_config, distro: (
+            cls,
+            distro,
+            local_config['container']['sandbox-type'],
+        ),
+    )
+    def get_krunner_mount_plan(
+        cls,
+        local_config: Mapping[str, Any],
+        distro: str,
+    ) -> KrunnerMountPlan:
+        """
+        Resolve the krunner artifacts to mount for the given base distro.
+        The result is memoized as it depends only on the backend, the distro, the CPU
+        architecture, and the sandbox type.
+        """
+        mounts: List[KrunnerMount] = []
+
+        def _mount(type, src, dst):
+            mounts.append(KrunnerMount(type, src, dst))
+
+        arch, matched_distro, matched_libc_style, krunner_volume, krunner_pyver = \
+            resolve_krunner_info(local_config, distro)
+        artifact_path = Path(pkg_resources.resource_filename(
+            'ai.backend.agent', '../runner'))
+
+        def find_artifacts(pattern: str) -> Mapping[str, str]:
+            artifacts = {}
+            for p in artifact_path.glob(pattern):
+                m = cls._rx_distro.search(p.name)
+                if m is not None:
+                    artifacts[m.group(1)] = p.name
+            return artifacts
+
+        suexec_candidates = find_artifacts(f"su-exec.*.{arch}.bin")
+        _, suexec_candidate = match_distro_data(suexec_candidates, distro)
+        suexec_path = cls.resolve_krunner_filepath('runner/' + suexec_candidate)
+
+        hook_candidates = find_artifacts(f"libbaihook.*.{arch}.so")
+        _, hook_candidate = match_distro_data(hook_candidates, distro)
+        hook_path = cls.resolve_krunner_filepath('runner/' + hook_candidate)
+
+        sftp_server_candidates = find_artifacts(f"sftp-server.*.{arch}.bin")
+        _, sftp_server_candidate = match_distro_data(sftp_server_candidates, distro)
+        sftp_server_path = cls.resolve_krunner_filepath('runner/' + sftp_server_candidate)
+
+        scp_candidates = find_artifacts(f"scp.*.{arch}.bin")
+        _, scp_candidate = match_distro_data(scp_candidates, distro)
+        scp_path = cls.resolve_krunner_filepath('runner/' + scp_candidate)
+
+        jail_path: Optional[Path]
+        if local_config['container']['sandbox-type'] == 'jail':
+            jail_candidates = find_artifacts(f"jail.*.{arch}.bin")
+            _, jail_candidate = match_distro_data(jail_candidates, distro)
+            jail_path = cls.resolve_krunner_filepath('runner/' + jail_candidate)
+        else:
+            jail_path = None
+
+        kernel_pkg_path = cls.resolve_krunner_filepath('kernel')
+        helpers_pkg_path = cls.resolve_krunner_filepath('helpers')
+        dropbear_path = cls.resolve_krunner_filepath(f'runner/dropbear.{matched_libc_style}.{arch}.bin')
+        dropbearconv_path = \
+            cls.resolve_krunner_filepath(f'runner/dropbearconvert.{matched_libc_style}.{arch}.bin')
+        dropbearkey_path = \
+            cls.resolve_krunner_filepath(f'runner/dropbearkey.{matched_libc_style}.{arch}.bin')
+        tmux_path = cls.resolve_krunner_filepath(f'runner/tmux.{matched_libc_style}.{arch}.bin')
+        dotfile_extractor_path = cls.resolve_krunner_filepath('runner/extract_dotfiles.py')
+        persistent_files_warning_doc_path = \
+            cls.resolve_krunner_filepath('runner/DO_NOT_STORE_PERSISTENT_FILES_HERE.md')
+        entrypoint_sh_path = cls.resolve_krunner_filepath('runner/entrypoint.sh')
+
+        if matched_libc_style == 'musl':
+            terminfo_path = cls.resolve_krunner_filepath('runner/terminfo.alpine3.8')
+            _mount(MountTypes.BIND, terminfo_path, '/home/work/.terminfo')
+
+        _mount(MountTypes.BIND, dotfile_extractor_path, '/opt/kernel/extract_dotfiles.py')
+        _mount(MountTypes.BIND, entrypoint_sh_path, '/opt/kernel/entrypoint.sh')
+        _mount(MountTypes.BIND, suexec_path, '/opt/kernel/su-exec')
+        if jail_path is not None:
+            _mount(MountTypes.BIND, jail_path, '/opt/kernel/jail')
+        _mount(MountTypes.BIND, hook_path, '/opt/kernel/libbaihook.so')
+        _mount(MountTypes.BIND, dropbear_path, '/opt/kernel/dropbear')
+        _mount(MountTypes.BIND, dropbearconv_path, '/opt/kernel/dropbearconvert')
+        _mount(MountTypes.BIND, dropbearkey_path, '/opt/kernel/dropbearkey')
+        _mount(MountTypes.BIND, tmux_path, '/opt/kernel/tmux')
+        _mount(MountTypes.BIND, sftp_server_path, '/usr/libexec/sftp-server')
+        _mount(MountTypes.BIND, scp_path, '/usr/bin/scp')
+        _mount(MountTypes.BIND, persistent_files_warning_doc_path,
+               '/home/work/DO_NOT_STORE_PERSISTENT_FILES_HERE.md')
+
+        _mount(MountTypes.VOLUME, krunner_volume, '/opt/backend.ai')
+        pylib_path = f'/opt/backend.ai/lib/python{krunner_pyver}/site-packages/'
+        _mount(MountTypes.BIND, kernel_pkg_path,
+                                pylib_path + 'ai/backend/kernel')
+        _mount(MountTypes.BIND, helpers_pkg_path,
+                                pylib_path + 'ai/backend/helpers')
+        return KrunnerMountPlan(arch, tuple(mounts))
+
+    @classmethod
+    def prepare_krunner_mount_plans(cls, local_config: Mapping[str, Any]) -> None:
+        """
+        Resolve the krunner mount plans of all known base distros in advance
+        so that the kernel creations only copy them.
+        """
+        krunner_volumes = local_config['container'].get('krunner-volumes')
+        if not krunner_volumes:
+            return
+        distros = {distro for distro in krunner_volumes if not distro.startswith('static-')}
+        artifact_path = Path(pkg_resources.resource_filename(
+            'ai.backend.agent', '../runner'))
+        for p in artifact_path.iterdir():
+            if (m := cls._rx_distro.search(p.name)) is not None:
+                distros.add(m.group(1))
+        for distro in sorted(distros):
             try:
-                krunner_pyver = Path(pkg_resources.resource_filename(
-                    f'ai.backend.krunner.{matched_distro_pkgname}',
-                    f'krunner-python.{matched_distro}.txt',
-                )).read_text().strip()
-            except FileNotFoundError:
-                pass
-        log.debug('selected krunner: {}', matched_distro)
-        log.debug('selected libc style: {}', matched_libc_style)
-        log.debug('krunner volume: {}', krunner_volume)
-        log.debug('krunner python: {}', krunner_pyver)
-        arch = get_arch_name()
-        return arch, matched_distro, matched_libc_style, krunner_volume, krunner_pyver
+                cls.get_krunner_mount_plan(local_config, distro)
+            except UnsupportedBaseDistroError:
+                log.debug('skipping the krunner mount plan of unsupported distro: {}', distro)
 
     async def mount_vfolders(
         self,
@@ -375,82 +534,10 @@ class AbstractKernelCreationContext(aobject, Generic[KernelObjectType]):
         # Inject Backend.AI kernel runner dependencies.
         image_labels = self.kernel_config['image']['labels']
         distro = image_labels.get('ai.backend.base-distro', 'ubuntu16.04')
-
-        arch, matched_distro, matched_libc_style, krunner_volume, krunner_pyver = \
-            self.get_krunner_info()
-        artifact_path = Path(pkg_resources.resource_filename(
-            'ai.backend.agent', '../runner'))
-
-        def find_artifacts(pattern: str) -> Mapping[str, str]:
-            artifacts = {}
-            for p in artifact_path.glob(pattern):
-                m = self._rx_distro.search(p.name)
-                if m is not None:
-                    artifacts[m.group(1)] = p.name
-            return artifacts
-
-        suexec_candidates = find_artifacts(f"su-exec.*.{arch}.bin")
-        _, suexec_candidate = match_distro_data(suexec_candidates, distro)
-        suexec_path = self.resolve_krunner_filepath('runner/' + suexec_candidate)
-
-        hook_candidates = find_artifacts(f"libbaihook.*.{arch}.so")
-        _, hook_candidate = match_distro_data(hook_candidates, distro)
-        hook_path = self.resolve_krunner_filepath('runner/' + hook_candidate)
-
-        sftp_server_candidates = find_artifacts(f"sftp-server.*.{arch}.bin")
-        _, sftp_server_candidate = match_distro_data(sftp_server_candidates, distro)
-        sftp_server_path = self.resolve_krunner_filepath('runner/' + sftp_server_candidate)
-
-        scp_candidates = find_artifacts(f"scp.*.{arch}.bin")
-        _, scp_candidate = match_distro_data(scp_candidates, distro)
-        scp_path = self.resolve_krunner_filepath('runner/' + scp_candidate)
-
-        jail_path: Optional[Path]
-        if self.local_config['container']['sandbox-type'] == 'jail':
-            jail_candidates = find_artifacts(f"jail.*.{arch}.bin")
-            _, jail_candidate = match_distro_data(jail_candidates, distro)
-            jail_path = self.resolve_krunner_filepath('runner/' + jail_candidate)
-        else:
-            jail_path = None
-
-        kernel_pkg_path = self.resolve_krunner_filepath('kernel')
-        helpers_pkg_path = self.resolve_krunner_filepath('helpers')
-        dropbear_path = self.resolve_krunner_filepath(f'runner/dropbear.{matched_libc_style}.{arch}.bin')
-        dropbearconv_path = \
-            self.resolve_krunner_filepath(f'runner/dropbearconvert.{matched_libc_style}.{arch}.bin')
-        dropbearkey_path = \
-            self.resolve_krunner_filepath(f'runner/dropbearkey.{matched_libc_style}.{arch}.bin')
-        tmux_path = self.resolve_krunner_filepath(f'runner/tmux.{matched_libc_style}.{arch}.bin')
-        dotfile_extractor_path = self.resolve_krunner_filepath('runner/extract_dotfiles.py')
-        persistent_files_warning_doc_path = \
-            self.resolve_krunner_filepath('runner/DO_NOT_STORE_PERSISTENT_FILES_HERE.md')
-        entrypoint_sh_path = self.resolve_krunner_filepath('runner/entrypoint.sh')
-
-        if matched_libc_style == 'musl':
-            terminfo_path = self.resolve_krunner_filepath('runner/terminfo.alpine3.8')
-            _mount(MountTypes.BIND, terminfo_path, '/home/work/.terminfo')
-
-        _mount(MountTypes.BIND, dotfile_extractor_path, '/opt/kernel/extract_dotfiles.py')
-        _mount(MountTypes.BIND, entrypoint_sh_path, '/opt/kernel/entrypoint.sh')
-        _mount(MountTypes.BIND, suexec_path, '/opt/kernel/su-exec')
-        if jail_path is not None:
-            _mount(MountTypes.BIND, jail_path, '/opt/kernel/jail')
-        _mount(MountTypes.BIND, hook_path, '/opt/kernel/libbaihook.so')
-        _mount(MountTypes.BIND, dropbear_path, '/opt/kernel/dropbear')
-        _mount(MountTypes.BIND, dropbearconv_path, '/opt/kernel/dropbearconvert')
-        _mount(MountTypes.BIND, dropbearkey_path, '/opt/kernel/dropbearkey')
-        _mount(MountTypes.BIND, tmux_path, '/opt/kernel/tmux')
-        _mount(MountTypes.BIND, sftp_server_path, '/usr/libexec/sftp-server')
-        _mount(MountTypes.BIND, scp_path, '/usr/bin/scp')
-        _mount(MountTypes.BIND, persistent_files_warning_doc_path,
-               '/home/work/DO_NOT_STORE_PERSISTENT_FILES_HERE.md')
-
-        _mount(MountTypes.VOLUME, krunner_volume, '/opt/backend.ai')
-        pylib_path = f'/opt/backend.ai/lib/python{krunner_pyver}/site-packages/'
-        _mount(MountTypes.BIND, kernel_pkg_path,
-                                pylib_path + 'ai/backend/kernel')
-        _mount(MountTypes.BIND, helpers_pkg_path,
-                                pylib_path + 'ai/backend/helpers')
+        krunner_mount_plan = self.get_krunner_mount_plan(self.local_config, distro)
+        arch = krunner_mount_plan.arch
+        for krunner_mount in krunner_mount_plan.mounts:
+            _mount(krunner_mount.type, krunner_mount.source, krunner_mount.target)
         environ['LD_PRELOAD'] = '/opt/kernel/libbaihook.so'
 
         # Inject ComputeDevice-specific env-varibles and hooks
@@ -495,6 +582,136 @@ class ComputerContext:
     alloc_map: AbstractAllocMap
 
 
+def allocate_kernel_resources(
+    computers: Mapping[str, ComputerContext],
+    kernel_slots: Sequence[Mapping[SlotName, Any]],
+    *,
+    numa_nodes: Collection[int] = (),
+) -> List[MutableMapping[DeviceName, Mapping[SlotName, Mapping[DeviceId, Decimal]]]]:
+    """
+    Allocate the resources of multiple kernels from the alloc maps of all device types
+    as a single transaction.  If any allocation fails, all allocations made so far are
+    rolled back before raising the error.
+
+    The kernels requesting more accelerators and CPU cores are placed first to reduce
+    fragmentation.  *numa_nodes* is the placement hint of the batch.  The CPU cores and
+    memory of each kernel are placed on the NUMA nodes of its own accelerators if any,
+    or on the nodes of the batch hint.  If no hint is given, the nodes of the accelerators
+    of the first kernel placed become the hint so that the following kernels are
+    placed near them.
+    """
+    preferred_numa_nodes = set(numa_nodes)
+    results: List[MutableMapping[DeviceName, Mapping[SlotName, Mapping[DeviceId, Decimal]]]] = \
+        [{} for _ in kernel_slots]
+    done: List[Tuple[AbstractAllocMap, Mapping[SlotName, Mapping[DeviceId, Decimal]]]] = []
+
+    def placement_order(idx: int) -> Tuple[Decimal, Decimal]:
+        slots = kernel_slots[idx]
+        accelerator_amount = sum(
+            (Decimal(amount) for slot_name, amount in slots.items() if slot_name not in ('cpu', 'mem')),
+            Decimal(0),
+        )
+        return accelerator_amount, Decimal(slots.get(SlotName('cpu'), 0))
+
+    try:
+        for idx in sorted(range(len(kernel_slots)), key=placement_order, reverse=True):
+            slots = kernel_slots[idx]
+            kernel_numa_nodes = set(preferred_numa_nodes)
+            accelerator_numa_nodes: Set[int] = set()
+            dev_names: Set[DeviceName] = set()
+            for slot_name in slots.keys():
+                dev_name = slot_name.split('.', maxsplit=1)[0]
+                dev_names.add(DeviceName(dev_name))
+            # Allocate the accelerators first so that the CPU cores can be placed
+            # on the NUMA nodes of them.
+            for dev_name in sorted(dev_names, key=lambda name: name in ('cpu', 'mem')):
+                computer_set = computers[dev_name]
+                device_specific_slots = {
+                    SlotName(slot_name): Decimal(alloc)
+                    for slot_name, alloc in slots.items()
+                    if slot_name.startswith(dev_name)
+                }
+                try:
+                    device_alloc: Mapping[SlotName, Mapping[DeviceId, Decimal]]
+                    if isinstance(computer_set.alloc_map, DiscretePropertyAllocMap):
+                        device_alloc = computer_set.alloc_map.allocate(
+                            device_specific_slots,
+                            context_tag=dev_name,
+                            numa_nodes=accelerator_numa_nodes or kernel_numa_nodes)
+                    else:
+                        device_alloc = computer_set.alloc_map.allocate(
+                            device_specific_slots,
+                            context_tag=dev_name)
+                except ResourceError as e:
+                    log.info(
+                        "resource allocation failed ({}): {} of {}\n"
+                        "(alloc map: {})",
+                        type(e).__name__, device_specific_slots, dev_name,
+                        dict(computer_set.alloc_map.allocations),
+                    )
+                    raise
+                done.append((computer_set.alloc_map, device_alloc))
+                results[idx][dev_name] = device_alloc
+                if dev_name not in ('cpu', 'mem'):
+                    device_numa_nodes = {
+                        device.device_id: device.numa_node for device in computer_set.devices
+                    }
+                    for per_device_alloc in device_alloc.values():
+                        for device_id in per_device_alloc:
+                            numa_node = device_numa_nodes.get(device_id)
+                            if numa_node is not None:
+                                accelerator_numa_nodes.add(numa_node)
+            if not preferred_numa_nodes:
+                preferred_numa_nodes = accelerator_numa_nodes
+    except Exception:
+        for alloc_map, device_alloc in reversed(done):
+            alloc_map.free(device_alloc)
+        raise
+    return results
+
+
+def get_allocation_drifts(
+    alloc_map: AbstractAllocMap,
+    rebuilt_alloc_map: AbstractAllocMap,
+) -> List[Tuple[SlotName, DeviceId, Decimal, Decimal]]:
+    """
+    Compare the allocation map with the one rebuilt from the containers and
+    return the (slot name, device ID, current amount, rebuilt amount) tuples
+    of the mismatching device slots.
+    """
+    drifts = []
+    for slot_name, slot_allocs in alloc_map.allocations.items():
+        rebuilt_slot_allocs = rebuilt_alloc_map.get_slot_allocations(slot_name)
+        for device_id, amount in slot_allocs.items():
+            rebuilt_amount = rebuilt_slot_allocs.get(device_id, Decimal(0))
+            if amount != rebuilt_amount:
+                drifts.append((slot_name, device_id, amount, rebuilt_amount))
+    return drifts
+
+
+def get_kernel_creation_stage_deps(restarting: bool) -> Mapping[str, Sequence[str]]:
+    """
+    Returns the names of the stages each stage of the kernel creation depends on,
+    following the data dependencies between the preparation steps.
+    """
+    return {
+        'image': [],
+        'resource_spec': [],
+        'allocation': ['resource_spec'],
+        # When restarting, the resource spec is read from the existing scratch
+        # which may be remounted while preparing the scratch.
+        'scratch': ['resource_spec'] if restarting else [],
+        'network': [],
+        'ssh_keypair': ['scratch'],
+        # The krunner mounts read the device allocations to apply the accelerator
+        # allocations and to get the hooks of the compute plugins.
+        'mounts': ['allocation'],
+        # The mount list is complete after the vfolder and krunner mounts are added.
+        'process_mounts': ['mounts'],
+        'attached_devices': ['allocation'],
+    }
+
+
 class AbstractAgent(aobject, Generic[KernelObjectType, KernelCreationContextType], metaclass=ABCMeta):
 
     loop: asyncio.AbstractEventLoop
@@ -511,10 +728,13 @@ class AbstractAgent(aobject, Generic[KernelObjectType, KernelCreationContextType
 
     restarting_kernels: MutableMapping[KernelId, RestartTracker]
     terminating_kernels: Set[KernelId]
+    allocated_kernels: Set[KernelId]
     timer_tasks: MutableSequence[asyncio.Task]
     container_lifecycle_queue: asyncio.Queue[ContainerLifecycleEvent | Sentinel]
 
     stat_ctx: StatContext
+    stat_collector_task: PeriodicTask
+    metric_exporter: Optional[MetricExporter]
     stat_sync_sockpath: Path
     stat_sync_task: asyncio.Task
 
@@ -522,6 +742,7 @@ class AbstractAgent(aobject, Generic[KernelObjectType, KernelCreationContextType
     error_monitor: ErrorPluginContext  # unused in favor of produce_error_event()
 
     _pending_creation_tasks: Dict[KernelId, Set[asyncio.Task]]
+    _num_ongoing_creations: int
     _ongoing_exec_batch_tasks: weakref.WeakSet[asyncio.Task]
     _ongoing_destruction_tasks: weakref.WeakValueDictionary[KernelId, asyncio.Task]
 
@@ -544,10 +765,12 @@ class AbstractAgent(aobject, Generic[KernelObjectType, KernelCreationContextType
         self.images = {}  # repoTag -> digest
         self.restarting_kernels = {}
         self.terminating_kernels = set()
+        self.allocated_kernels = set()
         self.stat_ctx = StatContext(
             self, mode=StatModes(local_config['container']['stats-type']),
         )
         self.timer_tasks = []
+        self.metric_exporter = None
         self.port_pool = set(range(
             local_config['container']['port-range'][0],
             local_config['container']['port-range'][1] + 1,
@@ -555,6 +778,7 @@ class AbstractAgent(aobject, Generic[KernelObjectType, KernelCreationContextType
         self.stats_monitor = stats_monitor
         self.error_monitor = error_monitor
         self._pending_creation_tasks = defaultdict(set)
+        self._num_ongoing_creations = 0
         self._ongoing_exec_batch_tasks = weakref.WeakSet()
         self._ongoing_destruction_tasks = weakref.WeakValueDictionary()
 
@@ -586,18 +810,44 @@ class AbstractAgent(aobject, Generic[KernelObjectType, KernelCreationContextType
 
         if not self._skip_initial_scan:
             self.images = await self.scan_images()
-            self.timer_tasks.append(aiotools.create_timer(self._scan_images_wrapper, 20.0))
+            self.timer_tasks.append(
+                PeriodicTask(self._scan_images_wrapper, 20.0, jitter=0.1).start(),
+            )
             await self.scan_running_kernels()
 
-        # Prepare stat collector tasks.
-        self.timer_tasks.append(aiotools.create_timer(self.collect_node_stat, 5.0))
-        self.timer_tasks.append(aiotools.create_timer(self.collect_container_stat, 5.0))
+        # Prepare the stat collector task.
+        stats_config = self.local_config['stats']
+        self.stat_collector_task = PeriodicTask(
+            self.collect_stat,
+            stats_config['interval'],
+            jitter=stats_config['jitter'],
+            adaptive_threshold=stats_config['adaptive-threshold'] or None,
+            max_interval=stats_config['max-interval'],
+        )
+        self.timer_tasks.append(self.stat_collector_task.start())
+        if stats_config['exporter']['enabled']:
+            self.metric_exporter = MetricExporter(
+                self.stat_ctx, stats_config['exporter']['service-addr'],
+            )
+            await self.metric_exporter.start()
 
         # Prepare heartbeats.
+        # They keep using a plain timer so that a stalled heartbeat does not delay the next one.
         self.timer_tasks.append(aiotools.create_timer(self.heartbeat, 3.0))
 
         # Prepare auto-cleaning of idle kernels.
-        self.timer_tasks.append(aiotools.create_timer(self.sync_container_lifecycles, 10.0))
+        self.timer_tasks.append(
+            PeriodicTask(self.sync_container_lifecycles, 10.0, jitter=0.1).start(),
+        )
+
+        # Prepare the consistency checks of the resource usage.
+        self.timer_tasks.append(
+            PeriodicTask(
+                self.check_resource_usage,
+                self.local_config['resource']['rescan-interval'],
+                jitter=0.1,
+            ).start(),
+        )
 
         loop = current_loop()
         self.container_lifecycle_handler = loop.create_task(self.process_lifecycle_events())
@@ -626,6 +876,9 @@ class AbstractAgent(aobject, Generic[KernelObjectType, KernelCreationContextType
             if isinstance(result, Exception):
                 log.error('timer cancellation error: {}', result)
 
+        if self.metric_exporter is not None:
+            await self.metric_exporter.close()
+
         # Stop lifecycle event handler.
         await self.container_lifecycle_queue.put(_sentinel)
         await self.container_lifecycle_handler
@@ -757,6 +1010,20 @@ class AbstractAgent(aobject, Generic[KernelObjectType, KernelCreationContextType
         )
         await self.produce_event(DoSyncKernelLogsEvent(kernel_id, container_id))
 
+    async def collect_stat(self, interval: float) -> float:
+        # Sample the node and each container exactly once per period.
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        await self.collect_node_stat(interval)
+        await self.collect_container_stat(interval)
+        if self.metric_exporter is not None:
+            self.metric_exporter.render()
+        if self.local_config['debug']['log-stats']:
+            log.debug('stat collector: {0}', self.stat_collector_task.get_stats())
+        # Report the busy time excluding the sleeps spreading the container sampling,
+        # which would otherwise make the adaptive interval grow without real load.
+        return loop.time() - started - self.stat_ctx.last_spread_delay
+
     async def collect_node_stat(self, interval: float):
         if self.local_config['debug']['log-stats']:
             log.debug('collecting node statistics')
@@ -772,15 +1039,21 @@ class AbstractAgent(aobject, Generic[KernelObjectType, KernelCreationContextType
         if self.local_config['debug']['log-stats']:
             log.debug('collecting container statistics')
         try:
-            updated_kernel_ids = []
-            container_ids = []
-            for kernel_id, kernel_obj in [*self.kernel_registry.items()]:
-                if not kernel_obj.stats_enabled:
-                    continue
-                updated_kernel_ids.append(kernel_id)
-                container_ids.append(kernel_obj['container_id'])
-            await self.stat_ctx.collect_container_stat(container_ids)
+            container_ids = [
+                kernel_obj['container_id']
+                for kernel_obj in [*self.kernel_registry.values()]
+            ]
+            # Spread the sampling of containers across the period.
+            updated_metrics = await self.stat_ctx.collect_container_stat(
+                container_ids,
+                spread=interval * self.local_config['stats']['spread'],
+            )
             # Let the manager store the statistics in the persistent database.
+            updated_kernel_ids = []
+            for kernel_id in updated_metrics:
+                kernel_obj = self.kernel_registry.get(kernel_id)
+                if kernel_obj is not None and kernel_obj.stats_enabled:
+                    updated_kernel_ids.append(kernel_id)
             if updated_kernel_ids:
                 await self.produce_event(DoSyncKernelStatsEvent(updated_kernel_ids))
         except asyncio.CancelledError:
@@ -807,7 +1080,7 @@ class AbstractAgent(aobject, Generic[KernelObjectType, KernelCreationContextType
                 log.warning('destroy_kernel(k:{0}) kernel missing (already dead?)',
                             ev.kernel_id)
                 if ev.container_id is None:
-                    await self.rescan_resource_usage()
+                    await self.release_kernel_resources(ev.kernel_id, None)
                     if not ev.suppress_events:
                         await self.produce_event(
                             KernelTerminatedEvent(ev.kernel_id, "already-terminated"),
@@ -884,7 +1157,7 @@ class AbstractAgent(aobject, Generic[KernelObjectType, KernelCreationContextType
                 if restart_tracker := self.restarting_kernels.get(ev.kernel_id, None):
                     restart_tracker.destroy_event.set()
                 else:
-                    await self.rescan_resource_usage()
+                    await self.release_kernel_resources(ev.kernel_id, kernel_obj)
                     if not ev.suppress_events:
                         await self.produce_event(
                             KernelTerminatedEvent(ev.kernel_id, ev.reason),
@@ -967,24 +1240,105 @@ class AbstractAgent(aobject, Generic[KernelObjectType, KernelCreationContextType
         Enumerate the containers with the given status filter.
         """
 
+    async def release_kernel_resources(
+        self,
+        kernel_id: KernelId,
+        kernel_obj: Optional[AbstractKernel],
+    ) -> None:
+        """
+        Return the resources allocated to the cleaned-up kernel to the allocation maps.
+        It is safe to call this multiple times for the same kernel.
+        """
+        async with self.resource_lock:
+            if kernel_id not in self.allocated_kernels:
+                return
+            self.allocated_kernels.discard(kernel_id)
+            if kernel_obj is None:
+                log.warning(
+                    "release_kernel_resources(k:{}): missing kernel object; "
+                    "its allocations will be reclaimed by the next resource usage check",
+                    kernel_id,
+                )
+                return
+            kernel_obj.release_slots(self.computers)
+
+    async def check_resource_usage(self, interval: float) -> None:
+        try:
+            await self.rescan_resource_usage()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            log.exception('unhandled exception while checking the resource usage')
+            await self.produce_error_event()
+
     async def rescan_resource_usage(self) -> None:
+        """
+        Rebuild the resource usage from the active containers and compare it with
+        the allocation maps maintained incrementally upon kernel creation and cleanup.
+
+        Any drift is reported and fixed by adopting the rebuilt usage, unless there are
+        kernels being created, restarted or terminated whose containers may not reflect
+        their allocations yet.  In that case, the fix is deferred to the next check.
+
+        The containers are enumerated and their allocations are rebuilt into empty clones
+        of the allocation maps before taking the resource lock, so that the kernel creations
+        are not blocked by the scan.  If any kernel has been allocated or released meanwhile,
+        the fix is deferred as well.
+        """
+        scanned_kernels = set(self.allocated_kernels)
+        rebuilt_alloc_maps = {
+            computer_name: computer_set.alloc_map.clone_empty()
+            for computer_name, computer_set in self.computers.items()
+        }
+        active_kernels = set()
+        for kernel_id, container in (await self.enumerate_containers()):
+            active_kernels.add(kernel_id)
+            for computer_name, computer_set in self.computers.items():
+                try:
+                    await computer_set.instance.restore_from_container(
+                        container,
+                        rebuilt_alloc_maps[computer_name],
+                    )
+                except Exception:
+                    log.warning(
+                        "rescan_resoucre_usage(k:{}): "
+                        "failed to read kernel resource info; "
+                        "maybe already terminated",
+                        kernel_id,
+                    )
         async with self.resource_lock:
-            for computer_set in self.computers.values():
+            has_drift = False
+            for computer_name, computer_set in self.computers.items():
+                drifts = get_allocation_drifts(
+                    computer_set.alloc_map,
+                    rebuilt_alloc_maps[computer_name],
+                )
+                for slot_name, device_id, amount, rebuilt_amount in drifts:
+                    log.warning(
+                        "resource usage drift detected: {}/{}: {} (rebuilt from containers: {})",
+                        slot_name, device_id, amount, rebuilt_amount,
+                    )
+                has_drift = has_drift or bool(drifts)
+            if not has_drift:
+                return
+            if (
+                self._num_ongoing_creations > 0
+                or self.allocated_kernels != scanned_kernels
+                or self.restarting_kernels
+                or self.terminating_kernels
+                or not self.container_lifecycle_queue.empty()
+            ):
+                log.info("deferred fixing the resource usage drift due to ongoing kernel operations")
+                return
+            for computer_name, computer_set in self.computers.items():
                 computer_set.alloc_map.clear()
-            for kernel_id, container in (await self.enumerate_containers()):
-                for computer_set in self.computers.values():
-                    try:
-                        await computer_set.instance.restore_from_container(
-                            container,
-                            computer_set.alloc_map,
-                        )
-                    except Exception:
-                        log.warning(
-                            "rescan_resoucre_usage(k:{}): "
-                            "failed to read kernel resource info; "
-                            "maybe already terminated",
-                            kernel_id,
-                        )
+                computer_set.alloc_map.apply_allocation({
+                    slot_name: dict(slot_allocs)
+                    for slot_name, slot_allocs
+                    in rebuilt_alloc_maps[computer_name].allocations.items()
+                })
+            self.allocated_kernels = active_kernels
+            log.info("fixed the resource usage drift with the usage rebuilt from the containers")
 
     async def sync_container_lifecycles(self, interval: float) -> None:
         """
@@ -1150,11 +1504,18 @@ class AbstractAgent(aobject, Generic[KernelObjectType, KernelCreationContextType
                         if p.host_port is not None:
                             self.port_pool.discard(p.host_port)
                     # Restore compute resources.
-                    for computer_set in self.computers.values():
-                        await computer_set.instance.restore_from_container(
-                            container,
-                            computer_set.alloc_map,
-                        )
+                    for computer_name, computer_set in self.computers.items():
+                        try:
+                            await computer_set.instance.restore_from_container(
+                                container,
+                                computer_set.alloc_map,
+                            )
+                        except Exception:
+                            log.exception(
+                                "failed to restore the {} allocation of the kernel {}",
+                                computer_name, kernel_id,
+                            )
+                    self.allocated_kernels.add(kernel_id)
                     await self.inject_container_lifecycle_event(
                         kernel_id,
                         LifecycleEvent.START,
@@ -1242,6 +1603,65 @@ class AbstractAgent(aobject, Generic[KernelObjectType, KernelCreationContextType
                 SessionFailureEvent(SessionId(kernel_id), "task-cancelled", -2),
             )
 
+    async def allocate_resources(
+        self,
+        kernel_slots: Sequence[Mapping[SlotName, Any]],
+        *,
+        numa_nodes: Collection[int] = (),
+    ) -> List[MutableMapping[DeviceName, Mapping[SlotName, Mapping[DeviceId, Decimal]]]]:
+        """
+        Allocate the resources of the given kernels all at once
+        within a single acquisition of the resource lock.
+        See :func:`allocate_kernel_resources()` for details.
+        """
+        async with self.resource_lock:
+            return allocate_kernel_resources(self.computers, kernel_slots, numa_nodes=numa_nodes)
+
+    async def free_resources(
+        self,
+        allocations: Mapping[DeviceName, Mapping[SlotName, Mapping[DeviceId, Decimal]]],
+    ) -> None:
+        async with self.resource_lock:
+            for dev_name, device_alloc in allocations.items():
+                self.computers[dev_name].alloc_map.free(device_alloc)
+
+    async def create_kernels(
+        self,
+        creation_id: str,
+        session_id: SessionId,
+        kernel_ids: Sequence[KernelId],
+        kernel_configs: Sequence[KernelCreationConfig],
+        cluster_info: ClusterInfo,
+    ) -> List[Union[KernelCreationResult, BaseException]]:
+        """
+        Create the kernels of a session assigned to this agent.
+
+        The resources of all kernels are allocated in a batch before creating them,
+        so that the request fails immediately without any partial allocation
+        if this agent cannot host all of them.
+        The results are returned in the same order of *kernel_ids*,
+        with the exceptions of failed kernels in place.
+        """
+        self._num_ongoing_creations += 1
+        try:
+            allocations = await self.allocate_resources([
+                get_requested_slots(kernel_config) for kernel_config in kernel_configs
+            ])
+            return await asyncio.gather(*[
+                self.create_kernel(
+                    creation_id,
+                    session_id,
+                    kernel_id,
+                    kernel_config,
+                    cluster_info,
+                    allocations=kernel_allocations,
+                )
+                for kernel_id, kernel_config, kernel_allocations
+                in zip(kernel_ids, kernel_configs, allocations)
+            ], return_exceptions=True)
+        finally:
+            self._num_ongoing_creations -= 1
+
     async def create_kernel(
         self,
         creation_id: str,
@@ -1251,203 +1671,225 @@ class AbstractAgent(aobject, Generic[KernelObjectType, KernelCreationContextType
         cluster_info: ClusterInfo,
         *,
         restarting: bool = False,
+        allocations: Optional[Mapping[DeviceName, Mapping[SlotName, Mapping[DeviceId, Decimal]]]] = None,
     ) -> KernelCreationResult:
         """
         Create a new kernel.
-        """
 
-        if not restarting:
-            await self.produce_event(
-                KernelPreparingEvent(kernel_id, creation_id),
-            )
-
-        # Initialize the creation context
-        if self.local_config['debug']['log-kernel-config']:
-            log.debug('Kernel creation config: {0}', pretty(kernel_config))
-        ctx = await self.init_kernel_context(
-            kernel_id, kernel_config,
-            restarting=restarting,
-        )
-        environ: MutableMapping[str, str] = {**kernel_config['environ']}
-
-        # Inject Backend.AI-intrinsic env-variables for gosu
-        if KernelFeatures.UID_MATCH in ctx.kernel_features:
-            uid = self.local_config['container']['kernel-uid']
-            gid = self.local_config['container']['kernel-gid']
-            environ['LOCAL_USER_ID'] = str(uid)
-            environ['LOCAL_GROUP_ID'] = str(gid)
-        environ.update(
-            await ctx.get_extra_envs(),
-        )
-        image_labels = kernel_config['image']['labels']
+        If *allocations* is given, the kernel takes the ownership of the resources
+        already allocated by :meth:`allocate_resources()` instead of allocating them by itself.
+        They are released if the creation fails before spawning the container.
+        """
+        owned_allocations = allocations
+        stages = StageGraph()
+        try:
+            if not restarting:
+                await self.produce_event(
+                    KernelPreparingEvent(kernel_id, creation_id),
+                )
 
-        # Check if we need to pull the container image
-        do_pull = await self.check_image(
-            ctx.image_ref,
-            kernel_config['image']['digest'],
-            AutoPullBehavior(kernel_config.get('auto_pull', 'digest')),
-        )
-        if do_pull:
-            await self.produce_event(
-                KernelPullingEvent(kernel_id, creation_id, ctx.image_ref.canonical),
-            )
-            await self.pull_image(ctx.image_ref, kernel_config['image']['registry'])
+            # Initialize the creation context
+            if self.local_config['debug']['log-kernel-config']:
+                log.debug('Kernel creation config: {0}', pretty(kernel_config))
+            with stages.measure('init_context'):
+                ctx = await self.init_kernel_context(
+                    kernel_id, kernel_config,
+                    restarting=restarting,
+                )
+                environ: MutableMapping[str, str] = {**kernel_config['environ']}
+
+                # Inject Backend.AI-intrinsic env-variables for gosu
+                if KernelFeatures.UID_MATCH in ctx.kernel_features:
+                    uid = self.local_config['container']['kernel-uid']
+                    gid = self.local_config['container']['kernel-gid']
+                    environ['LOCAL_USER_ID'] = str(uid)
+                    environ['LOCAL_GROUP_ID'] = str(gid)
+                environ.update(
+                    await ctx.get_extra_envs(),
+                )
+            image_labels = kernel_config['image']['labels']
 
-        if not restarting:
-            await self.produce_event(
-                KernelCreatingEvent(kernel_id, creation_id),
-            )
+            # The preparation steps run as a dependency graph
+            # so that the independent ones (e.g., the image pull and the scratch setup) overlap.
 
-        # Get the resource spec from existing kernel scratches
-        # or create a new resource spec from ctx.kernel_config
-        resource_spec, resource_opts = await ctx.prepare_resource_spec()
-        # When creating a new kernel,
-        # we need to allocate agent resources, prepare the networks,
-        # adn specify the container mounts.
+            async def _pull_image() -> None:
+                # Check if we need to pull the container image
+                do_pull = await self.check_image(
+                    ctx.image_ref,
+                    kernel_config['image']['digest'],
+                    AutoPullBehavior(kernel_config.get('auto_pull', 'digest')),
+                )
+                if do_pull:
+                    await self.produce_event(
+                        KernelPullingEvent(kernel_id, creation_id, ctx.image_ref.canonical),
+                    )
+                    await self.pull_image(ctx.image_ref, kernel_config['image']['registry'])
 
-        # Mount backend-specific intrinsic mounts (e.g., scratch directories)
-        resource_spec.mounts.extend(
-            await ctx.get_intrinsic_mounts(),
-        )
+                if not restarting:
+                    await self.produce_event(
+                        KernelCreatingEvent(kernel_id, creation_id),
+                    )
 
-        # Realize ComputeDevice (including accelerators) allocations.
-        slots = resource_spec.slots
-        dev_names: Set[DeviceName] = set()
-        for slot_name in slots.keys():
-            dev_name = slot_name.split('.', maxsplit=1)[0]
-            dev_names.add(DeviceName(dev_name))
-
-        if not restarting:
-            async with self.resource_lock:
-                for dev_name in dev_names:
-                    computer_set = self.computers[dev_name]
-                    device_specific_slots = {
-                        SlotName(slot_name): Decimal(alloc)
-                        for slot_name, alloc in slots.items()
-                        if slot_name.startswith(dev_name)
-                    }
-                    try:
-                        # TODO: support allocate_evenly()
-                        resource_spec.allocations[dev_name] = \
-                            computer_set.alloc_map.allocate(
-                                device_specific_slots,
-                                context_tag=dev_name)
-                    except ResourceError as e:
-                        log.info(
-                            "resource allocation failed ({}): {} of {}\n"
-                            "(alloc map: {})",
-                            type(e).__name__, device_specific_slots, dev_name,
-                            dict(computer_set.alloc_map.allocations),
-                        )
-                        raise
-
-        # Prepare scratch spaces and dotfiles inside it.
-        await ctx.prepare_scratch()
-
-        # Prepare networking.
-        await ctx.apply_network(cluster_info)
-        await ctx.install_ssh_keypair(cluster_info)
-
-        # Mount vfolders and krunner stuffs.
-        await ctx.mount_vfolders(kernel_config['mounts'], resource_spec)
-        await ctx.mount_krunner(resource_spec, environ)
-
-        # Inject Backend.AI-intrinsic env-variables for libbaihook and gosu
-        label_envs_corecount = image_labels.get('ai.backend.envs.corecount', '')
-        envs_corecount = label_envs_corecount.split(',') if label_envs_corecount else []
-        cpu_core_count = len(resource_spec.allocations[DeviceName('cpu')][SlotName('cpu')])
-        environ.update({k: str(cpu_core_count) for k in envs_corecount if k not in environ})
-
-        # Realize mounts.
-        await ctx.process_mounts(resource_spec.mounts)
-
-        # Get attached devices information (including model_name).
-        attached_devices = {}
-        for dev_name, device_alloc in resource_spec.allocations.items():
-            computer_set = self.computers[dev_name]
-            devices = await computer_set.instance.get_attached_devices(device_alloc)
-            attached_devices[dev_name] = devices
-
-        exposed_ports = [2000, 2001]
-        service_ports = []
-        port_map = {}
-        preopen_ports = ctx.kernel_config.get('preopen_ports')
-        if preopen_ports is None:
-            preopen_ports = []
-
-        if ctx.kernel_config['cluster_role'] in ('main', 'master'):
-            for sport in parse_service_ports(image_labels.get('ai.backend.service-ports', '')):
-                port_map[sport['name']] = sport
-            port_map['sshd'] = {
-                'name': 'sshd',
-                'protocol': ServicePortProtocols('tcp'),
-                'container_ports': (2200,),
-                'host_ports': (None,),
-            }
-            port_map['ttyd'] = {
-                'name': 'ttyd',
-                'protocol': ServicePortProtocols('http'),
-                'container_ports': (7681,),
-                'host_ports': (None,),
-            }
-            for port_no in preopen_ports:
-                sport = {
-                    'name': str(port_no),
-                    'protocol': ServicePortProtocols('preopen'),
-                    'container_ports': (port_no,),
+            async def _prepare_resource_spec() -> Tuple[KernelResourceSpec, Optional[Mapping[str, Any]]]:
+                # Get the resource spec from existing kernel scratches
+                # or create a new resource spec from ctx.kernel_config
+                resource_spec, resource_opts = await ctx.prepare_resource_spec()
+                # Mount backend-specific intrinsic mounts (e.g., scratch directories)
+                resource_spec.mounts.extend(
+                    await ctx.get_intrinsic_mounts(),
+                )
+                return resource_spec, resource_opts
+
+            async def _allocate_resources() -> None:
+                nonlocal owned_allocations
+                resource_spec, _ = resource_spec_stage.result()
+                # Realize ComputeDevice (including accelerators) allocations.
+                if not restarting:
+                    if owned_allocations is None:
+                        owned_allocations, = await self.allocate_resources([resource_spec.slots])
+                    resource_spec.allocations.update(owned_allocations)
+
+            async def _mount_vfolders_and_krunner() -> None:
+                resource_spec, _ = resource_spec_stage.result()
+                await ctx.mount_vfolders(kernel_config['mounts'], resource_spec)
+                await ctx.mount_krunner(resource_spec, environ)
+
+            async def _process_mounts() -> None:
+                resource_spec, _ = resource_spec_stage.result()
+                await ctx.process_mounts(resource_spec.mounts)
+
+            async def _get_attached_devices() -> Mapping[DeviceName, Sequence[DeviceModelInfo]]:
+                # Get attached devices information (including model_name).
+                resource_spec, _ = resource_spec_stage.result()
+                dev_names = [*resource_spec.allocations.keys()]
+                results = await asyncio.gather(*[
+                    self.computers[dev_name].instance.get_attached_devices(
+                        resource_spec.allocations[dev_name],
+                    )
+                    for dev_name in dev_names
+                ])
+                return dict(zip(dev_names, results))
+
+            stage_deps = get_kernel_creation_stage_deps(restarting)
+            stages.add('image', _pull_image, after=stage_deps['image'])
+            resource_spec_stage = stages.add(
+                'resource_spec',
+                _prepare_resource_spec,
+                after=stage_deps['resource_spec'],
+            )
+            stages.add('allocation', _allocate_resources, after=stage_deps['allocation'])
+            stages.add('scratch', ctx.prepare_scratch, after=stage_deps['scratch'])
+            stages.add('network', partial(ctx.apply_network, cluster_info), after=stage_deps['network'])
+            stages.add(
+                'ssh_keypair',
+                partial(ctx.install_ssh_keypair, cluster_info),
+                after=stage_deps['ssh_keypair'],
+            )
+            stages.add('mounts', _mount_vfolders_and_krunner, after=stage_deps['mounts'])
+            stages.add('process_mounts', _process_mounts, after=stage_deps['process_mounts'])
+            attached_devices_stage = stages.add(
+                'attached_devices',
+                _get_attached_devices,
+                after=stage_deps['attached_devices'],
+            )
+            await stages.wait()
+            resource_spec, resource_opts = resource_spec_stage.result()
+            attached_devices = attached_devices_stage.result()
+
+            # Inject Backend.AI-intrinsic env-variables for libbaihook and gosu
+            label_envs_corecount = image_labels.get('ai.backend.envs.corecount', '')
+            envs_corecount = label_envs_corecount.split(',') if label_envs_corecount else []
+            cpu_core_count = len(resource_spec.allocations[DeviceName('cpu')][SlotName('cpu')])
+            environ.update({k: str(cpu_core_count) for k in envs_corecount if k not in environ})
+
+            exposed_ports = [2000, 2001]
+            service_ports = []
+            port_map = {}
+            preopen_ports = ctx.kernel_config.get('preopen_ports')
+            if preopen_ports is None:
+                preopen_ports = []
+
+            if ctx.kernel_config['cluster_role'] in ('main', 'master'):
+                for sport in parse_service_ports(image_labels.get('ai.backend.service-ports', '')):
+                    port_map[sport['name']] = sport
+                port_map['sshd'] = {
+                    'name': 'sshd',
+                    'protocol': ServicePortProtocols('tcp'),
+                    'container_ports': (2200,),
+                    'host_ports': (None,),
+                }
+                port_map['ttyd'] = {
+                    'name': 'ttyd',
+                    'protocol': ServicePortProtocols('http'),
+                    'container_ports': (7681,),
                     'host_ports': (None,),
                 }
-                service_ports.append(sport)
-                for cport in sport['container_ports']:
-                    exposed_ports.append(cport)
-            for sport in port_map.values():
-                service_ports.append(sport)
-                for cport in sport['container_ports']:
-                    exposed_ports.append(cport)
-            log.debug('exposed ports: {!r}', exposed_ports)
-
-        runtime_type = image_labels.get('ai.backend.runtime-type', 'python')
-        runtime_path = image_labels.get('ai.backend.runtime-path', None)
-        cmdargs: List[str] = []
-        if self.local_config['container']['sandbox-type'] == 'jail':
+                for port_no in preopen_ports:
+                    sport = {
+                        'name': str(port_no),
+                        'protocol': ServicePortProtocols('preopen'),
+                        'container_ports': (port_no,),
+                        'host_ports': (None,),
+                    }
+                    service_ports.append(sport)
+                    for cport in sport['container_ports']:
+                        exposed_ports.append(cport)
+                for sport in port_map.values():
+                    service_ports.append(sport)
+                    for cport in sport['container_ports']:
+                        exposed_ports.append(cport)
+                log.debug('exposed ports: {!r}', exposed_ports)
+
+            runtime_type = image_labels.get('ai.backend.runtime-type', 'python')
+            runtime_path = image_labels.get('ai.backend.runtime-path', None)
+            cmdargs: List[str] = []
+            if self.local_config['container']['sandbox-type'] == 'jail':
+                cmdargs += [
+                    "/opt/kernel/jail",
+                    "-policy", "/etc/backend.ai/jail/policy.yml",
+                ]
+                if self.local_config['container']['jail-args']:
+                    cmdargs += map(lambda s: s.strip(), self.local_config['container']['jail-args'])
             cmdargs += [
-                "/opt/kernel/jail",
-                "-policy", "/etc/backend.ai/jail/policy.yml",
+                "/opt/backend.ai/bin/python",
+                "-m", "ai.backend.kernel", runtime_type,
             ]
-            if self.local_config['container']['jail-args']:
-                cmdargs += map(lambda s: s.strip(), self.local_config['container']['jail-args'])
-        cmdargs += [
-            "/opt/backend.ai/bin/python",
-            "-m", "ai.backend.kernel", runtime_type,
-        ]
-        if runtime_path is not None:
-            cmdargs.append(runtime_path)
-
-        # Store information required for restarts.
-        # NOTE: kconfig may be updated after restarts.
-        resource_spec.freeze()
-        await self.restart_kernel__store_config(
-            kernel_id, 'kconfig.dat',
-            pickle.dumps(ctx.kernel_config),
-        )
-        if not restarting:
+            if runtime_path is not None:
+                cmdargs.append(runtime_path)
+
+            # Store information required for restarts.
+            # NOTE: kconfig may be updated after restarts.
+            resource_spec.freeze()
             await self.restart_kernel__store_config(
-                kernel_id, 'cluster.json',
-                json.dumps(cluster_info).encode('utf8'),
+                kernel_id, 'kconfig.dat',
+                pickle.dumps(ctx.kernel_config),
             )
+            if not restarting:
+                await self.restart_kernel__store_config(
+                    kernel_id, 'cluster.json',
+                    json.dumps(cluster_info).encode('utf8'),
+                )
 
-        if self.local_config['debug']['log-kernel-config']:
-            log.info('kernel starting with resource spec: \n{0}',
-                     pretty(attr.asdict(resource_spec)))
-        kernel_obj: KernelObjectType = await ctx.spawn(
-            resource_spec,
-            resource_opts,
-            environ,
-            service_ports,
-            preopen_ports,
-            cmdargs,
-        )
+            if self.local_config['debug']['log-kernel-config']:
+                log.info('kernel starting with resource spec: \n{0}',
+                         pretty(attr.asdict(resource_spec)))
+        except BaseException:
+            if owned_allocations is not None:
+                await self.free_resources(owned_allocations)
+            raise
+
+        with stages.measure('spawn'):
+            kernel_obj: KernelObjectType = await ctx.spawn(
+                resource_spec,
+                resource_opts,
+                environ,
+                service_ports,
+                preopen_ports,
+                cmdargs,
+            )
+        kernel_obj['session_id'] = str(session_id)
         self.kernel_registry[ctx.kernel_id] = kernel_obj
+        self.allocated_kernels.add(ctx.kernel_id)
 
         current_task = asyncio.current_task()
         assert current_task is not None
@@ -1456,7 +1898,8 @@ class AbstractAgent(aobject, Generic[KernelObjectType, KernelCreationContextType
             # Wait until bootstrap script is executed.
             # - Main kernel runner is executed after bootstrap script, and
             #   check_status is accessible only after kernel runner is loaded.
-            await kernel_obj.check_status()
+            with stages.measure('bootstrap'):
+                await kernel_obj.check_status()
 
             # Update the service-ports metadata from the image labels
             # with the extended template metadata from the agent and krunner.
@@ -1479,6 +1922,11 @@ class AbstractAgent(aobject, Generic[KernelObjectType, KernelCreationContextType
                 del self._pending_creation_tasks[kernel_id]
 
         # Finally we are done.
+        kernel_obj['creation_stage_durations'] = stages.durations
+        self.stat_ctx.observe_kernel_creation(stages.durations)
+        log.debug('create_kernel(k:{}): stage durations: {}', kernel_id, ', '.join(
+            f'{stage}={duration:.3f}s' for stage, duration in stages.durations.items()
+        ))
         await self.produce_event(
             KernelStartedEvent(kernel_id, creation_id),
         )
@@ -1740,6 +2188,23 @@ class AbstractAgent(aobject, Generic[KernelObjectType, KernelCreationContextType
     async def get_logs(self, kernel_id: KernelId):
         return await self.kernel_registry[kernel_id].get_logs()
 
+    async def get_kernel_metrics_history(
+        self,
+        kernel_id: KernelId,
+        metric_key: MetricKey,
+        since: float,
+        step: float,
+    ) -> Mapping[str, Any]:
+        history = self.stat_ctx.history
+        points: Sequence[Tuple[float, float]] = []
+        actual_step = step
+        if history is not None:
+            actual_step, points = history.query_kernel(kernel_id, metric_key, since, step)
+        return {
+            'step': actual_step,
+            'points': [[timestamp, value] for timestamp, value in points],
+        }
+
     async def interrupt_kernel(self, kernel_id: KernelId):
         return await self.kernel_registry[kernel_id].interrupt_kernel()
 
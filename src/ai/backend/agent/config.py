@@ -5,6 +5,7 @@ import trafaret as t
 from ai.backend.common import config
 from ai.backend.common import validators as tx
 
+from .metric_history import default_history_tiers
 from .stats import StatModes
 from .types import AgentBackend
 
@@ -16,6 +17,51 @@ coredump_defaults = {
     'size-limit': '64M',
 }
 
+docker_client_defaults = {
+    'max-connections': 32,
+    'max-concurrency': 16,
+    'keepalive-timeout': 30.0,
+    'request-timeout': 30.0,
+}
+
+warm_pool_defaults = {
+    'enabled': False,
+    'images': [],
+    'size': 1,
+    'max-containers': 8,
+    'min-free-ports': 100,
+    'refill-interval': 10.0,
+}
+
+stats_publish_defaults = {
+    'max-batch-size': 256,
+    'agent-hash': False,
+}
+
+stats_history_defaults = {
+    'enabled': False,
+    'max-size': 64 * (2 ** 20),  # bytes
+    'tiers': [list(tier) for tier in default_history_tiers],
+}
+
+stats_exporter_defaults = {
+    'enabled': False,
+    'service-addr': {'host': '127.0.0.1', 'port': 6011},
+}
+
+stats_defaults = {
+    'interval': 5.0,
+    'metric-intervals': {},
+    'jitter': 0.1,
+    'adaptive-threshold': 0.5,
+    'max-interval': 30.0,
+    'sample-batch-size': 32,
+    'spread': 0.5,
+    'history': stats_history_defaults,
+    'publish': stats_publish_defaults,
+    'exporter': stats_exporter_defaults,
+}
+
 agent_local_config_iv = t.Dict({
     t.Key('agent'): t.Dict({
         tx.AliasedKey(['backend', 'mode']): tx.Enum(AgentBackend),
@@ -50,11 +96,42 @@ agent_local_config_iv = t.Dict({
         t.Key('scratch-nfs-address', default=None): t.Null | t.String,
         t.Key('scratch-nfs-options', default=None): t.Null | t.String,
     }).allow_extra('*'),
+    t.Key('stats', default=stats_defaults): t.Dict({
+        t.Key('interval', default=stats_defaults['interval']): t.Float(gt=0),
+        t.Key('metric-intervals', default=stats_defaults['metric-intervals']):
+            t.Mapping(t.String, t.Float(gt=0)),
+        t.Key('jitter', default=stats_defaults['jitter']): t.Float[0:1],
+        t.Key('adaptive-threshold', default=stats_defaults['adaptive-threshold']):
+            t.Float[0:1],
+        t.Key('max-interval', default=stats_defaults['max-interval']): t.Float(gt=0),
+        t.Key('sample-batch-size', default=stats_defaults['sample-batch-size']): t.Int[1:],
+        t.Key('spread', default=stats_defaults['spread']): t.Float[0:1],
+        t.Key('history', default=stats_history_defaults): t.Dict({
+            t.Key('enabled', default=stats_history_defaults['enabled']): t.ToBool,
+            t.Key('max-size', default=stats_history_defaults['max-size']): tx.BinarySize,
+            # a list of [bucket size in seconds, retention in seconds]
+            t.Key('tiers', default=stats_history_defaults['tiers']):
+                t.List(t.Tuple(t.Float(gt=0), t.Float(gt=0)), min_length=1),
+        }).allow_extra('*'),
+        t.Key('publish', default=stats_publish_defaults): t.Dict({
+            t.Key('max-batch-size', default=stats_publish_defaults['max-batch-size']):
+                t.Int[1:],
+            t.Key('agent-hash', default=stats_publish_defaults['agent-hash']): t.ToBool,
+        }).allow_extra('*'),
+        t.Key('exporter', default=stats_exporter_defaults): t.Dict({
+            t.Key('enabled', default=stats_exporter_defaults['enabled']): t.ToBool,
+            t.Key('service-addr', default=stats_exporter_defaults['service-addr']):
+                tx.HostPortPair,
+        }).allow_extra('*'),
+    }).allow_extra('*'),
     t.Key('logging'): t.Any,  # checked in ai.backend.common.logging
     t.Key('resource'): t.Dict({
         t.Key('reserved-cpu', default=1): t.Int,
         t.Key('reserved-mem', default="1G"): tx.BinarySize,
         t.Key('reserved-disk', default="8G"): tx.BinarySize,
+        t.Key('cpu-allocation-strategy', default='evenly'):
+            t.Enum('fill', 'evenly', 'topology'),
+        t.Key('rescan-interval', default=60.0): t.Float(gt=0),
     }).allow_extra('*'),
     t.Key('debug'): t.Dict({
         t.Key('enabled', default=False): t.Bool,
@@ -80,6 +157,25 @@ agent_local_config_iv = t.Dict({
 docker_extra_config_iv = t.Dict({
     t.Key('container'): t.Dict({
         t.Key('swarm-enabled', default=False): t.Bool,
+        t.Key('docker-client', default=docker_client_defaults): t.Dict({
+            t.Key('max-connections', default=docker_client_defaults['max-connections']):
+                t.Int[1:],
+            t.Key('max-concurrency', default=docker_client_defaults['max-concurrency']):
+                t.Int[1:],
+            t.Key('keepalive-timeout', default=docker_client_defaults['keepalive-timeout']):
+                t.Float[0:],
+            t.Key('request-timeout', default=docker_client_defaults['request-timeout']):
+                t.Null | t.Float[0:],
+        }).allow_extra('*'),
+        t.Key('warm-pool', default=warm_pool_defaults): t.Dict({
+            t.Key('enabled', default=warm_pool_defaults['enabled']): t.ToBool,
+            t.Key('images', default=warm_pool_defaults['images']): t.List(t.String),
+            t.Key('size', default=warm_pool_defaults['size']): t.Int[1:],
+            t.Key('max-containers', default=warm_pool_defaults['max-containers']): t.Int[1:],
+            t.Key('min-free-ports', default=warm_pool_defaults['min-free-ports']): t.Int[0:],
+            t.Key('refill-interval', default=warm_pool_defaults['refill-interval']):
+                t.Float(gt=0),
+        }).allow_extra('*'),
     }).allow_extra('*'),
 }).allow_extra('*')
 
@@ -58,20 +58,34 @@ from ai.backend.common.types import (
     SlotName,
     MountPermission,
     MountTypes,
-    ResourceSlot,
     Sentinel,
-    current_resource_slots,
 )
-from ai.backend.common.utils import AsyncFileWriter, current_loop
+from ai.backend.common.utils import current_loop
+from .cgroup import CgroupStatReader
 from .kernel import DockerKernel
+from .procfs import ProcSnapshot
 from .resources import detect_resources
-from .utils import PersistentServiceContainer
-from ..exception import UnsupportedResource, InitializationError
-from ..fs import create_scratch_filesystem, destroy_scratch_filesystem
+from .scratch import ScratchUsageTracker
+from .scratch_template import ScratchTemplate
+from .stats import DockerStatsStreamer
+from .utils import PersistentServiceContainer, PooledDocker
+from .warm_pool import (
+    WarmContainer,
+    WarmContainerPool,
+    get_kernel_binds,
+    kernel_id_label,
+    warm_pool_label,
+)
+from ..config import docker_client_defaults, warm_pool_defaults
+from ..exception import InitializationError
+from ..fs import FileBatch, create_scratch_filesystem, destroy_scratch_filesystem
 from ..kernel import KernelFeatures
 from ..resources import (
     Mount,
     KernelResourceSpec,
+    get_requested_slots,
+    read_resource_spec,
+    resource_spec_binary_filename,
 )
 from ..agent import (
     AbstractAgent,
@@ -83,14 +97,16 @@ from ..agent import (
 from ..proxy import proxy_connection, DomainSocketProxy
 from ..resources import (
     AbstractComputePlugin,
-    known_slot_types,
 )
+from ..scheduler import PeriodicTask
 from ..server import (
     get_extra_volumes,
 )
+from ..stats import StatModes
 from ..types import (
     Container,
     Port,
+    ContainerLifecycleEvent,
     ContainerStatus,
     LifecycleEvent,
 )
@@ -109,7 +125,15 @@ log = BraceStyleAdapter(logging.getLogger(__name__))
 eof_sentinel = Sentinel.TOKEN
 
 
-def container_from_docker_container(src: DockerContainer) -> Container:
+def container_from_docker_container(
+    src: DockerContainer,
+    kernel_id: Optional[KernelId] = None,
+) -> Container:
+    labels = src['Config']['Labels'] or {}
+    if kernel_id is not None and warm_pool_label in labels and kernel_id_label not in labels:
+        # The containers claimed from the warm pool cannot be labeled after creation,
+        # so they get the kernel ID label identified from their names here.
+        labels = {**labels, kernel_id_label: str(kernel_id)}
     ports = []
     for private_port, host_ports in src['NetworkSettings']['Ports'].items():
         private_port = int(private_port.split('/')[0])
@@ -124,7 +148,7 @@ def container_from_docker_container(src: DockerContainer) -> Container:
         id=src._id,
         status=src['State']['Status'],
         image=src['Config']['Image'],
-        labels=src['Config']['Labels'],
+        labels=labels,
         ports=ports,
         backend_obj=src,
     )
@@ -156,6 +180,9 @@ class DockerKernelCreationContext(AbstractKernelCreationContext[DockerKernel]):
     port_pool: Set[int]
     agent_sockpath: Path
     resource_lock: asyncio.Lock
+    docker: Docker
+    warm_pool: Optional[WarmContainerPool]
+    scratch_template: ScratchTemplate
 
     def __init__(
         self,
@@ -166,7 +193,10 @@ class DockerKernelCreationContext(AbstractKernelCreationContext[DockerKernel]):
         port_pool: Set[int],
         agent_sockpath: Path,
         resource_lock: asyncio.Lock,
+        docker: Docker,
         restarting: bool = False,
+        warm_pool: Optional[WarmContainerPool] = None,
+        scratch_template: Optional[ScratchTemplate] = None,
     ) -> None:
         super().__init__(kernel_id, kernel_config, local_config, computers, restarting=restarting)
         scratch_dir = (self.local_config['container']['scratch-root'] / str(kernel_id)).resolve()
@@ -180,40 +210,37 @@ class DockerKernelCreationContext(AbstractKernelCreationContext[DockerKernel]):
         self.port_pool = port_pool
         self.agent_sockpath = agent_sockpath
         self.resource_lock = resource_lock
+        self.docker = docker
+        self.warm_pool = warm_pool
+        if scratch_template is None:
+            scratch_template = ScratchTemplate(
+                self.local_config['container']['scratch-root'] / '.template',
+            )
+        self.scratch_template = scratch_template
 
         self.container_configs = []
         self.domain_socket_proxies = []
         self.computer_docker_args  = {}
 
-    def _kernel_resource_spec_read(self, filename):
-        with open(filename, 'r') as f:
-            resource_spec = KernelResourceSpec.read_from_file(f)
-        return resource_spec
-
     async def get_extra_envs(self) -> Mapping[str, str]:
         return {}
 
+    def get_warm_pool_binds(self) -> Mapping[str, Path]:
+        """
+        Return the per-kernel bind sources which the warm containers bind via symbolic links.
+        """
+        return get_kernel_binds(self.scratch_dir.parent, self.kernel_id)
+
     async def prepare_resource_spec(self) -> Tuple[KernelResourceSpec, Optional[Mapping[str, Any]]]:
         loop = current_loop()
         if self.restarting:
             resource_spec = await loop.run_in_executor(
                 None,
-                self._kernel_resource_spec_read,
-                self.config_dir / 'resource.txt')
+                read_resource_spec,
+                self.config_dir)
             resource_opts = None
         else:
-            slots = ResourceSlot.from_json(self.kernel_config['resource_slots'])
-            # Ensure that we have intrinsic slots.
-            assert SlotName('cpu') in slots
-            assert SlotName('mem') in slots
-            # accept unknown slot type with zero values
-            # but reject if they have non-zero values.
-            for st, sv in slots.items():
-                if st not in known_slot_types and sv != Decimal(0):
-                    raise UnsupportedResource(st)
-            # sanitize the slots
-            current_resource_slots.set(known_slot_types)
-            slots = slots.normalize_slots(ignore_unknown=True)
+            slots = get_requested_slots(self.kernel_config)
             resource_spec = KernelResourceSpec(
                 container_id='',
                 allocations={},
@@ -233,8 +260,10 @@ class DockerKernelCreationContext(AbstractKernelCreationContext[DockerKernel]):
             and self.local_config['container']['scratch-type'] == 'memory'
         ):
             await loop.run_in_executor(None, partial(self.tmp_dir.mkdir, exist_ok=True))
-            await create_scratch_filesystem(self.scratch_dir, 64)
-            await create_scratch_filesystem(self.tmp_dir, 64)
+            await asyncio.gather(
+                create_scratch_filesystem(self.scratch_dir, 64),
+                create_scratch_filesystem(self.tmp_dir, 64),
+            )
         else:
             await loop.run_in_executor(None, partial(self.scratch_dir.mkdir, exist_ok=True))
 
@@ -249,46 +278,14 @@ class DockerKernelCreationContext(AbstractKernelCreationContext[DockerKernel]):
             # we need to touch them first to avoid their "ghost" files are created
             # as root in the host-side filesystem, which prevents deletion of scratch
             # directories when the agent is running as non-root.
-            def _clone_dotfiles():
-                jupyter_custom_css_path = Path(pkg_resources.resource_filename(
-                    'ai.backend.runner', 'jupyter-custom.css'))
-                logo_path = Path(pkg_resources.resource_filename(
-                    'ai.backend.runner', 'logo.svg'))
-                font_path = Path(pkg_resources.resource_filename(
-                    'ai.backend.runner', 'roboto.ttf'))
-                font_italic_path = Path(pkg_resources.resource_filename(
-                    'ai.backend.runner', 'roboto-italic.ttf'))
-                bashrc_path = Path(pkg_resources.resource_filename(
-                    'ai.backend.runner', '.bashrc'))
-                bash_profile_path = Path(pkg_resources.resource_filename(
-                    'ai.backend.runner', '.bash_profile'))
-                vimrc_path = Path(pkg_resources.resource_filename(
-                    'ai.backend.runner', '.vimrc'))
-                tmux_conf_path = Path(pkg_resources.resource_filename(
-                    'ai.backend.runner', '.tmux.conf'))
-                jupyter_custom_dir = (self.work_dir / '.jupyter' / 'custom')
-                jupyter_custom_dir.mkdir(parents=True, exist_ok=True)
-                shutil.copy(jupyter_custom_css_path.resolve(), jupyter_custom_dir / 'custom.css')
-                shutil.copy(logo_path.resolve(), jupyter_custom_dir / 'logo.svg')
-                shutil.copy(font_path.resolve(), jupyter_custom_dir / 'roboto.ttf')
-                shutil.copy(font_italic_path.resolve(), jupyter_custom_dir / 'roboto-italic.ttf')
-                shutil.copy(bashrc_path.resolve(), self.work_dir / '.bashrc')
-                shutil.copy(bash_profile_path.resolve(), self.work_dir / '.bash_profile')
-                shutil.copy(vimrc_path.resolve(), self.work_dir / '.vimrc')
-                shutil.copy(tmux_conf_path.resolve(), self.work_dir / '.tmux.conf')
-                if KernelFeatures.UID_MATCH in self.kernel_features:
-                    uid = self.local_config['container']['kernel-uid']
-                    gid = self.local_config['container']['kernel-gid']
-                    if os.geteuid() == 0:  # only possible when I am root.
-                        os.chown(self.work_dir, uid, gid)
-                        os.chown(self.work_dir / '.jupyter', uid, gid)
-                        os.chown(self.work_dir / '.jupyter' / 'custom', uid, gid)
-                        os.chown(self.work_dir / '.bashrc', uid, gid)
-                        os.chown(self.work_dir / '.bash_profile', uid, gid)
-                        os.chown(self.work_dir / '.vimrc', uid, gid)
-                        os.chown(self.work_dir / '.tmux.conf', uid, gid)
-
-            await loop.run_in_executor(None, _clone_dotfiles)
+            owner = None
+            if KernelFeatures.UID_MATCH in self.kernel_features:
+                if os.geteuid() == 0:  # only possible when I am root.
+                    owner = (
+                        self.local_config['container']['kernel-uid'],
+                        self.local_config['container']['kernel-gid'],
+                    )
+            await loop.run_in_executor(None, self.scratch_template.instantiate, self.work_dir, owner)
 
     async def get_intrinsic_mounts(self) -> Sequence[Mount]:
         loop = current_loop()
@@ -336,8 +333,7 @@ class DockerKernelCreationContext(AbstractKernelCreationContext[DockerKernel]):
             )
 
         # extra mounts
-        async with closing_async(Docker()) as docker:
-            extra_mount_list = await get_extra_volumes(docker, self.image_ref.short)
+        extra_mount_list = await get_extra_volumes(self.docker, self.image_ref.short)
         mounts.extend(Mount(MountTypes.VOLUME, v.name, v.container_path, v.mode)
                       for v in extra_mount_list)
 
@@ -383,7 +379,8 @@ class DockerKernelCreationContext(AbstractKernelCreationContext[DockerKernel]):
 
         return mounts
 
-    def resolve_krunner_filepath(self, filename) -> Path:
+    @classmethod
+    def resolve_krunner_filepath(cls, filename) -> Path:
         return Path(pkg_resources.resource_filename(
             'ai.backend.agent', '../' + filename)).resolve()
 
@@ -482,11 +479,10 @@ class DockerKernelCreationContext(AbstractKernelCreationContext[DockerKernel]):
         self.container_configs.append(container_config)
 
     async def apply_accelerator_allocation(self, computer, device_alloc) -> None:
-        async with closing_async(Docker()) as docker:
-            update_nested_dict(
-                self.computer_docker_args,
-                await computer.generate_docker_args(docker, device_alloc),
-            )
+        update_nested_dict(
+            self.computer_docker_args,
+            await computer.generate_docker_args(self.docker, device_alloc),
+        )
 
     async def spawn(
         self,
@@ -503,21 +499,42 @@ class DockerKernelCreationContext(AbstractKernelCreationContext[DockerKernel]):
         for sport in service_ports:
             exposed_ports.extend(sport['container_ports'])
 
+        owner = None
+        if KernelFeatures.UID_MATCH in self.kernel_features:
+            if os.geteuid() == 0:  # only possible when I am root.
+                owner = (
+                    self.local_config['container']['kernel-uid'],
+                    self.local_config['container']['kernel-gid'],
+                )
+        resource_data: List[Tuple[str, str]] = []
+        for dev_type, device_alloc in resource_spec.allocations.items():
+            computer_self = self.computers[dev_type]
+            kvpairs = await computer_self.instance.generate_resource_data(device_alloc)
+            resource_data.extend(kvpairs.items())
+
+        def _render_resource_txt() -> bytes:
+            with StringIO() as buf:
+                resource_spec.write_to_file(buf)
+                for k, v in resource_data:
+                    buf.write(f'{k}={v}\n')
+                return buf.getvalue().encode('utf8')
+
+        # All config files are built in memory and written at once with a single executor job
+        # after the container id is known.
+        config_files = FileBatch()
         if self.restarting:
-            pass
+            # Keep the files of the previous container as the base ones.
+            for name in ('environ', 'resource'):
+                config_files.add_copy(
+                    self.config_dir / f'{name}.txt',
+                    self.config_dir / f'{name}_base.txt',
+                )
         else:
             # Create bootstrap.sh into workdir if needed
             if bootstrap := self.kernel_config.get('bootstrap_script'):
-
-                def _write_user_bootstrap_script():
-                    (self.work_dir / 'bootstrap.sh').write_text(bootstrap)
-                    if KernelFeatures.UID_MATCH in self.kernel_features:
-                        uid = self.local_config['container']['kernel-uid']
-                        gid = self.local_config['container']['kernel-gid']
-                        if os.geteuid() == 0:
-                            os.chown(self.work_dir / 'bootstrap.sh', uid, gid)
-
-                await loop.run_in_executor(None, _write_user_bootstrap_script)
+                config_files.add_file(
+                    self.work_dir / 'bootstrap.sh', bootstrap.encode('utf8'), owner=owner,
+                )
 
             with StringIO() as buf:
                 for k, v in environ.items():
@@ -525,37 +542,19 @@ class DockerKernelCreationContext(AbstractKernelCreationContext[DockerKernel]):
                 accel_envs = self.computer_docker_args.get('Env', [])
                 for env in accel_envs:
                     buf.write(f'{env}\n')
-                await loop.run_in_executor(
-                    None,
-                    (self.config_dir / 'environ.txt').write_bytes,
-                    buf.getvalue().encode('utf8'),
-                )
-
-            with StringIO() as buf:
-                resource_spec.write_to_file(buf)
-                for dev_type, device_alloc in resource_spec.allocations.items():
-                    computer_self = self.computers[dev_type]
-                    kvpairs = \
-                        await computer_self.instance.generate_resource_data(device_alloc)
-                    for k, v in kvpairs.items():
-                        buf.write(f'{k}={v}\n')
-                await loop.run_in_executor(
-                    None,
-                    (self.config_dir / 'resource.txt').write_bytes,
-                    buf.getvalue().encode('utf8'),
-                )
+                environ_data = buf.getvalue().encode('utf8')
+            config_files.add_file(self.config_dir / 'environ.txt', environ_data)
+            config_files.add_file(self.config_dir / 'environ_base.txt', environ_data)
+            config_files.add_file(self.config_dir / 'resource_base.txt', _render_resource_txt())
 
             docker_creds = self.internal_data.get('docker_credentials')
             if docker_creds:
-                await loop.run_in_executor(
-                    None,
-                    (self.config_dir / 'docker-creds.json').write_text,
-                    json.dumps(docker_creds))
+                config_files.add_file(
+                    self.config_dir / 'docker-creds.json', json.dumps(docker_creds).encode('utf8'),
+                )
 
         # TODO: refactor out dotfiles/sshkey initialization to the base agent?
 
-        shutil.copyfile(self.config_dir / 'environ.txt', self.config_dir / 'environ_base.txt')
-        shutil.copyfile(self.config_dir / 'resource.txt', self.config_dir / 'resource_base.txt')
         # Create SSH keypair only if ssh_keypair internal_data exists and
         # /home/work/.ssh folder is not mounted.
         if self.internal_data.get('ssh_keypair'):
@@ -567,23 +566,9 @@ class DockerKernelCreationContext(AbstractKernelCreationContext[DockerKernel]):
                 pubkey = self.internal_data['ssh_keypair']['public_key'].encode('ascii')
                 privkey = self.internal_data['ssh_keypair']['private_key'].encode('ascii')
                 ssh_dir = self.work_dir / '.ssh'
-
-                def _populate_ssh_config():
-                    ssh_dir.mkdir(parents=True, exist_ok=True)
-                    ssh_dir.chmod(0o700)
-                    (ssh_dir / 'authorized_keys').write_bytes(pubkey)
-                    (ssh_dir / 'authorized_keys').chmod(0o600)
-                    (self.work_dir / 'id_container').write_bytes(privkey)
-                    (self.work_dir / 'id_container').chmod(0o600)
-                    if KernelFeatures.UID_MATCH in self.kernel_features:
-                        uid = self.local_config['container']['kernel-uid']
-                        gid = self.local_config['container']['kernel-gid']
-                        if os.geteuid() == 0:  # only possible when I am root.
-                            os.chown(ssh_dir, uid, gid)
-                            os.chown(ssh_dir / 'authorized_keys', uid, gid)
-                            os.chown(self.work_dir / 'id_container', uid, gid)
-
-                await loop.run_in_executor(None, _populate_ssh_config)
+                config_files.add_dir(ssh_dir, mode=0o700, owner=owner)
+                config_files.add_file(ssh_dir / 'authorized_keys', pubkey, mode=0o600, owner=owner)
+                config_files.add_file(self.work_dir / 'id_container', privkey, mode=0o600, owner=owner)
 
         # higher priority dotfiles are stored last to support overwriting
         for dotfile in self.internal_data.get('dotfiles', []):
@@ -595,21 +580,14 @@ class DockerKernelCreationContext(AbstractKernelCreationContext[DockerKernel]):
                     file_path = Path(dotfile['path'])
             else:
                 file_path = self.work_dir / dotfile['path']
-            file_path.parent.mkdir(parents=True, exist_ok=True)
-            await loop.run_in_executor(
-                None,
-                file_path.write_text,
-                dotfile['data'])
-
-            tmp = Path(file_path)
-            while tmp != self.work_dir:
-                tmp.chmod(int(dotfile['perm'], 8))
-                # only possible when I am root.
-                if KernelFeatures.UID_MATCH in self.kernel_features and os.geteuid() == 0:
-                    uid = self.local_config['container']['kernel-uid']
-                    gid = self.local_config['container']['kernel-gid']
-                    os.chown(tmp, uid, gid)
-                tmp = tmp.parent
+            perm = int(dotfile['perm'], 8)
+            config_files.add_file(file_path, dotfile['data'].encode('utf8'), mode=perm, owner=owner)
+            # The parent directories inside the work directory also get the same permission.
+            if self.work_dir in file_path.parents:
+                tmp = file_path.parent
+                while tmp != self.work_dir:
+                    config_files.add_dir(tmp, mode=perm, owner=owner)
+                    tmp = tmp.parent
 
         # PHASE 4: Run!
         container_bind_host = self.local_config['container']['bind-host']
@@ -639,7 +617,7 @@ class DockerKernelCreationContext(AbstractKernelCreationContext[DockerKernel]):
             'WorkingDir': "/home/work",
             'Hostname': self.kernel_config['cluster_hostname'],
             'Labels': {
-                'ai.backend.kernel-id': str(self.kernel_id),
+                kernel_id_label: str(self.kernel_id),
                 'ai.backend.internal.block-service-ports':
                     '1' if self.internal_data.get('block_service_ports', False) else '0',
             },
@@ -696,77 +674,92 @@ class DockerKernelCreationContext(AbstractKernelCreationContext[DockerKernel]):
 
         # optional local override of docker config
         extra_container_opts_name = 'agent-docker-container-opts.json'
-        for extra_container_opts_file in [
-            Path('/etc/backend.ai') / extra_container_opts_name,
-            Path.home() / '.config' / 'backend.ai' / extra_container_opts_name,
-            Path.cwd() / extra_container_opts_name,
-        ]:
-            if extra_container_opts_file.is_file():
-                try:
-                    extra_container_opts = json.loads(extra_container_opts_file.read_bytes())
-                    update_nested_dict(container_config, extra_container_opts)
-                except IOError:
-                    pass
+
+        def _read_extra_container_opts() -> List[Mapping[str, Any]]:
+            extra_container_opts_list = []
+            for extra_container_opts_file in [
+                Path('/etc/backend.ai') / extra_container_opts_name,
+                Path.home() / '.config' / 'backend.ai' / extra_container_opts_name,
+                Path.cwd() / extra_container_opts_name,
+            ]:
+                if extra_container_opts_file.is_file():
+                    try:
+                        extra_container_opts_list.append(
+                            json.loads(extra_container_opts_file.read_bytes()),
+                        )
+                    except IOError:
+                        pass
+            return extra_container_opts_list
+
+        for extra_container_opts in await loop.run_in_executor(None, _read_extra_container_opts):
+            update_nested_dict(container_config, extra_container_opts)
 
         # We are all set! Create and start the container.
-        async with closing_async(Docker()) as docker:
-            try:
-                container = await docker.containers.create(
-                    config=container_config, name=kernel_name)
-                cid = container._id
-
-                resource_spec.container_id = cid
-                # Write resource.txt again to update the contaienr id.
-                with open(self.config_dir / 'resource.txt', 'w') as f:
-                    await loop.run_in_executor(None, resource_spec.write_to_file, f)
-                async with AsyncFileWriter(
-                    target_filename=self.config_dir / 'resource.txt',
-                    access_mode='a',
-                ) as writer:
-                    for dev_name, device_alloc in resource_spec.allocations.items():
-                        computer_ctx = self.computers[dev_name]
-                        kvpairs = \
-                            await computer_ctx.instance.generate_resource_data(device_alloc)
-                        for k, v in kvpairs.items():
-                            await writer.write(f'{k}={v}\n')
-
-                await container.start()
-            except asyncio.CancelledError:
-                raise
-            except Exception:
-                # Oops, we have to restore the allocated resources!
-                if (sys.platform.startswith('linux') and
-                    self.local_config['container']['scratch-type'] == 'memory'):
-                    await destroy_scratch_filesystem(self.scratch_dir)
-                    await destroy_scratch_filesystem(self.tmp_dir)
-                    await loop.run_in_executor(None, shutil.rmtree, self.tmp_dir)
-                await loop.run_in_executor(None, shutil.rmtree, self.scratch_dir)
+        warm_container: Optional[WarmContainer] = None
+        try:
+            if self.warm_pool is not None:
+                warm_container = await self.warm_pool.claim(
+                    self.image_ref.canonical,
+                    container_config,
+                    kernel_name,
+                    self.get_warm_pool_binds(),
+                )
+            if warm_container is not None:
+                container = warm_container.container
+                # The host ports are already bound to the pre-created container.
                 self.port_pool.update(host_ports)
-                async with self.resource_lock:
-                    for dev_name, device_alloc in resource_spec.allocations.items():
-                        self.computers[dev_name].alloc_map.free(device_alloc)
-                raise
+                host_ports = [warm_container.host_ports[f'{port}/tcp'] for port in exposed_ports]
+            else:
+                container = await self.docker.containers.create(
+                    config=container_config, name=kernel_name)
+            cid = container._id
+
+            resource_spec.container_id = cid
+            config_files.add_file(self.config_dir / 'resource.txt', _render_resource_txt())
+            # The binary resource spec is read by the agent when restoring the kernel.
+            config_files.add_file(
+                self.config_dir / resource_spec_binary_filename,
+                resource_spec.write_to_bytes(),
+            )
+            await loop.run_in_executor(None, config_files.write)
 
-            ctnr_host_port_map: MutableMapping[int, int] = {}
-            stdin_port = 0
-            stdout_port = 0
-            for idx, port in enumerate(exposed_ports):
-                host_port = int((await container.port(port))[0]['HostPort'])
-                assert host_port == host_ports[idx]
-                if port == 2000:     # intrinsic
-                    repl_in_port = host_port
-                elif port == 2001:   # intrinsic
-                    repl_out_port = host_port
-                elif port == 2002:   # legacy
-                    stdin_port = host_port
-                elif port == 2003:   # legacy
-                    stdout_port = host_port
-                else:
-                    ctnr_host_port_map[port] = host_port
-            for sport in service_ports:
-                sport['host_ports'] = tuple(
-                    ctnr_host_port_map[cport] for cport in sport['container_ports']
-                )
+            await container.start()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # Oops, we have to restore the allocated resources!
+            if (sys.platform.startswith('linux') and
+                self.local_config['container']['scratch-type'] == 'memory'):
+                await destroy_scratch_filesystem(self.scratch_dir)
+                await destroy_scratch_filesystem(self.tmp_dir)
+                await loop.run_in_executor(None, shutil.rmtree, self.tmp_dir)
+            await loop.run_in_executor(None, shutil.rmtree, self.scratch_dir)
+            self.port_pool.update(host_ports)
+            async with self.resource_lock:
+                for dev_name, device_alloc in resource_spec.allocations.items():
+                    self.computers[dev_name].alloc_map.free(device_alloc)
+            raise
+
+        ctnr_host_port_map: MutableMapping[int, int] = {}
+        stdin_port = 0
+        stdout_port = 0
+        for idx, port in enumerate(exposed_ports):
+            host_port = int((await container.port(port))[0]['HostPort'])
+            assert host_port == host_ports[idx]
+            if port == 2000:     # intrinsic
+                repl_in_port = host_port
+            elif port == 2001:   # intrinsic
+                repl_out_port = host_port
+            elif port == 2002:   # legacy
+                stdin_port = host_port
+            elif port == 2003:   # legacy
+                stdout_port = host_port
+            else:
+                ctnr_host_port_map[port] = host_port
+        for sport in service_ports:
+            sport['host_ports'] = tuple(
+                ctnr_host_port_map[cport] for cport in sport['container_ports']
+            )
 
         kernel_obj = await DockerKernel.new(
             self.kernel_id,
@@ -791,10 +784,17 @@ class DockerKernelCreationContext(AbstractKernelCreationContext[DockerKernel]):
 
 class DockerAgent(AbstractAgent[DockerKernel, DockerKernelCreationContext]):
 
+    docker: PooledDocker
+    stats_streamer: Optional[DockerStatsStreamer]
+    cgroups: Optional[CgroupStatReader]
+    node_snapshot: Optional[ProcSnapshot]
+    scratch_usage: ScratchUsageTracker
     monitor_docker_task: asyncio.Task
     agent_sockpath: Path
     agent_sock_task: asyncio.Task
     scan_images_timer: asyncio.Task
+    warm_pool: Optional[WarmContainerPool]
+    scratch_template: ScratchTemplate
 
     def __init__(
         self,
@@ -819,17 +819,64 @@ class DockerAgent(AbstractAgent[DockerKernel, DockerKernelCreationContext]):
         DockerContainerError.__reduce__ = _DockerContainerError_reduce   # type: ignore
 
     async def __ainit__(self) -> None:
-        async with closing_async(Docker()) as docker:
-            if not self._skip_initial_scan:
-                docker_version = await docker.version()
-                log.info('running with Docker {0} with API {1}',
-                         docker_version['Version'], docker_version['ApiVersion'])
+        client_config = {
+            **docker_client_defaults,
+            **self.local_config['container'].get('docker-client', {}),
+        }
+        # Also used by legacy accelerator plugins.
+        self.docker = PooledDocker(
+            max_connections=client_config['max-connections'],
+            max_concurrency=client_config['max-concurrency'],
+            keepalive_timeout=client_config['keepalive-timeout'],
+            request_timeout=client_config['request-timeout'],
+        )
+        self.stat_ctx.docker = self.docker
+        self.stats_streamer = None
+        if self.stat_ctx.mode == StatModes.DOCKER_STREAM:
+            self.stats_streamer = DockerStatsStreamer()
+            self.stat_ctx.docker_stats = self.stats_streamer.samples
+        self.cgroups = None
+        if self.stat_ctx.mode == StatModes.CGROUP:
+            self.cgroups = CgroupStatReader()
+            self.stat_ctx.cgroups = self.cgroups
+        self.node_snapshot = None
+        if sys.platform.startswith('linux'):
+            self.node_snapshot = ProcSnapshot()
+            self.stat_ctx.node_snapshot = self.node_snapshot
+        self.scratch_usage = ScratchUsageTracker()
+        await self.scratch_usage.start()
+        self.stat_ctx.scratch_usage = self.scratch_usage
+        self.warm_pool = None
+        warm_pool_config = {
+            **warm_pool_defaults,
+            **self.local_config['container'].get('warm-pool', {}),
+        }
+        if warm_pool_config['enabled']:
+            self.warm_pool = WarmContainerPool(
+                self.docker,
+                self.port_pool,
+                self.local_config['container']['scratch-root'],
+                images=warm_pool_config['images'],
+                size=warm_pool_config['size'],
+                max_containers=warm_pool_config['max-containers'],
+                min_free_ports=warm_pool_config['min-free-ports'],
+            )
+            self.stat_ctx.warm_pool = self.warm_pool
+        self.scratch_template = ScratchTemplate(
+            self.local_config['container']['scratch-root'] / '.template',
+        )
+        await current_loop().run_in_executor(None, self.scratch_template.build)
+        if not self._skip_initial_scan:
+            docker_version = await self.docker.version()
+            log.info('running with Docker {0} with API {1}',
+                     docker_version['Version'], docker_version['ApiVersion'])
         await super().__ainit__()
         await self.check_swarm_status()
         if self.heartbeat_extra_info['swarm_enabled']:
             log.info('The Docker Swarm cluster is configured and enabled')
         (ipc_base_path / 'container').mkdir(parents=True, exist_ok=True)
         self.agent_sockpath = ipc_base_path / 'container' / f'agent.{self.local_instance_id}.sock'
+        DockerKernelCreationContext.prepare_krunner_mount_plans(self.local_config)
         socket_relay_name = f"backendai-socket-relay.{self.local_instance_id}"
         socket_relay_container = PersistentServiceContainer(
             'backendai-socket-relay:latest',
@@ -855,9 +902,16 @@ class DockerAgent(AbstractAgent[DockerKernel, DockerKernelCreationContext]):
         self.agent_sock_task = asyncio.create_task(self.handle_agent_socket())
         self.monitor_docker_task = asyncio.create_task(self.monitor_docker_events())
         self.monitor_swarm_task = asyncio.create_task(self.check_swarm_status(as_task=True))
-
-        # For legacy accelerator plugins
-        self.docker = Docker()
+        if self.warm_pool is not None:
+            await self.warm_pool.start()
+            self.timer_tasks.append(
+                PeriodicTask(
+                    self.warm_pool.refill,
+                    warm_pool_config['refill-interval'],
+                    name='refill_warm_pool',
+                    jitter=0.1,
+                ).start(),
+            )
 
     async def shutdown(self, stop_signal: signal.Signals):
         # Stop handling agent sock.
@@ -877,9 +931,37 @@ class DockerAgent(AbstractAgent[DockerKernel, DockerKernelCreationContext]):
             self.monitor_swarm_task.cancel()
             await self.monitor_swarm_task
 
+        if self.stats_streamer is not None:
+            await self.stats_streamer.close()
+        if self.cgroups is not None:
+            self.cgroups.close()
+        if self.node_snapshot is not None:
+            self.node_snapshot.close()
+        await self.scratch_usage.close()
+        if self.warm_pool is not None:
+            await self.warm_pool.close()
+
         if self.docker:
             await self.docker.close()
 
+    async def collect_node_stat(self, interval: float):
+        if self.local_config['debug']['log-stats']:
+            log.debug('docker client: {0}', self.docker.get_stats())
+            if self.warm_pool is not None:
+                log.debug('warm pool: {0}', self.warm_pool.get_stats())
+        await super().collect_node_stat(interval)
+
+    async def _handle_start_event(self, ev: ContainerLifecycleEvent) -> None:
+        await super()._handle_start_event(ev)
+        if ev.container_id is not None:
+            if self.stats_streamer is not None:
+                self.stats_streamer.start(ev.container_id)
+            await self.scratch_usage.register(
+                ev.kernel_id,
+                ev.container_id,
+                self.local_config['container']['scratch-root'] / str(ev.kernel_id),
+            )
+
     async def detect_resources(self) -> Tuple[
         Mapping[DeviceName, AbstractComputePlugin],
         Mapping[SlotName, Decimal],
@@ -892,34 +974,33 @@ class DockerAgent(AbstractAgent[DockerKernel, DockerKernelCreationContext]):
     ) -> Sequence[Tuple[KernelId, Container]]:
         result = []
         fetch_tasks = []
-        async with closing_async(Docker()) as docker:
-            for container in (await docker.containers.list()):
+        for container in (await self.docker.containers.list()):
 
-                async def _fetch_container_info(container):
-                    kernel_id = "(unknown)"
-                    try:
-                        kernel_id = await get_kernel_id_from_container(container)
-                        if kernel_id is None:
-                            return
-                        if container['State']['Status'] in status_filter:
-                            await container.show()
-                            result.append(
-                                (
-                                    kernel_id,
-                                    container_from_docker_container(container),
-                                ),
-                            )
-                    except asyncio.CancelledError:
-                        pass
-                    except Exception:
-                        log.exception(
-                            "error while fetching container information (cid:{}, k:{})",
-                            container._id, kernel_id,
+            async def _fetch_container_info(container):
+                kernel_id = "(unknown)"
+                try:
+                    kernel_id = await get_kernel_id_from_container(container)
+                    if kernel_id is None:
+                        return
+                    if container['State']['Status'] in status_filter:
+                        await container.show()
+                        result.append(
+                            (
+                                kernel_id,
+                                container_from_docker_container(container, kernel_id),
+                            ),
                         )
+                except asyncio.CancelledError:
+                    pass
+                except Exception:
+                    log.exception(
+                        "error while fetching container information (cid:{}, k:{})",
+                        container._id, kernel_id,
+                    )
 
-                fetch_tasks.append(_fetch_container_info(container))
+            fetch_tasks.append(_fetch_container_info(container))
 
-            await asyncio.gather(*fetch_tasks, return_exceptions=True)
+        await asyncio.gather(*fetch_tasks, return_exceptions=True)
         return result
 
     async def check_swarm_status(self, as_task=False):
@@ -931,13 +1012,12 @@ class DockerAgent(AbstractAgent[DockerKernel, DockerKernelCreationContext]):
                     swarm_enabled = self.local_config['container'].get('swarm-enabled', False)
                     if not swarm_enabled:
                         continue
-                    async with closing_async(Docker()) as docker:
-                        docker_info = await docker.system.info()
-                        if docker_info['Swarm']['LocalNodeState'] == 'inactive':
-                            raise InitializationError(
-                                "The swarm mode is enabled but the node state of "
-                                "the local Docker daemon is inactive.",
-                            )
+                    docker_info = await self.docker.system.info()
+                    if docker_info['Swarm']['LocalNodeState'] == 'inactive':
+                        raise InitializationError(
+                            "The swarm mode is enabled but the node state of "
+                            "the local Docker daemon is inactive.",
+                        )
                 except InitializationError as e:
                     log.exception(str(e))
                     swarm_enabled = False
@@ -951,27 +1031,26 @@ class DockerAgent(AbstractAgent[DockerKernel, DockerKernelCreationContext]):
             pass
 
     async def scan_images(self) -> Mapping[str, str]:
-        async with closing_async(Docker()) as docker:
-            all_images = await docker.images.list()
-            updated_images = {}
-            for image in all_images:
-                if image['RepoTags'] is None:
+        all_images = await self.docker.images.list()
+        updated_images = {}
+        for image in all_images:
+            if image['RepoTags'] is None:
+                continue
+            for repo_tag in image['RepoTags']:
+                if repo_tag.endswith('<none>'):
                     continue
-                for repo_tag in image['RepoTags']:
-                    if repo_tag.endswith('<none>'):
-                        continue
-                    img_detail = await docker.images.inspect(repo_tag)
-                    labels = img_detail['Config']['Labels']
-                    if labels is None or 'ai.backend.kernelspec' not in labels:
-                        continue
-                    kernelspec = int(labels['ai.backend.kernelspec'])
-                    if MIN_KERNELSPEC <= kernelspec <= MAX_KERNELSPEC:
-                        updated_images[repo_tag] = img_detail['Id']
-            for added_image in (updated_images.keys() - self.images.keys()):
-                log.debug('found kernel image: {0}', added_image)
-            for removed_image in (self.images.keys() - updated_images.keys()):
-                log.debug('removed kernel image: {0}', removed_image)
-            return updated_images
+                img_detail = await self.docker.images.inspect(repo_tag)
+                labels = img_detail['Config']['Labels']
+                if labels is None or 'ai.backend.kernelspec' not in labels:
+                    continue
+                kernelspec = int(labels['ai.backend.kernelspec'])
+                if MIN_KERNELSPEC <= kernelspec <= MAX_KERNELSPEC:
+                    updated_images[repo_tag] = img_detail['Id']
+        for added_image in (updated_images.keys() - self.images.keys()):
+            log.debug('found kernel image: {0}', added_image)
+        for removed_image in (self.images.keys() - updated_images.keys()):
+            log.debug('removed kernel image: {0}', removed_image)
+        return updated_images
 
     async def handle_agent_socket(self):
         """
@@ -1058,18 +1137,16 @@ class DockerAgent(AbstractAgent[DockerKernel, DockerKernelCreationContext]):
                 'auth': encoded_creds,
             }
         log.info('pulling image {} from registry', image_ref.canonical)
-        async with closing_async(Docker()) as docker:
-            await docker.images.pull(
-                image_ref.canonical,
-                auth=auth_config)
+        await self.docker.images.pull(
+            image_ref.canonical,
+            auth=auth_config)
 
     async def check_image(self, image_ref: ImageRef, image_id: str, auto_pull: AutoPullBehavior) -> bool:
         try:
-            async with closing_async(Docker()) as docker:
-                image_info = await docker.images.inspect(image_ref.canonical)
-                if auto_pull == AutoPullBehavior.DIGEST:
-                    if image_info['Id'] != image_id:
-                        return True
+            image_info = await self.docker.images.inspect(image_ref.canonical)
+            if auto_pull == AutoPullBehavior.DIGEST:
+                if image_info['Id'] != image_id:
+                    return True
             log.info('found the local up-to-date image for {}', image_ref.canonical)
         except DockerError as e:
             if e.status == 404:
@@ -1098,7 +1175,10 @@ class DockerAgent(AbstractAgent[DockerKernel, DockerKernelCreationContext]):
             self.port_pool,
             self.agent_sockpath,
             self.resource_lock,
+            self.docker,
             restarting=restarting,
+            warm_pool=self.warm_pool,
+            scratch_template=self.scratch_template,
         )
 
     async def restart_kernel__load_config(
@@ -1137,21 +1217,18 @@ class DockerAgent(AbstractAgent[DockerKernel, DockerKernelCreationContext]):
         if container_id is None:
             return
         try:
-            async with closing_async(Docker()) as docker:
-                container = docker.containers.container(container_id)
-                # The default timeout of the docker stop API is 10 seconds
-                # to kill if container does not self-terminate.
-                await container.stop()
+            container = self.docker.containers.container(container_id)
+            # The default timeout of the docker stop API is 10 seconds
+            # to kill if container does not self-terminate.
+            await container.stop()
         except DockerError as e:
             if e.status == 409 and 'is not running' in e.message:
                 # already dead
                 log.warning('destroy_kernel(k:{0}) already dead', kernel_id)
-                await self.rescan_resource_usage()
             elif e.status == 404:
                 # missing
                 log.warning('destroy_kernel(k:{0}) kernel missing, '
                             'forgetting this kernel', kernel_id)
-                await self.rescan_resource_usage()
             else:
                 log.exception('destroy_kernel(k:{0}) kill error', kernel_id)
                 self.error_monitor.capture_exception()
@@ -1163,108 +1240,106 @@ class DockerAgent(AbstractAgent[DockerKernel, DockerKernelCreationContext]):
         restarting: bool,
     ) -> None:
         loop = current_loop()
-        async with closing_async(Docker()) as docker:
-            if container_id is not None:
-                container = docker.containers.container(container_id)
-
-                async def log_iter():
-                    it = container.log(
-                        stdout=True, stderr=True, follow=True,
-                    )
-                    async with aiotools.aclosing(it):
-                        async for line in it:
-                            yield line.encode('utf-8')
-
-                try:
-                    with timeout(60):
-                        await self.collect_logs(kernel_id, container_id, log_iter())
-                except asyncio.TimeoutError:
-                    log.warning('timeout for collecting container logs (k:{}, cid:{})',
-                                kernel_id, container_id)
-                except Exception as e:
-                    log.warning('error while collecting container logs (k:{}, cid:{})',
-                                kernel_id, container_id, exc_info=e)
+        if self.stats_streamer is not None and container_id is not None:
+            await self.stats_streamer.stop(container_id)
+        if self.cgroups is not None and container_id is not None:
+            self.cgroups.release(container_id)
+        if container_id is not None:
+            self.scratch_usage.unregister(container_id)
+        if container_id is not None:
+            container = self.docker.containers.container(container_id)
+
+            async def log_iter():
+                it = container.log(
+                    stdout=True, stderr=True, follow=True,
+                )
+                async with aiotools.aclosing(it):
+                    async for line in it:
+                        yield line.encode('utf-8')
 
-            kernel_obj = self.kernel_registry.get(kernel_id)
-            if kernel_obj is not None:
-                for domain_socket_proxy in kernel_obj.get('domain_socket_proxies', []):
-                    if domain_socket_proxy.proxy_server.is_serving():
-                        domain_socket_proxy.proxy_server.close()
-                        await domain_socket_proxy.proxy_server.wait_closed()
-                        try:
-                            domain_socket_proxy.host_proxy_path.unlink()
-                        except IOError:
-                            pass
+            try:
+                with timeout(60):
+                    await self.collect_logs(kernel_id, container_id, log_iter())
+            except asyncio.TimeoutError:
+                log.warning('timeout for collecting container logs (k:{}, cid:{})',
+                            kernel_id, container_id)
+            except Exception as e:
+                log.warning('error while collecting container logs (k:{}, cid:{})',
+                            kernel_id, container_id, exc_info=e)
+
+        kernel_obj = self.kernel_registry.get(kernel_id)
+        if kernel_obj is not None:
+            for domain_socket_proxy in kernel_obj.get('domain_socket_proxies', []):
+                if domain_socket_proxy.proxy_server.is_serving():
+                    domain_socket_proxy.proxy_server.close()
+                    await domain_socket_proxy.proxy_server.wait_closed()
+                    try:
+                        domain_socket_proxy.host_proxy_path.unlink()
+                    except IOError:
+                        pass
 
-            if not self.local_config['debug']['skip-container-deletion'] and container_id is not None:
-                container = docker.containers.container(container_id)
-                try:
-                    with timeout(90):
-                        await container.delete(force=True, v=True)
-                except DockerError as e:
-                    if e.status == 409 and 'already in progress' in e.message:
-                        return
-                    elif e.status == 404:
-                        return
-                    else:
-                        log.exception(
-                            'unexpected docker error while deleting container (k:{}, c:{})',
+        if not self.local_config['debug']['skip-container-deletion'] and container_id is not None:
+            container = self.docker.containers.container(container_id)
+            try:
+                with timeout(90):
+                    await container.delete(force=True, v=True)
+            except DockerError as e:
+                if e.status == 409 and 'already in progress' in e.message:
+                    return
+                elif e.status == 404:
+                    return
+                else:
+                    log.exception(
+                        'unexpected docker error while deleting container (k:{}, c:{})',
+                        kernel_id, container_id)
+            except asyncio.TimeoutError:
+                log.warning('container deletion timeout (k:{}, c:{})',
                             kernel_id, container_id)
-                except asyncio.TimeoutError:
-                    log.warning('container deletion timeout (k:{}, c:{})',
-                                kernel_id, container_id)
-
-            if not restarting:
-                scratch_root = self.local_config['container']['scratch-root']
-                scratch_dir = scratch_root / str(kernel_id)
-                tmp_dir = scratch_root / f'{kernel_id}_tmp'
-                try:
-                    if (sys.platform.startswith('linux') and
-                        self.local_config['container']['scratch-type'] == 'memory'):
-                        await destroy_scratch_filesystem(scratch_dir)
-                        await destroy_scratch_filesystem(tmp_dir)
-                        await loop.run_in_executor(None, shutil.rmtree, tmp_dir)
-                    await loop.run_in_executor(None, shutil.rmtree, scratch_dir)
-                except CalledProcessError:
-                    pass
-                except FileNotFoundError:
-                    pass
+
+        if not restarting:
+            scratch_root = self.local_config['container']['scratch-root']
+            scratch_dir = scratch_root / str(kernel_id)
+            tmp_dir = scratch_root / f'{kernel_id}_tmp'
+            try:
+                if (sys.platform.startswith('linux') and
+                    self.local_config['container']['scratch-type'] == 'memory'):
+                    await destroy_scratch_filesystem(scratch_dir)
+                    await destroy_scratch_filesystem(tmp_dir)
+                    await loop.run_in_executor(None, shutil.rmtree, tmp_dir)
+                await loop.run_in_executor(None, shutil.rmtree, scratch_dir)
+            except CalledProcessError:
+                pass
+            except FileNotFoundError:
+                pass
 
     async def create_overlay_network(self, network_name: str) -> None:
         if not self.heartbeat_extra_info['swarm_enabled']:
             raise RuntimeError("This agent has not joined to a swarm cluster.")
-        async with closing_async(Docker()) as docker:
-            await docker.networks.create({
-                'Name': network_name,
-                'Driver': 'overlay',
-                'Attachable': True,
-                'Labels': {
-                    'ai.backend.cluster-network': '1',
-                },
-            })
+        await self.docker.networks.create({
+            'Name': network_name,
+            'Driver': 'overlay',
+            'Attachable': True,
+            'Labels': {
+                'ai.backend.cluster-network': '1',
+            },
+        })
 
     async def destroy_overlay_network(self, network_name: str) -> None:
-        docker = Docker()
-        try:
-            network = await docker.networks.get(network_name)
-            await network.delete()
-        finally:
-            await docker.close()
+        network = await self.docker.networks.get(network_name)
+        await network.delete()
 
     async def create_local_network(self, network_name: str) -> None:
-        async with closing_async(Docker()) as docker:
-            await docker.networks.create({
-                'Name': network_name,
-                'Driver': 'bridge',
-                'Labels': {
-                    'ai.backend.cluster-network': '1',
-                },
-            })
+        await self.docker.networks.create({
+            'Name': network_name,
+            'Driver': 'bridge',
+            'Labels': {
+                'ai.backend.cluster-network': '1',
+            },
+        })
 
     async def destroy_local_network(self, network_name: str) -> None:
-        async with closing_async(Docker()) as docker:
-            network = await docker.networks.get(network_name)
-            await network.delete()
+        network = await self.docker.networks.get(network_name)
+        await network.delete()
 
     async def monitor_docker_events(self):
 
@@ -0,0 +1,305 @@
+"""
+A cgroup-based statistics reader for Docker containers.
+
+It supports both the legacy (v1) and the unified (v2) cgroup hierarchies
+with either the cgroupfs or the systemd cgroup driver of Docker.
+The files are opened once per container and kept open until the container is released,
+so that each collection costs a single ``pread()`` syscall per file
+instead of a path lookup, open, read, and close.
+The network statistics of a container are read in the same way from ``/proc/<pid>/net/dev``
+of a process in the container, which reflects the network namespace of the container.
+"""
+
+import enum
+import logging
+import os
+from pathlib import Path
+from typing import (
+    Dict,
+    Mapping,
+    MutableMapping,
+    Optional,
+    Set,
+    Tuple,
+)
+
+from ai.backend.common.logging import BraceStyleAdapter
+
+from .procfs import parse_net_dev, proc_root
+
+log = BraceStyleAdapter(logging.getLogger(__name__))
+
+cgroup_root = Path('/sys/fs/cgroup')
+_read_size = 64 * 1024
+
+
+class CgroupVersion(enum.Enum):
+    V1 = 'v1'
+    V2 = 'v2'
+
+
+def detect_cgroup_version(root: Path = cgroup_root) -> CgroupVersion:
+    """
+    Returns the cgroup hierarchy version used by the host.
+    A hybrid hierarchy is treated as v1, as Docker places the containers there.
+    """
+    if (root / 'cgroup.controllers').exists():
+        return CgroupVersion.V2
+    return CgroupVersion.V1
+
+
+def get_container_cgroup_path(
+    container_id: str,
+    version: CgroupVersion,
+    controller: str = '',
+    root: Path = cgroup_root,
+) -> Path:
+    """
+    Returns the cgroup directory of the given container, trying both
+    the cgroupfs driver layout ("docker/<cid>") and the systemd driver layout
+    ("system.slice/docker-<cid>.scope").
+    """
+    base = root if version == CgroupVersion.V2 else root / controller
+    candidates = [
+        base / 'docker' / container_id,
+        base / 'system.slice' / f'docker-{container_id}.scope',
+    ]
+    for path in candidates:
+        if path.is_dir():
+            return path
+    raise FileNotFoundError(f'cgroup of container {container_id[:12]} not found under {base}')
+
+
+def parse_flat_keyed(data: str) -> Dict[str, int]:
+    # example data (cpu.stat):
+    #   usage_usec 2071350
+    #   user_usec 1554370
+    #   system_usec 516980
+    result = {}
+    for line in data.splitlines():
+        key, _, value = line.partition(' ')
+        if value:
+            result[key] = int(value)
+    return result
+
+
+def parse_io_stat(data: str) -> Tuple[int, int]:
+    # example data (io.stat):
+    #   8:0 rbytes=13918208 wbytes=0 rios=340 wios=0 dbytes=0 dios=0
+    io_read_bytes = 0
+    io_write_bytes = 0
+    for line in data.splitlines():
+        for field in line.split()[1:]:
+            key, _, value = field.partition('=')
+            if key == 'rbytes':
+                io_read_bytes += int(value)
+            elif key == 'wbytes':
+                io_write_bytes += int(value)
+    return io_read_bytes, io_write_bytes
+
+
+def parse_blkio_service_bytes(data: str) -> Tuple[int, int]:
+    # example data (blkio.throttle.io_service_bytes):
+    #   8:0 Read 13918208
+    #   8:0 Write 0
+    #   8:0 Sync 0
+    #   8:0 Async 13918208
+    #   8:0 Total 13918208
+    #   Total 13918208
+    io_read_bytes = 0
+    io_write_bytes = 0
+    for line in data.splitlines():
+        if line.startswith('Total '):
+            continue
+        dev, op, nbytes = line.strip().split()
+        if op == 'Read':
+            io_read_bytes += int(nbytes)
+        elif op == 'Write':
+            io_write_bytes += int(nbytes)
+    return io_read_bytes, io_write_bytes
+
+
+def parse_pressure(data: str) -> Mapping[str, Mapping[str, float]]:
+    # example data (memory.pressure):
+    #   some avg10=0.00 avg60=0.00 avg300=0.00 total=0
+    #   full avg10=0.00 avg60=0.00 avg300=0.00 total=0
+    result = {}
+    for line in data.splitlines():
+        kind, *fields = line.split()
+        result[kind] = {
+            key: float(value)
+            for key, _, value in (field.partition('=') for field in fields)
+        }
+    return result
+
+
+class ContainerCgroup:
+    """
+    Keeps the cgroup stat files of a container open and re-reads them from the offset zero.
+    """
+
+    # (controller in v1, filename in v1, filename in v2)
+    _files: Mapping[str, Tuple[str, Optional[str], str]] = {
+        'cpu': ('cpuacct', 'cpuacct.usage', 'cpu.stat'),
+        'memory': ('memory', 'memory.usage_in_bytes', 'memory.current'),
+        'io': ('blkio', 'blkio.throttle.io_service_bytes', 'io.stat'),
+        'cpu.throttling': ('cpu', 'cpu.stat', 'cpu.stat'),
+        'memory.events': ('memory', 'memory.oom_control', 'memory.events'),
+        'cpu.pressure': ('cpu', None, 'cpu.pressure'),
+        'memory.pressure': ('memory', None, 'memory.pressure'),
+        'io.pressure': ('blkio', None, 'io.pressure'),
+        'procs': ('memory', 'cgroup.procs', 'cgroup.procs'),
+    }
+
+    def __init__(
+        self,
+        container_id: str,
+        version: CgroupVersion,
+        root: Path = cgroup_root,
+        proc_root: Path = proc_root,
+    ) -> None:
+        self.container_id = container_id
+        self.version = version
+        self.root = root
+        self.proc_root = proc_root
+        self._fds: MutableMapping[str, int] = {}
+        # the files not provided by the kernel (e.g., PSI without CONFIG_PSI)
+        self._unsupported: Set[str] = set()
+
+    def _open(self, key: str) -> int:
+        controller, v1_filename, v2_filename = self._files[key]
+        filename: Optional[str]
+        if self.version == CgroupVersion.V2:
+            filename = v2_filename
+        else:
+            filename = v1_filename
+        if filename is None:
+            self._unsupported.add(key)
+            raise FileNotFoundError(f'{key} is not supported in cgroup {self.version.value}')
+        path = get_container_cgroup_path(self.container_id, self.version, controller, self.root)
+        try:
+            return os.open(path / filename, os.O_RDONLY | os.O_CLOEXEC)
+        except FileNotFoundError:
+            # The cgroup directory exists but the file does not.
+            self._unsupported.add(key)
+            raise
+
+    def read(self, key: str) -> str:
+        if key in self._unsupported:
+            raise FileNotFoundError(f'{key} is not supported by the kernel')
+        fd = self._fds.get(key)
+        if fd is None:
+            fd = self._open(key)
+            self._fds[key] = fd
+        try:
+            return os.pread(fd, _read_size, 0).decode('ascii')
+        except OSError:
+            # The cgroup may have been removed and recreated (e.g., container restarts).
+            self._fds.pop(key, None)
+            os.close(fd)
+            raise
+
+    def read_cpu_used(self) -> float:
+        """
+        Returns the accumulated CPU time in msec.
+        """
+        data = self.read('cpu')
+        if self.version == CgroupVersion.V2:
+            return parse_flat_keyed(data)['usage_usec'] / 1e3
+        return int(data) / 1e6
+
+    def read_mem_used(self) -> int:
+        return int(self.read('memory'))
+
+    def read_io_bytes(self) -> Tuple[int, int]:
+        data = self.read('io')
+        if self.version == CgroupVersion.V2:
+            return parse_io_stat(data)
+        return parse_blkio_service_bytes(data)
+
+    def read_cpu_throttling(self) -> Tuple[int, float]:
+        """
+        Returns the number of throttled periods and the accumulated throttled time in msec.
+        """
+        data = parse_flat_keyed(self.read('cpu.throttling'))
+        if self.version == CgroupVersion.V2:
+            return data['nr_throttled'], data['throttled_usec'] / 1e3
+        return data['nr_throttled'], data['throttled_time'] / 1e6
+
+    def read_memory_events(self) -> Mapping[str, int]:
+        """
+        Returns the accumulated counts of memory events such as "oom" and "oom_kill".
+        cgroup v1 provides only "oom_kill" (since Linux 4.13).
+        """
+        return parse_flat_keyed(self.read('memory.events'))
+
+    def read_pressure(self, resource: str) -> Mapping[str, Mapping[str, float]]:
+        return parse_pressure(self.read(f'{resource}.pressure'))
+
+    def _open_net_dev(self) -> int:
+        pids = self.read('procs').split()
+        if not pids:
+            raise ProcessLookupError(f'no process in container {self.container_id[:12]}')
+        pid_path = self.proc_root / pids[0]
+        netns_inode = os.stat(pid_path / 'ns' / 'net').st_ino
+        if netns_inode == os.stat(self.proc_root / 'self' / 'ns' / 'net').st_ino:
+            # The traffic of containers using the host network cannot be distinguished.
+            self._unsupported.add('net.dev')
+            raise FileNotFoundError(f'container {self.container_id[:12]} uses the host network')
+        # The opened file keeps referring to the network namespace
+        # even after the process exits.
+        return os.open(pid_path / 'net' / 'dev', os.O_RDONLY | os.O_CLOEXEC)
+
+    def read_net_bytes(self) -> Tuple[int, int]:
+        """
+        Returns the received and transmitted bytes over the network interfaces
+        of the container except the loopback interface.
+        """
+        if 'net.dev' in self._unsupported:
+            raise FileNotFoundError('net.dev is not supported for the container')
+        fd = self._fds.get('net.dev')
+        if fd is None:
+            fd = self._open_net_dev()
+            self._fds['net.dev'] = fd
+        try:
+            data = os.pread(fd, _read_size, 0)
+        except OSError:
+            self._fds.pop('net.dev', None)
+            os.close(fd)
+            raise
+        return parse_net_dev(data, skip_loopback=True)
+
+    def close(self) -> None:
+        for fd in self._fds.values():
+            os.close(fd)
+        self._fds.clear()
+
+
+class CgroupStatReader:
+    """
+    Maintains the open cgroup stat files of live containers.
+    """
+
+    def __init__(self, root: Path = cgroup_root, proc_root: Path = proc_root) -> None:
+        self.root = root
+        self.proc_root = proc_root
+        self.version = detect_cgroup_version(root)
+        self._cgroups: MutableMapping[str, ContainerCgroup] = {}
+        log.info('using cgroup {} stat reader', self.version.value)
+
+    def get(self, container_id: str) -> ContainerCgroup:
+        cgroup = self._cgroups.get(container_id)
+        if cgroup is None:
+            cgroup = ContainerCgroup(container_id, self.version, self.root, self.proc_root)
+            self._cgroups[container_id] = cgroup
+        return cgroup
+
+    def release(self, container_id: str) -> None:
+        cgroup = self._cgroups.pop(container_id, None)
+        if cgroup is not None:
+            cgroup.close()
+
+    def close(self) -> None:
+        for cgroup in self._cgroups.values():
+            cgroup.close()
+        self._cgroups.clear()
@@ -5,14 +5,16 @@ import os
 from pathlib import Path
 import platform
 from typing import (
-    cast,
     Any,
+    Callable,
     Collection,
     Dict,
     List,
     Mapping,
     Optional,
     Sequence,
+    TypeVar,
+    Union,
 )
 
 import aiohttp
@@ -33,9 +35,12 @@ from .agent import Container
 from .resources import (
     get_resource_spec_from_container,
 )
+from .stats import is_valid_stats_sample
 from .. import __version__
 from ..resources import (
     AbstractAllocMap, DeviceSlotInfo,
+    AllocationStrategy,
+    DeviceTopology,
     DiscretePropertyAllocMap,
     AbstractComputeDevice,
     AbstractComputePlugin,
@@ -44,11 +49,23 @@ from ..stats import (
     StatContext, NodeMeasurement, ContainerMeasurement,
     StatModes, MetricTypes, Measurement,
 )
-from ..utils import closing_async, read_sysfs
-from ..vendor.linux import libnuma
+from ..vendor.linux import get_online_cpus, libnuma
 
 log = BraceStyleAdapter(logging.getLogger(__name__))
 
+T = TypeVar('T')
+
+
+def read_optional_cgroup_stat(read: Callable[..., T], *args: Any) -> Optional[T]:
+    """
+    Returns None if the stat file is not provided by the cgroup version or the kernel,
+    or if there is no process to read the per-process stat file from.
+    """
+    try:
+        return read(*args)
+    except (FileNotFoundError, ProcessLookupError):
+        return None
+
 
 async def fetch_api_stats(container: DockerContainer) -> Optional[Dict[str, Any]]:
     short_cid = container._id[:7]
@@ -79,10 +96,7 @@ async def fetch_api_stats(container: DockerContainer) -> Optional[Dict[str, Any]
                 short_cid, ret,
             )
             return None
-        if (
-            ret['read'].startswith('0001-01-01') or
-            ret['preread'].startswith('0001-01-01')
-        ):
+        if not is_valid_stats_sample(ret):
             return None
         return ret
 
@@ -146,12 +160,30 @@ class CPUPlugin(AbstractComputePlugin):
         }
 
     async def gather_node_measures(self, ctx: StatContext) -> Sequence[NodeMeasurement]:
-        _cstat = psutil.cpu_times(True)
-        q = Decimal('0.000')
-        total_cpu_used = cast(Decimal,
-                              sum((Decimal(c.user + c.system) * 1000).quantize(q) for c in _cstat))
+        total_cpu_used: Union[Decimal, int, float]
+        per_core_cpu_used: Mapping[DeviceId, Union[Decimal, int, float]]
+        snapshot = ctx.node_snapshot
+        if snapshot is not None:
+            # The CPU times are integers in msec, so there is no need to quantize them.
+            total_cpu_used = snapshot.total_cpu_used
+            per_core_cpu_used = {
+                DeviceId(str(cpu_id)): cpu_used
+                for cpu_id, cpu_used in snapshot.iter_cpu_used()
+            }
+        else:
+            _cstat = psutil.cpu_times(True)
+            # psutil lists only the online CPUs, whose IDs may have gaps.
+            cpu_ids: Sequence[int] = get_online_cpus() or []
+            if len(cpu_ids) != len(_cstat):
+                cpu_ids = range(len(_cstat))
+            q = Decimal('0.000')
+            per_core_cpu_used = {
+                DeviceId(str(cpu_id)): (Decimal(c.user + c.system) * 1000).quantize(q)
+                for cpu_id, c in zip(cpu_ids, _cstat)
+            }
+            total_cpu_used = sum(per_core_cpu_used.values(), Decimal(0))
         now, raw_interval = ctx.update_timestamp('cpu-node')
-        interval = Decimal(raw_interval * 1000).quantize(q)
+        interval = raw_interval * 1000
 
         return [
             NodeMeasurement(
@@ -161,12 +193,8 @@ class CPUPlugin(AbstractComputePlugin):
                 current_hook=lambda metric: metric.stats.diff,
                 per_node=Measurement(total_cpu_used, interval),
                 per_device={
-                    DeviceId(str(idx)):
-                    Measurement(
-                        (Decimal(c.user + c.system) * 1000).quantize(q),
-                        interval,
-                    )
-                    for idx, c in enumerate(_cstat)
+                    dev_id: Measurement(cpu_used, interval)
+                    for dev_id, cpu_used in per_core_cpu_used.items()
                 },
             ),
         ]
@@ -178,45 +206,72 @@ class CPUPlugin(AbstractComputePlugin):
     ) -> Sequence[ContainerMeasurement]:
 
         async def sysfs_impl(container_id):
-            cpu_prefix = f'/sys/fs/cgroup/cpuacct/docker/{container_id}/'
             try:
-                cpu_used = read_sysfs(cpu_prefix + 'cpuacct.usage', int) / 1e6
+                cgroup = ctx.cgroups.get(container_id)
+                cpu_used = cgroup.read_cpu_used()
+                throttling = read_optional_cgroup_stat(cgroup.read_cpu_throttling)
+                pressure = read_optional_cgroup_stat(cgroup.read_pressure, 'cpu')
             except IOError as e:
                 log.warning('cannot read stats: sysfs unreadable for container {0}\n{1!r}',
                             container_id[:7], e)
                 return None
-            return cpu_used
+            return cpu_used, throttling, pressure
+
+        def parse_api_stats(ret):
+            cpu_used = nmget(ret, 'cpu_stats.cpu_usage.total_usage', 0) / 1e6
+            throttling = (
+                nmget(ret, 'cpu_stats.throttling_data.throttled_periods', 0),
+                nmget(ret, 'cpu_stats.throttling_data.throttled_time', 0) / 1e6,
+            )
+            # The pressure stall information is not available via the Docker API.
+            return cpu_used, throttling, None
 
         async def api_impl(container_id):
-            async with closing_async(Docker()) as docker:
-                container = DockerContainer(docker, id=container_id)
-                try:
-                    async with async_timeout.timeout(2.0):
-                        ret = await fetch_api_stats(container)
-                except asyncio.TimeoutError:
-                    return None
-                if ret is None:
-                    return None
-                cpu_used = nmget(ret, 'cpu_stats.cpu_usage.total_usage', 0) / 1e6
-                return cpu_used
+            container = DockerContainer(ctx.docker, id=container_id)
+            try:
+                async with async_timeout.timeout(2.0):
+                    ret = await fetch_api_stats(container)
+            except asyncio.TimeoutError:
+                return None
+            if ret is None:
+                return None
+            return parse_api_stats(ret)
+
+        async def stream_impl(container_id):
+            ret = ctx.docker_stats.get(container_id)
+            if ret is None:
+                return None
+            return parse_api_stats(ret)
 
         if ctx.mode == StatModes.CGROUP:
             impl = sysfs_impl
         elif ctx.mode == StatModes.DOCKER:
             impl = api_impl
+        elif ctx.mode == StatModes.DOCKER_STREAM:
+            impl = stream_impl
         else:
             raise RuntimeError("should not reach here")
 
         q = Decimal('0.000')
         per_container_cpu_used = {}
+        per_container_cpu_throttled = {}
+        per_container_cpu_throttled_periods = {}
+        per_container_cpu_pressure = {}
         tasks = []
         for cid in container_ids:
             tasks.append(asyncio.ensure_future(impl(cid)))
         results = await asyncio.gather(*tasks)
-        for cid, cpu_used in zip(container_ids, results):
-            if cpu_used is None:
+        for cid, result in zip(container_ids, results):
+            if result is None:
                 continue
+            cpu_used, throttling, pressure = result
             per_container_cpu_used[cid] = Measurement(Decimal(cpu_used).quantize(q))
+            if throttling is not None:
+                per_container_cpu_throttled_periods[cid] = Measurement(throttling[0])
+                per_container_cpu_throttled[cid] = Measurement(throttling[1])
+            if pressure is not None:
+                # the accumulated stall time in msec
+                per_container_cpu_pressure[cid] = Measurement(pressure['some']['total'] / 1e3)
         return [
             ContainerMeasurement(
                 MetricKey('cpu_util'),
@@ -232,16 +287,55 @@ class CPUPlugin(AbstractComputePlugin):
                 unit_hint='msec',
                 per_container=per_container_cpu_used.copy(),
             ),
+            ContainerMeasurement(
+                MetricKey('cpu_throttled'),
+                MetricTypes.ACCUMULATED,
+                unit_hint='msec',
+                stats_filter=frozenset({'rate'}),
+                per_container=per_container_cpu_throttled,
+            ),
+            ContainerMeasurement(
+                MetricKey('cpu_throttled_periods'),
+                MetricTypes.ACCUMULATED,
+                unit_hint='count',
+                stats_filter=frozenset({'diff'}),
+                per_container=per_container_cpu_throttled_periods,
+            ),
+            ContainerMeasurement(
+                MetricKey('cpu_pressure'),
+                MetricTypes.UTILIZATION,
+                unit_hint='percent',
+                current_hook=lambda metric: metric.stats.rate,
+                stats_filter=frozenset({'avg', 'max'}),
+                per_container=per_container_cpu_pressure,
+            ),
         ]
 
+    @property
+    def allocation_strategy(self) -> AllocationStrategy:
+        strategy = self.local_config.get('resource', {}).get('cpu-allocation-strategy', 'evenly')
+        return AllocationStrategy[strategy.upper()]
+
     async def create_alloc_map(self) -> AbstractAllocMap:
         devices = await self.list_devices()
+        device_topology: Optional[Mapping[DeviceId, DeviceTopology]] = None
+        if self.allocation_strategy == AllocationStrategy.TOPOLOGY:
+            device_topology = {
+                dev.device_id: DeviceTopology(
+                    numa_node=dev.numa_node or 0,
+                    cache_domain=min(libnuma.get_cache_siblings(int(dev.device_id))),
+                    core=min(libnuma.get_thread_siblings(int(dev.device_id))),
+                )
+                for dev in devices
+            }
         return DiscretePropertyAllocMap(
             device_slots={
                 dev.device_id:
                     DeviceSlotInfo(SlotTypes.COUNT, SlotName('cpu'), Decimal(dev.processing_units))
                 for dev in devices
             },
+            allocation_strategy=self.allocation_strategy,
+            device_topology=device_topology,
         )
 
     async def get_hooks(self, distro: str, arch: str) -> Sequence[Path]:
@@ -255,14 +349,18 @@ class CPUPlugin(AbstractComputePlugin):
     ) -> Mapping[str, Any]:
         cores = [*map(int, device_alloc['cpu'].keys())]
         sorted_core_ids = [*map(str, sorted(cores))]
+        host_config = {
+            'CpuPeriod': 100_000,  # docker default
+            'CpuQuota': int(100_000 * len(cores)),
+            'Cpus': ','.join(sorted_core_ids),
+            'CpusetCpus': ','.join(sorted_core_ids),
+        }
+        if self.allocation_strategy == AllocationStrategy.TOPOLOGY:
+            # bind the memory to the NUMA nodes of the allocated cores
+            numa_nodes = {libnuma.node_of_cpu(core) for core in cores}
+            host_config['CpusetMems'] = ','.join(map(str, sorted(numa_nodes)))
         return {
-            'HostConfig': {
-                'CpuPeriod': 100_000,  # docker default
-                'CpuQuota': int(100_000 * len(cores)),
-                'Cpus': ','.join(sorted_core_ids),
-                'CpusetCpus': ','.join(sorted_core_ids),
-                # 'CpusetMems': f'{resource_spec.numa_node}',
-            },
+            'HostConfig': host_config,
         }
 
     async def restore_from_container(
@@ -352,12 +450,19 @@ class MemoryPlugin(AbstractComputePlugin):
         return {}
 
     async def gather_node_measures(self, ctx: StatContext) -> Sequence[NodeMeasurement]:
-        _mstat = psutil.virtual_memory()
-        total_mem_used_bytes = Decimal(_mstat.total - _mstat.available)
-        total_mem_capacity_bytes = Decimal(_mstat.total)
-        _nstat = psutil.net_io_counters()
-        net_rx_bytes = _nstat.bytes_recv
-        net_tx_bytes = _nstat.bytes_sent
+        snapshot = ctx.node_snapshot
+        if snapshot is not None:
+            total_mem_used_bytes = snapshot.mem_total - snapshot.mem_available
+            total_mem_capacity_bytes = snapshot.mem_total
+            net_rx_bytes = snapshot.net_rx_bytes
+            net_tx_bytes = snapshot.net_tx_bytes
+        else:
+            _mstat = psutil.virtual_memory()
+            total_mem_used_bytes = _mstat.total - _mstat.available
+            total_mem_capacity_bytes = _mstat.total
+            _nstat = psutil.net_io_counters()
+            net_rx_bytes = _nstat.bytes_recv
+            net_tx_bytes = _nstat.bytes_sent
 
         def get_disk_stat():
             pruned_disk_types = frozenset(['squashfs', 'vfat', 'tmpfs'])
@@ -400,96 +505,93 @@ class MemoryPlugin(AbstractComputePlugin):
                 MetricTypes.RATE,
                 unit_hint='bps',
                 current_hook=lambda metric: metric.stats.rate,
-                per_node=Measurement(Decimal(net_rx_bytes)),
-                per_device={DeviceId('node'): Measurement(Decimal(net_rx_bytes))},
+                per_node=Measurement(net_rx_bytes),
+                per_device={DeviceId('node'): Measurement(net_rx_bytes)},
             ),
             NodeMeasurement(
                 MetricKey('net_tx'),
                 MetricTypes.RATE,
                 unit_hint='bps',
                 current_hook=lambda metric: metric.stats.rate,
-                per_node=Measurement(Decimal(net_tx_bytes)),
-                per_device={DeviceId('node'): Measurement(Decimal(net_tx_bytes))},
+                per_node=Measurement(net_tx_bytes),
+                per_device={DeviceId('node'): Measurement(net_tx_bytes)},
             ),
         ]
 
     async def gather_container_measures(self, ctx: StatContext, container_ids: Sequence[str]) \
             -> Sequence[ContainerMeasurement]:
 
-        def get_scratch_size(container_id: str) -> int:
-            for kernel_id, info in ctx.agent.kernel_registry.items():
-                if info['container_id'] == container_id:
-                    break
-            else:
-                return 0
-            work_dir = ctx.agent.local_config['container']['scratch-root'] / str(kernel_id) / 'work'
-            total_size = 0
-            for path in work_dir.rglob('*'):
-                if path.is_symlink():
-                    total_size += path.lstat().st_size
-                elif path.is_file():
-                    total_size += path.stat().st_size
-            return total_size
+        def get_scratch_usage(container_id):
+            if not ctx.is_metric_due('io_scratch_size', container_id):
+                return None
+            return ctx.scratch_usage.get_usage(container_id)
 
         async def sysfs_impl(container_id):
-            mem_prefix = f'/sys/fs/cgroup/memory/docker/{container_id}/'
-            io_prefix = f'/sys/fs/cgroup/blkio/docker/{container_id}/'
             try:
-                mem_cur_bytes = read_sysfs(mem_prefix + 'memory.usage_in_bytes', int)
-                io_stats = Path(io_prefix + 'blkio.throttle.io_service_bytes').read_text()
-                # example data:
-                #   8:0 Read 13918208
-                #   8:0 Write 0
-                #   8:0 Sync 0
-                #   8:0 Async 13918208
-                #   8:0 Total 13918208
-                #   Total 13918208
-                io_read_bytes = 0
-                io_write_bytes = 0
-                for line in io_stats.splitlines():
-                    if line.startswith('Total '):
-                        continue
-                    dev, op, nbytes = line.strip().split()
-                    if op == 'Read':
-                        io_read_bytes += int(nbytes)
-                    elif op == 'Write':
-                        io_write_bytes += int(nbytes)
+                cgroup = ctx.cgroups.get(container_id)
+                mem_cur_bytes = cgroup.read_mem_used()
+                io_read_bytes, io_write_bytes = cgroup.read_io_bytes()
+                mem_events = read_optional_cgroup_stat(cgroup.read_memory_events)
+                mem_pressure = read_optional_cgroup_stat(cgroup.read_pressure, 'memory')
+                io_pressure = read_optional_cgroup_stat(cgroup.read_pressure, 'io')
+                net_bytes = read_optional_cgroup_stat(cgroup.read_net_bytes)
             except IOError as e:
                 log.warning('cannot read stats: sysfs unreadable for container {0}\n{1!r}',
                             container_id[:7], e)
                 return None
-            loop = current_loop()
-            scratch_sz = await loop.run_in_executor(
-                None, get_scratch_size, container_id)
-            return mem_cur_bytes, io_read_bytes, io_write_bytes, scratch_sz
+            scratch_sz = get_scratch_usage(container_id)
+            return (
+                mem_cur_bytes, io_read_bytes, io_write_bytes, scratch_sz,
+                mem_events, mem_pressure, io_pressure, net_bytes,
+            )
+
+        def parse_api_stats(container_id, ret):
+            mem_cur_bytes = nmget(ret, 'memory_stats.usage', 0)
+            io_read_bytes = 0
+            io_write_bytes = 0
+            for item in nmget(ret, 'blkio_stats.io_service_bytes_recursive', []):
+                if item['op'] == 'Read':
+                    io_read_bytes += item['value']
+                elif item['op'] == 'Write':
+                    io_write_bytes += item['value']
+            net_bytes = None
+            networks = ret.get('networks')
+            if networks is not None:
+                net_bytes = (
+                    sum(item['rx_bytes'] for item in networks.values()),
+                    sum(item['tx_bytes'] for item in networks.values()),
+                )
+            scratch_sz = get_scratch_usage(container_id)
+            # The memory events and the pressure stall information
+            # are not available via the Docker API.
+            return (
+                mem_cur_bytes, io_read_bytes, io_write_bytes, scratch_sz,
+                None, None, None, net_bytes,
+            )
 
         async def api_impl(container_id):
-            async with closing_async(Docker()) as docker:
-                container = DockerContainer(docker, id=container_id)
-                try:
-                    async with async_timeout.timeout(2.0):
-                        ret = await fetch_api_stats(container)
-                except asyncio.TimeoutError:
-                    return None
-                if ret is None:
-                    return None
-                mem_cur_bytes = nmget(ret, 'memory_stats.usage', 0)
-                io_read_bytes = 0
-                io_write_bytes = 0
-                for item in nmget(ret, 'blkio_stats.io_service_bytes_recursive', []):
-                    if item['op'] == 'Read':
-                        io_read_bytes += item['value']
-                    elif item['op'] == 'Write':
-                        io_write_bytes += item['value']
-                loop = current_loop()
-                scratch_sz = await loop.run_in_executor(
-                    None, get_scratch_size, container_id)
-                return mem_cur_bytes, io_read_bytes, io_write_bytes, scratch_sz
+            container = DockerContainer(ctx.docker, id=container_id)
+            try:
+                async with async_timeout.timeout(2.0):
+                    ret = await fetch_api_stats(container)
+            except asyncio.TimeoutError:
+                return None
+            if ret is None:
+                return None
+            return parse_api_stats(container_id, ret)
+
+        async def stream_impl(container_id):
+            ret = ctx.docker_stats.get(container_id)
+            if ret is None:
+                return None
+            return parse_api_stats(container_id, ret)
 
         if ctx.mode == StatModes.CGROUP:
             impl = sysfs_impl
         elif ctx.mode == StatModes.DOCKER:
             impl = api_impl
+        elif ctx.mode == StatModes.DOCKER_STREAM:
+            impl = stream_impl
         else:
             raise RuntimeError("should not reach here")
 
@@ -497,6 +599,12 @@ class MemoryPlugin(AbstractComputePlugin):
         per_container_io_read_bytes = {}
         per_container_io_write_bytes = {}
         per_container_io_scratch_size = {}
+        per_container_mem_oom = {}
+        per_container_mem_oom_kill = {}
+        per_container_mem_pressure = {}
+        per_container_io_pressure = {}
+        per_container_net_rx_bytes = {}
+        per_container_net_tx_bytes = {}
         tasks = []
         for cid in container_ids:
             tasks.append(asyncio.ensure_future(impl(cid)))
@@ -510,8 +618,23 @@ class MemoryPlugin(AbstractComputePlugin):
                 Decimal(result[1]))
             per_container_io_write_bytes[cid] = Measurement(
                 Decimal(result[2]))
-            per_container_io_scratch_size[cid] = Measurement(
-                Decimal(result[3]))
+            if result[3] is not None:
+                per_container_io_scratch_size[cid] = Measurement(
+                    Decimal(result[3]))
+            mem_events, mem_pressure, io_pressure, net_bytes = result[4:]
+            if mem_events is not None:
+                if 'oom' in mem_events:
+                    per_container_mem_oom[cid] = Measurement(mem_events['oom'])
+                if 'oom_kill' in mem_events:
+                    per_container_mem_oom_kill[cid] = Measurement(mem_events['oom_kill'])
+            # the accumulated stall time in msec
+            if mem_pressure is not None:
+                per_container_mem_pressure[cid] = Measurement(mem_pressure['some']['total'] / 1e3)
+            if io_pressure is not None:
+                per_container_io_pressure[cid] = Measurement(io_pressure['some']['total'] / 1e3)
+            if net_bytes is not None:
+                per_container_net_rx_bytes[cid] = Measurement(net_bytes[0])
+                per_container_net_tx_bytes[cid] = Measurement(net_bytes[1])
         return [
             ContainerMeasurement(
                 MetricKey('mem'),
@@ -541,6 +664,50 @@ class MemoryPlugin(AbstractComputePlugin):
                 stats_filter=frozenset({'max'}),
                 per_container=per_container_io_scratch_size,
             ),
+            ContainerMeasurement(
+                MetricKey('mem_oom'),
+                MetricTypes.ACCUMULATED,
+                unit_hint='count',
+                stats_filter=frozenset({'diff'}),
+                per_container=per_container_mem_oom,
+            ),
+            ContainerMeasurement(
+                MetricKey('mem_oom_kill'),
+                MetricTypes.ACCUMULATED,
+                unit_hint='count',
+                stats_filter=frozenset({'diff'}),
+                per_container=per_container_mem_oom_kill,
+            ),
+            ContainerMeasurement(
+                MetricKey('mem_pressure'),
+                MetricTypes.UTILIZATION,
+                unit_hint='percent',
+                current_hook=lambda metric: metric.stats.rate,
+                stats_filter=frozenset({'avg', 'max'}),
+                per_container=per_container_mem_pressure,
+            ),
+            ContainerMeasurement(
+                MetricKey('io_pressure'),
+                MetricTypes.UTILIZATION,
+                unit_hint='percent',
+                current_hook=lambda metric: metric.stats.rate,
+                stats_filter=frozenset({'avg', 'max'}),
+                per_container=per_container_io_pressure,
+            ),
+            ContainerMeasurement(
+                MetricKey('net_rx'),
+                MetricTypes.RATE,
+                unit_hint='bps',
+                current_hook=lambda metric: metric.stats.rate,
+                per_container=per_container_net_rx_bytes,
+            ),
+            ContainerMeasurement(
+                MetricKey('net_tx'),
+                MetricTypes.RATE,
+                unit_hint='bps',
+                current_hook=lambda metric: metric.stats.rate,
+                per_container=per_container_net_tx_bytes,
+            ),
         ]
 
     async def create_alloc_map(self) -> AbstractAllocMap:
@@ -0,0 +1,173 @@
+"""
+A procfs-based reader of the node-wide CPU, memory, and network statistics.
+
+The intrinsic compute plugins share a single snapshot taken once per collection,
+instead of calling psutil separately in each plugin.
+Like the cgroup stat reader, it keeps the procfs files open and re-reads them
+from the offset zero, and it parses the per-core CPU times into preallocated
+integer arrays without creating an intermediate object per core.
+"""
+
+from array import array
+import logging
+import os
+from pathlib import Path
+from typing import (
+    Iterator,
+    MutableMapping,
+    Tuple,
+    Union,
+)
+
+from ai.backend.common.logging import BraceStyleAdapter
+
+log = BraceStyleAdapter(logging.getLogger(__name__))
+
+proc_root = Path('/proc')
+_initial_read_size = 64 * 1024
+
+
+def parse_proc_stat_cpus(data: bytes, cpu_ids: array, cpu_used: array) -> int:
+    """
+    Fills the IDs and the accumulated user and system time in clock ticks
+    of the online CPUs from the content of ``/proc/stat``,
+    and returns the number of the online CPUs.
+    The arrays must be large enough to hold all CPUs.
+    """
+    # example data (/proc/stat):
+    #   cpu  51141 0 5819 246983 1267 0 64 2307 0 0
+    #   cpu0 25570 0 2909 123491 633 0 32 1153 0 0
+    #   cpu1 25571 0 2910 123492 634 0 32 1154 0 0
+    #   intr 332290 0 0 0 ...
+    num_cpus = 0
+    for line in data.split(b'\n')[1:]:
+        if not line.startswith(b'cpu'):
+            # The per-CPU lines always come right after the aggregated one.
+            break
+        name, user, nice, system, _ = line.split(maxsplit=4)
+        cpu_ids[num_cpus] = int(name[3:])
+        cpu_used[num_cpus] = int(user) + int(system)
+        num_cpus += 1
+    return num_cpus
+
+
+def parse_meminfo(data: bytes) -> Tuple[int, int]:
+    """
+    Returns the total and available memory in bytes from the content of ``/proc/meminfo``.
+    """
+    # example data (/proc/meminfo):
+    #   MemTotal:       16314888 kB
+    #   MemFree:         9935236 kB
+    #   MemAvailable:   13815632 kB
+    fields: MutableMapping[bytes, int] = {}
+    for line in data.split(b'\n'):
+        key, _, value = line.partition(b':')
+        if value:
+            fields[key] = int(value.split()[0]) * 1024
+    available = fields.get(b'MemAvailable')
+    if available is None:
+        # for kernels older than 3.14
+        available = fields[b'MemFree'] + fields.get(b'Buffers', 0) + fields.get(b'Cached', 0)
+    return fields[b'MemTotal'], available
+
+
+def parse_net_dev(data: bytes, *, skip_loopback: bool = False) -> Tuple[int, int]:
+    """
+    Returns the received and transmitted bytes summed over all network interfaces
+    (except the loopback interface if *skip_loopback* is set)
+    from the content of ``/proc/net/dev``.
+    """
+    # example data (/proc/net/dev):
+    #   Inter-|   Receive                                                |  Transmit
+    #    face |bytes    packets errs drop fifo frame compressed multicast|bytes    packets ...
+    #       lo: 89226708   10408    0    0    0     0          0         0 89226708   10408 ...
+    rx_bytes = 0
+    tx_bytes = 0
+    for line in data.split(b'\n')[2:]:
+        name, _, counters = line.partition(b':')
+        if counters and not (skip_loopback and name.strip() == b'lo'):
+            fields = counters.split()
+            rx_bytes += int(fields[0])
+            tx_bytes += int(fields[8])
+    return rx_bytes, tx_bytes
+
+
+class ProcSnapshot:
+    """
+    Keeps the latest node-wide statistics read from procfs.
+
+    The per-CPU values are stored in the first :attr:`num_cpus` items of
+    :attr:`cpu_ids` and :attr:`cpu_used` which are reallocated only when
+    the number of online CPUs exceeds their capacity.
+    """
+
+    def __init__(self, root: Path = proc_root) -> None:
+        self.root = root
+        clock_ticks = os.sysconf('SC_CLK_TCK')
+        # USER_HZ is 100 on all Linux platforms, so the CPU times become integers in msec.
+        self.msec_per_tick: Union[int, float]
+        if 1000 % clock_ticks == 0:
+            self.msec_per_tick = 1000 // clock_ticks
+        else:
+            self.msec_per_tick = 1000 / clock_ticks
+        self.num_cpus = 0
+        self._allocate_cpus(os.cpu_count() or 1)
+        self.mem_total = 0
+        self.mem_available = 0
+        self.net_rx_bytes = 0
+        self.net_tx_bytes = 0
+        self._fds: MutableMapping[str, int] = {}
+        self._read_sizes: MutableMapping[str, int] = {}
+
+    def _allocate_cpus(self, capacity: int) -> None:
+        self.cpu_ids = array('i', bytes(4 * capacity))
+        self.cpu_used = array('q', bytes(8 * capacity))
+
+    def _read(self, name: str) -> bytes:
+        fd = self._fds.get(name)
+        if fd is None:
+            fd = os.open(self.root / name, os.O_RDONLY | os.O_CLOEXEC)
+            self._fds[name] = fd
+        read_size = self._read_sizes.get(name, _initial_read_size)
+        while True:
+            data = os.pread(fd, read_size, 0)
+            if len(data) < read_size:
+                return data
+            # The content may have been truncated, e.g., /proc/net/dev with many veth interfaces.
+            read_size *= 2
+            self._read_sizes[name] = read_size
+
+    def read(self) -> None:
+        """
+        Takes a new snapshot.
+        """
+        data = self._read('stat')
+        num_cpu_lines = data.count(b'\ncpu')
+        if num_cpu_lines > len(self.cpu_ids):
+            # More CPUs have become online.
+            self._allocate_cpus(num_cpu_lines)
+        self.num_cpus = parse_proc_stat_cpus(data, self.cpu_ids, self.cpu_used)
+        self.mem_total, self.mem_available = parse_meminfo(self._read('meminfo'))
+        self.net_rx_bytes, self.net_tx_bytes = parse_net_dev(self._read('net/dev'))
+
+    def iter_cpu_used(self) -> Iterator[Tuple[int, Union[int, float]]]:
+        """
+        Yields the pairs of the CPU ID and the accumulated CPU time in msec of each online CPU.
+        """
+        msec_per_tick = self.msec_per_tick
+        cpu_ids = self.cpu_ids
+        cpu_used = self.cpu_used
+        for idx in range(self.num_cpus):
+            yield cpu_ids[idx], cpu_used[idx] * msec_per_tick
+
+    @property
+    def total_cpu_used(self) -> Union[int, float]:
+        """
+        The accumulated CPU time in msec summed over all online CPUs.
+        """
+        return sum(self.cpu_used[:self.num_cpus]) * self.msec_per_tick
+
+    def close(self) -> None:
+        for fd in self._fds.values():
+            os.close(fd)
+        self._fds.clear()
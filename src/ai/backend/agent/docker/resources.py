@@ -1,3 +1,4 @@
+import asyncio
 from decimal import Decimal
 import logging
 from pathlib import Path
@@ -7,8 +8,6 @@ from typing import (
     Tuple,
 )
 
-import aiofiles
-
 from ai.backend.common.etcd import AsyncEtcd
 from ai.backend.common.logging import BraceStyleAdapter
 from ai.backend.common.types import (
@@ -17,7 +16,10 @@ from ai.backend.common.types import (
 from ..exception import InitializationError
 from ..resources import (
     AbstractComputePlugin, ComputePluginContext, KernelResourceSpec, known_slot_types,
+    read_resource_spec,
 )
+from ..utils import get_kernel_id_from_container
+from .warm_pool import get_claimed_bind_source, warm_pool_label
 
 log = BraceStyleAdapter(logging.getLogger(__name__))
 
@@ -92,7 +94,15 @@ async def detect_resources(
 async def get_resource_spec_from_container(container_info) -> Optional[KernelResourceSpec]:
     for mount in container_info['HostConfig']['Mounts']:
         if mount['Target'] == '/home/config':
-            async with aiofiles.open(Path(mount['Source']) / 'resource.txt', 'r') as f:  # type: ignore
-                return await KernelResourceSpec.aread_from_file(f)
+            config_dir = Path(mount['Source'])
+            if warm_pool_label in (container_info['Config'].get('Labels') or {}):
+                # The containers claimed from the warm pool bind it through a symbolic link
+                # in their pool entries, so read it from the scratch directory of the kernel.
+                kernel_id = await get_kernel_id_from_container(container_info['Name'])
+                if kernel_id is None:
+                    return None
+                config_dir = get_claimed_bind_source(config_dir, kernel_id)
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(None, read_resource_spec, config_dir)
     else:
         return None
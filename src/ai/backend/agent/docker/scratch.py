@@ -0,0 +1,479 @@
+"""
+Incremental accounting of the scratch directory usage of kernels.
+
+If the scratch directory of a kernel is a separate filesystem (e.g., the "memory" scratch-type)
+or is covered by a project quota (XFS/ext4 with the project-inherit flag), the usage is
+read from ``statvfs()`` with a single syscall.
+
+Otherwise, the tracker keeps the total size of the files directly under each directory,
+marks directories dirty upon inotify events, and rescans only the dirty directories.
+A rate-limited reconciliation walk runs periodically in the background
+to recover from missed events (e.g., inotify queue overflows or watch limits).
+The first walk of a newly registered kernel takes precedence over the periodic walks
+of the other kernels, and its usage is reported as unknown until the walk finishes.
+"""
+
+import asyncio
+import errno
+import fcntl
+import logging
+import os
+from pathlib import Path
+import struct
+import time
+from typing import (
+    Dict,
+    List,
+    MutableMapping,
+    Optional,
+    Set,
+    Tuple,
+)
+
+import attr
+
+from ai.backend.common.logging import BraceStyleAdapter
+from ai.backend.common.types import ContainerId, KernelId
+from ai.backend.common.utils import current_loop
+
+from ..vendor.linux import inotify
+
+log = BraceStyleAdapter(logging.getLogger(__name__))
+
+FS_IOC_FSGETXATTR = 0x801c581f
+FS_XFLAG_PROJINHERIT = 0x00000200
+_fsxattr = struct.Struct('IIIII8x')
+
+_watch_mask = (
+    inotify.IN_MODIFY | inotify.IN_CLOSE_WRITE |
+    inotify.IN_CREATE | inotify.IN_DELETE |
+    inotify.IN_MOVED_FROM | inotify.IN_MOVED_TO |
+    inotify.IN_ONLYDIR | inotify.IN_DONT_FOLLOW | inotify.IN_EXCL_UNLINK
+)
+
+
+def get_statfs_usage(path: str) -> int:
+    st = os.statvfs(path)
+    return (st.f_blocks - st.f_bfree) * st.f_frsize
+
+
+def is_statfs_accountable(scratch_dir: Path, work_dir: Path) -> bool:
+    """
+    Checks if ``statvfs()`` on the work directory reports the usage of the kernel only.
+    """
+    if os.path.ismount(scratch_dir) or os.path.ismount(work_dir):
+        return True
+    try:
+        fd = os.open(work_dir, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            buf = fcntl.ioctl(fd, FS_IOC_FSGETXATTR, bytes(_fsxattr.size))
+        finally:
+            os.close(fd)
+    except OSError:
+        return False
+    xflags, _, _, projid, _ = _fsxattr.unpack(buf)
+    if not (xflags & FS_XFLAG_PROJINHERIT) or projid == 0:
+        return False
+    # XFS and ext4 report the project quota via statfs() only when its limit is set.
+    try:
+        return os.statvfs(work_dir).f_blocks != os.statvfs(scratch_dir.parent).f_blocks
+    except OSError:
+        return False
+
+
+@attr.s(auto_attribs=True, slots=True)
+class DirScanResult:
+    path: str
+    wd: Optional[int]
+    size: int  # the sum of sizes of non-directory entries directly under the path
+    subdirs: List[str]
+    missing: bool = False
+
+
+def scan_dir(path: str, inotify_fd: Optional[int]) -> DirScanResult:
+    wd = None
+    if inotify_fd is not None:
+        # Watch before scanning so that no changes are missed in between.
+        try:
+            wd = inotify.add_watch(inotify_fd, path, _watch_mask)
+        except (FileNotFoundError, NotADirectoryError):
+            return DirScanResult(path, None, 0, [], missing=True)
+        except OSError as e:
+            if e.errno != errno.ENOSPC:
+                raise
+            # The watch limit is reached; rely on reconciliation walks for this directory.
+    size = 0
+    subdirs = []
+    try:
+        with os.scandir(path) as it:
+            for entry in it:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry.path)
+                    else:
+                        size += entry.stat(follow_symlinks=False).st_size
+                except FileNotFoundError:
+                    continue
+    except (FileNotFoundError, NotADirectoryError):
+        return DirScanResult(path, wd, 0, [], missing=True)
+    except PermissionError:
+        pass
+    return DirScanResult(path, wd, size, subdirs)
+
+
+@attr.s(auto_attribs=True, slots=True)
+class ReconcileWalk:
+    stack: List[str]
+    dir_sizes: Dict[str, int] = attr.Factory(dict)
+    # the directories rescanned by flushes during the walk
+    flushed: Set[str] = attr.Factory(set)
+
+
+class KernelScratchUsage:
+
+    def __init__(self, kernel_id: KernelId, scratch_dir: Path) -> None:
+        self.kernel_id = kernel_id
+        self.scratch_dir = scratch_dir
+        self.work_dir = scratch_dir / 'work'
+        self.root = str(self.work_dir)
+        self.use_statfs = False
+        self.dir_sizes: Dict[str, int] = {}
+        self.total = 0
+        self.dirty: Set[str] = set()
+        self.watches: Set[int] = set()
+        self.lock = asyncio.Lock()
+        self.last_reconciled = 0.0
+        self.reconcile_requested = True
+        self.walk: Optional[ReconcileWalk] = None
+        self.walked = False  # if the first reconciliation walk has finished
+        self.closed = False
+
+    @property
+    def usage(self) -> Optional[int]:
+        if self.use_statfs:
+            try:
+                return get_statfs_usage(self.root)
+            except OSError:
+                return None
+        if not self.walked:
+            return None
+        return self.total
+
+    def update_dir(self, path: str, size: int) -> None:
+        self.total += size - self.dir_sizes.get(path, 0)
+        self.dir_sizes[path] = size
+
+    def remove_trees(self, paths: Set[str]) -> None:
+        for path in [*self.dir_sizes.keys()]:
+            p = path
+            while True:
+                if p in paths:
+                    self.total -= self.dir_sizes.pop(path)
+                    break
+                parent = os.path.dirname(p)
+                if p == self.root or parent == p:
+                    break
+                p = parent
+
+    def replace_dirs(self, dir_sizes: Dict[str, int]) -> None:
+        self.dir_sizes = dir_sizes
+        self.total = sum(dir_sizes.values())
+
+
+class ScratchUsageTracker:
+    """
+    Tracks the scratch directory usage of the kernels, keyed by their container IDs.
+    """
+
+    def __init__(
+        self,
+        *,
+        flush_interval: float = 1.0,
+        reconcile_interval: float = 600.0,
+        reconcile_rate: int = 5000,
+        reconcile_batch_size: int = 500,
+    ) -> None:
+        self.flush_interval = flush_interval
+        self.reconcile_interval = reconcile_interval
+        self.reconcile_rate = reconcile_rate  # the maximum number of entries scanned per second
+        self.reconcile_batch_size = reconcile_batch_size
+        self._kernels: MutableMapping[ContainerId, KernelScratchUsage] = {}
+        self._watches: MutableMapping[int, Tuple[KernelScratchUsage, str]] = {}
+        self._orphan_wds: MutableMapping[int, float] = {}
+        self._inotify_fd: Optional[int] = None
+        self._tasks: List[asyncio.Task] = []
+        self._walk_lock = asyncio.Lock()  # serializes the batches of the walks
+
+    async def start(self) -> None:
+        if inotify.is_supported():
+            try:
+                self._inotify_fd = inotify.init()
+            except OSError as e:
+                log.warning('inotify is unavailable, using periodic scans only ({!r})', e)
+            else:
+                current_loop().add_reader(self._inotify_fd, self._read_events)
+        self._tasks.append(asyncio.create_task(self._flush_loop()))
+        self._tasks.append(asyncio.create_task(self._reconcile_loop()))
+
+    async def close(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+        if self._inotify_fd is not None:
+            current_loop().remove_reader(self._inotify_fd)
+            os.close(self._inotify_fd)
+            self._inotify_fd = None
+        self._kernels.clear()
+        self._watches.clear()
+
+    async def register(
+        self,
+        kernel_id: KernelId,
+        container_id: ContainerId,
+        scratch_dir: Path,
+    ) -> None:
+        if container_id in self._kernels:
+            return
+        kernel = KernelScratchUsage(kernel_id, scratch_dir)
+        kernel.use_statfs = await current_loop().run_in_executor(
+            None, is_statfs_accountable, scratch_dir, kernel.work_dir,
+        )
+        self._kernels[container_id] = kernel
+
+    def unregister(self, container_id: ContainerId) -> None:
+        kernel = self._kernels.pop(container_id, None)
+        if kernel is None:
+            return
+        kernel.closed = True
+        self._remove_watches(kernel)
+
+    def _remove_watches(self, kernel: KernelScratchUsage) -> None:
+        for wd in kernel.watches:
+            self._watches.pop(wd, None)
+            if self._inotify_fd is not None:
+                inotify.rm_watch(self._inotify_fd, wd)
+        kernel.watches.clear()
+
+    def get_usage(self, container_id: ContainerId) -> Optional[int]:
+        """
+        Returns the scratch usage of the kernel, or None if it is unknown yet.
+        """
+        kernel = self._kernels.get(container_id)
+        if kernel is None:
+            return None
+        return kernel.usage
+
+    def _read_events(self) -> None:
+        assert self._inotify_fd is not None
+        while True:
+            try:
+                buf = os.read(self._inotify_fd, 64 * 1024)
+            except BlockingIOError:
+                return
+            if not buf:
+                return
+            for wd, mask, name in inotify.parse_events(buf):
+                if mask & inotify.IN_Q_OVERFLOW:
+                    log.warning('inotify queue overflow; scheduling reconciliation of scratch usage')
+                    for kernel in self._kernels.values():
+                        kernel.reconcile_requested = True
+                    continue
+                watch = self._watches.get(wd)
+                if watch is None:
+                    self._orphan_wds[wd] = time.monotonic()
+                    continue
+                kernel, path = watch
+                if mask & inotify.IN_IGNORED:
+                    del self._watches[wd]
+                    kernel.watches.discard(wd)
+                    continue
+                kernel.dirty.add(path)
+                if mask & inotify.IN_ISDIR:
+                    # A subdirectory is created, moved in/out, or deleted.
+                    kernel.dirty.add(os.path.join(path, name))
+
+    def _add_watch(self, kernel: KernelScratchUsage, result: DirScanResult) -> None:
+        if result.wd is None or result.missing:
+            return
+        self._watches[result.wd] = (kernel, result.path)
+        kernel.watches.add(result.wd)
+        if self._orphan_wds.pop(result.wd, None) is not None:
+            # Some events have arrived before we know the watch.
+            kernel.dirty.add(result.path)
+
+    def _apply_scan_results(
+        self,
+        kernel: KernelScratchUsage,
+        results: List[DirScanResult],
+    ) -> None:
+        missing = set()
+        for result in results:
+            if result.missing:
+                missing.add(result.path)
+                continue
+            kernel.update_dir(result.path, result.size)
+            self._add_watch(kernel, result)
+        if missing:
+            kernel.remove_trees(missing)
+        if kernel.closed:
+            self._remove_watches(kernel)
+
+    def _rescan_dirs(
+        self,
+        paths: Set[str],
+        known_dirs: Optional[Set[str]],
+    ) -> List[DirScanResult]:
+        results = []
+        queue = [*paths]
+        visited = set()
+        while queue:
+            path = queue.pop()
+            if path in visited:
+                continue
+            visited.add(path)
+            result = scan_dir(path, self._inotify_fd)
+            results.append(result)
+            if known_dirs is not None:
+                # Recursively scan newly appeared directories.
+                queue.extend(p for p in result.subdirs if p not in known_dirs)
+        return results
+
+    async def flush(self) -> None:
+        loop = current_loop()
+        for kernel in [*self._kernels.values()]:
+            if not kernel.dirty or kernel.use_statfs:
+                continue
+            async with kernel.lock:
+                paths, kernel.dirty = kernel.dirty, set()
+                # During a reconciliation walk, new subdirectories are covered by the walk.
+                known_dirs = None
+                if kernel.walk is None:
+                    known_dirs = set(kernel.dir_sizes.keys())
+                results = await loop.run_in_executor(
+                    None, self._rescan_dirs, paths, known_dirs,
+                )
+                self._apply_scan_results(kernel, results)
+                if kernel.walk is not None:
+                    kernel.walk.flushed.update(paths)
+        now = time.monotonic()
+        for wd, ts in [*self._orphan_wds.items()]:
+            if now - ts > 60:
+                del self._orphan_wds[wd]
+
+    def _walk_batch(
+        self,
+        stack: List[str],
+        dir_sizes: Dict[str, int],
+    ) -> Tuple[List[DirScanResult], int]:
+        results = []
+        num_entries = 0
+        while stack and num_entries < self.reconcile_batch_size:
+            result = scan_dir(stack.pop(), self._inotify_fd)
+            results.append(result)
+            if not result.missing:
+                dir_sizes[result.path] = result.size
+                stack.extend(result.subdirs)
+            num_entries += 1 + len(result.subdirs)
+        return results, num_entries
+
+    def _begin_walk(self, kernel: KernelScratchUsage) -> None:
+        kernel.reconcile_requested = False
+        kernel.walk = ReconcileWalk([kernel.root])
+
+    def _end_walk(self, kernel: KernelScratchUsage) -> None:
+        kernel.walk = None
+        kernel.last_reconciled = time.monotonic()
+
+    async def _walk_step(self, kernel: KernelScratchUsage) -> int:
+        """
+        Scans the next batch of the reconciliation walk of the kernel
+        and replaces the accounted directory sizes with the walk result when it is done.
+        Returns the number of scanned entries.
+        """
+        async with self._walk_lock:
+            walk = kernel.walk
+            if walk is None:
+                return 0
+            try:
+                results, num_entries = await current_loop().run_in_executor(
+                    None, self._walk_batch, walk.stack, walk.dir_sizes,
+                )
+                for result in results:
+                    self._add_watch(kernel, result)
+                if kernel.closed:
+                    self._remove_watches(kernel)
+                    self._end_walk(kernel)
+                elif not walk.stack:
+                    async with kernel.lock:
+                        kernel.replace_dirs(walk.dir_sizes)
+                        # The walk results of the directories updated during the walk may be stale.
+                        kernel.dirty.update(walk.flushed)
+                        kernel.walked = True
+                    self._end_walk(kernel)
+            except BaseException:
+                self._end_walk(kernel)
+                raise
+            return num_entries
+
+    async def reconcile(self, kernel: KernelScratchUsage) -> None:
+        """
+        Walks the whole work directory of the kernel with the rate budget
+        and replaces the accounted directory sizes with the walk result.
+        If a walk is already in progress, it is continued instead.
+        """
+        if kernel.walk is None:
+            self._begin_walk(kernel)
+        while kernel.walk is not None:
+            num_entries = await self._walk_step(kernel)
+            await asyncio.sleep(num_entries / self.reconcile_rate)
+
+    async def _flush_loop(self) -> None:
+        while True:
+            try:
+                await asyncio.sleep(self.flush_interval)
+                await self.flush()
+            except asyncio.CancelledError:
+                break
+            except Exception:
+                log.exception('unexpected error while updating scratch usage')
+
+    def _next_walk(self) -> Optional[KernelScratchUsage]:
+        """
+        Starts the due reconciliation walks and returns the kernel to continue walking,
+        preferring the kernels whose first walk has not finished yet.
+        """
+        now = time.monotonic()
+        walking = []
+        for kernel in self._kernels.values():
+            if kernel.use_statfs:
+                continue
+            if kernel.walk is None and (
+                kernel.reconcile_requested or
+                now - kernel.last_reconciled >= self.reconcile_interval
+            ):
+                self._begin_walk(kernel)
+            if kernel.walk is not None:
+                walking.append(kernel)
+        if not walking:
+            return None
+        return min(walking, key=lambda kernel: kernel.walked)
+
+    async def _reconcile_loop(self) -> None:
+        """
+        Runs the reconciliation walks one batch at a time within the global rate budget,
+        so that the first walk of a new kernel does not wait for the walks of the others.
+        """
+        while True:
+            try:
+                kernel = self._next_walk()
+                if kernel is None:
+                    await asyncio.sleep(self.flush_interval)
+                    continue
+                num_entries = await self._walk_step(kernel)
+                await asyncio.sleep(num_entries / self.reconcile_rate)
+            except asyncio.CancelledError:
+                break
+            except Exception:
+                log.exception('unexpected error while reconciling scratch usage')
+                await asyncio.sleep(self.flush_interval)
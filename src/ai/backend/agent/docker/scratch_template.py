@@ -0,0 +1,214 @@
+"""
+A prebuilt template of the files that every new kernel gets in its work directory
+(the shell and editor dotfiles and the Jupyter customizations).
+
+The template is materialized once per agent version under the scratch root,
+and the work directory of each kernel is populated from it in a single pass
+over the precomputed list of its entries.
+The files are cloned with reflinks (copy-on-write) if the filesystem supports them
+or copied inside the kernel with ``copy_file_range()`` otherwise.
+Hard links are not used since the kernel user may modify the files in place,
+which would change the template and the work directories of the other kernels.
+"""
+
+import enum
+import errno
+import fcntl
+import hashlib
+import logging
+import os
+from pathlib import Path
+import pkg_resources
+import shutil
+import tempfile
+import threading
+from typing import (
+    Dict,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+from ai.backend.common.logging import BraceStyleAdapter
+
+from .. import __version__
+
+log = BraceStyleAdapter(logging.getLogger(__name__))
+
+FICLONE = 0x40049409
+
+# The resource names in ai.backend.runner and their paths relative to the work directory
+template_files: Sequence[Tuple[str, str]] = [
+    ('jupyter-custom.css', '.jupyter/custom/custom.css'),
+    ('logo.svg', '.jupyter/custom/logo.svg'),
+    ('roboto.ttf', '.jupyter/custom/roboto.ttf'),
+    ('roboto-italic.ttf', '.jupyter/custom/roboto-italic.ttf'),
+    ('.bashrc', '.bashrc'),
+    ('.bash_profile', '.bash_profile'),
+    ('.vimrc', '.vimrc'),
+    ('.tmux.conf', '.tmux.conf'),
+]
+
+# The errors meaning that the filesystem (or the kernel) does not support the clone method
+_unsupported_errnos = frozenset([
+    errno.EOPNOTSUPP, errno.ENOTTY, errno.ENOSYS, errno.EXDEV, errno.EINVAL,
+])
+
+
+class CloneMethod(enum.Enum):
+    REFLINK = 'reflink'
+    COPY_FILE_RANGE = 'copy_file_range'
+    COPY = 'copy'
+
+
+def copy_fd(src_fd: int, dst_fd: int, size: int, method: CloneMethod) -> CloneMethod:
+    """
+    Copy the content of *src_fd* to the empty file *dst_fd* using *method*
+    or the next fallback methods if it is not supported.
+    Returns the method actually used.
+    """
+    if method == CloneMethod.REFLINK:
+        try:
+            fcntl.ioctl(dst_fd, FICLONE, src_fd)
+            return method
+        except OSError as e:
+            if e.errno not in _unsupported_errnos:
+                raise
+            method = CloneMethod.COPY_FILE_RANGE
+    if method == CloneMethod.COPY_FILE_RANGE:
+        if hasattr(os, 'copy_file_range'):
+            try:
+                copied = 0
+                while copied < size:
+                    n = os.copy_file_range(src_fd, dst_fd, size - copied)
+                    if n == 0:
+                        break
+                    copied += n
+                return method
+            except OSError as e:
+                if e.errno not in _unsupported_errnos:
+                    raise
+                os.lseek(src_fd, 0, os.SEEK_SET)
+                os.lseek(dst_fd, 0, os.SEEK_SET)
+                os.ftruncate(dst_fd, 0)
+        method = CloneMethod.COPY
+    while True:
+        buf = os.read(src_fd, 1024 * 1024)
+        if not buf:
+            break
+        os.write(dst_fd, buf)
+    return method
+
+
+class ScratchTemplate:
+    """
+    Populates the work directories of new kernels from the template directory
+    built under *template_root*.
+    """
+
+    template_dir: Optional[Path]
+    dirs: List[str]
+    files: List[Tuple[str, int, int]]
+
+    def __init__(self, template_root: Path) -> None:
+        self.template_root = template_root
+        self.template_dir = None
+        self.dirs = []  # the relative paths of the directories, parents first
+        self.files = []  # the relative paths of the files with their sizes and modes
+        # The clone methods that work, keyed by the device IDs of the destination filesystems
+        self.clone_methods: Dict[int, CloneMethod] = {}
+        self._build_lock = threading.Lock()
+
+    def build(self) -> Path:
+        """
+        Materialize the template directory if it does not exist yet and
+        remove the templates of other agent versions.
+        """
+        with self._build_lock:
+            sources = [
+                (Path(pkg_resources.resource_filename('ai.backend.runner', name)).resolve(), rel_path)
+                for name, rel_path in template_files
+            ]
+            # Include the file stats to catch the changes in development setups
+            # where the version does not change.
+            digest = hashlib.sha1()
+            for src_path, rel_path in sources:
+                stat = src_path.stat()
+                digest.update(f'{rel_path}:{stat.st_size}:{stat.st_mtime_ns}\n'.encode())
+            template_dir = self.template_root / f'{__version__}-{digest.hexdigest()[:12]}'
+            if not template_dir.is_dir():
+                self.template_root.mkdir(parents=True, exist_ok=True)
+                build_dir = Path(tempfile.mkdtemp(prefix='.build-', dir=self.template_root))
+                try:
+                    for src_path, rel_path in sources:
+                        (build_dir / rel_path).parent.mkdir(parents=True, exist_ok=True)
+                        shutil.copy(src_path, build_dir / rel_path)
+                    build_dir.chmod(0o755)
+                    os.rename(build_dir, template_dir)
+                except OSError:
+                    shutil.rmtree(build_dir, ignore_errors=True)
+                    if not template_dir.is_dir():
+                        raise
+                    # Another agent sharing the scratch root has built it.
+                log.info('built the scratch template at {}', template_dir)
+            for path in self.template_root.iterdir():
+                if path != template_dir:
+                    shutil.rmtree(path, ignore_errors=True)
+            dirs = set()
+            files = []
+            for _, rel_path in template_files:
+                parent = os.path.dirname(rel_path)
+                while parent:
+                    dirs.add(parent)
+                    parent = os.path.dirname(parent)
+                stat = (template_dir / rel_path).stat()
+                files.append((rel_path, stat.st_size, stat.st_mode & 0o777))
+            self.dirs = sorted(dirs, key=lambda p: p.count('/'))
+            self.files = files
+            self.template_dir = template_dir
+            return template_dir
+
+    def instantiate(self, work_dir: Path, owner: Optional[Tuple[int, int]] = None) -> None:
+        """
+        Populate the existing work directory with the template files.
+        If *owner* is given as a pair of uid and gid, the work directory and
+        all created entries are owned by them.
+        """
+        if self.template_dir is None:
+            self.build()
+        template_dir = self.template_dir
+        assert template_dir is not None
+        work_fd = os.open(work_dir, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            dev = os.fstat(work_fd).st_dev
+            method = self.clone_methods.get(dev, CloneMethod.REFLINK)
+            if owner is not None:
+                os.fchown(work_fd, *owner)
+            for rel_path in self.dirs:
+                try:
+                    os.mkdir(rel_path, 0o755, dir_fd=work_fd)
+                except FileExistsError:
+                    pass
+                if owner is not None:
+                    os.chown(rel_path, *owner, dir_fd=work_fd, follow_symlinks=False)
+            for rel_path, size, mode in self.files:
+                src_fd = os.open(template_dir / rel_path, os.O_RDONLY)
+                try:
+                    dst_fd = os.open(
+                        rel_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | os.O_NOFOLLOW,
+                        mode, dir_fd=work_fd,
+                    )
+                    try:
+                        method = copy_fd(src_fd, dst_fd, size, method)
+                        if owner is not None:
+                            os.fchown(dst_fd, *owner)
+                    finally:
+                        os.close(dst_fd)
+                finally:
+                    os.close(src_fd)
+        finally:
+            os.close(work_fd)
+        if self.clone_methods.get(dev) != method:
+            log.debug('scratch template: using {} for the device {}', method.value, dev)
+            self.clone_methods[dev] = method
@@ -0,0 +1,93 @@
+import asyncio
+import logging
+from typing import (
+    Any,
+    Dict,
+    MutableMapping,
+)
+
+import aiohttp
+from aiodocker.docker import DockerContainer
+from aiodocker.exceptions import DockerError
+
+from ai.backend.common.logging import BraceStyleAdapter
+from ai.backend.common.types import ContainerId
+
+from .utils import PooledDocker
+
+log = BraceStyleAdapter(logging.getLogger(__name__))
+
+
+def is_valid_stats_sample(sample: Any) -> bool:
+    # The API may return an invalid or empty result upon container startup/termination.
+    if sample is None or not isinstance(sample, dict):
+        return False
+    return not (
+        sample.get('read', '0001-01-01').startswith('0001-01-01') or
+        sample.get('preread', '0001-01-01').startswith('0001-01-01')
+    )
+
+
+class DockerStatsStreamer:
+    """
+    Keeps a long-lived streaming stats subscription for each live container
+    and caches the latest sample so that the stat collectors can read it
+    without issuing a Docker API request per container per tick.
+
+    The subscriptions use a separate Docker client with an unbounded connection pool,
+    because each stream occupies a connection for the whole lifetime of its container.
+    """
+
+    samples: Dict[ContainerId, Dict[str, Any]]
+
+    def __init__(self, *, retry_interval: float = 1.0) -> None:
+        self.docker = PooledDocker(max_connections=0)
+        self.retry_interval = retry_interval
+        self.samples = {}
+        self._tasks: MutableMapping[ContainerId, asyncio.Task] = {}
+
+    def start(self, container_id: ContainerId) -> None:
+        task = self._tasks.get(container_id)
+        if task is not None and not task.done():
+            return
+        self._tasks[container_id] = asyncio.create_task(self._subscribe(container_id))
+
+    async def stop(self, container_id: ContainerId) -> None:
+        task = self._tasks.pop(container_id, None)
+        if task is not None and not task.done():
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+        self.samples.pop(container_id, None)
+
+    async def close(self) -> None:
+        tasks = [*self._tasks.values()]
+        self._tasks.clear()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.samples.clear()
+        await self.docker.close()
+
+    async def _subscribe(self, container_id: ContainerId) -> None:
+        container = DockerContainer(self.docker, id=container_id)
+        try:
+            while True:
+                try:
+                    async for sample in container.stats(stream=True):
+                        if is_valid_stats_sample(sample):
+                            self.samples[container_id] = sample
+                    # The daemon closes the stream when the container stops.
+                    return
+                except DockerError as e:
+                    if e.status == 404:
+                        return
+                    log.warning('stats stream error (cid:{}): {!r}', container_id[:7], e)
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    log.warning('stats stream error (cid:{}): {!r}', container_id[:7], e)
+                await asyncio.sleep(self.retry_interval)
+        except asyncio.CancelledError:
+            pass
+        finally:
+            self.samples.pop(container_id, None)
+            if self._tasks.get(container_id) is asyncio.current_task():
+                del self._tasks[container_id]
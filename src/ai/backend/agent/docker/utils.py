@@ -1,13 +1,17 @@
 import asyncio
 import gzip
 import logging
+import os
 from pathlib import Path
 import pkg_resources
 import subprocess
-from typing import Any, BinaryIO, Mapping, Tuple, cast
+from typing import Any, BinaryIO, Mapping, Optional, Tuple, cast
 
+import aiohttp
 from aiodocker.docker import Docker
 from aiodocker.exceptions import DockerError
+from aiodocker.types import SENTINEL
+import async_timeout
 
 from ai.backend.common.logging import BraceStyleAdapter
 
@@ -15,6 +19,95 @@ from ..utils import closing_async, get_arch_name, update_nested_dict
 
 log = BraceStyleAdapter(logging.getLogger(__name__))
 
+_docker_sock_search_paths = (
+    Path('/run/docker.sock'),
+    Path('/var/run/docker.sock'),
+)
+
+
+class PooledDocker(Docker):
+    """
+    An agent-wide Docker API client which reuses keep-alive connections
+    from a bounded pool instead of opening a new session for every call.
+
+    The number of concurrently dispatched requests is limited by a semaphore,
+    and the dispatch of each request (until the response headers arrive) is bounded
+    by ``request_timeout`` unless the caller gives an explicit timeout.
+    Streaming responses such as events and stats streams are not affected
+    once their headers are received.
+    """
+
+    def __init__(
+        self,
+        url: Optional[str] = None,
+        *,
+        max_connections: int = 32,
+        max_concurrency: int = 16,
+        keepalive_timeout: float = 30.0,
+        request_timeout: Optional[float] = 30.0,
+    ) -> None:
+        docker_host = url or os.environ.get('DOCKER_HOST')
+        if docker_host is None:
+            for sock_path in _docker_sock_search_paths:
+                if sock_path.is_socket():
+                    docker_host = f'unix://{sock_path}'
+                    break
+        connector: Optional[aiohttp.BaseConnector] = None
+        session: Optional[aiohttp.ClientSession] = None
+        if docker_host is not None and docker_host.startswith('unix://'):
+            connector = aiohttp.UnixConnector(
+                docker_host[len('unix://'):],
+                limit=max_connections,
+                keepalive_timeout=keepalive_timeout,
+            )
+            # Streaming calls must not be cut by the session-wide total timeout.
+            session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=None, sock_connect=request_timeout),
+            )
+        super().__init__(url=docker_host, connector=connector, session=session)
+        if connector is not None:
+            # dummy hostname for URL composition (aiodocker does this only for its own connector)
+            self.docker_host = 'unix://localhost'
+        self.request_timeout = request_timeout
+        self._sema = asyncio.Semaphore(max_concurrency)
+        self.num_in_flight = 0
+        self.num_queued = 0
+        self.num_requests = 0
+        self.num_timeouts = 0
+
+    def get_stats(self) -> Mapping[str, int]:
+        return {
+            'in_flight': self.num_in_flight,
+            'queued': self.num_queued,
+            'requests': self.num_requests,
+            'timeouts': self.num_timeouts,
+        }
+
+    async def _do_query(self, path, method, **kwargs) -> aiohttp.ClientResponse:
+        if kwargs.get('versioned_api', True):
+            # Resolve the API version before taking a slot,
+            # as it issues a nested query by itself.
+            await self._check_version()
+        self.num_queued += 1
+        try:
+            await self._sema.acquire()
+        finally:
+            self.num_queued -= 1
+        self.num_in_flight += 1
+        self.num_requests += 1
+        try:
+            if self.request_timeout is None or kwargs.get('timeout') is not SENTINEL:
+                return await super()._do_query(path, method, **kwargs)
+            async with async_timeout.timeout(self.request_timeout):
+                return await super()._do_query(path, method, **kwargs)
+        except asyncio.TimeoutError:
+            self.num_timeouts += 1
+            raise
+        finally:
+            self.num_in_flight -= 1
+            self._sema.release()
+
 
 class PersistentServiceContainer:
 
@@ -0,0 +1,344 @@
+"""
+A pool of pre-created containers to cut the cold-start latency of the configured images.
+
+Docker does not allow changing the mounts, environment variables, and port bindings
+of a container once it is created, so the pool keeps the containers created but not started
+and matches them against the container config of each new kernel:
+
+* The template of an image is learned from the container config of the first kernel
+  created from it, with the per-kernel values (the name, the resource limits,
+  the host ports, and the environment variables) stripped out.
+* The pooled containers bind the scratch and config directories through symbolic links
+  in their own entry directories, which are switched to the directories of the claiming
+  kernel before starting the container since the bind sources are resolved upon start.
+  The entry directories of the claimed containers are kept until the scratch directories
+  of their kernels are removed, so that the containers can be started again.
+* The pooled containers run a wrapper entrypoint which exports the variables in
+  the ``environ.txt`` of the claiming kernel before running the usual entrypoint.
+* The resource limits are applied with the container update API and the container is
+  renamed after the claiming kernel.  Docker cannot change the labels of existing containers,
+  so the kernel ID label is added when the agent reads the claimed containers,
+  identifying the kernel from their names as for the other containers.
+
+A kernel whose container config differs from the template in any other part
+(e.g., vfolder mounts, accelerator devices, or preopen ports) falls back to
+the normal creation and replaces the template.
+"""
+
+from __future__ import annotations
+
+import collections
+import copy
+import json
+import logging
+import os
+from pathlib import Path
+import pkg_resources
+import shutil
+from typing import (
+    Any,
+    Deque,
+    Dict,
+    List,
+    Mapping,
+    MutableMapping,
+    Optional,
+    Set,
+    Tuple,
+)
+import uuid
+
+from aiodocker.docker import Docker, DockerContainer
+from aiodocker.exceptions import DockerError
+import attr
+
+from ai.backend.common.logging import BraceStyleAdapter
+from ai.backend.common.types import KernelId
+from ai.backend.common.utils import current_loop
+
+log = BraceStyleAdapter(logging.getLogger(__name__))
+
+# The resource limits which can be changed by the container update API.
+# ("Cpus" is not a Docker option but is set by the intrinsic CPU plugin.)
+resource_limit_keys = frozenset([
+    'CpuShares', 'CpuPeriod', 'CpuQuota', 'CpusetCpus', 'CpusetMems', 'Cpus', 'NanoCpus',
+    'Memory', 'MemorySwap', 'MemoryReservation', 'PidsLimit', 'BlkioWeight',
+])
+warm_pool_label = 'ai.backend.warm-pool'
+kernel_id_label = 'ai.backend.kernel-id'
+warm_entrypoint_path = '/opt/kernel/warm-entrypoint.sh'
+
+
+def get_kernel_binds(scratch_root: Path, kernel_id: KernelId) -> Dict[str, Path]:
+    """
+    Return the per-kernel bind sources which the warm containers bind via symbolic links.
+    """
+    return {
+        'config': scratch_root / str(kernel_id) / 'config',
+        'work': scratch_root / str(kernel_id) / 'work',
+        'tmp': scratch_root / f'{kernel_id}_tmp',
+    }
+
+
+def get_claimed_bind_source(source: Path, kernel_id: KernelId) -> Path:
+    """
+    Return the real bind source of a container claimed by the given kernel
+    from the bind source in its container config, which is a symbolic link
+    in its pool entry directory (``<scratch-root>/.warm/<entry>/<key>``).
+    """
+    scratch_root = source.parent.parent.parent
+    return get_kernel_binds(scratch_root, kernel_id)[source.name]
+
+
+def split_container_config(
+    container_config: Mapping[str, Any],
+    binds: Mapping[str, Path],
+) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """
+    Split the container config of a kernel into the template shared with other kernels
+    of the same image and the resource limits to apply with the container update API.
+    The bind sources in *binds* are replaced with the placeholders of their keys
+    (e.g., ``<work>``) in the template.
+    """
+    template = copy.deepcopy(dict(container_config))
+    template.pop('Env', None)
+    # The per-kernel label cannot be set after creating the container.
+    template.get('Labels', {}).pop(kernel_id_label, None)
+    host_config = template.setdefault('HostConfig', {})
+    limits = {
+        key: host_config.pop(key)
+        for key in resource_limit_keys
+        if key in host_config
+    }
+    for bindings in host_config.get('PortBindings', {}).values():
+        for binding in bindings:
+            binding.pop('HostPort', None)
+    bind_keys = {str(path): key for key, path in binds.items()}
+    for mount in host_config.get('Mounts', []):
+        if mount['Type'] == 'bind' and mount['Source'] in bind_keys:
+            mount['Source'] = f"<{bind_keys[mount['Source']]}>"
+    return template, limits
+
+
+@attr.s(auto_attribs=True, slots=True)
+class WarmContainer:
+    image: str
+    template: Mapping[str, Any]
+    container: DockerContainer
+    entry_dir: Path
+    # the host ports bound to the container, keyed by the "port/tcp" of the container ports
+    host_ports: Mapping[str, int]
+
+
+class WarmContainerPool:
+    """
+    Keeps up to *size* pre-created containers for each of the configured images
+    and refills them in the background within the given budget: the total number of
+    pooled containers and the number of host ports left for the normal creations.
+    """
+
+    hits: MutableMapping[str, int]
+    misses: MutableMapping[str, int]
+
+    def __init__(
+        self,
+        docker: Docker,
+        port_pool: Set[int],
+        scratch_root: Path,
+        *,
+        images: List[str],
+        size: int,
+        max_containers: int,
+        min_free_ports: int,
+    ) -> None:
+        self.docker = docker
+        self.port_pool = port_pool
+        self.pool_root = scratch_root / '.warm'
+        self.images = frozenset(images)
+        self.size = size
+        self.max_containers = max_containers
+        self.min_free_ports = min_free_ports
+        self.entrypoint_path = Path(pkg_resources.resource_filename(
+            'ai.backend.agent', '../runner/warm-entrypoint.sh')).resolve()
+        self.hits = collections.Counter()
+        self.misses = collections.Counter()
+        self._templates: Dict[str, Mapping[str, Any]] = {}
+        self._idle: Dict[str, Deque[WarmContainer]] = collections.defaultdict(collections.deque)
+
+    @property
+    def num_containers(self) -> int:
+        return sum(len(idle) for idle in self._idle.values())
+
+    def get_stats(self) -> Mapping[str, Any]:
+        return {
+            'hits': dict(self.hits),
+            'misses': dict(self.misses),
+            'idle': {image: len(idle) for image, idle in self._idle.items()},
+        }
+
+    async def start(self) -> None:
+        """
+        Remove the unclaimed pooled containers left by the previous run of the agent.
+        The claimed containers keep the label but are renamed after their kernels.
+        """
+        loop = current_loop()
+        containers = await self.docker.containers.list(
+            all=True,
+            filters=json.dumps({'label': [warm_pool_label]}),
+        )
+        for container in containers:
+            name = container['Names'][0].lstrip('/')
+            if not name.startswith('warm.'):
+                continue
+            try:
+                await container.delete(force=True)
+            except DockerError:
+                log.warning('failed to remove the stale warm container {}', container._id)
+                continue
+            entry_dir = self.pool_root / name.rsplit('.', 1)[-1]
+            await loop.run_in_executor(None, shutil.rmtree, entry_dir, True)
+        await loop.run_in_executor(None, self._remove_stale_entries)
+
+    async def close(self) -> None:
+        for idle in self._idle.values():
+            while idle:
+                await self._discard(idle.popleft())
+
+    async def claim(
+        self,
+        image: str,
+        container_config: Mapping[str, Any],
+        name: str,
+        binds: Mapping[str, Path],
+    ) -> Optional[WarmContainer]:
+        """
+        Hand over a pooled container matching the container config of a new kernel
+        after applying its resource limits, bind directories, and name.
+        Returns None if there is no matching container.
+        """
+        if image not in self.images:
+            return None
+        template, limits = split_container_config(container_config, binds)
+        if self._templates.get(image) != template:
+            # Pool the containers of the latest kernel config from the next refill.
+            self._templates[image] = template
+            self.misses[image] += 1
+            return None
+        idle = self._idle[image]
+        while idle:
+            warm_container = idle.popleft()
+            if warm_container.template == template:
+                break
+            await self._discard(warm_container)
+        else:
+            self.misses[image] += 1
+            return None
+        loop = current_loop()
+        try:
+            await loop.run_in_executor(None, self._switch_binds, warm_container.entry_dir, binds)
+            if limits:
+                await self.docker._query_json(
+                    f'containers/{warm_container.container._id}/update',
+                    method='POST',
+                    data=limits,
+                )
+            await warm_container.container.rename(name)
+        except (DockerError, OSError):
+            log.exception('failed to claim the warm container {}', warm_container.container._id)
+            await self._discard(warm_container)
+            self.misses[image] += 1
+            return None
+        self.hits[image] += 1
+        log.debug('claimed the warm container {} as {}', warm_container.container._id, name)
+        return warm_container
+
+    async def refill(self, interval: float) -> None:
+        loop = current_loop()
+        await loop.run_in_executor(None, self._remove_stale_entries)
+        for image, template in [*self._templates.items()]:
+            idle = self._idle[image]
+            num_ports = len(template['HostConfig'].get('PortBindings', {}))
+            while len(idle) < self.size and self.num_containers < self.max_containers:
+                if len(self.port_pool) - num_ports < self.min_free_ports:
+                    log.debug('warm pool: not enough host ports left to refill')
+                    return
+                try:
+                    idle.append(await self._create(image, template))
+                except (DockerError, OSError):
+                    log.exception('warm pool: failed to pre-create a container of {}', image)
+                    break
+
+    async def _create(self, image: str, template: Mapping[str, Any]) -> WarmContainer:
+        loop = current_loop()
+        entry_id = uuid.uuid4().hex
+        entry_dir = self.pool_root / entry_id
+        container_config = copy.deepcopy(dict(template))
+        host_config = container_config['HostConfig']
+        bind_keys: List[str] = []
+        for mount in host_config.get('Mounts', []):
+            source = mount['Source']
+            if mount['Type'] == 'bind' and source.startswith('<') and source.endswith('>'):
+                bind_keys.append(source[1:-1])
+                mount['Source'] = str(entry_dir / source[1:-1])
+        host_config.setdefault('Mounts', []).append({
+            'Type': 'bind',
+            'Source': str(self.entrypoint_path),
+            'Target': warm_entrypoint_path,
+            'ReadOnly': True,
+        })
+        container_config['EntryPoint'] = [warm_entrypoint_path]
+        container_config.setdefault('Labels', {})[warm_pool_label] = image
+        host_ports: Dict[str, int] = {}
+        for port, bindings in host_config.get('PortBindings', {}).items():
+            host_ports[port] = self.port_pool.pop()
+            for binding in bindings:
+                binding['HostPort'] = str(host_ports[port])
+        try:
+            await loop.run_in_executor(None, self._create_binds, entry_dir, bind_keys)
+            image_name = image.split('/')[-1].split(':')[0]
+            container = await self.docker.containers.create(
+                config=container_config,
+                name=f'warm.{image_name}.{entry_id}',
+            )
+        except BaseException:
+            self.port_pool.update(host_ports.values())
+            await loop.run_in_executor(None, shutil.rmtree, entry_dir, True)
+            raise
+        return WarmContainer(image, template, container, entry_dir, host_ports)
+
+    async def _discard(self, warm_container: WarmContainer) -> None:
+        try:
+            await warm_container.container.delete(force=True)
+        except DockerError:
+            log.warning('failed to remove the warm container {}', warm_container.container._id)
+        self.port_pool.update(warm_container.host_ports.values())
+        loop = current_loop()
+        await loop.run_in_executor(None, shutil.rmtree, warm_container.entry_dir, True)
+
+    def _remove_stale_entries(self) -> None:
+        # The entry directories of the claimed containers whose kernels are cleaned up
+        # have only the dangling links, while the unclaimed ones link to their ".empty".
+        try:
+            entry_dirs = [*self.pool_root.iterdir()]
+        except FileNotFoundError:
+            return
+        for entry_dir in entry_dirs:
+            links = [p for p in entry_dir.iterdir() if p.is_symlink()]
+            if not any(p.exists() for p in links):
+                shutil.rmtree(entry_dir, ignore_errors=True)
+
+    @staticmethod
+    def _create_binds(entry_dir: Path, bind_keys: List[str]) -> None:
+        # The bind sources must exist when creating the container.
+        (entry_dir / '.empty').mkdir(parents=True)
+        for key in bind_keys:
+            (entry_dir / key).symlink_to(entry_dir / '.empty')
+
+    @staticmethod
+    def _switch_binds(entry_dir: Path, binds: Mapping[str, Path]) -> None:
+        for key, path in binds.items():
+            temp_link = entry_dir / f'.{key}.tmp'
+            if temp_link.is_symlink():
+                temp_link.unlink()
+            temp_link.symlink_to(path)
+            os.replace(temp_link, entry_dir / key)
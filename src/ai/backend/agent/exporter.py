@@ -0,0 +1,171 @@
+"""
+An optional HTTP endpoint exposing the node, device, and kernel metrics
+in the OpenMetrics text format for Prometheus.
+
+The exposition text is rendered from the in-memory metrics of :class:`StatContext`
+once per stat collection and the same buffer is served to all scrapes.
+"""
+
+import logging
+import math
+import re
+from typing import (
+    Iterable,
+    List,
+    Mapping,
+    Optional,
+    TYPE_CHECKING,
+)
+
+from aiohttp import web
+
+from ai.backend.common.logging import BraceStyleAdapter
+from ai.backend.common.types import HostPortPair
+
+if TYPE_CHECKING:
+    from .stats import StatContext
+
+log = BraceStyleAdapter(logging.getLogger(__name__))
+
+content_type = 'application/openmetrics-text; version=1.0.0; charset=utf-8'
+_rx_invalid_name_chars = re.compile(r'[^a-zA-Z0-9_]')
+
+
+def format_metric_name(*parts: str) -> str:
+    return _rx_invalid_name_chars.sub('_', '_'.join(parts))
+
+
+def format_labels(labels: Mapping[str, str]) -> str:
+    def escape(value: str) -> str:
+        return value.replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+    return '{' + ','.join(f'{key}="{escape(value)}"' for key, value in labels.items()) + '}'
+
+
+def format_value(value: float) -> str:
+    if isinstance(value, int):
+        return str(value)
+    if math.isnan(value):
+        return 'NaN'
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(value)
+
+
+class MetricExporter:
+
+    def __init__(self, stat_ctx: 'StatContext', service_addr: HostPortPair) -> None:
+        self.stat_ctx = stat_ctx
+        self.service_addr = service_addr
+        self._body = b'# EOF\n'
+        self._runner: Optional[web.AppRunner] = None
+
+    async def start(self) -> None:
+        app = web.Application()
+        app.router.add_route('GET', '/metrics', self.handle_metrics)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(
+            self._runner,
+            str(self.service_addr.host),
+            self.service_addr.port,
+            backlog=16,
+            reuse_port=True,
+        )
+        await site.start()
+        log.info('serving metrics at http://{}/metrics', self.service_addr)
+
+    async def close(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def handle_metrics(self, request: web.Request) -> web.Response:
+        return web.Response(body=self._body, headers={'Content-Type': content_type})
+
+    def _render_family(
+        self,
+        lines: List[str],
+        name: str,
+        unit_hint: Optional[str],
+        samples: Iterable[tuple],
+    ) -> None:
+        samples = [*samples]
+        if not samples:
+            return
+        lines.append(f'# TYPE {name} gauge')
+        if unit_hint:
+            lines.append(f'# HELP {name} in {unit_hint}')
+        for labels, value in samples:
+            lines.append(f'{name}{format_labels(labels)} {format_value(value)}')
+
+    def render(self) -> None:
+        """
+        Rebuilds the exposition text from the current metrics.
+        """
+        stat_ctx = self.stat_ctx
+        agent = stat_ctx.agent
+        agent_labels = {'agent_id': str(agent.local_config['agent']['id'])}
+        lines: List[str] = []
+        for metric_key, metric in stat_ctx.node_metrics.items():
+            name = format_metric_name('backendai', 'node', metric_key)
+            self._render_family(lines, name, metric.unit_hint, [
+                (agent_labels, metric.current),
+            ])
+            if metric.capacity is not None:
+                self._render_family(lines, f'{name}_capacity', metric.unit_hint, [
+                    (agent_labels, metric.capacity),
+                ])
+        for metric_key, per_device in stat_ctx.device_metrics.items():
+            if not per_device:
+                continue
+            name = format_metric_name('backendai', 'device', metric_key)
+            unit_hint = next(iter(per_device.values())).unit_hint
+            self._render_family(lines, name, unit_hint, (
+                ({**agent_labels, 'device': str(dev_id)}, metric.current)
+                for dev_id, metric in per_device.items()
+            ))
+            self._render_family(lines, f'{name}_capacity', unit_hint, (
+                ({**agent_labels, 'device': str(dev_id)}, metric.capacity)
+                for dev_id, metric in per_device.items()
+                if metric.capacity is not None
+            ))
+        # Group the kernel metrics by the metric keys as each metric family must be contiguous.
+        kernel_families: dict = {}
+        for kernel_id, metrics in stat_ctx.kernel_metrics.items():
+            kernel_obj = agent.kernel_registry.get(kernel_id)
+            if kernel_obj is None:
+                continue
+            kernel_labels = {
+                **agent_labels,
+                'kernel_id': str(kernel_id),
+                'session_id': str(kernel_obj.get('session_id', '')),
+                'image': kernel_obj.image.canonical,
+            }
+            for metric_key, metric in metrics.items():
+                family = kernel_families.setdefault(metric_key, (metric.unit_hint, []))
+                family[1].append((kernel_labels, metric.current))
+        for metric_key, (unit_hint, samples) in kernel_families.items():
+            name = format_metric_name('backendai', 'kernel', metric_key)
+            self._render_family(lines, name, unit_hint, samples)
+        if stat_ctx.kernel_creation_stages:
+            name = 'backendai_kernel_creation_stage_duration_seconds'
+            lines.append(f'# TYPE {name} histogram')
+            lines.append(f'# HELP {name} in seconds')
+            for stage, histogram in stat_ctx.kernel_creation_stages.items():
+                stage_labels = {**agent_labels, 'stage': stage}
+                for upper_bound, count in histogram.cumulative_counts():
+                    bucket_labels = {**stage_labels, 'le': format_value(float(upper_bound))}
+                    lines.append(f'{name}_bucket{format_labels(bucket_labels)} {count}')
+                lines.append(f'{name}_sum{format_labels(stage_labels)} {format_value(histogram.sum)}')
+                lines.append(f'{name}_count{format_labels(stage_labels)} {histogram.count}')
+        if stat_ctx.warm_pool is not None:
+            warm_pool = stat_ctx.warm_pool
+            for kind, counts in (('hits', warm_pool.hits), ('misses', warm_pool.misses)):
+                name = f'backendai_warm_pool_{kind}'
+                lines.append(f'# TYPE {name} counter')
+                for image in sorted(warm_pool.images):
+                    image_labels = {**agent_labels, 'image': image}
+                    lines.append(f'{name}_total{format_labels(image_labels)} {counts.get(image, 0)}')
+        lines.append('# EOF\n')
+        self._body = '\n'.join(lines).encode('utf-8')
@@ -1,5 +1,15 @@
 from subprocess import CalledProcessError
 import asyncio
+import os
+from pathlib import Path
+import secrets
+from typing import (
+    List,
+    Optional,
+    Tuple,
+)
+
+import attr
 
 
 async def create_scratch_filesystem(scratch_dir, size):
@@ -40,3 +50,110 @@ async def destroy_scratch_filesystem(scratch_dir):
     if exit_code < 0:
         raise CalledProcessError(proc.returncode, proc.args,
                                  output=proc.stdout, stderr=proc.stderr)
+
+
+def write_file_atomic(
+    path: Path,
+    data: bytes,
+    mode: Optional[int] = None,
+    owner: Optional[Tuple[int, int]] = None,
+) -> None:
+    '''
+    Write a file into a temporary file in the same directory and rename it to the target path,
+    so that readers never see a partially written file.
+
+    :param mode: The permission bits of the file.
+                 If not given, the file is created as ``open()`` does.
+
+    :param owner: The pair of uid and gid to own the file.
+    '''
+    temp_path = path.with_name(f'.{path.name}.{secrets.token_hex(4)}.tmp')
+    # Create the file with the final mode to avoid exposing private keys in between.
+    fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666 if mode is None else mode)
+    try:
+        try:
+            view = memoryview(data)
+            while view:
+                view = view[os.write(fd, view):]
+            if mode is not None:
+                os.fchmod(fd, mode)
+            if owner is not None:
+                os.fchown(fd, *owner)
+        finally:
+            os.close(fd)
+        os.replace(temp_path, path)
+    except BaseException:
+        # The temporary file may have been removed with its directory in the meantime.
+        temp_path.unlink(missing_ok=True)
+        raise
+
+
+@attr.s(auto_attribs=True, slots=True)
+class _BatchEntry:
+    path: Path
+    data: Optional[bytes] = None  # None for directories
+    copy_from: Optional[Path] = None
+    mode: Optional[int] = None
+    owner: Optional[Tuple[int, int]] = None
+
+
+class FileBatch:
+    '''
+    Collects the files to materialize and writes all of them at once in :meth:`write()`,
+    which is meant to be run as a single executor job.
+    The entries are processed in the order they are added, so a later entry overwrites
+    an earlier one of the same path.
+    '''
+
+    def __init__(self) -> None:
+        self._entries: List[_BatchEntry] = []
+
+    def add_file(
+        self,
+        path: Path,
+        data: bytes,
+        *,
+        mode: Optional[int] = None,
+        owner: Optional[Tuple[int, int]] = None,
+    ) -> None:
+        '''
+        Add a file to write atomically, creating its parent directories if missing.
+        '''
+        self._entries.append(_BatchEntry(path, data=data, mode=mode, owner=owner))
+
+    def add_copy(self, src: Path, dst: Path) -> None:
+        '''
+        Add a copy of the content of *src* as it is when the entry is processed.
+        '''
+        self._entries.append(_BatchEntry(dst, copy_from=src))
+
+    def add_dir(
+        self,
+        path: Path,
+        *,
+        mode: Optional[int] = None,
+        owner: Optional[Tuple[int, int]] = None,
+    ) -> None:
+        '''
+        Add a directory to create if missing and set its mode and owner.
+        '''
+        self._entries.append(_BatchEntry(path, mode=mode, owner=owner))
+
+    def write(self) -> None:
+        for entry in self._entries:
+            if entry.copy_from is not None:
+                write_file_atomic(entry.path, entry.copy_from.read_bytes())
+            elif entry.data is not None:
+                try:
+                    write_file_atomic(entry.path, entry.data, entry.mode, entry.owner)
+                except FileNotFoundError:
+                    if entry.path.parent.is_dir():
+                        raise
+                    entry.path.parent.mkdir(parents=True, exist_ok=True)
+                    write_file_atomic(entry.path, entry.data, entry.mode, entry.owner)
+            else:
+                entry.path.mkdir(parents=True, exist_ok=True)
+                if entry.mode is not None:
+                    entry.path.chmod(entry.mode)
+                if entry.owner is not None:
+                    os.chown(entry.path, *entry.owner)
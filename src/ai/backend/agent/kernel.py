@@ -848,6 +848,9 @@ class AbstractCodeRunner(aobject, metaclass=ABCMeta):
                 break
 
 
+_rx_ver_suffix = re.compile(r'(\d+(\.\d+)*)$')
+
+
 def match_distro_data(data: Mapping[str, Any], distro: str) -> Tuple[str, Any]:
     """
     Find the latest or exactly matching entry from krunner_volumes mapping using the given distro
@@ -857,8 +860,7 @@ def match_distro_data(data: Mapping[str, Any], distro: str) -> Tuple[str, Any]:
     prefix (e.g., "centos", "ubuntu") and a distro version composed of multiple integer components
     joined by single dots (e.g., "1.2.3", "18.04").
     """
-    rx_ver_suffix = re.compile(r'(\d+(\.\d+)*)$')
-    m = rx_ver_suffix.search(distro)
+    m = _rx_ver_suffix.search(distro)
     if m is None:
         # Assume latest
         distro_prefix = distro
@@ -884,7 +886,7 @@ def match_distro_data(data: Mapping[str, Any], distro: str) -> Tuple[str, Any]:
     ]
 
     def _extract_version(item: Tuple[str, Any]) -> Tuple[int, ...]:
-        m = rx_ver_suffix.search(item[0])
+        m = _rx_ver_suffix.search(item[0])
         if m is not None:
             return tuple(map(int, m.group(1).split('.')))
         return (0,)
@@ -35,13 +35,15 @@ from .kube_object import (
 
 from ..agent import ACTIVE_STATUS_SET, AbstractAgent, AbstractKernelCreationContext, ComputerContext
 from ..defs import ipc_base_path
-from ..exception import K8sError, UnsupportedResource
+from ..exception import K8sError
 from ..kernel import KernelFeatures
 from ..resources import (
     AbstractComputePlugin,
     KernelResourceSpec,
     Mount,
-    known_slot_types,
+    get_requested_slots,
+    read_resource_spec,
+    resource_spec_binary_filename,
 )
 from ..types import Container, ContainerStatus, Port
 
@@ -60,9 +62,7 @@ from ai.backend.common.types import (
     MountTuple4,
     MountTuple5,
     MountTypes,
-    ResourceSlot,
     SlotName,
-    current_resource_slots,
 )
 
 log = BraceStyleAdapter(logging.getLogger('ai.backend.agent.kubernetes.agent'))
@@ -121,26 +121,14 @@ class KubernetesKernelCreationContext(AbstractKernelCreationContext[KubernetesKe
         if self.restarting:
             await kube_config.load_kube_config()
 
-            def _kernel_resource_spec_read():
-                with open((self.config_dir / 'resource.txt').resolve(), 'r') as f:
-                    resource_spec = KernelResourceSpec.read_from_file(f)
-                return resource_spec
-
-            resource_spec = await loop.run_in_executor(None, _kernel_resource_spec_read)
+            resource_spec = await loop.run_in_executor(
+                None,
+                read_resource_spec,
+                self.config_dir.resolve(),
+            )
             resource_opts = None
         else:
-            slots = ResourceSlot.from_json(self.kernel_config['resource_slots'])
-            # Ensure that we have intrinsic slots.
-            assert SlotName('cpu') in slots
-            assert SlotName('mem') in slots
-            # accept unknown slot type with zero values
-            # but reject if they have non-zero values.
-            for st, sv in slots.items():
-                if st not in known_slot_types and sv != Decimal(0):
-                    raise UnsupportedResource(st)
-            # sanitize the slots
-            current_resource_slots.set(known_slot_types)
-            slots = slots.normalize_slots(ignore_unknown=True)
+            slots = get_requested_slots(self.kernel_config)
             resource_spec = KernelResourceSpec(
                 container_id='',
                 allocations={},
@@ -314,7 +302,8 @@ class KubernetesKernelCreationContext(AbstractKernelCreationContext[KubernetesKe
                     mount.type,
                 )
 
-    def resolve_krunner_filepath(self, filename: str) -> Path:
+    @classmethod
+    def resolve_krunner_filepath(cls, filename: str) -> Path:
         return Path(filename)
 
     def get_runner_mount(
@@ -515,6 +504,12 @@ class KubernetesKernelCreationContext(AbstractKernelCreationContext[KubernetesKe
                 await loop.run_in_executor(
                     None, functools.partial(_write_config, 'resource.txt', buf.getvalue()),
                 )
+            # The binary resource spec is read by the agent when restoring the kernel.
+            await loop.run_in_executor(
+                None,
+                (self.config_dir / resource_spec_binary_filename).write_bytes,
+                resource_spec.write_to_bytes(),
+            )
 
             docker_creds = self.internal_data.get('docker_credentials')
             if docker_creds:
@@ -732,6 +727,7 @@ class KubernetesAgent(AbstractAgent[KubernetesKernel, KubernetesKernelCreationCo
         await super().__ainit__()
         (ipc_base_path / 'container').mkdir(parents=True, exist_ok=True)
         self.agent_sockpath = ipc_base_path / 'container' / f'agent.{self.local_instance_id}.sock'
+        KubernetesKernelCreationContext.prepare_krunner_mount_plans(self.local_config)
 
         await self.check_krunner_pv_status()
         await self.fetch_workers()
@@ -1,3 +1,4 @@
+import asyncio
 from decimal import Decimal
 import logging
 from pathlib import Path
@@ -7,8 +8,6 @@ from typing import (
     Tuple,
 )
 
-import aiofiles
-
 from ai.backend.common.etcd import AsyncEtcd
 from ai.backend.common.logging import BraceStyleAdapter
 from ai.backend.common.types import (
@@ -17,6 +16,7 @@ from ai.backend.common.types import (
 from ..exception import InitializationError
 from ..resources import (
     AbstractComputePlugin, ComputePluginContext, KernelResourceSpec, known_slot_types,
+    read_resource_spec,
 )
 
 log = BraceStyleAdapter(logging.getLogger(__name__))
@@ -92,7 +92,7 @@ async def detect_resources(
 async def get_resource_spec_from_container(container_info) -> Optional[KernelResourceSpec]:
     for mount in container_info['HostConfig']['Mounts']:
         if mount['Target'] == '/home/config':
-            async with aiofiles.open(Path(mount['Source']) / 'resource.txt', 'r') as f:  # type: ignore
-                return await KernelResourceSpec.aread_from_file(f)
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(None, read_resource_spec, Path(mount['Source']))
     else:
         return None
@@ -0,0 +1,247 @@
+"""
+A memory-bounded, in-process time-series store of node and kernel metrics.
+
+Each metric keeps multiple tiers of fixed-size ring buffers with different resolutions
+(e.g., 5-second buckets for the last hour and 1-minute buckets for the last 6 hours),
+and every sample is aggregated into all tiers at once.
+With the default tiers, each metric takes about 15 KB,
+so the store can be capped by the total size of the histories.
+"""
+
+from array import array
+import logging
+import math
+from typing import (
+    Dict,
+    List,
+    MutableMapping,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+from ai.backend.common.logging import BraceStyleAdapter
+from ai.backend.common.types import KernelId
+
+log = BraceStyleAdapter(logging.getLogger(__name__))
+
+# (bucket size in seconds, retention in seconds)
+default_history_tiers: Sequence[Tuple[float, float]] = [
+    (5.0, 3600.0),
+    (60.0, 6 * 3600.0),
+    (600.0, 24 * 3600.0),
+]
+
+
+class MetricHistoryTier:
+    """
+    A ring buffer of the sum and count of samples in fixed-size time buckets.
+    """
+
+    __slots__ = ('step', 'capacity', '_sums', '_counts', '_last_bucket')
+
+    step: float
+    capacity: int
+    _sums: array
+    _counts: array
+    _last_bucket: Optional[int]
+
+    def __init__(self, step: float, retention: float) -> None:
+        self.step = step
+        self.capacity = max(1, math.ceil(retention / step))
+        self._sums = array('d', bytes(8 * self.capacity))
+        self._counts = array('i', bytes(4 * self.capacity))
+        self._last_bucket = None
+
+    def add(self, timestamp: float, value: float) -> None:
+        bucket = int(timestamp // self.step)
+        last_bucket = self._last_bucket
+        if last_bucket is None or bucket > last_bucket:
+            # Clear the slots of the skipped and the new buckets.
+            first_bucket = bucket - self.capacity + 1
+            if last_bucket is not None:
+                first_bucket = max(first_bucket, last_bucket + 1)
+            for b in range(first_bucket, bucket + 1):
+                idx = b % self.capacity
+                self._sums[idx] = 0.0
+                self._counts[idx] = 0
+            self._last_bucket = bucket
+        elif bucket <= last_bucket - self.capacity:
+            # too old to keep
+            return
+        idx = bucket % self.capacity
+        self._sums[idx] += value
+        self._counts[idx] += 1
+
+    @property
+    def nbytes(self) -> int:
+        return len(self._sums) * self._sums.itemsize + len(self._counts) * self._counts.itemsize
+
+    @property
+    def oldest_timestamp(self) -> Optional[float]:
+        if self._last_bucket is None:
+            return None
+        return (self._last_bucket - self.capacity + 1) * self.step
+
+    def query(self, since: float) -> List[Tuple[float, float]]:
+        """
+        Returns the pairs of the bucket start timestamp and the average value
+        of the non-empty buckets since the given timestamp.
+        """
+        if self._last_bucket is None:
+            return []
+        first_bucket = max(
+            int(since // self.step),
+            self._last_bucket - self.capacity + 1,
+        )
+        points = []
+        for b in range(first_bucket, self._last_bucket + 1):
+            idx = b % self.capacity
+            count = self._counts[idx]
+            if count:
+                points.append((b * self.step, self._sums[idx] / count))
+        return points
+
+
+class MetricHistory:
+
+    __slots__ = ('tiers', )
+
+    tiers: Sequence[MetricHistoryTier]
+
+    def __init__(self, tiers: Sequence[Tuple[float, float]] = default_history_tiers) -> None:
+        self.tiers = [
+            MetricHistoryTier(step, retention)
+            for step, retention in sorted(tiers)
+        ]
+
+    @property
+    def nbytes(self) -> int:
+        return sum(tier.nbytes for tier in self.tiers)
+
+    def add(self, timestamp: float, value: float) -> None:
+        if not math.isfinite(value):
+            return
+        for tier in self.tiers:
+            tier.add(timestamp, value)
+
+    def _choose_tier(self, since: float, step: float) -> MetricHistoryTier:
+        # Choose the coarsest tier not coarser than the requested step among the tiers
+        # covering the requested range.  If there is no such tier, choose the finest one
+        # covering the range or the coarsest one if none covers the range.
+        covering = [
+            tier for tier in self.tiers
+            if tier.oldest_timestamp is not None and tier.oldest_timestamp <= since
+        ]
+        if not covering:
+            return self.tiers[-1]
+        finer = [tier for tier in covering if tier.step <= step]
+        return finer[-1] if finer else covering[0]
+
+    def query(self, since: float, step: float) -> Tuple[float, List[Tuple[float, float]]]:
+        """
+        Returns the actual step and the list of timestamp-value pairs since the given timestamp.
+        If the requested step is coarser than the chosen tier, the buckets are averaged again.
+        """
+        tier = self._choose_tier(since, step)
+        points = tier.query(since)
+        if step <= tier.step:
+            return tier.step, points
+        merged: Dict[float, Tuple[float, int]] = {}
+        for timestamp, value in points:
+            key = (timestamp // step) * step
+            total, count = merged.get(key, (0.0, 0))
+            merged[key] = (total + value, count + 1)
+        return step, [
+            (timestamp, total / count)
+            for timestamp, (total, count) in merged.items()
+        ]
+
+
+class MetricHistoryStore:
+    """
+    Keeps the histories of the node-level metrics and the per-kernel metrics.
+
+    If *max_size* is given, no more histories are created once their total size
+    in bytes would exceed it, until the histories of terminated kernels are forgotten.
+    """
+
+    def __init__(
+        self,
+        tiers: Sequence[Tuple[float, float]] = default_history_tiers,
+        max_size: Optional[int] = None,
+    ) -> None:
+        self.tiers = tiers
+        self.max_size = max_size
+        self.history_size = MetricHistory(tiers).nbytes
+        self.size = 0
+        self._is_full = False
+        self.node: MutableMapping[str, MetricHistory] = {}
+        self.kernels: MutableMapping[KernelId, MutableMapping[str, MetricHistory]] = {}
+
+    def _create_history(self) -> Optional[MetricHistory]:
+        if self.max_size is not None and self.size + self.history_size > self.max_size:
+            if not self._is_full:
+                log.warning('the metric history has reached its maximum size ({} bytes); '
+                            'the new metrics are not recorded', self.max_size)
+                self._is_full = True
+            return None
+        self.size += self.history_size
+        return MetricHistory(self.tiers)
+
+    def record_node(self, metric_key: str, timestamp: float, value: float) -> None:
+        history = self.node.get(metric_key)
+        if history is None:
+            history = self._create_history()
+            if history is None:
+                return
+            self.node[metric_key] = history
+        history.add(timestamp, value)
+
+    def record_kernel(
+        self,
+        kernel_id: KernelId,
+        metric_key: str,
+        timestamp: float,
+        value: float,
+    ) -> None:
+        per_kernel = self.kernels.get(kernel_id)
+        if per_kernel is None:
+            per_kernel = {}
+            self.kernels[kernel_id] = per_kernel
+        history = per_kernel.get(metric_key)
+        if history is None:
+            history = self._create_history()
+            if history is None:
+                return
+            per_kernel[metric_key] = history
+        history.add(timestamp, value)
+
+    def forget_kernel(self, kernel_id: KernelId) -> None:
+        per_kernel = self.kernels.pop(kernel_id, None)
+        if per_kernel:
+            self.size -= self.history_size * len(per_kernel)
+            self._is_full = False
+
+    def query_node(
+        self,
+        metric_key: str,
+        since: float,
+        step: float,
+    ) -> Tuple[float, List[Tuple[float, float]]]:
+        history = self.node.get(metric_key)
+        if history is None:
+            return step, []
+        return history.query(since, step)
+
+    def query_kernel(
+        self,
+        kernel_id: KernelId,
+        metric_key: str,
+        since: float,
+        step: float,
+    ) -> Tuple[float, List[Tuple[float, float]]]:
+        history = self.kernels.get(kernel_id, {}).get(metric_key)
+        if history is None:
+            return step, []
+        return history.query(since, step)
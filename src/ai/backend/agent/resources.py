@@ -1,8 +1,10 @@
 from __future__ import annotations
 
 from abc import ABCMeta, abstractmethod
+import array
+import copy
 from collections import defaultdict
-from decimal import Decimal, ROUND_DOWN
+from decimal import Decimal
 import enum
 import fnmatch
 import logging
@@ -11,6 +13,7 @@ import operator
 from pathlib import Path
 from typing import (
     Any,
+    Callable,
     Collection,
     Container,
     Iterable,
@@ -26,6 +29,7 @@ from typing import (
     Tuple,
     Type,
     TypeVar,
+    Union,
     cast,
     TYPE_CHECKING,
 )
@@ -33,12 +37,14 @@ from typing import (
 import attr
 import aiodocker
 
+from ai.backend.common import msgpack
 from ai.backend.common.types import (
     ResourceSlot, SlotName, SlotTypes,
     DeviceId, DeviceName, DeviceModelInfo,
     MountPermission, MountTypes,
     BinarySize,
     HardwareMetadata,
+    current_resource_slots,
 )
 from ai.backend.common.logging import BraceStyleAdapter
 from ai.backend.common.plugin import AbstractPlugin, BasePluginContext
@@ -47,6 +53,7 @@ from .exception import (
     InvalidResourceArgument,
     InvalidResourceCombination,
     NotMultipleOfQuantum,
+    UnsupportedResource,
 )
 from .stats import StatContext, NodeMeasurement, ContainerMeasurement
 from .types import Container as SessionContainer
@@ -62,10 +69,14 @@ log_alloc_map: bool = False
 
 known_slot_types: Mapping[SlotName, SlotTypes] = {}
 
+resource_spec_binary_version = 1
+resource_spec_binary_filename = 'resource.msgpack'
+
 
 class AllocationStrategy(enum.Enum):
     FILL = 0
     EVENLY = 1
+    TOPOLOGY = 2
 
 
 @attr.s(auto_attribs=True, slots=True)
@@ -185,14 +196,86 @@ class KernelResourceSpec:
 
     @classmethod
     def read_from_file(cls, file: TextIOWrapper) -> 'KernelResourceSpec':
-        text = '\n'.join(file.readlines())
-        return cls.read_from_string(text)
+        return cls.read_from_string(file.read())
 
     @classmethod
     async def aread_from_file(cls, file: AsyncTextIOWrapper) -> 'KernelResourceSpec':
-        text = '\n'.join(await file.readlines())  # type: ignore
+        text = await file.read()  # type: ignore
         return cls.read_from_string(text)
 
+    def write_to_bytes(self) -> bytes:
+        """
+        Serialize the spec into a compact versioned msgpack binary.
+        Unlike :meth:`write_to_string()`, it is only for the agent itself and
+        preserves the mount types and options as well.
+        """
+        return msgpack.packb((
+            resource_spec_binary_version,
+            self.container_id,
+            self.scratch_disk_size,
+            {str(k): str(v) for k, v in self.slots.items()},
+            {
+                str(device_name): {
+                    str(slot_name): {
+                        str(dev_id): str(alloc) for dev_id, alloc in per_device_alloc.items()
+                    }
+                    for slot_name, per_device_alloc in slots.items()
+                }
+                for device_name, slots in self.allocations.items()
+            },
+            [
+                (
+                    mount.type.value,
+                    None if mount.source is None else str(mount.source),
+                    str(mount.target),
+                    mount.permission.value,
+                    mount.opts,
+                    mount.is_unmanaged,
+                )
+                for mount in self.mounts
+            ],
+        ))
+
+    @classmethod
+    def read_from_bytes(cls, data: bytes) -> 'KernelResourceSpec':
+        """
+        Deserialize the spec written by :meth:`write_to_bytes()`.
+        It raises :exc:`ValueError` if the data is written in an unsupported version.
+        """
+        payload = msgpack.unpackb(data)
+        if not isinstance(payload, tuple) or len(payload) != 6:
+            raise ValueError('malformed resource spec binary')
+        if payload[0] != resource_spec_binary_version:
+            raise ValueError(f'unsupported resource spec binary version: {payload[0]}')
+        _, container_id, scratch_disk_size, slots, allocations, mounts = payload
+        return cls(
+            container_id=container_id,
+            scratch_disk_size=scratch_disk_size,
+            allocations={
+                DeviceName(device_name): {
+                    SlotName(slot_name): {
+                        DeviceId(dev_id): Decimal(alloc) for dev_id, alloc in per_device_alloc.items()
+                    }
+                    for slot_name, per_device_alloc in device_slots.items()
+                }
+                for device_name, device_slots in allocations.items()
+            },
+            slots=ResourceSlot(slots),
+            mounts=[
+                Mount(
+                    MountTypes(mount_type),
+                    None if source is None else (
+                        source if mount_type == MountTypes.VOLUME else Path(source)
+                    ),
+                    Path(target),
+                    MountPermission(permission),
+                    opts,
+                    is_unmanaged,
+                )
+                for mount_type, source, target, permission, opts, is_unmanaged in mounts
+            ],
+        )
+
     def to_json_serializable_dict(self) -> Mapping[str, Any]:
         o = attr.asdict(self)
         for slot_name, alloc in o['slots'].items():
@@ -215,6 +298,42 @@ class KernelResourceSpec:
         return json.dumps(self.to_json_serializable_dict())
 
 
+def read_resource_spec(config_dir: Path) -> KernelResourceSpec:
+    """
+    Read the resource spec persisted in the kernel config directory.
+    It prefers the binary one and falls back to ``resource.txt`` if the binary one
+    is missing or unreadable (e.g., written by older agents).
+    """
+    try:
+        data = (config_dir / resource_spec_binary_filename).read_bytes()
+        return KernelResourceSpec.read_from_bytes(data)
+    except FileNotFoundError:
+        pass
+    except ValueError as e:
+        log.warning('failed to read the binary resource spec in {} ({}), '
+                    'falling back to resource.txt', config_dir, e)
+    with open(config_dir / 'resource.txt', 'r') as f:
+        return KernelResourceSpec.read_from_file(f)
+
+
+def get_requested_slots(kernel_config: Mapping[str, Any]) -> ResourceSlot:
+    """
+    Return the sanitized resource slots requested by the kernel creation config.
+    """
+    slots = ResourceSlot.from_json(kernel_config['resource_slots'])
+    # Ensure that we have intrinsic slots.
+    assert SlotName('cpu') in slots
+    assert SlotName('mem') in slots
+    # accept unknown slot type with zero values
+    # but reject if they have non-zero values.
+    for st, sv in slots.items():
+        if st not in known_slot_types and sv != Decimal(0):
+            raise UnsupportedResource(st)
+    # sanitize the slots
+    current_resource_slots.set(known_slot_types)
+    return slots.normalize_slots(ignore_unknown=True)
+
+
 @attr.s(auto_attribs=True)
 class AbstractComputeDevice():
     device_id: DeviceId
@@ -410,12 +529,94 @@ class DeviceSlotInfo:
     amount: Decimal
 
 
+@attr.s(auto_attribs=True, slots=True, frozen=True)
+class DeviceTopology:
+    """
+    The location of a device in the host topology used by
+    :attr:`AllocationStrategy.TOPOLOGY`.  The groups are identified by
+    arbitrary integers such as the lowest CPU index of the group.
+    """
+
+    numa_node: int
+    cache_domain: int   # the group of devices sharing the last-level (L3) cache
+    core: int           # the group of sibling hyperthreads of a physical core
+
+
+class SlotAllocations(MutableMapping[DeviceId, Decimal]):
+    """
+    Stores the capacities and allocated amounts of the devices in a slot
+    as scaled integers in compact arrays indexed by the device ordinals.
+
+    It behaves as a mapping from the device IDs to the allocated amounts in
+    :class:`Decimal` for the API users, while the alloc maps work directly
+    on the :attr:`capacity` and :attr:`used` arrays.
+    """
+
+    __slots__ = ('device_ids', 'index', 'capacity', 'used', 'exponent')
+
+    device_ids: Sequence[DeviceId]
+    index: Mapping[DeviceId, int]
+    capacity: array.array
+    used: array.array
+    exponent: int
+
+    def __init__(
+        self,
+        device_ids: Sequence[DeviceId],
+        capacity: Iterable[int],
+        exponent: int,
+    ) -> None:
+        self.device_ids = tuple(device_ids)
+        self.index = {dev_id: idx for idx, dev_id in enumerate(self.device_ids)}
+        self.capacity = array.array('q', capacity)
+        self.used = array.array('q', bytes(self.capacity.itemsize * len(self.device_ids)))
+        self.exponent = exponent
+
+    def __getitem__(self, dev_id: DeviceId) -> Decimal:
+        return Decimal(self.used[self.index[dev_id]]).scaleb(self.exponent)
+
+    def __setitem__(self, dev_id: DeviceId, value: Decimal) -> None:
+        self.used[self.index[dev_id]] = round(value.scaleb(-self.exponent))
+
+    def __delitem__(self, dev_id: DeviceId) -> None:
+        raise TypeError('The devices of a slot cannot be removed.')
+
+    def __iter__(self) -> Iterator[DeviceId]:
+        return iter(self.device_ids)
+
+    def __len__(self) -> int:
+        return len(self.device_ids)
+
+    def __repr__(self) -> str:
+        return repr(dict(self))
+
+    def reset(self) -> None:
+        self.used = array.array('q', bytes(self.used.itemsize * len(self.used)))
+
+    def clone_empty(self) -> SlotAllocations:
+        """
+        Return a new instance for the same devices and capacities without any allocations.
+        The device IDs, the index and the capacities are shared as they are never modified.
+        """
+        clone = SlotAllocations.__new__(SlotAllocations)
+        clone.device_ids = self.device_ids
+        clone.index = self.index
+        clone.capacity = self.capacity
+        clone.used = array.array('q', bytes(self.used.itemsize * len(self.used)))
+        clone.exponent = self.exponent
+        return clone
+
+
+TAllocMap = TypeVar("TAllocMap", bound="AbstractAllocMap")
+
+
 class AbstractAllocMap(metaclass=ABCMeta):
 
     device_slots: Mapping[DeviceId, DeviceSlotInfo]
     device_mask: FrozenSet[DeviceId]
     exclusive_slot_types: Iterable[SlotName]
-    allocations: MutableMapping[SlotName, MutableMapping[DeviceId, Decimal]]
+    allocations: Mapping[SlotName, SlotAllocations]
+    exponent: int = 0  # the allocations are stored in the multiples of 10 ** exponent
 
     def __init__(
         self, *,
@@ -427,14 +628,52 @@ class AbstractAllocMap(metaclass=ABCMeta):
         self.device_slots = device_slots or {}
         self.slot_types = {info.slot_name: info.slot_type for info in self.device_slots.values()}
         self.device_mask = frozenset(device_mask) if device_mask is not None else frozenset()
-        self.allocations = defaultdict(lambda: defaultdict(Decimal))
+        self._scale = 10 ** -self.exponent
+        slot_devices: MutableMapping[SlotName, List[DeviceId]] = defaultdict(list)
         for dev_id, dev_slot_info in self.device_slots.items():
-            self.allocations[dev_slot_info.slot_name][dev_id] = Decimal(0)
+            slot_devices[dev_slot_info.slot_name].append(dev_id)
+        self.allocations = {
+            slot_name: SlotAllocations(
+                dev_ids,
+                [self.to_int(self.device_slots[dev_id].amount) for dev_id in dev_ids],
+                self.exponent,
+            )
+            for slot_name, dev_ids in slot_devices.items()
+        }
+        self._empty_slot = SlotAllocations([], [], self.exponent)
+
+    def to_int(self, value: Union[Decimal, int]) -> int:
+        """
+        Convert the given amount to the scaled integer used in the allocation arrays.
+        """
+        return round(value * self._scale)
+
+    def to_decimal(self, value: int) -> Decimal:
+        """
+        Convert the given scaled integer from the allocation arrays to the amount.
+        """
+        return Decimal(value).scaleb(self.exponent)
+
+    def get_slot_allocations(self, slot_name: SlotName) -> SlotAllocations:
+        # Unknown slots have no devices and so nothing to allocate.
+        return self.allocations.get(slot_name, self._empty_slot)
 
     def clear(self) -> None:
-        self.allocations.clear()
-        for dev_id, dev_slot_info in self.device_slots.items():
-            self.allocations[dev_slot_info.slot_name][dev_id] = Decimal(0)
+        for slot_allocs in self.allocations.values():
+            slot_allocs.reset()
+
+    def clone_empty(self: TAllocMap) -> TAllocMap:
+        """
+        Return a new alloc map with the same devices and settings without any allocations.
+        It is much cheaper than creating a new one from the compute plugin
+        as the devices are not listed and the allocation arrays are not built again.
+        """
+        clone = copy.copy(self)
+        clone.allocations = {
+            slot_name: slot_allocs.clone_empty()
+            for slot_name, slot_allocs in self.allocations.items()
+        }
+        return clone
 
     def check_exclusive(self, a: SlotName, b: SlotName) -> bool:
         if not self.exclusive_slot_types:
@@ -460,6 +699,24 @@ class AbstractAllocMap(metaclass=ABCMeta):
                 bufs.append(f"  {device_id}: {alloc}")
         return "\n".join(bufs)
 
+    def _update_allocations(
+        self,
+        existing_alloc: Mapping[SlotName, Mapping[DeviceId, Union[Decimal, int]]],
+        sign: int,
+    ) -> None:
+        scale = self._scale
+        empty_slot = self._empty_slot
+        for slot_name, per_device_alloc in existing_alloc.items():
+            slot_allocs = self.allocations.get(slot_name, empty_slot)
+            index, used = slot_allocs.index, slot_allocs.used
+            for device_id, alloc in per_device_alloc.items():
+                try:
+                    # the persisted amounts are the multiples of the unit
+                    used[index[device_id]] += sign * int(alloc if scale == 1 else alloc * scale)
+                except KeyError:
+                    log.warning('{}: ignoring the allocation for an unknown device {} of {}',
+                                type(self).__name__, device_id, slot_name)
+
     @abstractmethod
     def allocate(
         self,
@@ -522,6 +779,52 @@ def distribute(num_items: int, groups: Sequence[T]) -> Mapping[T, int]:
     ))
 
 
+def _pack_hierarchically(
+    dev_indices: Sequence[int],
+    free: Sequence[int],
+    request: int,
+    levels: Sequence[Callable[[int], int]],
+    preferred_groups: Container[int] = frozenset(),
+) -> MutableMapping[int, int]:
+    """
+    Packs the requested amount into the fewest groups of devices at each topology level,
+    from the outermost (e.g., NUMA nodes) to the innermost (e.g., physical cores).
+    *levels* are the functions returning the group of a device index at each level and
+    *preferred_groups* are the outermost groups to try first.
+
+    If a group can hold the whole remaining amount, the smallest such group is chosen
+    to keep larger groups available for later requests.  Otherwise the largest group is
+    filled up first.  Returns the mapping from the device indices to the allocated amounts.
+    """
+    allocation: MutableMapping[int, int] = {}
+    remaining = request
+    if not levels:
+        for idx in sorted(dev_indices):
+            allocated = min(remaining, free[idx])
+            if allocated > 0:
+                allocation[idx] = allocated
+                remaining -= allocated
+            if remaining == 0:
+                break
+        return allocation
+    groups: MutableMapping[int, List[int]] = defaultdict(list)
+    for idx in dev_indices:
+        groups[levels[0](idx)].append(idx)
+    group_free = {group: sum(free[idx] for idx in members) for group, members in groups.items()}
+    while remaining > 0 and group_free:
+        fitting = [group for group, amount in group_free.items() if amount >= remaining]
+        if fitting:
+            group = min(fitting, key=lambda group: (
+                group not in preferred_groups, group_free[group], group))
+        else:
+            group = min(group_free, key=lambda group: (
+                group not in preferred_groups, -group_free[group], group))
+        allocated = min(remaining, group_free.pop(group))
+        allocation.update(_pack_hierarchically(groups[group], free, allocated, levels[1:]))
+        remaining -= allocated
+    return allocation
+
+
 class DiscretePropertyAllocMap(AbstractAllocMap):
     """
     An allocation map using discrete property.
@@ -530,19 +833,26 @@ class DiscretePropertyAllocMap(AbstractAllocMap):
 
     e.g., 1.0 means 1 device, 2.0 means 2 devices, etc.
     (no fractions allowed)
+
+    The :attr:`AllocationStrategy.TOPOLOGY` strategy packs the allocations onto
+    the fewest NUMA nodes, cache domains and physical cores described by
+    *device_topology*.
     """
 
+    _allocate_impl: Mapping[AllocationStrategy, str] = {
+        AllocationStrategy.FILL: '_allocate_by_filling',
+        AllocationStrategy.EVENLY: '_allocate_evenly',
+    }
+
     def __init__(
         self,
         *args,
         allocation_strategy: AllocationStrategy = AllocationStrategy.EVENLY,
+        device_topology: Optional[Mapping[DeviceId, DeviceTopology]] = None,
         **kwargs,
     ) -> None:
         self.allocation_strategy = allocation_strategy
-        self._allocate_impl = {
-            AllocationStrategy.FILL: self._allocate_by_filling,
-            AllocationStrategy.EVENLY: self._allocate_evenly,
-        }
+        self.device_topology = device_topology or {}
         super().__init__(*args, **kwargs)
 
     def allocate(
@@ -550,7 +860,14 @@ class DiscretePropertyAllocMap(AbstractAllocMap):
         slots: Mapping[SlotName, Decimal],
         *,
         context_tag: str = None,
+        numa_nodes: Optional[Collection[int]] = None,
     ) -> Mapping[SlotName, Mapping[DeviceId, Decimal]]:
+        """
+        Allocate the given amount of resources.
+
+        *numa_nodes* are the NUMA nodes preferred by the topology-aware strategy,
+        such as the nodes of the accelerators allocated for the same kernel.
+        """
         # prune zero alloc slots
         requested_slots = {k: v for k, v in slots.items() if v > 0}
 
@@ -572,11 +889,66 @@ class DiscretePropertyAllocMap(AbstractAllocMap):
                         f"You may allocate only 1 for the unique-type slot {slot_name}",
                     )
 
-        return self._allocate_impl[self.allocation_strategy](
+        if self.allocation_strategy == AllocationStrategy.TOPOLOGY:
+            return self._allocate_by_topology(
+                requested_slots,
+                context_tag=context_tag,
+                numa_nodes=numa_nodes,
+            )
+        allocate_impl = getattr(self, self._allocate_impl[self.allocation_strategy])
+        return allocate_impl(
             requested_slots,
             context_tag=context_tag,
         )
 
+    def _allocate_by_topology(
+        self,
+        requested_slots: Mapping[SlotName, Decimal],
+        *,
+        context_tag: Optional[str] = None,
+        numa_nodes: Optional[Collection[int]] = None,
+    ) -> Mapping[SlotName, Mapping[DeviceId, Decimal]]:
+        allocation = {}
+        for slot_name, alloc in requested_slots.items():
+            slot_allocs = self.get_slot_allocations(slot_name)
+            capacity, used = slot_allocs.capacity, slot_allocs.used
+            free = [capacity[idx] - used[idx] for idx in range(len(used))]
+            remaining_alloc = self.to_int(alloc)
+
+            if log_alloc_map:
+                log.debug('DiscretePropertyAllocMap: allocating {} {} (numa_nodes: {})',
+                          slot_name, alloc, numa_nodes)
+                log.debug('DiscretePropertyAllocMap: current-alloc: {!r}', slot_allocs)
+
+            total_allocatable = sum(free)
+            if total_allocatable < remaining_alloc:
+                raise InsufficientResource(
+                    'DiscretePropertyAllocMap: insufficient allocatable amount!',
+                    context_tag, slot_name, str(alloc), str(self.to_decimal(total_allocatable)))
+            # devices without the topology information are treated as separate cores
+            topology = [
+                self.device_topology.get(dev_id, DeviceTopology(0, 0, -1 - idx))
+                for idx, dev_id in enumerate(slot_allocs.device_ids)
+            ]
+            slot_allocation = _pack_hierarchically(
+                [idx for idx in range(len(free)) if free[idx] > 0],
+                free,
+                remaining_alloc,
+                [
+                    lambda idx: topology[idx].numa_node,
+                    lambda idx: topology[idx].cache_domain,
+                    lambda idx: topology[idx].core,
+                ],
+                frozenset(numa_nodes or ()),
+            )
+            for idx, value in slot_allocation.items():
+                used[idx] += value
+            allocation[slot_name] = {
+                slot_allocs.device_ids[idx]: self.to_decimal(slot_allocation[idx])
+                for idx in sorted(slot_allocation)
+            }
+        return allocation
+
     def _allocate_by_filling(
         self,
         requested_slots: Mapping[SlotName, Decimal],
@@ -586,35 +958,33 @@ class DiscretePropertyAllocMap(AbstractAllocMap):
         allocation = {}
         for slot_name, alloc in requested_slots.items():
             slot_allocation: MutableMapping[DeviceId, Decimal] = {}
+            slot_allocs = self.get_slot_allocations(slot_name)
+            capacity, used = slot_allocs.capacity, slot_allocs.used
 
-            sorted_dev_allocs = sorted(
-                self.allocations[slot_name].items(),  # k: slot_name, v: per-device alloc
-                key=lambda pair: self.device_slots[pair[0]].amount - pair[1],
+            # device indices sorted by the free amount
+            sorted_dev_indices = sorted(
+                range(len(used)),
+                key=lambda idx: capacity[idx] - used[idx],
                 reverse=True)
 
             if log_alloc_map:
                 log.debug('DiscretePropertyAllocMap: allocating {} {}', slot_name, alloc)
-                log.debug('DiscretePropertyAllocMap: current-alloc: {!r}', sorted_dev_allocs)
+                log.debug('DiscretePropertyAllocMap: current-alloc: {!r}', slot_allocs)
 
-            total_allocatable = int(0)
-            remaining_alloc = Decimal(alloc).normalize()
+            total_allocatable = sum(capacity[idx] - used[idx] for idx in sorted_dev_indices)
+            remaining_alloc = self.to_int(alloc)
 
-            # fill up starting from the most free devices
-            for dev_id, current_alloc in sorted_dev_allocs:
-                current_alloc = self.allocations[slot_name][dev_id]
-                assert slot_name == self.device_slots[dev_id].slot_name
-                total_allocatable += int(self.device_slots[dev_id].amount - current_alloc)
-            if total_allocatable < alloc:
+            if total_allocatable < remaining_alloc:
                 raise InsufficientResource(
                     'DiscretePropertyAllocMap: insufficient allocatable amount!',
-                    context_tag, slot_name, str(alloc), str(total_allocatable))
-            for dev_id, current_alloc in sorted_dev_allocs:
-                current_alloc = self.allocations[slot_name][dev_id]
-                allocatable = (self.device_slots[dev_id].amount - current_alloc)
+                    context_tag, slot_name, str(alloc), str(self.to_decimal(total_allocatable)))
+            # fill up starting from the most free devices
+            for idx in sorted_dev_indices:
+                allocatable = capacity[idx] - used[idx]
                 if allocatable > 0:
-                    allocated = Decimal(min(remaining_alloc, allocatable))
-                    slot_allocation[dev_id] = allocated
-                    self.allocations[slot_name][dev_id] += allocated
+                    allocated = min(remaining_alloc, allocatable)
+                    slot_allocation[slot_allocs.device_ids[idx]] = self.to_decimal(allocated)
+                    used[idx] += allocated
                     remaining_alloc -= allocated
                 if remaining_alloc == 0:
                     break
@@ -630,52 +1000,55 @@ class DiscretePropertyAllocMap(AbstractAllocMap):
         allocation = {}
 
         for slot_name, requested_alloc in requested_slots.items():
-            new_alloc: MutableMapping[DeviceId, Decimal] = defaultdict(Decimal)
-            remaining_alloc = int(Decimal(requested_alloc))
+            slot_allocs = self.get_slot_allocations(slot_name)
+            capacity, used = slot_allocs.capacity, slot_allocs.used
+            dev_indices = range(len(used))
+            new_alloc = [0] * len(used)
+            remaining_alloc = self.to_int(requested_alloc)
+            # device indices sorted by the free amount
+            sorted_dev_indices = sorted(
+                dev_indices,
+                key=lambda idx: capacity[idx] - used[idx],
+                reverse=True)
 
             while remaining_alloc > 0:
                 # calculate remaining slots per device
-                total_allocatable = int(sum(
-                    self.device_slots[dev_id].amount - current_alloc - new_alloc[dev_id]
-                    for dev_id, current_alloc in self.allocations[slot_name].items()
-                ))
+                allocatables = [
+                    capacity[idx] - used[idx] - new_alloc[idx]
+                    for idx in dev_indices
+                ]
+                total_allocatable = sum(allocatables)
                 # if the sum of remaining slot is less than the remaining alloc, fail.
                 if total_allocatable < remaining_alloc:
                     raise InsufficientResource(
                         "DiscretePropertyAllocMap: insufficient allocatable amount!",
-                        context_tag, slot_name, str(requested_alloc), str(total_allocatable),
+                        context_tag, slot_name, str(requested_alloc),
+                        str(self.to_decimal(total_allocatable)),
                     )
 
                 # calculate the amount to spread out
-                nonzero_devs = [
-                    dev_id
-                    for dev_id, current_alloc in self.allocations[slot_name].items()
-                    if self.device_slots[dev_id].amount - current_alloc - new_alloc[dev_id] > 0
-                ]
+                nonzero_devs = [idx for idx in dev_indices if allocatables[idx] > 0]
                 initial_diffs = distribute(remaining_alloc, nonzero_devs)
-                diffs = {
-                    dev_id: min(
-                        int(self.device_slots[dev_id].amount - current_alloc - new_alloc[dev_id]),
-                        initial_diffs.get(dev_id, 0),
-                    )
-                    for dev_id, current_alloc in self.allocations[slot_name].items()
-                }
+                diffs = [
+                    min(allocatables[idx], initial_diffs.get(idx, 0))
+                    for idx in dev_indices
+                ]
 
                 # distribute the remainig alloc to the remaining slots.
-                sorted_dev_allocs = sorted(
-                    self.allocations[slot_name].items(),  # k: slot_name, v: per-device alloc
-                    key=lambda pair: self.device_slots[pair[0]].amount - pair[1],
-                    reverse=True)
-                for dev_id, current_alloc in sorted_dev_allocs:
-                    diff = diffs[dev_id]
-                    new_alloc[dev_id] += diff
+                for idx in sorted_dev_indices:
+                    diff = diffs[idx]
+                    new_alloc[idx] += diff
                     remaining_alloc -= diff
                     if remaining_alloc == 0:
                         break
 
-            for dev_id, allocated in new_alloc.items():
-                self.allocations[slot_name][dev_id] += allocated
-            allocation[slot_name] = {k: v for k, v in new_alloc.items() if v > 0}
+            for idx in dev_indices:
+                used[idx] += new_alloc[idx]
+            allocation[slot_name] = {
+                slot_allocs.device_ids[idx]: self.to_decimal(allocated)
+                for idx, allocated in enumerate(new_alloc)
+                if allocated > 0
+            }
 
         return allocation
 
@@ -683,21 +1056,131 @@ class DiscretePropertyAllocMap(AbstractAllocMap):
         self,
         existing_alloc: Mapping[SlotName, Mapping[DeviceId, Decimal]],
     ) -> None:
-        for slot_name, per_device_alloc in existing_alloc.items():
-            for device_id, alloc in per_device_alloc.items():
-                self.allocations[slot_name][device_id] += alloc
+        self._update_allocations(existing_alloc, 1)
 
     def free(
         self,
         existing_alloc: Mapping[SlotName, Mapping[DeviceId, Decimal]],
     ) -> None:
-        for slot_name, per_device_alloc in existing_alloc.items():
-            for device_id, alloc in per_device_alloc.items():
-                self.allocations[slot_name][device_id] -= alloc
+        self._update_allocations(existing_alloc, -1)
+
+
+def _quantize_int(value: int, unit: int) -> int:
+    """
+    Rounds the value to a multiple of the unit like ``Decimal.quantize()``
+    with the default half-even rounding.
+    """
+    if unit == 1:
+        return value
+    quotient, remainder = divmod(value, unit)
+    if remainder * 2 > unit or (remainder * 2 == unit and quotient % 2 == 1):
+        quotient += 1
+    return quotient * unit
+
+
+def _search_even_allocation(
+    amounts: Sequence[int],
+    free: Sequence[int],
+    request: int,
+    min_free: int,
+    unit: int,
+) -> Mapping[int, int]:
+    """
+    Finds the most even allocation of the requested amount across multiple devices
+    for :meth:`FractionAllocMap._allocate_evenly()`.
+
+    All amounts are integers scaled so that *unit* represents the allocation quantum
+    (``FractionAllocMap.digits``) and the devices must be sorted by the free amount
+    in the descending order.  Returns the mapping from the device indices to the
+    allocated amounts in the same scale.
+    """
+    n_total = len(free)
+    # prefix sums of the free amounts for the window feasibility checks
+    free_sums = [0]
+    for value in free:
+        free_sums.append(free_sums[-1] + value)
+    q_request = _quantize_int(request, unit)
+
+    # allocates the request across all devices in the window [start, start + n_dev)
+    def allocate_across_devices(start: int, n_dev: int) -> MutableMapping[int, int]:
+        slot_allocation: MutableMapping[int, int] = {}
+        remaining = request
+        n_devices = n_dev
+        idx = start + n_devices - 1  # check from the device with smallest allocatable resource
+        while n_devices > 0:
+            allocatable = free[idx]
+            # if the remaining amount can be allocated to evenly among remaining devices
+            if allocatable * n_devices >= remaining:
+                break
+            slot_allocation[idx] = _quantize_int(allocatable, unit)
+            remaining -= allocatable
+            idx -= 1
+            n_devices -= 1
+        if n_devices > 0:
+            # evenly distributes the remaining amount
+            dev_allocation = remaining // (n_devices * unit) * unit
+            for idx in range(start, start + n_devices):
+                slot_allocation[idx] = dev_allocation
+            # need to take care of the remainders
+            extra = _quantize_int(remaining - dev_allocation * n_devices, unit) // unit
+            for idx in range(start, start + extra):
+                slot_allocation[idx] += unit
+        return slot_allocation
+
+    # higher value means more even with 0 being the highest value
+    def measure_evenness(slot_allocation: Mapping[int, int]) -> int:
+        # the sum of the differences between the sorted amounts
+        return -(max(slot_allocation.values()) - min(slot_allocation.values()))
+
+    # higher value means more fragmented
+    # i.e. the number of unusable resources is higher
+    def measure_fragmentation(slot_allocation: Mapping[int, int]) -> int:
+        return sum(
+            unit < _quantize_int(amounts[idx] - value, unit) < min_free
+            for idx, value in slot_allocation.items()
+        )
+
+    # calculate the minimum number of required devices
+    n_devices = 0
+    for n_devices in range(1, n_total + 1):
+        if _quantize_int(free_sums[n_devices], unit) >= q_request:
+            break
+    # need to check from using minimum number of devices to using all devices
+    # evenness must be non-decreasing with the increase of window size
+    best_alloc_candidates = []
+    for n_dev in range(n_devices, n_total + 1):
+        # choose the best allocation from all possible allocation candidates
+        alloc_candidate = allocate_across_devices(0, n_dev)
+        max_evenness = measure_evenness(alloc_candidate)
+        # three criteria to decide allocation are
+        # evenness, number of resources used, and amount of fragmentation
+        alloc_candidates = [(alloc_candidate, max_evenness, -len(alloc_candidate),
+                             -measure_fragmentation(alloc_candidate))]
+        for start in range(1, n_total - n_dev + 1):
+            # break if not enough resource
+            allocatable = free_sums[start + n_dev] - free_sums[start]
+            if _quantize_int(allocatable, unit) < q_request:
+                break
+            alloc_candidate = allocate_across_devices(start, n_dev)
+            # evenness gets worse (or same at best) as the allocatable gets smaller
+            evenness_score = measure_evenness(alloc_candidate)
+            if evenness_score < max_evenness:
+                break
+            alloc_candidates.append((alloc_candidate, evenness_score, -len(alloc_candidate),
+                                     -measure_fragmentation(alloc_candidate)))
+        # since evenness is the same, sort by the number of used devices (fewer is good)
+        best_alloc_candidates.append(sorted(alloc_candidates, key=lambda x: x[2])[-1])
+    # choose the best allocation with the three criteria
+    return sorted(best_alloc_candidates, key=operator.itemgetter(1, 2, 3))[-1][0]
 
 
 class FractionAllocMap(AbstractAllocMap):
 
+    _allocate_impl: Mapping[AllocationStrategy, str] = {
+        AllocationStrategy.FILL: '_allocate_by_filling',
+        AllocationStrategy.EVENLY: '_allocate_evenly',
+    }
+
     def __init__(
         self,
         *args,
@@ -709,13 +1192,14 @@ class FractionAllocMap(AbstractAllocMap):
         self.allocation_strategy = allocation_strategy
         self.quantum_size = quantum_size
         self.enforce_physical_continuity = enforce_physical_continuity
-        self._allocate_impl = {
-            AllocationStrategy.FILL: self._allocate_by_filling,
-            AllocationStrategy.EVENLY: self._allocate_evenly,
-        }
-        super().__init__(*args, **kwargs)
         self.digits = Decimal(10) ** -2  # decimal points that is supported by agent
         self.powers = Decimal(100)  # reciprocal of self.digits
+        # store the amounts in the finer one of the supported digits and the quantum size
+        self.exponent = min(
+            cast(int, self.digits.as_tuple().exponent),
+            cast(int, quantum_size.as_tuple().exponent),
+        )
+        super().__init__(*args, **kwargs)
 
     def allocate(
         self,
@@ -743,12 +1227,24 @@ class FractionAllocMap(AbstractAllocMap):
                     f"not a multiple of {self.quantum_size}.",
                 )
 
-        return self._allocate_impl[self.allocation_strategy](
+        allocate_impl = getattr(self, self._allocate_impl[self.allocation_strategy])
+        return allocate_impl(
             requested_slots,
             context_tag=context_tag,
             min_memory=min_memory,
         )
 
+    def _check_quantum(self, slot_allocation: Mapping[int, int], slot_allocs: SlotAllocations) -> None:
+        quantum = self.to_int(self.quantum_size)
+        if any(value % quantum != 0 for value in slot_allocation.values()):
+            alloc_repr = ", ".join(
+                f"{slot_allocs.device_ids[idx]}={self.to_decimal(value)}"
+                for idx, value in slot_allocation.items()
+            )
+            raise InsufficientResource(
+                f"Device allocation ({alloc_repr}) is not a multiple of {self.quantum_size}",
+            )
+
     def _allocate_by_filling(
         self,
         requested_slots: Mapping[SlotName, Decimal],
@@ -758,17 +1254,18 @@ class FractionAllocMap(AbstractAllocMap):
     ) -> Mapping[SlotName, Mapping[DeviceId, Decimal]]:
         allocation = {}
         for slot_name, alloc in requested_slots.items():
-            slot_allocation: MutableMapping[DeviceId, Decimal] = {}
+            slot_allocs = self.get_slot_allocations(slot_name)
+            capacity, used = slot_allocs.capacity, slot_allocs.used
 
-            # fill up starting from the most free devices
-            sorted_dev_allocs = sorted(
-                self.allocations[slot_name].items(),
-                key=lambda pair: self.device_slots[pair[0]].amount - pair[1],
+            # device indices sorted by the free amount
+            sorted_dev_indices = sorted(
+                range(len(used)),
+                key=lambda idx: capacity[idx] - used[idx],
                 reverse=True)
 
             if log_alloc_map:
                 log.debug('FractionAllocMap: allocating {} {}', slot_name, alloc)
-                log.debug('FractionAllocMap: current-alloc: {!r}', sorted_dev_allocs)
+                log.debug('FractionAllocMap: current-alloc: {!r}', slot_allocs)
 
             slot_type = self.slot_types.get(slot_name, SlotTypes.COUNT)
             if slot_type in (SlotTypes.COUNT, SlotTypes.BYTES):
@@ -778,36 +1275,30 @@ class FractionAllocMap(AbstractAllocMap):
                     raise InvalidResourceArgument(
                         f"You may allocate only 1 for the unique-type slot {slot_name}",
                     )
-            total_allocatable = Decimal(0)
-            remaining_alloc = Decimal(alloc).normalize()
-
-            for dev_id, current_alloc in sorted_dev_allocs:
-                current_alloc = self.allocations[slot_name][dev_id]
-                assert slot_name == self.device_slots[dev_id].slot_name
-                total_allocatable += (self.device_slots[dev_id].amount -
-                                      current_alloc)
-            if total_allocatable < alloc:
+            total_allocatable = sum(capacity[idx] - used[idx] for idx in sorted_dev_indices)
+            remaining_alloc = self.to_int(alloc)
+            if total_allocatable < remaining_alloc:
                 raise InsufficientResource(
                     'FractionAllocMap: insufficient allocatable amount!',
-                    context_tag, slot_name, str(alloc), str(total_allocatable))
-            slot_allocation = {}
-            for dev_id, current_alloc in sorted_dev_allocs:
-                current_alloc = self.allocations[slot_name][dev_id]
-                allocatable = (self.device_slots[dev_id].amount -
-                               current_alloc)
+                    context_tag, slot_name, str(alloc), str(self.to_decimal(total_allocatable)))
+
+            # fill up starting from the most free devices
+            slot_allocation: MutableMapping[int, int] = {}
+            for idx in sorted_dev_indices:
+                allocatable = capacity[idx] - used[idx]
                 if allocatable > 0:
                     allocated = min(remaining_alloc, allocatable)
-                    slot_allocation[dev_id] = allocated
-                    self.allocations[slot_name][dev_id] += allocated
+                    slot_allocation[idx] = allocated
                     remaining_alloc -= allocated
                 if remaining_alloc <= 0:
                     break
-            if any(value.remainder_near(self.quantum_size) != 0 for value in slot_allocation.values()):
-                alloc_repr = ", ".join(f"{k}={v}" for k, v in slot_allocation.items())
-                raise InsufficientResource(
-                    f"Device allocation ({alloc_repr}) is not a multiple of {self.quantum_size}",
-                )
-            allocation[slot_name] = slot_allocation
+            self._check_quantum(slot_allocation, slot_allocs)
+            for idx, value in slot_allocation.items():
+                used[idx] += value
+            allocation[slot_name] = {
+                slot_allocs.device_ids[idx]: self.to_decimal(value)
+                for idx, value in slot_allocation.items()
+            }
         return allocation
 
     def _allocate_evenly(
@@ -817,182 +1308,76 @@ class FractionAllocMap(AbstractAllocMap):
         context_tag: str = None,
         min_memory: Decimal = Decimal(0.01),
     ) -> Mapping[SlotName, Mapping[DeviceId, Decimal]]:
-
-        # higher value means more even with 0 being the highest value
-        def measure_evenness(alloc_map: Mapping[DeviceId, Decimal]) \
-                             -> Decimal:
-            alloc_arr = sorted([alloc_map[dev_id] for dev_id in alloc_map])
-            evenness_score = Decimal(0).quantize(self.digits)
-            for idx in range(len(alloc_arr) - 1):
-                evenness_score += abs(alloc_arr[idx + 1] - alloc_arr[idx])
-            return -evenness_score
-
-        # higher value means more fragmented
-        # i.e. the number of unusable resources is higher
-        def measure_fragmentation(allocation: Mapping[DeviceId, Decimal],
-                                  min_memory: Decimal):
-            fragmentation_arr = [self.device_slots[dev_id].amount - allocation[dev_id]
-                                 for dev_id in allocation]
-            return sum(self.digits < v.quantize(self.digits) < min_memory.quantize(self.digits)
-                       for v in fragmentation_arr)
-
-        # evenly distributes remaining_alloc across dev_allocs
-        def distribute_evenly(dev_allocs: List[Tuple[DeviceId, Decimal]],
-                              remaining_alloc: Decimal,
-                              allocation: MutableMapping[DeviceId, Decimal]):
-            n_devices = len(dev_allocs)
-            for dev_id, _ in dev_allocs:
-                dev_allocation = remaining_alloc / n_devices
-                dev_allocation = dev_allocation.quantize(self.digits, rounding=ROUND_DOWN)
-                allocation[dev_id] = dev_allocation
-
-            # need to take care of decimals
-            remainder = round(remaining_alloc * self.powers -
-                              dev_allocation * n_devices * self.powers)
-            for idx in range(remainder):
-                dev_id, _ = dev_allocs[idx]
-                allocation[dev_id] += self.digits
-
-        # allocates remaining_alloc across multiple devices i.e. dev_allocs
-        # all devices in dev_allocs are being used
-        def allocate_across_devices(dev_allocs: List[Tuple[DeviceId, Decimal]],
-                                    remaining_alloc: Decimal, slot_name: str) \
-                                    -> MutableMapping[DeviceId, Decimal]:
-            slot_allocation: MutableMapping[DeviceId, Decimal] = {}
-            n_devices = len(dev_allocs)
-            idx = n_devices - 1  # check from the device with smallest allocatable resource
-            while n_devices > 0:
-                dev_id, current_alloc = dev_allocs[idx]
-                allocatable = self.device_slots[dev_id].amount - current_alloc
-                # if the remaining_alloc can be allocated to evenly among remaining devices
-                if allocatable >= remaining_alloc / n_devices:
-                    break
-                slot_allocation[dev_id] = allocatable.quantize(self.digits)
-                remaining_alloc -= allocatable
-                idx -= 1
-                n_devices -= 1
-
-            if n_devices > 0:
-                distribute_evenly(dev_allocs[:n_devices], remaining_alloc, slot_allocation)
-
-            return slot_allocation
-
-        min_memory = min_memory.quantize(self.digits)
+        min_free = self.to_int(min_memory.quantize(self.digits))
+        unit = self.to_int(self.digits)
         allocation = {}
         for slot_name, alloc in requested_slots.items():
-            slot_allocation: MutableMapping[DeviceId, Decimal] = {}
-            remaining_alloc = Decimal(alloc).normalize()
-            sorted_dev_allocs = sorted(
-                self.allocations[slot_name].items(),
-                key=lambda pair: self.device_slots[pair[0]].amount - pair[1],
-                reverse=True)
-
-            # do not consider devices whose remaining resource under min_memory
-            sorted_dev_allocs = list(filter(
-                lambda pair: self.device_slots[pair[0]].amount - pair[1] >= min_memory,
-                sorted_dev_allocs))
+            slot_allocs = self.get_slot_allocations(slot_name)
+            capacity, used = slot_allocs.capacity, slot_allocs.used
+            remaining_alloc = self.to_int(alloc)
+
+            # device indices sorted by the free amount,
+            # without the devices whose remaining resource under min_memory
+            sorted_dev_indices = [
+                idx for idx in sorted(
+                    range(len(used)),
+                    key=lambda idx: capacity[idx] - used[idx],
+                    reverse=True)
+                if capacity[idx] - used[idx] >= min_free
+            ]
+            free = [capacity[idx] - used[idx] for idx in sorted_dev_indices]
 
             if log_alloc_map:
                 log.debug('FractionAllocMap: allocating {} {}', slot_name, alloc)
-                log.debug('FractionAllocMap: current-alloc: {!r}', sorted_dev_allocs)
+                log.debug('FractionAllocMap: current-alloc: {!r}', slot_allocs)
 
             # check if there is enough resource for allocation
-            total_allocatable = Decimal(0)
-            for dev_id, current_alloc in sorted_dev_allocs:
-                current_alloc = self.allocations[slot_name][dev_id]
-                total_allocatable += (self.device_slots[dev_id].amount - current_alloc)
-            if total_allocatable.quantize(self.digits) < \
-                    remaining_alloc.quantize(self.digits):
+            total_allocatable = sum(free)
+            if _quantize_int(total_allocatable, unit) < _quantize_int(remaining_alloc, unit):
                 raise InsufficientResource(
                     'FractionAllocMap: insufficient allocatable amount!',
-                    context_tag, slot_name, str(alloc), str(total_allocatable))
+                    context_tag, slot_name, str(alloc), str(self.to_decimal(total_allocatable)))
 
             # allocate resources
-            if (remaining_alloc <=
-                self.device_slots[sorted_dev_allocs[0][0]].amount - sorted_dev_allocs[0][1]):
+            slot_allocation: Mapping[int, int]
+            if remaining_alloc <= free[0]:
                 # if remaining_alloc fits in one device
                 slot_allocation = {}
-                for dev_id, current_alloc in sorted_dev_allocs[::-1]:
-                    allocatable = (self.device_slots[dev_id].amount - current_alloc)
-                    if remaining_alloc <= allocatable:
-                        slot_allocation[dev_id] = remaining_alloc.quantize(self.digits)
+                for pos in reversed(range(len(free))):
+                    if remaining_alloc <= free[pos]:
+                        slot_allocation = {
+                            sorted_dev_indices[pos]: _quantize_int(remaining_alloc, unit),
+                        }
                         break
             else:
                 # need to distribute across devices
-                # calculate the minimum number of required devices
-                n_devices, allocated = 0, Decimal(0)
-                for dev_id, current_alloc in sorted_dev_allocs:
-                    n_devices += 1
-                    allocated += self.device_slots[dev_id].amount - current_alloc
-                    if allocated.quantize(self.digits) >= \
-                            remaining_alloc.quantize(self.digits):
-                        break
-                # need to check from using minimum number of devices to using all devices
-                # evenness must be non-decreasing with the increase of window size
-                best_alloc_candidate_arr = []
-                for n_dev in range(n_devices, len(sorted_dev_allocs) + 1):
-                    allocatable = sum(map(lambda x: self.device_slots[x[0]].amount - x[1],
-                                      sorted_dev_allocs[:n_dev]), start=Decimal(0))
-                    # choose the best allocation from all possible allocation candidates
-                    alloc_candidate = allocate_across_devices(sorted_dev_allocs[:n_dev],
-                                                              remaining_alloc, slot_name)
-                    max_evenness = measure_evenness(alloc_candidate)
-                    # three criteria to decide allocation are
-                    # eveness, number of resources used, and amount of fragmentatino
-                    alloc_candidate_arr = [(alloc_candidate, max_evenness, -len(alloc_candidate),
-                                            -measure_fragmentation(alloc_candidate, min_memory))]
-                    for idx in range(1, len(sorted_dev_allocs) - n_dev + 1):
-                        # update amount of allocatable space
-                        allocatable -= \
-                            self.device_slots[sorted_dev_allocs[idx - 1][0]].amount - \
-                            sorted_dev_allocs[idx - 1][1]
-                        allocatable += \
-                            self.device_slots[sorted_dev_allocs[idx + n_dev - 1][0]].amount - \
-                            sorted_dev_allocs[idx + n_dev - 1][1]
-                        # break if not enough resource
-                        if allocatable.quantize(self.digits) < \
-                                remaining_alloc.quantize(self.digits):
-                            break
-                        alloc_candidate = allocate_across_devices(
-                            sorted_dev_allocs[idx:idx + n_dev], remaining_alloc, slot_name)
-                        # evenness gets worse (or same at best) as the allocatable gets smaller
-                        evenness_score = measure_evenness(alloc_candidate)
-                        if evenness_score < max_evenness:
-                            break
-                        alloc_candidate_arr.append((alloc_candidate, evenness_score,
-                            -len(alloc_candidate), -measure_fragmentation(alloc_candidate, min_memory)))
-                    # since evenness is the same, sort by fragmentation (low is good)
-                    best_alloc_candidate_arr.append(
-                        sorted(alloc_candidate_arr, key=lambda x: x[2])[-1])
-                    # there is no need to look at more devices if the desired evenness is achieved
-                    if max_evenness.quantize(self.digits) == self.digits:
-                        best_alloc_candidate_arr = best_alloc_candidate_arr[-1:]
-                        break
-                # choose the best allocation with the three criteria
-                slot_allocation = sorted(best_alloc_candidate_arr,
-                                         key=operator.itemgetter(1, 2, 3))[-1][0]
-            allocation[slot_name] = slot_allocation
-            if any(value.remainder_near(self.quantum_size) != 0 for value in slot_allocation.values()):
-                alloc_repr = ", ".join(f"{k}={v}" for k, v in slot_allocation.items())
-                raise InsufficientResource(
-                    f"Device allocation ({alloc_repr}) is not a multiple of {self.quantum_size}",
-                )
-            for dev_id, value in slot_allocation.items():
-                self.allocations[slot_name][dev_id] += value
+                slot_allocation = {
+                    sorted_dev_indices[pos]: value
+                    for pos, value in _search_even_allocation(
+                        [capacity[idx] for idx in sorted_dev_indices],
+                        free,
+                        remaining_alloc,
+                        min_free,
+                        unit,
+                    ).items()
+                }
+            self._check_quantum(slot_allocation, slot_allocs)
+            for idx, value in slot_allocation.items():
+                used[idx] += value
+            allocation[slot_name] = {
+                slot_allocs.device_ids[idx]: self.to_decimal(value)
+                for idx, value in slot_allocation.items()
+            }
         return allocation
 
     def apply_allocation(
         self,
         existing_alloc: Mapping[SlotName, Mapping[DeviceId, Decimal]],
     ) -> None:
-        for slot_name, per_device_alloc in existing_alloc.items():
-            for device_id, alloc in per_device_alloc.items():
-                self.allocations[slot_name][device_id] += alloc
+        self._update_allocations(existing_alloc, 1)
 
     def free(
         self,
         existing_alloc: Mapping[SlotName, Mapping[DeviceId, Decimal]],
     ) -> None:
-        for slot_name, per_device_alloc in existing_alloc.items():
-            for device_id, alloc in per_device_alloc.items():
-                self.allocations[slot_name][device_id] -= alloc
+        self._update_allocations(existing_alloc, -1)
@@ -0,0 +1,132 @@
+"""
+A scheduler for the periodic tasks of the agent.
+"""
+
+import asyncio
+import logging
+import math
+import random
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Mapping,
+    Optional,
+)
+
+from ai.backend.common.logging import BraceStyleAdapter
+
+log = BraceStyleAdapter(logging.getLogger(__name__))
+
+
+class PeriodicTask:
+    """
+    Runs the given coroutine function periodically like ``aiotools.create_timer()``,
+    but never runs its invocations concurrently.
+
+    If an invocation takes longer than the interval, the missed ticks are skipped
+    and counted as overruns instead of piling up behind the running one.
+    The ticks are randomly shifted by the fraction of the interval given as *jitter*
+    so that the periodic tasks do not fire all at once.
+
+    If *adaptive_threshold* is set, the interval is doubled (up to *max_interval*)
+    whenever an invocation takes longer than the given fraction of the interval,
+    and halved back towards the base interval when the invocations become fast again.
+    If the coroutine function returns a number, it is used as the busy time of the invocation
+    in seconds instead of its whole duration, so that the deliberate sleeps inside it
+    (e.g., spreading the work across the interval) do not count.
+    """
+
+    def __init__(
+        self,
+        func: Callable[..., Awaitable[Any]],
+        interval: float,
+        *,
+        name: Optional[str] = None,
+        jitter: float = 0.0,
+        adaptive_threshold: Optional[float] = None,
+        max_interval: Optional[float] = None,
+    ) -> None:
+        self.func = func
+        self.name = name if name is not None else func.__name__
+        self.base_interval = interval
+        self.interval = interval
+        self.jitter = jitter
+        self.adaptive_threshold = adaptive_threshold
+        self.max_interval = max(interval, max_interval) if max_interval is not None else interval
+        self.num_runs = 0
+        self.num_overruns = 0
+        self.last_duration = 0.0
+        self.last_busy_duration = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> asyncio.Task:
+        """
+        Starts the periodic task.
+        You can stop it by cancelling the returned task.
+        """
+        assert self._task is None, 'already started'
+        self._task = asyncio.create_task(self._run())
+        return self._task
+
+    def get_stats(self) -> Mapping[str, Any]:
+        return {
+            'interval': self.interval,
+            'runs': self.num_runs,
+            'overruns': self.num_overruns,
+            'last_duration': self.last_duration,
+            'last_busy_duration': self.last_busy_duration,
+        }
+
+    def _get_jitter(self) -> float:
+        if self.jitter <= 0:
+            return 0.0
+        return random.uniform(-self.jitter, self.jitter) * self.interval
+
+    def _adapt_interval(self, busy_duration: float) -> None:
+        if self.adaptive_threshold is None:
+            return
+        interval = self.interval
+        if busy_duration > interval * self.adaptive_threshold:
+            interval = min(self.max_interval, interval * 2)
+        elif busy_duration < interval * self.adaptive_threshold / 4:
+            interval = max(self.base_interval, interval / 2)
+        if interval != self.interval:
+            log.info('periodic task {}: interval changed from {:.1f}s to {:.1f}s '
+                     '(last run was busy for {:.3f}s)',
+                     self.name, self.interval, interval, busy_duration)
+            self.interval = interval
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        next_tick = loop.time() + abs(self._get_jitter())
+        try:
+            while True:
+                await asyncio.sleep(max(0.0, next_tick - loop.time()))
+                started = loop.time()
+                result = None
+                try:
+                    result = await self.func(interval=self.interval)
+                except asyncio.CancelledError:
+                    raise
+                except Exception:
+                    log.exception('periodic task {}: unhandled exception', self.name)
+                finished = loop.time()
+                duration = finished - started
+                busy_duration = duration
+                if isinstance(result, (int, float)) and not isinstance(result, bool):
+                    busy_duration = min(duration, max(0.0, float(result)))
+                self.num_runs += 1
+                self.last_duration = duration
+                self.last_busy_duration = busy_duration
+                self._adapt_interval(busy_duration)
+                next_tick = started + self.interval + self._get_jitter()
+                if finished > next_tick:
+                    missed = math.ceil((finished - next_tick) / self.interval)
+                    self.num_overruns += missed
+                    log.warning('periodic task {}: overrun (took {:.3f}s, interval {:.1f}s), '
+                                'skipping {} tick(s)',
+                                self.name, duration, self.interval, missed)
+                    next_tick += missed * self.interval
+        except asyncio.CancelledError:
+            pass
@@ -46,6 +46,7 @@ from ai.backend.common.types import (
     HostPortPair,
     KernelId,
     KernelCreationConfig,
+    MetricKey,
     SessionId,
 )
 from ai.backend.common.utils import current_loop
@@ -315,27 +316,29 @@ class AgentRPCServer(aobject):
         async with self._create_sema:
             cluster_info = cast(ClusterInfo, raw_cluster_info)
             session_id = SessionId(UUID(raw_session_id))
-            raw_results = []
-            coros = []
+            kernel_ids = []
+            kernel_configs = []
             for raw_kernel_id, raw_config in zip(raw_kernel_ids, raw_configs):
                 log.info('rpc::create_kernel(k:{0}, img:{1})',
                         raw_kernel_id, raw_config['image']['canonical'])
-                kernel_id = KernelId(UUID(raw_kernel_id))
-                kernel_config = cast(KernelCreationConfig, raw_config)
-                coros.append(self.agent.create_kernel(
-                    creation_id,
-                    session_id,
-                    kernel_id,
-                    kernel_config,
-                    cluster_info,
-                ))
-            results = await asyncio.gather(*coros, return_exceptions=True)
-        errors = [*filter(lambda item: isinstance(item, Exception), results)]
+                kernel_ids.append(KernelId(UUID(raw_kernel_id)))
+                kernel_configs.append(cast(KernelCreationConfig, raw_config))
+            # The resources of all kernels are allocated at once
+            # so that a partial failure does not leave dangling allocations.
+            results = await self.agent.create_kernels(
+                creation_id,
+                session_id,
+                kernel_ids,
+                kernel_configs,
+                cluster_info,
+            )
+        errors = [item for item in results if isinstance(item, BaseException)]
         if errors:
             # Raise up the first error.
             if len(errors) == 1:
                 raise errors[0]
             raise aiotools.MultiError("agent.create_kernels() failed", errors=errors)
+        created = [item for item in results if not isinstance(item, BaseException)]
         raw_results = [
             {
                 'id': str(result['id']),
@@ -349,7 +352,7 @@ class AgentRPCServer(aobject):
                 'resource_spec': result['resource_spec'],
                 'attached_devices': result['attached_devices'],
             }
-            for result in results
+            for result in created
         ]
         return raw_results
 
@@ -393,6 +396,23 @@ class AgentRPCServer(aobject):
         log.info('rpc::get_logs(k:{0})', kernel_id)
         return await self.agent.get_logs(KernelId(UUID(kernel_id)))
 
+    @rpc_function
+    @collect_error
+    async def get_kernel_metrics_history(
+        self,
+        kernel_id: str,
+        metric: str,
+        since: float,
+        step: float,
+    ):
+        log.debug('rpc::get_kernel_metrics_history(k:{0}, m:{1})', kernel_id, metric)
+        return await self.agent.get_kernel_metrics_history(
+            KernelId(UUID(kernel_id)),
+            MetricKey(metric),
+            since,
+            step,
+        )
+
     @rpc_function
     @collect_error
     async def restart_kernel(
@@ -0,0 +1,84 @@
+"""
+A dependency graph runner for the stages of multi-step jobs such as kernel creation.
+"""
+
+import asyncio
+from contextlib import contextmanager
+from typing import (
+    Awaitable,
+    Callable,
+    Dict,
+    Iterator,
+    Sequence,
+    TypeVar,
+)
+
+T = TypeVar('T')
+
+
+class StageGraph:
+    """
+    Runs the stages of a job as tasks which start as soon as the stages they depend on
+    are finished, so that the independent stages run concurrently.
+
+    The duration of each stage, excluding the time waiting for its dependencies,
+    is recorded in :attr:`durations` in seconds.
+    If any stage fails, :meth:`wait()` cancels the remaining stages and
+    raises the first error.
+    """
+
+    durations: Dict[str, float]
+
+    def __init__(self) -> None:
+        self.durations = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    def add(
+        self,
+        name: str,
+        func: Callable[[], Awaitable[T]],
+        *,
+        after: Sequence[str] = (),
+    ) -> 'asyncio.Task[T]':
+        """
+        Add a stage which runs *func* after all stages named in *after* are finished.
+        The returned task can be awaited to get the result of the stage.
+        """
+        assert name not in self._tasks, f'duplicate stage name: {name}'
+        dependencies = [self._tasks[dep] for dep in after]
+
+        async def _run() -> T:
+            if dependencies:
+                await asyncio.gather(*dependencies)
+            with self.measure(name):
+                return await func()
+
+        task = asyncio.create_task(_run())
+        self._tasks[name] = task
+        return task
+
+    @contextmanager
+    def measure(self, name: str) -> Iterator[None]:
+        """
+        Record the duration of the code block as a stage,
+        for the stages that need to run inline.
+        """
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        try:
+            yield
+        finally:
+            self.durations[name] = loop.time() - started
+
+    async def wait(self) -> None:
+        """
+        Wait until all added stages are finished.
+        """
+        tasks = [*self._tasks.values()]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
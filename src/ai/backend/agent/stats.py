@@ -4,13 +4,18 @@ A module to collect various performance metrics of Docker containers.
 Reference: https://www.datadoghq.com/blog/how-to-collect-docker-metrics/
 """
 
+import array
 import asyncio
+import bisect
 from decimal import Decimal
 import enum
 import logging
+import math
+import random
 import sys
 import time
 from typing import (
+    Any,
     Callable,
     Dict,
     FrozenSet,
@@ -19,9 +24,12 @@ from typing import (
     MutableMapping,
     Optional,
     Sequence,
+    Set,
     Tuple,
     TYPE_CHECKING,
+    Union,
 )
+import aiodocker
 import aioredis
 
 import attr
@@ -34,11 +42,13 @@ from ai.backend.common.types import (
     ContainerId, DeviceId, KernelId,
     MetricKey, MetricValue, MovingStatValue,
 )
-from .utils import (
-    remove_exponent,
-)
+from .metric_history import MetricHistoryStore
 if TYPE_CHECKING:
     from .agent import AbstractAgent
+    from .docker.cgroup import CgroupStatReader
+    from .docker.procfs import ProcSnapshot
+    from .docker.scratch import ScratchUsageTracker
+    from .docker.warm_pool import WarmContainerPool
 
 __all__ = (
     'StatContext',
@@ -47,10 +57,13 @@ __all__ = (
     'NodeMeasurement',
     'ContainerMeasurement',
     'Measurement',
+    'Histogram',
 )
 
 log = BraceStyleAdapter(logging.getLogger('ai.backend.agent.stats'))
 
+Number = Union[int, float]
+
 
 def check_cgroup_available():
     """
@@ -62,6 +75,7 @@ def check_cgroup_available():
 class StatModes(enum.Enum):
     CGROUP = 'cgroup'
     DOCKER = 'docker'
+    DOCKER_STREAM = 'docker-stream'
 
     @staticmethod
     def get_preferred_mode():
@@ -82,8 +96,8 @@ class MetricTypes(enum.Enum):
 
 @attr.s(auto_attribs=True, slots=True)
 class Measurement:
-    value: Decimal
-    capacity: Optional[Decimal] = None
+    value: Union[Decimal, Number]
+    capacity: Optional[Union[Decimal, Number]] = None
 
 
 @attr.s(auto_attribs=True, slots=True)
@@ -99,7 +113,7 @@ class NodeMeasurement:
     per_device: Mapping[DeviceId, Measurement] = attr.Factory(dict)
     unit_hint: Optional[str] = None
     stats_filter: FrozenSet[str] = attr.Factory(frozenset)
-    current_hook: Optional[Callable[['Metric'], Decimal]] = None
+    current_hook: Optional[Callable[['Metric'], Union[Decimal, Number]]] = None
 
 
 @attr.s(auto_attribs=True, slots=True)
@@ -112,120 +126,224 @@ class ContainerMeasurement:
     per_container: Mapping[str, Measurement] = attr.Factory(dict)
     unit_hint: Optional[str] = None
     stats_filter: FrozenSet[str] = attr.Factory(frozenset)
-    current_hook: Optional[Callable[['Metric'], Decimal]] = None
+    current_hook: Optional[Callable[['Metric'], Union[Decimal, Number]]] = None
+
+
+def to_number(value: Union[Decimal, Number]) -> Number:
+    """
+    Converts a measured value into an int if it is integral or a float otherwise.
+    """
+    if isinstance(value, Decimal):
+        if not value.is_finite():
+            return float(value)
+        numerator, denominator = value.as_integer_ratio()
+        if denominator == 1:
+            return numerator
+        return numerator / denominator
+    return value
+
+
+def format_number(value: Number, precision: int = 3) -> str:
+    """
+    Formats a number as a fixed-point decimal string without trailing zeros,
+    in the same format as ``remove_exponent(Decimal(value).quantize(q))``.
+    """
+    if type(value) is int:
+        return str(value)
+    if not math.isfinite(value):
+        return str(Decimal(value))
+    # Prefer the shortest round-tripping representation to avoid
+    # exposing the binary rounding errors of large values.
+    text = repr(value)
+    if 'e' in text or len(text) - text.index('.') - 1 > precision:
+        text = f'{value:.{precision}f}'
+    if '.' in text:
+        text = text.rstrip('0').rstrip('.')
+    return text
 
 
 class MovingStatistics:
+    """
+    Keeps the aggregates of all data points and the latest data points
+    in a fixed-size ring buffer using int/float arithmetic.
+    """
+
     __slots__ = (
         '_sum', '_count',
-        '_min', '_max', '_last',
+        '_min', '_max',
+        '_values', '_timestamps', '_head', '_size',
     )
-    _sum: Decimal
+    _sum: Number
     _count: int
-    _min: Decimal
-    _max: Decimal
-    _last: List[Tuple[Decimal, float]]
-
-    def __init__(self, initial_value: Decimal = None):
-        self._last = []
+    _min: Number
+    _max: Number
+    _values: List[Number]
+    _timestamps: array.array
+    _head: int
+    _size: int
+
+    def __init__(
+        self,
+        initial_value: Optional[Union[Decimal, Number]] = None,
+        *,
+        window: int = 2,
+    ) -> None:
+        assert window >= 2
+        self._values = [0] * window
+        self._timestamps = array.array('d', bytes(8 * window))
+        self._head = 0
+        self._size = 0
         if initial_value is None:
-            self._sum = Decimal(0)
-            self._min = Decimal('inf')
-            self._max = Decimal('-inf')
+            self._sum = 0
+            self._min = math.inf
+            self._max = -math.inf
             self._count = 0
         else:
-            self._sum = initial_value
-            self._min = initial_value
-            self._max = initial_value
+            value = to_number(initial_value)
+            self._sum = value
+            self._min = value
+            self._max = value
             self._count = 1
-            point = (initial_value, time.perf_counter())
-            self._last.append(point)
-
-    def update(self, value: Decimal):
+            self._push(value)
+
+    def _push(self, value: Number) -> None:
+        head = self._head
+        self._values[head] = value
+        self._timestamps[head] = time.perf_counter()
+        self._head = (head + 1) % len(self._values)
+        if self._size < len(self._values):
+            self._size += 1
+
+    def update(self, value: Union[Decimal, Number]) -> None:
+        value = to_number(value)
         self._sum += value
-        self._min = min(self._min, value)
-        self._max = max(self._max, value)
+        if value < self._min:
+            self._min = value
+        if value > self._max:
+            self._max = value
         self._count += 1
-        point = (value, time.perf_counter())
-        self._last.append(point)
-        # keep only the latest two data points
-        if len(self._last) > 2:
-            self._last.pop(0)
+        self._push(value)
+
+    def _last_two(self) -> Tuple[int, int]:
+        last = self._head - 1
+        return last, last - 1  # negative indices wrap around the ring buffer
 
     @property
-    def min(self) -> Decimal:
+    def min(self) -> Number:
         return self._min
 
     @property
-    def max(self) -> Decimal:
+    def max(self) -> Number:
         return self._max
 
     @property
-    def sum(self) -> Decimal:
+    def sum(self) -> Number:
         return self._sum
 
     @property
-    def avg(self) -> Decimal:
+    def avg(self) -> Number:
         return self._sum / self._count
 
     @property
-    def diff(self) -> Decimal:
-        if len(self._last) == 2:
-            return self._last[-1][0] - self._last[-2][0]
-        return Decimal(0)
+    def diff(self) -> Number:
+        if self._size >= 2:
+            last, prev = self._last_two()
+            return self._values[last] - self._values[prev]
+        return 0
 
     @property
-    def rate(self) -> Decimal:
-        if len(self._last) == 2:
-            return ((self._last[-1][0] - self._last[-2][0]) /
-                    Decimal(self._last[-1][1] - self._last[-2][1]))
-        return Decimal(0)
+    def rate(self) -> Number:
+        if self._size >= 2:
+            last, prev = self._last_two()
+            interval = self._timestamps[last] - self._timestamps[prev]
+            if interval > 0:
+                return (self._values[last] - self._values[prev]) / interval
+        return 0
 
     def to_serializable_dict(self) -> MovingStatValue:
-        q = Decimal('0.000')
         return {
-            'min': str(remove_exponent(self.min.quantize(q))),
-            'max': str(remove_exponent(self.max.quantize(q))),
-            'sum': str(remove_exponent(self.sum.quantize(q))),
-            'avg': str(remove_exponent(self.avg.quantize(q))),
-            'diff': str(remove_exponent(self.diff.quantize(q))),
-            'rate': str(remove_exponent(self.rate.quantize(q))),
+            'min': format_number(self.min),
+            'max': format_number(self.max),
+            'sum': format_number(self.sum),
+            'avg': format_number(self.avg),
+            'diff': format_number(self.diff),
+            'rate': format_number(self.rate),
             'version': 2,
         }
 
 
+# The upper bounds of the histogram buckets for the kernel creation stage durations in seconds
+kernel_creation_duration_buckets = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+class Histogram:
+    """
+    Counts the observed values into the buckets of the given upper bounds
+    plus an overflow bucket, as in the Prometheus histograms.
+    """
+
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+    buckets: Tuple[Number, ...]
+    counts: List[int]
+    sum: Number
+    count: int
+
+    def __init__(self, buckets: Sequence[Number]) -> None:
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value: Number) -> None:
+        # The upper bounds are inclusive.
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative_counts(self) -> List[Tuple[Number, int]]:
+        """
+        Returns the pairs of the upper bounds and the number of the observed values
+        less than or equal to them, ending with the infinite upper bound.
+        """
+        result = []
+        total = 0
+        for upper_bound, count in zip((*self.buckets, math.inf), self.counts):
+            total += count
+            result.append((upper_bound, total))
+        return result
+
+
 @attr.s(auto_attribs=True, slots=True)
 class Metric:
     key: str
     type: MetricTypes
     stats: MovingStatistics
     stats_filter: FrozenSet[str]
-    current: Decimal
-    capacity: Optional[Decimal] = None
+    current: Number = attr.ib(converter=to_number)
+    capacity: Optional[Number] = attr.ib(default=None, converter=attr.converters.optional(to_number))
     unit_hint: Optional[str] = None
-    current_hook: Optional[Callable[['Metric'], Decimal]] = None
+    current_hook: Optional[Callable[['Metric'], Union[Decimal, Number]]] = None
 
     def update(self, value: Measurement):
         if value.capacity is not None:
-            self.capacity = value.capacity
+            self.capacity = to_number(value.capacity)
         self.stats.update(value.value)
-        self.current = value.value
         if self.current_hook is not None:
-            self.current = self.current_hook(self)
+            self.current = to_number(self.current_hook(self))
+        else:
+            self.current = to_number(value.value)
 
     def to_serializable_dict(self) -> MetricValue:
-        q = Decimal('0.000')
-        q_pct = Decimal('0.00')
+        capacity = self.capacity
         return {
-            'current': str(remove_exponent(self.current.quantize(q))),
-            'capacity': (str(remove_exponent(self.capacity.quantize(q)))
-                         if self.capacity is not None else None),
+            'current': format_number(self.current),
+            'capacity': (format_number(capacity)
+                         if capacity is not None else None),
             'pct': (
-                str(remove_exponent(
-                    (Decimal(self.current) / Decimal(self.capacity) * 100).quantize(q_pct)))
-                if (self.capacity is not None and
-                    self.capacity.is_normal() and
-                    self.capacity > 0)
+                format_number(self.current / capacity * 100, 2)
+                if (capacity is not None and
+                    math.isfinite(capacity) and
+                    capacity > 0)
                 else None),
             'unit_hint': self.unit_hint,
             **{f'stats.{k}': v  # type: ignore
@@ -234,6 +352,98 @@ class Metric:
         }
 
 
+class StatPublisher:
+    """
+    Publishes the serialized statistics to Redis, skipping the keys
+    whose payloads have not changed since their last publication.
+
+    Unchanged payloads are re-published only after a half of their lifespan has passed,
+    so that they do not expire while the agent is alive.
+    Optionally, it also keeps the kernel statistics in a per-agent hash ("agent:<agent-id>")
+    so that the manager can fetch the statistics of all kernels in a node at once.
+    """
+
+    def __init__(
+        self,
+        agent_id: str,
+        *,
+        cache_lifespan: int = 120,
+        max_batch_size: int = 256,
+        agent_hash: bool = False,
+    ) -> None:
+        self.agent_id = agent_id
+        self.cache_lifespan = cache_lifespan
+        self.max_batch_size = max_batch_size
+        self.agent_hash = agent_hash
+        self.agent_hash_key = f'agent:{agent_id}'
+        # key -> (the last published payload, the publication timestamp)
+        self._published: MutableMapping[str, Tuple[bytes, float]] = {}
+        self._removed_kernels: Set[str] = set()
+        self._lock = asyncio.Lock()
+
+    def forget_kernel(self, kernel_id: KernelId) -> None:
+        self._published.pop(str(kernel_id), None)
+        self._removed_kernels.add(str(kernel_id))
+
+    async def publish(
+        self,
+        redis_obj: Any,
+        *,
+        node_stat: Optional[Mapping[str, Any]] = None,
+        kernel_stats: Optional[Mapping[KernelId, Mapping[Any, Any]]] = None,
+    ) -> int:
+        """
+        Publishes the changed statistics and returns the number of written keys.
+        """
+        async with self._lock:
+            now = time.monotonic()
+            refresh_threshold = now - self.cache_lifespan / 2
+            updates: List[Tuple[str, bytes]] = []
+
+            def _check(key: str, stat: Mapping[str, Any]) -> None:
+                payload = msgpack.packb(stat)
+                last = self._published.get(key)
+                if last is None or last[0] != payload or last[1] <= refresh_threshold:
+                    updates.append((key, payload))
+
+            if node_stat is not None:
+                _check(self.agent_id, node_stat)
+            if kernel_stats is not None:
+                for kernel_id, kernel_stat in kernel_stats.items():
+                    # The kernel may have been restarted with the same ID.
+                    self._removed_kernels.discard(str(kernel_id))
+                    _check(str(kernel_id), kernel_stat)
+            removed_kernels = [*self._removed_kernels] if self.agent_hash else []
+            if not self.agent_hash:
+                self._removed_kernels.clear()
+            if not updates and not removed_kernels:
+                return 0
+
+            async def _pipe_builder(r: aioredis.Redis) -> None:
+                async with r.pipeline(transaction=False) as pipe:
+                    for key, payload in updates:
+                        pipe.set(key, payload, ex=self.cache_lifespan)
+                        if self.agent_hash and key != self.agent_id:
+                            pipe.hset(self.agent_hash_key, key, payload)
+                        # Keep the size of each round-trip bounded.
+                        if len(pipe) >= self.max_batch_size:
+                            await pipe.execute()
+                    if self.agent_hash:
+                        if removed_kernels:
+                            pipe.hdel(self.agent_hash_key, *removed_kernels)
+                        pipe.expire(self.agent_hash_key, self.cache_lifespan)
+                    if len(pipe) > 0:
+                        await pipe.execute()
+
+            await redis.execute(redis_obj, _pipe_builder)
+            self._removed_kernels.difference_update(removed_kernels)
+            for key, payload in updates:
+                # Skip the kernels forgotten while publishing.
+                if key not in self._removed_kernels:
+                    self._published[key] = (payload, now)
+            return len(updates)
+
+
 class StatContext:
 
     agent: 'AbstractAgent'
@@ -241,19 +451,83 @@ class StatContext:
     node_metrics: Mapping[MetricKey, Metric]
     device_metrics: Mapping[MetricKey, MutableMapping[DeviceId, Metric]]
     kernel_metrics: MutableMapping[KernelId, MutableMapping[MetricKey, Metric]]
+    docker: Optional[aiodocker.Docker]
+    docker_stats: Optional[Mapping[ContainerId, Mapping[str, Any]]]
+    cgroups: Optional['CgroupStatReader']
+    scratch_usage: Optional['ScratchUsageTracker']
+    node_snapshot: Optional['ProcSnapshot']
+    warm_pool: Optional['WarmContainerPool']
 
     def __init__(self, agent: 'AbstractAgent', mode: StatModes = None, *,
                  cache_lifespan: int = 120) -> None:
         self.agent = agent
         self.mode = mode if mode is not None else StatModes.get_preferred_mode()
         self.cache_lifespan = cache_lifespan
+        # The agent-wide shared Docker API client, set by the Docker backend.
+        self.docker = None
+        # The latest stats samples per container in the docker-stream mode,
+        # set by the Docker backend.
+        self.docker_stats = None
+        # The reader of container cgroup stat files in the cgroup mode,
+        # set by the Docker backend.
+        self.cgroups = None
+        # The tracker of kernel scratch directory usage, set by the Docker backend.
+        self.scratch_usage = None
+        # The procfs reader of the node-wide statistics shared by the intrinsic plugins,
+        # set by the Docker backend.
+        self.node_snapshot = None
+        # The pool of pre-created containers, set by the Docker backend if enabled.
+        self.warm_pool = None
+        publish_config = agent.local_config['stats']['publish']
+        self.publisher = StatPublisher(
+            agent.local_config['agent']['id'],
+            cache_lifespan=cache_lifespan,
+            max_batch_size=publish_config['max-batch-size'],
+            agent_hash=publish_config['agent-hash'],
+        )
 
         self.node_metrics = {}
         self.device_metrics = {}
         self.kernel_metrics = {}
+        # The histograms of the kernel creation durations per stage.
+        self.kernel_creation_stages: MutableMapping[str, Histogram] = {}
+
+        stats_config = agent.local_config['stats']
+        # The base sampling interval and the per-metric sampling intervals in seconds.
+        self.interval = stats_config['interval']
+        self.metric_intervals: Mapping[str, float] = stats_config['metric-intervals']
+        # The maximum number of containers sampled at once.
+        self.sample_batch_size = stats_config['sample-batch-size']
+        # The time slept to spread the batches in the last collection of container stats.
+        self.last_spread_delay = 0.0
+        self.history: Optional[MetricHistoryStore] = None
+        if stats_config['history']['enabled']:
+            self.history = MetricHistoryStore(
+                stats_config['history']['tiers'],
+                max_size=stats_config['history']['max-size'],
+            )
 
         self._lock = asyncio.Lock()
         self._timestamps: MutableMapping[str, float] = {}
+        # The last sampling timestamps of the metrics with their own intervals,
+        # keyed by the scope ("node" or a kernel ID) and the metric key.
+        self._metric_timestamps: MutableMapping[Tuple[str, str], float] = {}
+        # The metric keys reported by each compute plugin in the last sweep,
+        # keyed by "node" or "container" and the plugin key.
+        self._plugin_metric_keys: MutableMapping[Tuple[str, str], FrozenSet[str]] = {}
+        # The metric keys not due in the current sweep, keyed by "node" or a container ID.
+        self._skipped_metrics: MutableMapping[str, FrozenSet[str]] = {}
+
+    def observe_kernel_creation(self, durations: Mapping[str, float]) -> None:
+        """
+        Record the durations of the stages of a kernel creation.
+        """
+        for stage, duration in durations.items():
+            histogram = self.kernel_creation_stages.get(stage)
+            if histogram is None:
+                histogram = Histogram(kernel_creation_duration_buckets)
+                self.kernel_creation_stages[stage] = histogram
+            histogram.observe(duration)
 
     def update_timestamp(self, timestamp_key: str) -> Tuple[float, float]:
         """
@@ -271,27 +545,84 @@ class StatContext:
             return now, float('NaN')
         return now, now - last
 
+    def is_metric_due(self, metric_key: str, container_id: Optional[str] = None) -> bool:
+        """
+        Check if the metric of the node (or the given container) should be sampled
+        in the current sweep according to its own sampling interval,
+        so that the compute plugins may skip sampling the metrics not due.
+
+        Intended to be used by compute plugins.
+        """
+        scope = 'node' if container_id is None else container_id
+        return metric_key not in self._skipped_metrics.get(scope, frozenset())
+
+    def _get_skipped_metrics(self, scope: str, now: float) -> FrozenSet[str]:
+        """
+        Return the metric keys not due in the current sweep of the given scope
+        (the node or a kernel) according to their own sampling intervals,
+        and mark the due ones as sampled.
+        """
+        skipped = set()
+        for metric_key, interval in self.metric_intervals.items():
+            last = self._metric_timestamps.get((scope, metric_key))
+            # Tolerate the timer jitter up to a half of the base interval.
+            if last is None or now - last >= interval - self.interval / 2:
+                self._metric_timestamps[(scope, metric_key)] = now
+            else:
+                skipped.add(metric_key)
+        return frozenset(skipped)
+
+    def _forget_metric_timestamps(self, scope: str) -> None:
+        for metric_key in self.metric_intervals:
+            self._metric_timestamps.pop((scope, metric_key), None)
+
+    def _is_plugin_due(self, kind: str, plugin_key: str, skipped: FrozenSet[str]) -> bool:
+        # The plugins which have not reported any metrics yet are always sampled.
+        metric_keys = self._plugin_metric_keys.get((kind, plugin_key))
+        return metric_keys is None or not metric_keys <= skipped
+
     async def collect_node_stat(self):
         """
-        Collect the per-node, per-device, and per-container statistics.
+        Collect the per-node and per-device statistics.
 
         Intended to be used by the agent.
         """
         async with self._lock:
+            now = time.monotonic()
+            wall_now = time.time()
+            skipped = self._get_skipped_metrics('node', now)
+            self._skipped_metrics['node'] = skipped
+            if self.node_snapshot is not None:
+                try:
+                    self.node_snapshot.read()
+                except OSError:
+                    log.exception('collect_node_stat(): cannot read procfs, falling back to psutil')
+                    self.node_snapshot.close()
+                    self.node_snapshot = None
             # Here we use asyncio.gather() instead of aiotools.TaskGroup
             # to keep methods of other plugins running when a plugin raises an error
             # instead of cancelling them.
+            # The plugins whose metrics are all not due are not sampled at all.
             _tasks = []
-            for computer in self.agent.computers.values():
+            plugin_keys = []
+            for plugin_key, computer in self.agent.computers.items():
+                if not self._is_plugin_due('node', plugin_key, skipped):
+                    continue
                 _tasks.append(computer.instance.gather_node_measures(self))
+                plugin_keys.append(plugin_key)
             results = await asyncio.gather(*_tasks, return_exceptions=True)
-            for result in results:
-                if isinstance(result, Exception):
+            for plugin_key, result in zip(plugin_keys, results):
+                if isinstance(result, BaseException):
                     log.error('collect_node_stat(): gather_node_measures() error',
                               exc_info=result)
                     continue
+                self._plugin_metric_keys[('node', plugin_key)] = frozenset(
+                    node_measure.key for node_measure in result
+                )
                 for node_measure in result:
                     metric_key = node_measure.key
+                    if metric_key in skipped:
+                        continue
                     # update node metric
                     if metric_key not in self.node_metrics:
                         self.node_metrics[metric_key] = Metric(
@@ -305,6 +636,10 @@ class StatContext:
                         )
                     else:
                         self.node_metrics[metric_key].update(node_measure.per_node)
+                    if self.history is not None:
+                        self.history.record_node(
+                            metric_key, wall_now, self.node_metrics[metric_key].current,
+                        )
                     # update per-device metric
                     # NOTE: device IDs are defined by each metric keys.
                     for dev_id, measure in node_measure.per_device.items():
@@ -324,148 +659,174 @@ class StatContext:
                         else:
                             self.device_metrics[metric_key][dev_id].update(measure)
 
-            # gather container metrics from compute plugins
-            container_ids = []
-            kernel_id_map = {}
-            used_kernel_ids = set()
-            for kid, kobj in self.agent.kernel_registry.items():
-                cid = kobj['container_id']
-                container_ids.append(cid)
-                kernel_id_map[cid] = kid
-                used_kernel_ids.add(kid)
-            unused_kernel_ids = set(self.kernel_metrics.keys()) - used_kernel_ids
-            for unused_kernel_id in unused_kernel_ids:
-                log.debug('removing kernel_metric for {}', unused_kernel_id)
-                self.kernel_metrics.pop(unused_kernel_id, None)
-            _tasks = []
-            for computer in self.agent.computers.values():
-                _tasks.append(computer.instance.gather_container_measures(self, container_ids))
-            for ctnr_measures in (await asyncio.gather(*_tasks, return_exceptions=True)):
-                if isinstance(ctnr_measures, Exception):
-                    log.error('gather_container_measures error',
-                              exc_info=ctnr_measures)
-                    continue
-                for ctnr_measure in ctnr_measures:
-                    metric_key = ctnr_measure.key
-                    # update per-container metric
-                    for cid, measure in ctnr_measure.per_container.items():
-                        kernel_id = kernel_id_map[cid]
-                        if kernel_id not in self.kernel_metrics:
-                            self.kernel_metrics[kernel_id] = {}
-                        if metric_key not in self.kernel_metrics[kernel_id]:
-                            self.kernel_metrics[kernel_id][metric_key] = Metric(
-                                metric_key, ctnr_measure.type,
-                                current=measure.value,
-                                capacity=measure.value,
-                                unit_hint=ctnr_measure.unit_hint,
-                                stats=MovingStatistics(measure.value),
-                                stats_filter=frozenset(ctnr_measure.stats_filter),
-                                current_hook=ctnr_measure.current_hook,
-                            )
-                        else:
-                            self.kernel_metrics[kernel_id][metric_key].update(measure)
-
-        # push to the Redis server
-        redis_agent_updates = {
-            'node': {
-                key: obj.to_serializable_dict()
-                for key, obj in self.node_metrics.items()
-            },
-            'devices': {
-                metric_key: {dev_id: obj.to_serializable_dict()
-                             for dev_id, obj in per_device.items()}
-                for metric_key, per_device in self.device_metrics.items()
-            },
-        }
+            # push to the Redis server
+            redis_agent_updates = {
+                'node': {
+                    key: obj.to_serializable_dict()
+                    for key, obj in self.node_metrics.items()
+                },
+                'devices': {
+                    metric_key: {dev_id: obj.to_serializable_dict()
+                                 for dev_id, obj in per_device.items()}
+                    for metric_key, per_device in self.device_metrics.items()
+                },
+            }
         if self.agent.local_config['debug']['log-stats']:
             log.debug('stats: node_updates: {0}: {1}',
                       self.agent.local_config['agent']['id'], redis_agent_updates['node'])
-        serialized_agent_updates = msgpack.packb(redis_agent_updates)
-
-        async def _pipe_builder(r: aioredis.Redis):
-            async with r.pipeline() as pipe:
-                pipe.set(self.agent.local_config['agent']['id'], serialized_agent_updates)
-                pipe.expire(self.agent.local_config['agent']['id'], self.cache_lifespan)
-                for kernel_id, metrics in self.kernel_metrics.items():
-                    serialized_metrics = {
-                        key: obj.to_serializable_dict()
-                        for key, obj in metrics.items()
-                    }
-                    pipe.set(str(kernel_id), msgpack.packb(serialized_metrics))
-                    pipe.expire(str(kernel_id), self.cache_lifespan)
-                await pipe.execute()
-
-        await redis.execute(self.agent.redis_stat_pool, _pipe_builder)
+        await self.publisher.publish(
+            self.agent.redis_stat_pool,
+            node_stat=redis_agent_updates,
+        )
 
     async def collect_container_stat(
         self,
         container_ids: Sequence[ContainerId],
-    ) -> Mapping[MetricKey, Metric]:
+        *,
+        spread: float = 0.0,
+    ) -> Mapping[KernelId, Mapping[MetricKey, Metric]]:
         """
-        Collect the per-container statistics only,
+        Collect the per-container statistics of the given containers
+        and return the metrics of the updated kernels.
+
+        If there are more containers than the sampling batch size, the batches are
+        sampled at jittered offsets across the given *spread* duration in seconds
+        instead of sampling all containers at once.
 
         Intended to be used by the agent and triggered by container cgroup synchronization processes.
         """
+        self.last_spread_delay = 0.0
+        now = time.monotonic()
+        wall_now = time.time()
         async with self._lock:
             kernel_id_map: Dict[ContainerId, KernelId] = {}
             for kid, info in self.agent.kernel_registry.items():
                 cid = info['container_id']
                 kernel_id_map[ContainerId(cid)] = kid
-            # Here we use asyncio.gather() instead of aiotools.TaskGroup
-            # to keep methods of other plugins running when a plugin raises an error
-            # instead of cancelling them.
-            _tasks = []
-            kernel_id = None
-            for computer in self.agent.computers.values():
-                _tasks.append(asyncio.create_task(
-                    computer.instance.gather_container_measures(self, container_ids),
-                ))
-            results = await asyncio.gather(*_tasks, return_exceptions=True)
-            for result in results:
-                if isinstance(result, Exception):
-                    log.error('collect_container_stat(): gather_container_measures() error',
-                              exc_info=result)
-                    continue
-                for ctnr_measure in result:
-                    metric_key = ctnr_measure.key
-                    # update per-container metric
-                    for cid, measure in ctnr_measure.per_container.items():
-                        try:
-                            kernel_id = kernel_id_map[cid]
-                        except KeyError:
-                            continue
-                        if kernel_id not in self.kernel_metrics:
-                            self.kernel_metrics[kernel_id] = {}
-                        if metric_key not in self.kernel_metrics[kernel_id]:
-                            self.kernel_metrics[kernel_id][metric_key] = Metric(
-                                metric_key, ctnr_measure.type,
-                                current=measure.value,
-                                capacity=measure.value,
-                                unit_hint=ctnr_measure.unit_hint,
-                                stats=MovingStatistics(measure.value),
-                                stats_filter=frozenset(ctnr_measure.stats_filter),
-                                current_hook=ctnr_measure.current_hook,
-                            )
-                        else:
-                            self.kernel_metrics[kernel_id][metric_key].update(measure)
-
-        if kernel_id is not None:
-            metrics = self.kernel_metrics[kernel_id]
-            serializable_metrics = {
+            unused_kernel_ids = set(self.kernel_metrics.keys()) - set(kernel_id_map.values())
+            for unused_kernel_id in unused_kernel_ids:
+                log.debug('removing kernel_metric for {}', unused_kernel_id)
+                self.kernel_metrics.pop(unused_kernel_id, None)
+                self.publisher.forget_kernel(unused_kernel_id)
+                self._forget_metric_timestamps(str(unused_kernel_id))
+                if self.history is not None:
+                    self.history.forget_kernel(unused_kernel_id)
+        batch_size = self.sample_batch_size
+        batches = [
+            container_ids[idx:idx + batch_size]
+            for idx in range(0, len(container_ids), batch_size)
+        ]
+        slot = spread / len(batches) if batches else 0.0
+        # Use a dict as an insertion-ordered set.
+        updated_kernel_ids: Dict[KernelId, None] = {}
+        for batch_idx, batch in enumerate(batches):
+            if batch_idx > 0 and slot > 0:
+                delay = now + slot * (batch_idx + random.uniform(0, 0.5)) - time.monotonic()
+                if delay > 0:
+                    sleep_started = time.monotonic()
+                    await asyncio.sleep(delay)
+                    self.last_spread_delay += time.monotonic() - sleep_started
+            async with self._lock:
+                await self._sample_containers(
+                    batch, kernel_id_map, now, wall_now, updated_kernel_ids,
+                )
+        updated_metrics = {
+            kernel_id: self.kernel_metrics[kernel_id]
+            for kernel_id in updated_kernel_ids
+            if kernel_id in self.kernel_metrics
+        }
+        if not updated_metrics:
+            return {}
+        serializable_kernel_updates = {
+            kernel_id: {
                 key: obj.to_serializable_dict()
                 for key, obj in metrics.items()
             }
-            if self.agent.local_config['debug']['log-stats']:
+            for kernel_id, metrics in updated_metrics.items()
+        }
+        if self.agent.local_config['debug']['log-stats']:
+            for kernel_id, serializable_metrics in serializable_kernel_updates.items():
                 log.debug('kernel_updates: {0}: {1}',
                           kernel_id, serializable_metrics)
-            serialized_metrics = msgpack.packb(serializable_metrics)
+        await self.publisher.publish(
+            self.agent.redis_stat_pool,
+            kernel_stats=serializable_kernel_updates,
+        )
+        return updated_metrics
 
-            async def _pipe_builder(r: aioredis.Redis):
-                async with r.pipeline() as pipe:
-                    pipe.set(str(kernel_id), serialized_metrics)
-                    pipe.expire(str(kernel_id), self.cache_lifespan)
-                    await pipe.execute()
-
-            await redis.execute(self.agent.redis_stat_pool, _pipe_builder)
-            return metrics
-        return {}
+    async def _sample_containers(
+        self,
+        container_ids: Sequence[ContainerId],
+        kernel_id_map: Mapping[ContainerId, KernelId],
+        now: float,
+        wall_now: float,
+        updated_kernel_ids: MutableMapping[KernelId, None],
+    ) -> None:
+        # Decide the metrics due for each kernel before sampling,
+        # so that the plugins skip the containers whose metrics are all not due.
+        skipped_per_container: Dict[str, FrozenSet[str]] = {}
+        for container_id in container_ids:
+            kernel_id = kernel_id_map.get(container_id)
+            skipped: FrozenSet[str] = frozenset()
+            if kernel_id is not None:
+                skipped = self._get_skipped_metrics(str(kernel_id), now)
+            skipped_per_container[container_id] = skipped
+        self._skipped_metrics = {
+            **{k: v for k, v in self._skipped_metrics.items() if k == 'node'},
+            **skipped_per_container,
+        }
+        # Here we use asyncio.gather() instead of aiotools.TaskGroup
+        # to keep methods of other plugins running when a plugin raises an error
+        # instead of cancelling them.
+        _tasks = []
+        plugin_keys = []
+        for plugin_key, computer in self.agent.computers.items():
+            due_container_ids = [
+                container_id for container_id in container_ids
+                if self._is_plugin_due('container', plugin_key, skipped_per_container[container_id])
+            ]
+            if not due_container_ids:
+                continue
+            _tasks.append(asyncio.create_task(
+                computer.instance.gather_container_measures(self, due_container_ids),
+            ))
+            plugin_keys.append(plugin_key)
+        results = await asyncio.gather(*_tasks, return_exceptions=True)
+        for plugin_key, result in zip(plugin_keys, results):
+            if isinstance(result, BaseException):
+                log.error('collect_container_stat(): gather_container_measures() error',
+                          exc_info=result)
+                continue
+            self._plugin_metric_keys[('container', plugin_key)] = frozenset(
+                ctnr_measure.key for ctnr_measure in result
+            )
+            for ctnr_measure in result:
+                metric_key = ctnr_measure.key
+                # update per-container metric
+                for cid, measure in ctnr_measure.per_container.items():
+                    try:
+                        kernel_id = kernel_id_map[cid]
+                    except KeyError:
+                        continue
+                    if metric_key in skipped_per_container.get(cid, frozenset()):
+                        continue
+                    updated_kernel_ids[kernel_id] = None
+                    if kernel_id not in self.kernel_metrics:
+                        self.kernel_metrics[kernel_id] = {}
+                    if metric_key not in self.kernel_metrics[kernel_id]:
+                        self.kernel_metrics[kernel_id][metric_key] = Metric(
+                            metric_key, ctnr_measure.type,
+                            current=measure.value,
+                            capacity=measure.value,
+                            unit_hint=ctnr_measure.unit_hint,
+                            stats=MovingStatistics(measure.value),
+                            stats_filter=frozenset(ctnr_measure.stats_filter),
+                            current_hook=ctnr_measure.current_hook,
+                        )
+                    else:
+                        self.kernel_metrics[kernel_id][metric_key].update(measure)
+                    if self.history is not None:
+                        self.history.record_kernel(
+                            kernel_id, metric_key, wall_now,
+                            self.kernel_metrics[kernel_id][metric_key].current,
+                        )
@@ -0,0 +1,13 @@
+#! /bin/sh
+
+# The entrypoint of the containers pre-created by the warm pool of the agent.
+# The environment variables of a container are fixed when it is created,
+# so they are read from the environ.txt of the kernel which claimed the container.
+
+while IFS= read -r line || [ -n "$line" ]; do
+  case "$line" in
+    *=*) export "$line" ;;
+  esac
+done < /home/config/environ.txt
+
+exec /opt/kernel/entrypoint.sh "$@"
@@ -1,3 +1,5 @@
+import asyncio
+from pathlib import Path
 import signal
 from typing import (
     Any,
@@ -11,8 +13,9 @@ from ai.backend.common.exception import ImageNotAvailable
 from ai.backend.common.types import AutoPullBehavior
 from ai.backend.common.docker import ImageRef
 
+from ai.backend.agent.agent import krunner_mount_plan_cache
 from ai.backend.agent.config import agent_local_config_iv
-from ai.backend.agent.docker.agent import DockerAgent
+from ai.backend.agent.docker.agent import DockerAgent, DockerKernelCreationContext
 
 import pytest
 
@@ -219,3 +222,64 @@ async def test_auto_pull_none_when_missing(agent, mocker):
         await agent.check_image(imgref, query_digest, behavior)
     assert e.value.args[0] is imgref
     inspect_mock.assert_called_with(imgref.canonical)
+
+
+def create_kernel_creation_context(local_config, kernel_id, distro):
+    return DockerKernelCreationContext(
+        kernel_id,
+        {
+            'image': {
+                'canonical': 'index.docker.io/lablup/python:3.8',
+                'registry': {'name': 'index.docker.io'},
+                'labels': {'ai.backend.base-distro': distro},
+            },
+            'internal_data': None,
+        },
+        local_config,
+        {},
+        set(),
+        Path('/tmp/agent.sock'),
+        asyncio.Lock(),
+        MagicMock(),
+    )
+
+
+@pytest.mark.asyncio
+async def test_krunner_mount_plan(tmp_path):
+    local_config = {
+        'container': {
+            'scratch-root': tmp_path,
+            'sandbox-type': 'docker',
+            'krunner-volumes': {
+                'alpine3.8': 'backendai-krunner.v1.alpine3.8',
+                'static-gnu': 'backendai-krunner.v2.static-gnu',
+            },
+        },
+    }
+    krunner_mount_plan_cache.clear()
+    DockerKernelCreationContext.prepare_krunner_mount_plans(local_config)
+    distros = {key[1] for key in krunner_mount_plan_cache.keys()}
+    assert {'alpine3.8', 'centos7.6', 'ubuntu16.04', 'ubuntu18.04', 'ubuntu20.04'} <= distros
+
+    plan = DockerKernelCreationContext.get_krunner_mount_plan(local_config, 'ubuntu20.04')
+    assert DockerKernelCreationContext.get_krunner_mount_plan(local_config, 'ubuntu20.04') is plan
+    mounts = {m.target: m for m in plan.mounts}
+    assert mounts['/opt/backend.ai'].source == 'backendai-krunner.v2.static-gnu'
+    assert mounts['/opt/kernel/su-exec'].source.name == f'su-exec.ubuntu20.04.{plan.arch}.bin'
+    assert '/opt/kernel/jail' not in mounts
+    assert '/home/work/.terminfo' not in mounts
+    plan = DockerKernelCreationContext.get_krunner_mount_plan(local_config, 'alpine3.8')
+    assert '/home/work/.terminfo' in {m.target for m in plan.mounts}
+
+    # each kernel gets its own copy of the planned mounts
+    specs = []
+    for kernel_id in ('k1', 'k2'):
+        ctx = create_kernel_creation_context(local_config, kernel_id, 'ubuntu20.04')
+        resource_spec = MagicMock(mounts=[], allocations={})
+        environ = {}
+        await ctx.mount_krunner(resource_spec, environ)
+        assert environ['LD_PRELOAD'] == '/opt/kernel/libbaihook.so'
+        specs.append(resource_spec)
+    assert [str(m) for m in specs[0].mounts] == [str(m) for m in specs[1].mounts]
+    assert specs[0].mounts[0] is not specs[1].mounts[0]
+    assert str(specs[0].mounts[0].target) == '/opt/kernel/extract_dotfiles.py'
@@ -0,0 +1,118 @@
+import pytest
+
+from ai.backend.agent.docker.cgroup import (
+    CgroupStatReader,
+    CgroupVersion,
+    parse_pressure,
+)
+
+
+CID = 'a1b2c3d4e5f6' * 5
+
+
+def test_cgroup_v2_systemd_layout(tmp_path):
+    (tmp_path / 'cgroup.controllers').write_text('cpu io memory pids\n')
+    cg_path = tmp_path / 'system.slice' / f'docker-{CID}.scope'
+    cg_path.mkdir(parents=True)
+    (cg_path / 'cpu.stat').write_text(
+        'usage_usec 2071350\nuser_usec 1554370\nsystem_usec 516980\n'
+        'nr_periods 100\nnr_throttled 7\nthrottled_usec 35000\n')
+    (cg_path / 'memory.events').write_text(
+        'low 0\nhigh 0\nmax 12\noom 2\noom_kill 1\n')
+    (cg_path / 'cpu.pressure').write_text(
+        'some avg10=0.00 avg60=0.00 avg300=0.00 total=4000\n'
+        'full avg10=0.00 avg60=0.00 avg300=0.00 total=0\n')
+    (cg_path / 'memory.current').write_text('1048576\n')
+    (cg_path / 'io.stat').write_text(
+        '8:0 rbytes=4096 wbytes=512 rios=1 wios=1 dbytes=0 dios=0\n'
+        '8:16 rbytes=1024 wbytes=0 rios=1 wios=0 dbytes=0 dios=0\n')
+    (cg_path / 'memory.pressure').write_text(
+        'some avg10=1.50 avg60=0.00 avg300=0.00 total=1234\n'
+        'full avg10=0.00 avg60=0.00 avg300=0.00 total=56\n')
+
+    reader = CgroupStatReader(tmp_path)
+    assert reader.version == CgroupVersion.V2
+    cgroup = reader.get(CID)
+    assert reader.get(CID) is cgroup
+    try:
+        assert cgroup.read_cpu_used() == pytest.approx(2071.35)
+        assert cgroup.read_mem_used() == 1048576
+        assert cgroup.read_io_bytes() == (5120, 512)
+        assert cgroup.read_pressure('memory')['some']['total'] == 1234
+        assert cgroup.read_pressure('cpu')['some']['total'] == 4000
+        assert cgroup.read_cpu_throttling() == (7, pytest.approx(35.0))
+        assert cgroup.read_memory_events()['oom'] == 2
+        assert cgroup.read_memory_events()['oom_kill'] == 1
+        # The missing files are remembered as unsupported (e.g., without CONFIG_PSI).
+        with pytest.raises(FileNotFoundError):
+            cgroup.read_pressure('io')
+        assert 'io.pressure' in cgroup._unsupported
+        # The files are kept open and re-read from the beginning.
+        fds = dict(cgroup._fds)
+        (cg_path / 'memory.current').write_text('2097152\n')
+        assert cgroup.read_mem_used() == 2097152
+        assert cgroup._fds == fds
+    finally:
+        reader.release(CID)
+    assert cgroup._fds == {}
+
+
+def test_cgroup_v1_cgroupfs_layout(tmp_path):
+    cpu_path = tmp_path / 'cpuacct' / 'docker' / CID
+    cpu_ctrl_path = tmp_path / 'cpu' / 'docker' / CID
+    mem_path = tmp_path / 'memory' / 'docker' / CID
+    io_path = tmp_path / 'blkio' / 'docker' / CID
+    for path in (cpu_path, cpu_ctrl_path, mem_path, io_path):
+        path.mkdir(parents=True)
+    (cpu_path / 'cpuacct.usage').write_text('2500000000\n')
+    (cpu_ctrl_path / 'cpu.stat').write_text(
+        'nr_periods 100\nnr_throttled 3\nthrottled_time 12000000\n')
+    (mem_path / 'memory.usage_in_bytes').write_text('4096\n')
+    (mem_path / 'memory.oom_control').write_text(
+        'oom_kill_disable 0\nunder_oom 0\noom_kill 4\n')
+    (io_path / 'blkio.throttle.io_service_bytes').write_text(
+        '8:0 Read 13918208\n8:0 Write 100\n8:0 Sync 0\n'
+        '8:0 Async 13918208\n8:0 Total 13918308\nTotal 13918308\n')
+
+    reader = CgroupStatReader(tmp_path)
+    assert reader.version == CgroupVersion.V1
+    cgroup = reader.get(CID)
+    try:
+        assert cgroup.read_cpu_used() == pytest.approx(2500.0)
+        assert cgroup.read_mem_used() == 4096
+        assert cgroup.read_io_bytes() == (13918208, 100)
+        assert cgroup.read_cpu_throttling() == (3, pytest.approx(12.0))
+        assert cgroup.read_memory_events() == {
+            'oom_kill_disable': 0, 'under_oom': 0, 'oom_kill': 4,
+        }
+        with pytest.raises(FileNotFoundError):
+            cgroup.read_pressure('memory')
+        with pytest.raises(FileNotFoundError):
+            reader.get('unknown').read_mem_used()
+    finally:
+        reader.close()
+
+
+def test_parse_pressure():
+    data = parse_pressure('some avg10=0.12 avg60=0.34 avg300=0.56 total=789\n')
+    assert data == {'some': {'avg10': 0.12, 'avg60': 0.34, 'avg300': 0.56, 'total': 789.0}}
+
+
+def test_cgroup_net_bytes_with_host_network(tmp_path):
+    cg_path = tmp_path / 'cgroup' / 'docker' / CID
+    cg_path.mkdir(parents=True)
+    (tmp_path / 'cgroup' / 'cgroup.controllers').write_text('cpu io memory pids\n')
+    (cg_path / 'cgroup.procs').write_text('1234\n')
+    (tmp_path / 'proc' / '1234' / 'ns').mkdir(parents=True)
+    (tmp_path / 'proc' / '1234' / 'ns' / 'net').write_text('')
+    # The container shares the network namespace with the agent.
+    (tmp_path / 'proc' / 'self').symlink_to(tmp_path / 'proc' / '1234')
+
+    reader = CgroupStatReader(tmp_path / 'cgroup', tmp_path / 'proc')
+    cgroup = reader.get(CID)
+    try:
+        with pytest.raises(FileNotFoundError):
+            cgroup.read_net_bytes()
+        assert 'net.dev' in cgroup._unsupported
+    finally:
+        reader.close()
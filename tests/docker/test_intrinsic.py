@@ -0,0 +1,152 @@
+from decimal import Decimal
+from types import SimpleNamespace
+
+import pytest
+
+from ai.backend.agent.docker.cgroup import CgroupStatReader
+from ai.backend.agent.docker.intrinsic import CPUPlugin, MemoryPlugin
+from ai.backend.agent.stats import StatModes
+
+
+CID = 'a1b2c3d4e5f6' * 5
+
+
+NET_DEV = (
+    'Inter-|   Receive                                                |  Transmit\n'
+    ' face |bytes    packets errs drop fifo frame compressed multicast|'
+    'bytes    packets errs drop fifo colls carrier compressed\n'
+    '    lo:    1000      10    0    0    0     0          0         0'
+    '     1000      10    0    0    0     0       0          0\n'
+    '  eth0:  123456      20    0    0    0     0          0         0'
+    '     4321      20    0    0    0     0       0          0\n'
+)
+
+
+def create_fake_proc(proc_root, pid):
+    for name in ('self', str(pid)):
+        (proc_root / name / 'ns').mkdir(parents=True)
+        (proc_root / name / 'ns' / 'net').write_text('')
+    (proc_root / str(pid) / 'net').mkdir()
+    (proc_root / str(pid) / 'net' / 'dev').write_text(NET_DEV)
+
+
+@pytest.fixture
+def cgroup_ctx(tmp_path):
+    create_fake_proc(tmp_path / 'proc', 1234)
+    cgroup_root = tmp_path / 'cgroup'
+    cg_path = cgroup_root / 'docker' / CID
+    cg_path.mkdir(parents=True)
+    (cgroup_root / 'cgroup.controllers').write_text('cpu io memory pids\n')
+    (cg_path / 'cgroup.procs').write_text('1234\n1240\n')
+    (cg_path / 'cpu.stat').write_text(
+        'usage_usec 2071350\nuser_usec 1554370\nsystem_usec 516980\n'
+        'nr_periods 100\nnr_throttled 7\nthrottled_usec 35000\n')
+    (cg_path / 'memory.current').write_text('1048576\n')
+    (cg_path / 'memory.events').write_text('low 0\nhigh 0\nmax 12\noom 2\noom_kill 1\n')
+    (cg_path / 'io.stat').write_text('8:0 rbytes=4096 wbytes=512 rios=1 wios=1\n')
+    for resource, total in [('cpu', 4000), ('memory', 1234)]:
+        (cg_path / f'{resource}.pressure').write_text(
+            f'some avg10=0.00 avg60=0.00 avg300=0.00 total={total}\n'
+            'full avg10=0.00 avg60=0.00 avg300=0.00 total=0\n')
+    cgroups = CgroupStatReader(cgroup_root, tmp_path / 'proc')
+    yield SimpleNamespace(
+        mode=StatModes.CGROUP,
+        cgroups=cgroups,
+        scratch_usage=SimpleNamespace(get_usage=lambda cid: 0),
+        is_metric_due=lambda metric_key, container_id=None: True,
+    )
+    cgroups.close()
+
+
+@pytest.mark.asyncio
+async def test_cpu_plugin_contention_measures(cgroup_ctx):
+    plugin = CPUPlugin({}, {})
+    measures = {
+        m.key: m for m in await plugin.gather_container_measures(cgroup_ctx, [CID])
+    }
+    assert measures['cpu_used'].per_container[CID].value == Decimal('2071.350')
+    assert measures['cpu_throttled'].per_container[CID].value == pytest.approx(35.0)
+    assert measures['cpu_throttled_periods'].per_container[CID].value == 7
+    assert measures['cpu_pressure'].per_container[CID].value == pytest.approx(4.0)
+
+
+@pytest.mark.asyncio
+async def test_memory_plugin_contention_measures(cgroup_ctx):
+    plugin = MemoryPlugin({}, {})
+    measures = {
+        m.key: m for m in await plugin.gather_container_measures(cgroup_ctx, [CID])
+    }
+    assert measures['mem'].per_container[CID].value == 1048576
+    assert measures['mem_oom'].per_container[CID].value == 2
+    assert measures['mem_oom_kill'].per_container[CID].value == 1
+    assert measures['mem_pressure'].per_container[CID].value == pytest.approx(1.234)
+    # The kernel without io.pressure just omits the metric.
+    assert measures['io_pressure'].per_container == {}
+    # The loopback traffic is excluded.
+    assert measures['net_rx'].per_container[CID].value == 123456
+    assert measures['net_tx'].per_container[CID].value == 4321
+
+
+@pytest.mark.asyncio
+async def test_memory_plugin_network_measures_from_docker_stats():
+    ctx = SimpleNamespace(
+        mode=StatModes.DOCKER_STREAM,
+        docker_stats={
+            CID: {
+                'memory_stats': {'usage': 4096},
+                'networks': {
+                    'eth0': {'rx_bytes': 100, 'tx_bytes': 10},
+                    'eth1': {'rx_bytes': 200, 'tx_bytes': 20},
+                },
+            },
+        },
+        scratch_usage=SimpleNamespace(get_usage=lambda cid: 0),
+        is_metric_due=lambda metric_key, container_id=None: metric_key != 'io_scratch_size',
+    )
+    plugin = MemoryPlugin({}, {})
+    measures = {
+        m.key: m for m in await plugin.gather_container_measures(ctx, [CID])
+    }
+    assert measures['net_rx'].per_container[CID].value == 300
+    assert measures['net_tx'].per_container[CID].value == 30
+    assert measures['mem_pressure'].per_container == {}
+    # the metrics not due are not sampled
+    assert measures['mem'].per_container[CID].value == 4096
+    assert measures['io_scratch_size'].per_container == {}
+
+
+@pytest.mark.asyncio
+async def test_cpu_plugin_node_measures_from_psutil(monkeypatch):
+    from ai.backend.agent.docker import intrinsic
+    cpu_times = [SimpleNamespace(user=1.0, system=0.5), SimpleNamespace(user=2.0, system=0.25)]
+    monkeypatch.setattr(intrinsic.psutil, 'cpu_times', lambda percpu: cpu_times)
+    # The CPUs 1 and 2 are offline.
+    monkeypatch.setattr(intrinsic, 'get_online_cpus', lambda: [0, 3])
+    ctx = SimpleNamespace(node_snapshot=None, update_timestamp=lambda key: (0.0, 1.0))
+    plugin = CPUPlugin({}, {})
+    [measure] = await plugin.gather_node_measures(ctx)
+    assert {
+        dev_id: m.value for dev_id, m in measure.per_device.items()
+    } == {'0': Decimal('1500.000'), '3': Decimal('2250.000')}
+    assert measure.per_node.value == Decimal('3750.000')
+
+    # The enumeration order is used if the online CPUs are unknown.
+    monkeypatch.setattr(intrinsic, 'get_online_cpus', lambda: None)
+    [measure] = await plugin.gather_node_measures(ctx)
+    assert [*measure.per_device.keys()] == ['0', '1']
+
+
+@pytest.mark.asyncio
+async def test_cpu_plugin_topology_docker_args(monkeypatch):
+    from ai.backend.agent.docker import intrinsic
+    monkeypatch.setattr(intrinsic.libnuma, 'node_of_cpu', lambda core: core // 4)
+    device_alloc = {'cpu': {'1': Decimal(1), '5': Decimal(1), '6': Decimal(1)}}
+
+    plugin = CPUPlugin({}, {'resource': {'cpu-allocation-strategy': 'topology'}})
+    args = await plugin.generate_docker_args(None, device_alloc)
+    assert args['HostConfig']['CpusetCpus'] == '1,5,6'
+    assert args['HostConfig']['CpusetMems'] == '0,1'
+
+    plugin = CPUPlugin({}, {'resource': {'cpu-allocation-strategy': 'evenly'}})
+    args = await plugin.generate_docker_args(None, device_alloc)
+    assert 'CpusetMems' not in args['HostConfig']
@@ -0,0 +1,92 @@
+import sys
+
+import psutil
+import pytest
+
+from ai.backend.agent.docker.procfs import (
+    parse_meminfo,
+    parse_net_dev,
+    ProcSnapshot,
+)
+
+
+PROC_STAT = (
+    'cpu  300 0 60 1000 10 0 0 0 0 0\n'
+    'cpu0 100 0 20 500 5 0 0 0 0 0\n'
+    'cpu2 200 5 40 500 5 0 0 0 0 0\n'
+    'intr 332290 0 0 0\n'
+    'ctxt 123456\n'
+)
+
+PROC_MEMINFO = (
+    'MemTotal:       16314888 kB\n'
+    'MemFree:         9935236 kB\n'
+    'MemAvailable:   13815632 kB\n'
+    'Buffers:          241836 kB\n'
+)
+
+PROC_NET_DEV = (
+    'Inter-|   Receive                                                |  Transmit\n'
+    ' face |bytes    packets errs drop fifo frame compressed multicast|'
+    'bytes    packets errs drop fifo colls carrier compressed\n'
+    '    lo:    1000      10    0    0    0     0          0         0'
+    '     1000      10    0    0    0     0       0          0\n'
+    '  eth0:12345678   20    0    0    0     0          0         0'
+    '     4321      20    0    0    0     0       0          0\n'
+)
+
+
+def create_procfs(root):
+    (root / 'net').mkdir()
+    (root / 'stat').write_text(PROC_STAT)
+    (root / 'meminfo').write_text(PROC_MEMINFO)
+    (root / 'net' / 'dev').write_text(PROC_NET_DEV)
+
+
+def test_parse_meminfo_without_available():
+    assert parse_meminfo(b'MemTotal: 1000 kB\nMemFree: 100 kB\nBuffers: 10 kB\nCached: 1 kB\n') \
+        == (1000 * 1024, 111 * 1024)
+
+
+def test_parse_net_dev():
+    assert parse_net_dev(PROC_NET_DEV.encode()) == (12346678, 5321)
+
+
+def test_proc_snapshot(tmp_path):
+    create_procfs(tmp_path)
+    snapshot = ProcSnapshot(tmp_path)
+    snapshot.msec_per_tick = 10
+    try:
+        snapshot.read()
+        assert snapshot.num_cpus == 2
+        assert [*snapshot.iter_cpu_used()] == [(0, 1200), (2, 2400)]
+        assert snapshot.total_cpu_used == 3600
+        assert snapshot.mem_total == 16314888 * 1024
+        assert snapshot.mem_available == 13815632 * 1024
+        assert (snapshot.net_rx_bytes, snapshot.net_tx_bytes) == (12346678, 5321)
+
+        # The files are kept open and re-read from the beginning,
+        # and the arrays grow when more CPUs become online.
+        fds = dict(snapshot._fds)
+        (tmp_path / 'stat').write_text(PROC_STAT.replace(
+            'intr',
+            ''.join(f'cpu{idx} 1 0 1 0 0 0 0 0 0 0\n' for idx in range(3, 4000)) + 'intr',
+        ))
+        snapshot.read()
+        assert snapshot._fds == fds
+        assert snapshot.num_cpus == 3999
+        assert snapshot.total_cpu_used == 3600 + 3997 * 20
+    finally:
+        snapshot.close()
+    assert not snapshot._fds
+
+
+@pytest.mark.skipif(not sys.platform.startswith('linux'), reason='requires procfs')
+def test_proc_snapshot_matches_psutil():
+    snapshot = ProcSnapshot()
+    try:
+        snapshot.read()
+        assert snapshot.num_cpus == len(psutil.cpu_times(True))
+        assert snapshot.mem_total == psutil.virtual_memory().total
+    finally:
+        snapshot.close()
@@ -0,0 +1,91 @@
+import asyncio
+import shutil
+
+import pytest
+
+from ai.backend.agent.docker.scratch import ScratchUsageTracker, is_statfs_accountable
+
+
+def _du(path):
+    return sum(p.lstat().st_size for p in path.rglob('*') if not p.is_dir())
+
+
+async def _wait_until(predicate, timeout=3.0):
+    async def _poll():
+        while not predicate():
+            await asyncio.sleep(0.02)
+    await asyncio.wait_for(_poll(), timeout)
+
+
+@pytest.mark.asyncio
+async def test_scratch_usage_tracker(tmp_path):
+    scratch_dir = tmp_path / 'kernel'
+    work_dir = scratch_dir / 'work'
+    (work_dir / 'a' / 'b').mkdir(parents=True)
+    (work_dir / '.bashrc').write_bytes(b'x' * 100)
+    (work_dir / 'a' / 'b' / 'data').write_bytes(b'x' * 1000)
+    assert not is_statfs_accountable(scratch_dir, work_dir)
+
+    tracker = ScratchUsageTracker(flush_interval=0.05)
+    await tracker.start()
+    try:
+        await tracker.register('k1', 'c1', scratch_dir)
+        assert tracker.get_usage('unknown') is None
+        # unknown until the first walk finishes
+        assert tracker.get_usage('c1') is None
+        await _wait_until(lambda: tracker.get_usage('c1') == 1100)
+
+        # incremental updates of files and new directory trees
+        (work_dir / 'a' / 'b' / 'data').write_bytes(b'x' * 10)
+        (work_dir / 'c' / 'd').mkdir(parents=True)
+        (work_dir / 'c' / 'd' / 'more').write_bytes(b'x' * 500)
+        await _wait_until(lambda: tracker.get_usage('c1') == _du(work_dir) == 610)
+
+        # removal of a directory tree
+        shutil.rmtree(work_dir / 'a')
+        await _wait_until(lambda: tracker.get_usage('c1') == 600)
+
+        # move a tree within the work directory
+        (work_dir / 'c').rename(work_dir / 'e')
+        (work_dir / 'e' / 'd' / 'more').write_bytes(b'x' * 50)
+        await _wait_until(lambda: tracker.get_usage('c1') == 150)
+
+        # reconciliation recovers from missed updates
+        kernel = tracker._kernels['c1']
+        kernel.total += 12345
+        await tracker.reconcile(kernel)
+        assert tracker.get_usage('c1') == 150
+
+        tracker.unregister('c1')
+        assert tracker.get_usage('c1') is None
+        assert not tracker._watches
+    finally:
+        await tracker.close()
+
+
+@pytest.mark.asyncio
+async def test_scratch_usage_tracker_walks_new_kernels_first(tmp_path):
+    old_scratch_dir = tmp_path / 'old'
+    for idx in range(1000):
+        (old_scratch_dir / 'work' / f'd{idx}').mkdir(parents=True)
+    new_scratch_dir = tmp_path / 'new'
+    (new_scratch_dir / 'work').mkdir(parents=True)
+    (new_scratch_dir / 'work' / 'data').write_bytes(b'x' * 100)
+
+    tracker = ScratchUsageTracker(flush_interval=0.02, reconcile_rate=2000, reconcile_batch_size=10)
+    await tracker.start()
+    try:
+        await tracker.register('k1', 'c1', old_scratch_dir)
+        await _wait_until(lambda: tracker.get_usage('c1') == 0)
+        old_kernel = tracker._kernels['c1']
+        old_kernel.reconcile_requested = True
+        await _wait_until(lambda: old_kernel.walk is not None)
+
+        # The new kernel is walked before the periodic walk of the old one finishes.
+        await tracker.register('k2', 'c2', new_scratch_dir)
+        await _wait_until(lambda: tracker.get_usage('c2') == 100)
+        assert old_kernel.walk is not None
+        await _wait_until(lambda: old_kernel.walk is None)
+        assert tracker.get_usage('c1') == 0
+    finally:
+        await tracker.close()
@@ -0,0 +1,49 @@
+import os
+from pathlib import Path
+import pkg_resources
+
+from ai.backend.agent.docker.scratch_template import (
+    CloneMethod,
+    ScratchTemplate,
+    template_files,
+)
+
+
+def test_scratch_template(tmp_path):
+    template_root = tmp_path / '.template'
+    template_root.mkdir()
+    (template_root / '0.0.0-stale').mkdir()
+    template = ScratchTemplate(template_root)
+    template_dir = template.build()
+    assert [*template_root.iterdir()] == [template_dir]
+    assert template.dirs == ['.jupyter', '.jupyter/custom']
+    # building again reuses the materialized template
+    assert template.build() == template_dir
+
+    work_dirs = []
+    for idx in range(2):
+        work_dir = tmp_path / f'k{idx}' / 'work'
+        work_dir.mkdir(parents=True)
+        template.instantiate(work_dir, owner=(os.getuid(), os.getgid()))
+        work_dirs.append(work_dir)
+    for name, rel_path in template_files:
+        src_path = Path(pkg_resources.resource_filename('ai.backend.runner', name))
+        for work_dir in work_dirs:
+            assert (work_dir / rel_path).read_bytes() == src_path.read_bytes()
+            assert not (work_dir / rel_path).is_symlink()
+    dev = os.stat(work_dirs[0]).st_dev
+    assert template.clone_methods[dev] in (CloneMethod.REFLINK, CloneMethod.COPY_FILE_RANGE)
+
+    # the files are independent copies
+    (work_dirs[0] / '.bashrc').write_text('modified')
+    assert (work_dirs[1] / '.bashrc').read_text() != 'modified'
+    assert (template_dir / '.bashrc').read_text() != 'modified'
+
+    # the fallback copy
+    template.clone_methods[dev] = CloneMethod.COPY
+    work_dir = tmp_path / 'k2' / 'work'
+    work_dir.mkdir(parents=True)
+    template.instantiate(work_dir)
+    assert (work_dir / '.vimrc').read_bytes() == (template_dir / '.vimrc').read_bytes()
+    assert (work_dir / '.jupyter' / 'custom' / 'roboto.ttf').stat().st_size == \
+        (template_dir / '.jupyter' / 'custom' / 'roboto.ttf').stat().st_size
@@ -0,0 +1,59 @@
+import asyncio
+
+from aiodocker.docker import DockerContainer
+import pytest
+
+from ai.backend.agent.docker.stats import DockerStatsStreamer, is_valid_stats_sample
+
+
+def _sample(seq):
+    return {
+        'read': f'2021-10-01T00:00:{seq:02d}Z',
+        'preread': f'2021-10-01T00:00:{seq - 1:02d}Z',
+        'cpu_stats': {'cpu_usage': {'total_usage': seq * 1000}},
+    }
+
+
+def test_is_valid_stats_sample():
+    assert is_valid_stats_sample(_sample(2))
+    assert not is_valid_stats_sample(None)
+    assert not is_valid_stats_sample([])
+    assert not is_valid_stats_sample({
+        'read': '2021-10-01T00:00:01Z',
+        'preread': '0001-01-01T00:00:00Z',
+    })
+
+
+@pytest.mark.asyncio
+async def test_stats_streamer_caches_latest_sample(mocker, monkeypatch):
+    monkeypatch.setenv('DOCKER_HOST', 'unix:///tmp/nonexistent-docker.sock')
+    resume = asyncio.Event()
+
+    async def mock_stats(self, *, stream=True):
+        assert stream
+        yield {'read': '2021-10-01T00:00:01Z', 'preread': '0001-01-01T00:00:00Z'}
+        yield _sample(2)
+        yield _sample(3)
+        await resume.wait()
+
+    mocker.patch.object(DockerContainer, 'stats', mock_stats)
+    streamer = DockerStatsStreamer()
+    try:
+        streamer.start('c1')
+        streamer.start('c1')  # duplicate starts are ignored
+        await asyncio.sleep(0.01)
+        assert [*streamer.samples.keys()] == ['c1']
+        assert streamer.samples['c1'] == _sample(3)
+
+        await streamer.stop('c1')
+        assert 'c1' not in streamer.samples
+
+        # The cache entry is removed when the daemon closes the stream.
+        streamer.start('c2')
+        await asyncio.sleep(0.01)
+        assert streamer.samples['c2'] == _sample(3)
+        resume.set()
+        await asyncio.sleep(0.01)
+        assert 'c2' not in streamer.samples
+    finally:
+        await streamer.close()
@@ -0,0 +1,62 @@
+import asyncio
+
+from aiodocker.docker import Docker
+import pytest
+
+from ai.backend.agent.docker.utils import PooledDocker
+
+
+@pytest.mark.asyncio
+async def test_pooled_docker_limits_concurrency(mocker):
+    max_running = 0
+    running = 0
+
+    async def mock_do_query(self, path, method, **kwargs):
+        nonlocal running, max_running
+        running += 1
+        max_running = max(max_running, running)
+        await asyncio.sleep(0.05)
+        running -= 1
+        return path
+
+    mocker.patch.object(Docker, '_do_query', mock_do_query)
+    docker = PooledDocker('unix:///tmp/nonexistent-docker.sock', max_concurrency=2)
+    docker.api_version = 'v1.40'
+    try:
+        tasks = [
+            asyncio.create_task(docker._do_query(f'containers/{idx}', 'GET', timeout=None))
+            for idx in range(5)
+        ]
+        await asyncio.sleep(0.01)
+        assert docker.get_stats()['in_flight'] == 2
+        assert docker.get_stats()['queued'] == 3
+        results = await asyncio.gather(*tasks)
+        assert results == [f'containers/{idx}' for idx in range(5)]
+        assert max_running == 2
+        assert docker.get_stats() == {
+            'in_flight': 0,
+            'queued': 0,
+            'requests': 5,
+            'timeouts': 0,
+        }
+    finally:
+        await docker.close()
+
+
+@pytest.mark.asyncio
+async def test_pooled_docker_request_timeout(mocker):
+
+    async def mock_do_query(self, path, method, **kwargs):
+        await asyncio.sleep(1.0)
+
+    mocker.patch.object(Docker, '_do_query', mock_do_query)
+    docker = PooledDocker('unix:///tmp/nonexistent-docker.sock', request_timeout=0.05)
+    docker.api_version = 'v1.40'
+    try:
+        with pytest.raises(asyncio.TimeoutError):
+            await docker._query_json('containers/json')
+        assert docker.get_stats()['timeouts'] == 1
+        assert docker.get_stats()['in_flight'] == 0
+        assert docker.docker_host == 'unix://localhost'
+    finally:
+        await docker.close()
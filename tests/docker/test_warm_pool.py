@@ -0,0 +1,315 @@
+import os
+import shutil
+import uuid
+
+from aiodocker.docker import DockerContainer
+import pytest
+
+from ai.backend.common.types import ResourceSlot
+from ai.backend.agent.docker.agent import container_from_docker_container
+from ai.backend.agent.docker.resources import get_resource_spec_from_container
+from ai.backend.agent.resources import KernelResourceSpec, resource_spec_binary_filename
+from ai.backend.agent.docker.warm_pool import (
+    get_claimed_bind_source,
+    kernel_id_label,
+    split_container_config,
+    warm_entrypoint_path,
+    warm_pool_label,
+    WarmContainerPool,
+)
+
+image = 'index.docker.io/lablup/python:3.8'
+
+
+class DummyContainer:
+
+    def __init__(self, docker, cid, config, name):
+        self.docker = docker
+        self._id = cid
+        self.config = config
+        self.name = name
+        self.deleted = False
+
+    def __getitem__(self, key):
+        return {'Names': [f'/{self.name}']}[key]
+
+    async def rename(self, name):
+        self.name = name
+
+    async def delete(self, **kwargs):
+        self.deleted = True
+
+
+class DummyContainers:
+
+    def __init__(self, docker):
+        self.docker = docker
+        self.created = []
+        self.listed = []
+
+    async def create(self, config, name):
+        container = DummyContainer(self.docker, f'c{len(self.created)}', config, name)
+        self.created.append(container)
+        return container
+
+    async def list(self, **kwargs):
+        return self.listed
+
+
+class DummyDocker:
+
+    def __init__(self):
+        self.containers = DummyContainers(self)
+        self.updates = []
+
+    async def _query_json(self, path, method='GET', *, data=None):
+        self.updates.append((path, data))
+        return {'Warnings': []}
+
+
+def create_container_config(scratch_dir, host_ports, memory):
+    return {
+        'Image': image,
+        'EntryPoint': ['/opt/kernel/entrypoint.sh'],
+        'Cmd': ['/opt/backend.ai/bin/python', '-m', 'ai.backend.kernel', 'python'],
+        'Env': [f'BACKENDAI_KERNEL_ID={scratch_dir.name}'],
+        'Hostname': 'main1',
+        'Labels': {
+            'ai.backend.kernel-id': scratch_dir.name,
+            'ai.backend.service-ports': 'jupyter:http:8080',
+        },
+        'HostConfig': {
+            'PortBindings': {
+                f'{port}/tcp': [{'HostPort': str(host_port), 'HostIp': '0.0.0.0'}]
+                for port, host_port in zip((2000, 2001, 8080), host_ports)
+            },
+            'Mounts': [
+                {'Type': 'bind', 'Source': str(scratch_dir / 'config'), 'Target': '/home/config',
+                 'ReadOnly': True, 'BindOptions': {}},
+                {'Type': 'bind', 'Source': str(scratch_dir / 'work'), 'Target': '/home/work',
+                 'ReadOnly': False, 'BindOptions': {}},
+                {'Type': 'volume', 'Source': 'backendai-krunner.v1', 'Target': '/opt/backend.ai',
+                 'ReadOnly': True, 'VolumeOptions': {}},
+            ],
+            'CpuPeriod': 100_000,
+            'CpuQuota': 100_000,
+            'CpusetCpus': '1',
+            'Memory': memory,
+            'MemorySwap': memory,
+        },
+    }
+
+
+def create_binds(scratch_dir):
+    return {
+        'config': scratch_dir / 'config',
+        'work': scratch_dir / 'work',
+        'tmp': scratch_dir.with_name(f'{scratch_dir.name}_tmp'),
+    }
+
+
+def test_split_container_config(tmp_path):
+    config1 = create_container_config(tmp_path / 'k1', [30000, 30001, 30002], 1024)
+    config2 = create_container_config(tmp_path / 'k2', [30003, 30004, 30005], 2048)
+    template1, limits1 = split_container_config(config1, create_binds(tmp_path / 'k1'))
+    template2, limits2 = split_container_config(config2, create_binds(tmp_path / 'k2'))
+    assert template1 == template2
+    assert 'Env' not in template1
+    assert 'ai.backend.kernel-id' not in template1['Labels']
+    assert template1['HostConfig']['PortBindings']['2000/tcp'] == [{'HostIp': '0.0.0.0'}]
+    assert [m['Source'] for m in template1['HostConfig']['Mounts']] == [
+        '<config>', '<work>', 'backendai-krunner.v1',
+    ]
+    assert limits1 == {
+        'CpuPeriod': 100_000, 'CpuQuota': 100_000, 'CpusetCpus': '1',
+        'Memory': 1024, 'MemorySwap': 1024,
+    }
+    assert limits2['Memory'] == 2048
+    # the original config is not modified
+    assert config1['Env'] and config1['HostConfig']['Memory'] == 1024
+
+    # any other differences make a different template
+    config3 = create_container_config(tmp_path / 'k3', [30006, 30007, 30008], 1024)
+    config3['HostConfig']['Mounts'].append(
+        {'Type': 'bind', 'Source': '/vfroot/data', 'Target': '/home/work/data',
+         'ReadOnly': False, 'BindOptions': {}},
+    )
+    template3, _ = split_container_config(config3, create_binds(tmp_path / 'k3'))
+    assert template3 != template1
+
+
+@pytest.mark.asyncio
+async def test_warm_pool_claim_and_refill(tmp_path):
+    docker = DummyDocker()
+    port_pool = set(range(30000, 30010))
+    scratch_root = tmp_path / 'scratches'
+    pool = WarmContainerPool(
+        docker, port_pool, scratch_root,
+        images=[image], size=2, max_containers=3, min_free_ports=1,
+    )
+    await pool.start()
+
+    # images not configured are neither pooled nor counted
+    assert await pool.claim('other:latest', {}, 'kernel.other.k0', {}) is None
+    assert pool.misses == {}
+
+    scratch_dir = scratch_root / 'k1'
+    (scratch_dir / 'config').mkdir(parents=True)
+    (scratch_dir / 'work').mkdir()
+    config1 = create_container_config(scratch_dir, [30000, 30001, 30002], 1024)
+    # the first kernel is a miss which gives the template
+    assert await pool.claim(image, config1, 'kernel.python.k1', create_binds(scratch_dir)) is None
+    assert pool.misses[image] == 1
+
+    await pool.refill(interval=1.0)
+    assert len(docker.containers.created) == 2
+    assert pool.get_stats()['idle'] == {image: 2}
+    assert len(port_pool) == 10 - 6
+    created = docker.containers.created[0]
+    assert created.name.startswith('warm.python.')
+    assert created.config['EntryPoint'] == [warm_entrypoint_path]
+    assert created.config['Labels'][warm_pool_label] == image
+    assert 'Env' not in created.config
+    assert 'Memory' not in created.config['HostConfig']
+    mounts = {m['Target']: m for m in created.config['HostConfig']['Mounts']}
+    assert mounts[warm_entrypoint_path]['Source'] == str(pool.entrypoint_path)
+    assert mounts['/home/work']['Source'].startswith(str(scratch_root / '.warm'))
+    assert os.path.isdir(mounts['/home/work']['Source'])
+    assert mounts['/opt/backend.ai']['Source'] == 'backendai-krunner.v1'
+
+    scratch_dir = scratch_root / 'k2'
+    (scratch_dir / 'config').mkdir(parents=True)
+    (scratch_dir / 'work').mkdir()
+    (scratch_dir / 'work' / 'hello.txt').write_text('hello')
+    config2 = create_container_config(scratch_dir, [30007, 30008, 30009], 2048)
+    warm_container = await pool.claim(image, config2, 'kernel.python.k2', create_binds(scratch_dir))
+    assert warm_container is not None
+    assert warm_container.container is created
+    assert pool.hits[image] == 1
+    assert created.name == 'kernel.python.k2'
+    assert docker.updates[-1] == (
+        f'containers/{created._id}/update',
+        {'CpuPeriod': 100_000, 'CpuQuota': 100_000, 'CpusetCpus': '1',
+         'Memory': 2048, 'MemorySwap': 2048},
+    )
+    # the bind sources now point to the directories of the claiming kernel
+    assert (os.path.realpath(mounts['/home/work']['Source']) ==
+            os.path.realpath(scratch_dir / 'work'))
+    assert set(warm_container.host_ports) == {'2000/tcp', '2001/tcp', '8080/tcp'}
+    # the entry directory is kept for restarting the container
+    k2_entry_dir = warm_container.entry_dir
+    assert k2_entry_dir.exists()
+
+    # a kernel with a different config replaces the template and the stale container
+    scratch_dir = scratch_root / 'k3'
+    config3 = create_container_config(scratch_dir, [30007, 30008, 30009], 1024)
+    config3['Hostname'] = 'sub1'
+    assert await pool.claim(image, config3, 'kernel.python.k3', create_binds(scratch_dir)) is None
+    assert pool.misses[image] == 2
+    await pool.refill(interval=1.0)
+    assert pool.get_stats()['idle'] == {image: 2}
+    config4 = create_container_config(scratch_root / 'k4', [30007, 30008, 30009], 1024)
+    config4['Hostname'] = 'sub1'
+    (scratch_root / 'k4' / 'config').mkdir(parents=True)
+    (scratch_root / 'k4' / 'work').mkdir()
+    warm_container = await pool.claim(
+        image, config4, 'kernel.python.k4', create_binds(scratch_root / 'k4'),
+    )
+    assert warm_container is not None
+    assert warm_container.container.config['Hostname'] == 'sub1'
+    assert docker.containers.created[1].deleted
+    k4_entry_dir = warm_container.entry_dir
+
+    # the entry directories are removed after the kernel scratch directories are removed
+    shutil.rmtree(scratch_root / 'k2')
+    shutil.rmtree(scratch_root / 'k4')
+    # the budget limits the number of the pooled containers
+    await pool.refill(interval=1.0)
+    assert not k2_entry_dir.exists()
+    assert not k4_entry_dir.exists()
+    assert pool.num_containers == 1
+    assert len(docker.containers.created) == 4
+
+    await pool.close()
+    assert pool.num_containers == 0
+    assert docker.containers.created[3].deleted
+
+
+@pytest.mark.asyncio
+async def test_warm_pool_start(tmp_path):
+    docker = DummyDocker()
+    scratch_root = tmp_path / 'scratches'
+    unclaimed = DummyContainer(docker, 'c0', {}, 'warm.python.e0')
+    claimed = DummyContainer(docker, 'c1', {}, 'kernel.python.k1')
+    docker.containers.listed = [unclaimed, claimed]
+    pool = WarmContainerPool(
+        docker, set(), scratch_root,
+        images=[image], size=2, max_containers=3, min_free_ports=1,
+    )
+    (scratch_root / 'k1' / 'config').mkdir(parents=True)
+    for entry_id, target in [
+        ('e0', pool.pool_root / 'e0' / '.empty'),
+        ('e1', scratch_root / 'k1' / 'config'),
+        ('e2', scratch_root / 'k2' / 'config'),
+    ]:
+        (pool.pool_root / entry_id / '.empty').mkdir(parents=True)
+        (pool.pool_root / entry_id / 'config').symlink_to(target)
+        (pool.pool_root / entry_id / 'tmp').symlink_to(scratch_root / f'{entry_id}_tmp')
+
+    # only the unclaimed containers and the entries of the removed kernels are removed
+    await pool.start()
+    assert unclaimed.deleted
+    assert not claimed.deleted
+    assert [p.name for p in pool.pool_root.iterdir()] == ['e1']
+
+
+@pytest.mark.asyncio
+async def test_claimed_container_resource_spec(tmp_path):
+    kernel_id = uuid.uuid4()
+    scratch_root = tmp_path / 'scratches'
+    config_dir = scratch_root / str(kernel_id) / 'config'
+    config_dir.mkdir(parents=True)
+    resource_spec = KernelResourceSpec(
+        container_id='c1',
+        slots=ResourceSlot({'cpu': '1'}),
+        allocations={},
+        scratch_disk_size=0,
+        mounts=[],
+    )
+    (config_dir / resource_spec_binary_filename).write_bytes(resource_spec.write_to_bytes())
+    # the pool entry directory is not required
+    source = scratch_root / '.warm' / 'e1' / 'config'
+    assert get_claimed_bind_source(source, kernel_id) == config_dir
+    container_info = {
+        'Name': f'/kernel.python.{kernel_id}',
+        'Config': {'Labels': {warm_pool_label: image}},
+        'HostConfig': {'Mounts': [
+            {'Type': 'bind', 'Source': str(source), 'Target': '/home/config'},
+        ]},
+    }
+    restored_spec = await get_resource_spec_from_container(container_info)
+    assert restored_spec is not None
+    assert restored_spec.container_id == 'c1'
+
+
+def test_claimed_container_labels():
+    kernel_id = uuid.uuid4()
+
+    def create_docker_container(labels):
+        return DockerContainer(
+            None,
+            id='c1',
+            Config={'Image': 'python', 'Labels': labels},
+            State={'Status': 'running'},
+            NetworkSettings={'Ports': {}},
+        )
+
+    # The claimed warm containers have the same kernel ID label as the cold-started ones.
+    cold = container_from_docker_container(
+        create_docker_container({kernel_id_label: str(kernel_id)}), kernel_id)
+    claimed = container_from_docker_container(
+        create_docker_container({warm_pool_label: 'python'}), kernel_id)
+    assert cold.labels[kernel_id_label] == claimed.labels[kernel_id_label] == str(kernel_id)
+    # The kernel ID is not made up for the other containers.
+    other = container_from_docker_container(create_docker_container({}), kernel_id)
+    assert kernel_id_label not in other.labels
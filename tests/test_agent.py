@@ -2,11 +2,27 @@
 TODO: rewrite
 '''
 
+from decimal import Decimal
+
 import pytest
 
 from unittest.mock import AsyncMock
 
+from ai.backend.agent.agent import (
+    ComputerContext,
+    allocate_kernel_resources,
+    get_allocation_drifts,
+)
+from ai.backend.agent.exception import InsufficientResource
+from ai.backend.agent.resources import (
+    AbstractComputeDevice,
+    AllocationStrategy,
+    DeviceSlotInfo,
+    DeviceTopology,
+    DiscretePropertyAllocMap,
+)
 from ai.backend.agent.server import AgentRPCServer
+from ai.backend.common.types import DeviceId, SlotName, SlotTypes
 
 
 class Dummy:
@@ -62,3 +78,137 @@ async def test_read_agent_config_container_2valid(arpcs_no_ainit, mocker):
 
     assert arpcs_no_ainit.local_config[ctnr][kgid] == 10
     assert arpcs_no_ainit.local_config[ctnr][kuid] == 20
+
+
+def create_computers():
+    # 2 NUMA nodes x 4 physical cores x 2 hyperthreads, and a GPU on the NUMA node 1.
+    cpu_topology = {
+        DeviceId(str(cpu)): DeviceTopology(
+            numa_node=(cpu % 8) // 4,
+            cache_domain=(cpu % 8) // 2,
+            core=cpu % 8,
+        )
+        for cpu in range(16)
+    }
+    return {
+        'cpu': ComputerContext(
+            instance=None,
+            devices=[],
+            alloc_map=DiscretePropertyAllocMap(
+                device_slots={
+                    dev_id: DeviceSlotInfo(SlotTypes.COUNT, SlotName('cpu'), Decimal(1))
+                    for dev_id in cpu_topology
+                },
+                allocation_strategy=AllocationStrategy.TOPOLOGY,
+                device_topology=cpu_topology,
+            ),
+        ),
+        'mem': ComputerContext(
+            instance=None,
+            devices=[],
+            alloc_map=DiscretePropertyAllocMap(
+                device_slots={
+                    DeviceId('root'): DeviceSlotInfo(SlotTypes.BYTES, SlotName('mem'), Decimal(2**30)),
+                },
+            ),
+        ),
+        'cuda': ComputerContext(
+            instance=None,
+            devices=[AbstractComputeDevice(DeviceId('0'), '', 1, 0, 1)],
+            alloc_map=DiscretePropertyAllocMap(
+                device_slots={
+                    DeviceId('0'): DeviceSlotInfo(SlotTypes.COUNT, SlotName('cuda.device'), Decimal(1)),
+                },
+            ),
+        ),
+    }
+
+
+def test_allocate_kernel_resources_colocates_kernels():
+    computers = create_computers()
+    results = allocate_kernel_resources(computers, [
+        {SlotName('cpu'): Decimal(2), SlotName('mem'): Decimal(2**27)},
+        {
+            SlotName('cpu'): Decimal(2),
+            SlotName('mem'): Decimal(2**27),
+            SlotName('cuda.device'): Decimal(1),
+        },
+    ])
+    # The results follow the order of requests regardless of the placement order.
+    assert 'cuda' not in results[0]
+    assert results[1]['cuda'][SlotName('cuda.device')] == {DeviceId('0'): Decimal(1)}
+    # All kernels are placed on the NUMA node of the allocated GPU.
+    for result in results:
+        cpus = result['cpu'][SlotName('cpu')]
+        assert len(cpus) == 2
+        assert all((int(dev_id) % 8) // 4 == 1 for dev_id in cpus)
+
+
+def test_allocate_kernel_resources_near_own_accelerators():
+    computers = create_computers()
+    # Another GPU on the NUMA node 0
+    computers['cuda'] = ComputerContext(
+        instance=None,
+        devices=[
+            AbstractComputeDevice(DeviceId('0'), '', 1, 0, 1),
+            AbstractComputeDevice(DeviceId('1'), '', 0, 0, 1),
+        ],
+        alloc_map=DiscretePropertyAllocMap(
+            device_slots={
+                DeviceId(dev_id): DeviceSlotInfo(SlotTypes.COUNT, SlotName('cuda.device'), Decimal(1))
+                for dev_id in ('0', '1')
+            },
+        ),
+    )
+    gpu_numa_nodes = {DeviceId('0'): 1, DeviceId('1'): 0}
+    results = allocate_kernel_resources(computers, [
+        {
+            SlotName('cpu'): Decimal(2),
+            SlotName('mem'): Decimal(2**27),
+            SlotName('cuda.device'): Decimal(1),
+        }
+        for _ in range(2)
+    ])
+    assert {
+        dev_id for result in results for dev_id in result['cuda'][SlotName('cuda.device')]
+    } == {DeviceId('0'), DeviceId('1')}
+    # The CPU cores of each kernel are placed on the NUMA node of its own GPU.
+    for result in results:
+        [gpu_id] = result['cuda'][SlotName('cuda.device')]
+        cpus = result['cpu'][SlotName('cpu')]
+        assert len(cpus) == 2
+        assert all((int(dev_id) % 8) // 4 == gpu_numa_nodes[gpu_id] for dev_id in cpus)
+
+
+def test_allocate_kernel_resources_rollback():
+    computers = create_computers()
+    with pytest.raises(InsufficientResource):
+        allocate_kernel_resources(computers, [
+            {SlotName('cpu'): Decimal(8), SlotName('mem'): Decimal(2**28)},
+            {
+                SlotName('cpu'): Decimal(4),
+                SlotName('mem'): Decimal(2**28),
+                SlotName('cuda.device'): Decimal(1),
+            },
+            {SlotName('cpu'): Decimal(6), SlotName('mem'): Decimal(2**28)},
+        ])
+    # Nothing is left allocated when any of the kernels cannot be placed.
+    for computer_ctx in computers.values():
+        for per_device_alloc in computer_ctx.alloc_map.allocations.values():
+            assert all(alloc == 0 for alloc in per_device_alloc.values())
+
+
+def test_get_allocation_drifts():
+    computers = create_computers()
+    alloc_map = computers['cpu'].alloc_map
+    rebuilt_alloc_map = create_computers()['cpu'].alloc_map
+    alloc = alloc_map.allocate({SlotName('cpu'): Decimal(4)})
+    rebuilt_alloc_map.apply_allocation(alloc)
+    assert get_allocation_drifts(alloc_map, rebuilt_alloc_map) == []
+
+    # A leaked allocation which is not found in the containers
+    leaked = alloc_map.allocate({SlotName('cpu'): Decimal(1)})
+    [(leaked_device_id, _)] = leaked[SlotName('cpu')].items()
+    assert get_allocation_drifts(alloc_map, rebuilt_alloc_map) == [
+        (SlotName('cpu'), leaked_device_id, Decimal(1), Decimal(0)),
+    ]
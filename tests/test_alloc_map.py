@@ -7,6 +7,7 @@ import random
 from ai.backend.agent.resources import (
     AbstractComputeDevice,
     DeviceSlotInfo,
+    DeviceTopology,
     DiscretePropertyAllocMap,
     FractionAllocMap, AllocationStrategy,
 )
@@ -236,6 +237,59 @@ def test_discrete_alloc_map_cpu_even():
     check_clean()
 
 
+def create_topology_alloc_map():
+    # 2 NUMA nodes x 2 L3 cache domains x 2 physical cores x 2 hyperthreads,
+    # where the sibling hyperthreads are numbered as N and N + 8 like Linux does.
+    device_topology = {}
+    for cpu in range(16):
+        core = cpu % 8
+        device_topology[DeviceId(str(cpu))] = DeviceTopology(
+            numa_node=core // 4,
+            cache_domain=core // 2,
+            core=core,
+        )
+    return DiscretePropertyAllocMap(
+        device_slots={
+            dev_id: DeviceSlotInfo(SlotTypes.COUNT, SlotName('cpu'), Decimal(1))
+            for dev_id in device_topology
+        },
+        allocation_strategy=AllocationStrategy.TOPOLOGY,
+        device_topology=device_topology,
+    )
+
+
+def test_discrete_alloc_map_topology():
+    alloc_map = create_topology_alloc_map()
+
+    def cores(result):
+        return {int(dev_id) for dev_id in result[SlotName('cpu')]}
+
+    # The sibling hyperthreads of a physical core come first.
+    r1 = alloc_map.allocate({SlotName('cpu'): Decimal(2)})
+    assert cores(r1) == {0, 8}
+    # A single core goes to the smallest cache domain that fits.
+    r2 = alloc_map.allocate({SlotName('cpu'): Decimal(1)})
+    assert cores(r2) == {1}
+    # The next one fills up the half-used physical core.
+    r3 = alloc_map.allocate({SlotName('cpu'): Decimal(1)})
+    assert cores(r3) == {9}
+    # A request fitting in a NUMA node is not split across the nodes.
+    r4 = alloc_map.allocate({SlotName('cpu'): Decimal(6)})
+    assert cores(r4) == {4, 5, 6, 12, 13, 14}
+    alloc_map.free(r4)
+    # The NUMA nodes of the accelerators are preferred.
+    r5 = alloc_map.allocate({SlotName('cpu'): Decimal(2)}, numa_nodes={1})
+    assert cores(r5) == {4, 12}
+    # A request larger than a NUMA node takes the fewest nodes.
+    alloc_map.free(r5)
+    for result in (r1, r2, r3):
+        alloc_map.free(result)
+    r6 = alloc_map.allocate({SlotName('cpu'): Decimal(10)}, numa_nodes={1})
+    assert cores(r6) == {4, 5, 6, 7, 12, 13, 14, 15, 0, 8}
+    with pytest.raises(InsufficientResource):
+        alloc_map.allocate({SlotName('cpu'): Decimal(7)})
+
+
 def test_fraction_alloc_map():
     alloc_map = FractionAllocMap(
         device_slots={
@@ -583,6 +637,32 @@ def test_fraction_alloc_map_even_allocation_many_devices_2():
         assert alloc_map.allocations[SlotName('x')][DeviceId(f'a{idx}')] == Decimal('0')
 
 
+def test_fraction_alloc_map_even_allocation_unaligned_devices():
+    # The device amounts are finer than the allocation digits.
+    alloc_map = FractionAllocMap(
+        device_slots={
+            DeviceId('a0'): DeviceSlotInfo(SlotTypes.COUNT, SlotName('x'), Decimal('0.995')),
+            DeviceId('a1'): DeviceSlotInfo(SlotTypes.COUNT, SlotName('x'), Decimal('0.995')),
+            DeviceId('a2'): DeviceSlotInfo(SlotTypes.COUNT, SlotName('x'), Decimal('1.005')),
+        },
+        allocation_strategy=AllocationStrategy.EVENLY,
+        quantum_size=Decimal('0.005'),
+    )
+    alloc_map.allocations[SlotName('x')][DeviceId('a2')] = Decimal('0.5')
+    result = alloc_map.allocate({SlotName('x'): Decimal('1.5')})
+    assert result[SlotName('x')] == {
+        DeviceId('a0'): Decimal('0.75'),
+        DeviceId('a1'): Decimal('0.75'),
+    }
+    alloc_map.free(result)
+    result = alloc_map.allocate({SlotName('x'): Decimal('2.49')})
+    assert result[SlotName('x')] == {
+        DeviceId('a0'): Decimal('0.99'),
+        DeviceId('a1'): Decimal('0.99'),
+        DeviceId('a2'): Decimal('0.50'),
+    }
+
+
 @pytest.mark.parametrize(
     "alloc_strategy",
     [AllocationStrategy.FILL, AllocationStrategy.EVENLY],
@@ -840,3 +920,70 @@ def test_heterogeneous_resource_slots_with_fractional_alloc_map():
     alloc_map.free(result1)
     alloc_map.free(result2)
     check_clean()
+
+
+def test_alloc_map_integer_storage():
+    alloc_map = FractionAllocMap(
+        device_slots={
+            DeviceId('a0'): DeviceSlotInfo(SlotTypes.COUNT, SlotName('x'), Decimal(1)),
+            DeviceId('a1'): DeviceSlotInfo(SlotTypes.COUNT, SlotName('x'), Decimal(1)),
+        },
+        allocation_strategy=AllocationStrategy.FILL,
+    )
+    slot_allocs = alloc_map.allocations[SlotName('x')]
+    assert [*slot_allocs.capacity] == [100, 100]
+
+    # Repeated additions and subtractions of fractions do not drift.
+    for _ in range(10):
+        alloc_map.apply_allocation({SlotName('x'): {DeviceId('a0'): Decimal('0.1')}})
+    assert slot_allocs[DeviceId('a0')] == Decimal(1)
+    for _ in range(10):
+        alloc_map.free({SlotName('x'): {DeviceId('a0'): Decimal('0.1')}})
+    assert [*slot_allocs.used] == [0, 0]
+
+    # The allocations of unknown devices (e.g., restored from stale records) are ignored.
+    alloc_map.apply_allocation({
+        SlotName('x'): {DeviceId('a1'): Decimal('0.25'), DeviceId('a9'): Decimal('0.5')},
+        SlotName('y'): {DeviceId('a0'): Decimal('0.5')},
+    })
+    assert dict(alloc_map.allocations[SlotName('x')]) == {
+        DeviceId('a0'): Decimal(0),
+        DeviceId('a1'): Decimal('0.25'),
+    }
+    with pytest.raises(InsufficientResource):
+        alloc_map.allocate({SlotName('y'): Decimal('0.5')})
+
+    alloc_map.clear()
+    assert [*alloc_map.allocations[SlotName('x')].used] == [0, 0]
+
+    mem_alloc_map = DiscretePropertyAllocMap(
+        device_slots={
+            DeviceId('root'): DeviceSlotInfo(SlotTypes.BYTES, SlotName('mem'), Decimal(2**40)),
+        },
+    )
+    mem_alloc_map.apply_allocation({SlotName('mem'): {DeviceId('root'): 2**30}})
+    assert mem_alloc_map.allocations[SlotName('mem')][DeviceId('root')] == Decimal(2**30)
+
+
+@pytest.mark.parametrize("alloc_map_cls", [DiscretePropertyAllocMap, FractionAllocMap])
+def test_alloc_map_clone_empty(alloc_map_cls):
+    alloc_map = alloc_map_cls(
+        device_slots={
+            DeviceId('a0'): DeviceSlotInfo(SlotTypes.COUNT, SlotName('x'), Decimal(2)),
+            DeviceId('a1'): DeviceSlotInfo(SlotTypes.COUNT, SlotName('x'), Decimal(2)),
+        },
+        allocation_strategy=AllocationStrategy.FILL,
+    )
+    alloc_map.allocate({SlotName('x'): Decimal(3)})
+    clone = alloc_map.clone_empty()
+    assert type(clone) is alloc_map_cls
+    assert clone.allocation_strategy == AllocationStrategy.FILL
+    assert [*clone.allocations[SlotName('x')].used] == [0, 0]
+
+    # The clone allocates from its own arrays.
+    result = clone.allocate({SlotName('x'): Decimal(4)})
+    assert result[SlotName('x')] == {DeviceId('a0'): Decimal(2), DeviceId('a1'): Decimal(2)}
+    assert alloc_map.allocations[SlotName('x')][DeviceId('a0')] == Decimal(2)
+    assert alloc_map.allocations[SlotName('x')][DeviceId('a1')] == Decimal(1)
+    with pytest.raises(InsufficientResource):
+        clone.allocate({SlotName('x'): Decimal(1)})
@@ -0,0 +1,183 @@
+from collections import UserDict
+from decimal import Decimal
+from types import SimpleNamespace
+
+import pytest
+
+from ai.backend.common.types import HostPortPair
+from ai.backend.agent.config import stats_defaults
+from ai.backend.agent.exporter import (
+    content_type,
+    format_labels,
+    format_metric_name,
+    format_value,
+    MetricExporter,
+)
+from ai.backend.agent.stats import (
+    Histogram,
+    kernel_creation_duration_buckets,
+    Metric,
+    MetricTypes,
+    MovingStatistics,
+    StatContext,
+    StatModes,
+)
+
+
+def test_format_helpers():
+    assert format_metric_name('backendai', 'node', 'cuda.mem') == 'backendai_node_cuda_mem'
+    assert format_labels({'a': 'x', 'b': 'q"\\\n'}) == r'{a="x",b="q\"\\\n"}'
+    assert format_value(3) == '3'
+    assert format_value(0.25) == '0.25'
+    assert format_value(float('nan')) == 'NaN'
+    assert format_value(float('inf')) == '+Inf'
+    assert format_value(float('-inf')) == '-Inf'
+
+
+class DummyKernel(UserDict):
+
+    def __init__(self, data, image):
+        super().__init__(data)
+        self.image = image
+
+
+def create_metric(key, current, capacity=None, unit_hint=None):
+    return Metric(
+        key, MetricTypes.USAGE,
+        current=Decimal(current),
+        capacity=Decimal(capacity) if capacity is not None else None,
+        stats=MovingStatistics(Decimal(current)),
+        stats_filter=frozenset(),
+        unit_hint=unit_hint,
+    )
+
+
+@pytest.mark.asyncio
+async def test_metric_exporter_render():
+    agent = SimpleNamespace(
+        local_config={
+            'agent': {'id': 'i-test'},
+            'debug': {'log-stats': False},
+            'stats': stats_defaults,
+        },
+        kernel_registry={
+            'k1': DummyKernel(
+                {'container_id': 'c1', 'session_id': 's1'},
+                SimpleNamespace(canonical='index.docker.io/lablup/python:3.8'),
+            ),
+            'k2': DummyKernel(
+                {'container_id': 'c2'},
+                SimpleNamespace(canonical='index.docker.io/lablup/python:3.9'),
+            ),
+        },
+        computers={},
+    )
+    stat_ctx = StatContext(agent, mode=StatModes.DOCKER)
+    stat_ctx.node_metrics['mem'] = create_metric('mem', 1024, 4096, 'bytes')
+    stat_ctx.device_metrics['cpu_util'] = {
+        '0': create_metric('cpu_util', '12.5', 100, 'percent'),
+        '1': create_metric('cpu_util', '50', 100, 'percent'),
+    }
+    stat_ctx.kernel_metrics['k1'] = {'mem': create_metric('mem', 512, unit_hint='bytes')}
+    stat_ctx.kernel_metrics['k2'] = {'mem': create_metric('mem', 256, unit_hint='bytes')}
+    # orphaned kernel metrics are not exposed
+    stat_ctx.kernel_metrics['k3'] = {'mem': create_metric('mem', 128, unit_hint='bytes')}
+
+    exporter = MetricExporter(stat_ctx, HostPortPair('127.0.0.1', 6011))
+    response = await exporter.handle_metrics(None)
+    assert response.body == b'# EOF\n'
+
+    exporter.render()
+    response = await exporter.handle_metrics(None)
+    assert response.headers['Content-Type'] == content_type
+    assert response.body.decode('utf-8').splitlines() == [
+        '# TYPE backendai_node_mem gauge',
+        '# HELP backendai_node_mem in bytes',
+        'backendai_node_mem{agent_id="i-test"} 1024',
+        '# TYPE backendai_node_mem_capacity gauge',
+        '# HELP backendai_node_mem_capacity in bytes',
+        'backendai_node_mem_capacity{agent_id="i-test"} 4096',
+        '# TYPE backendai_device_cpu_util gauge',
+        '# HELP backendai_device_cpu_util in percent',
+        'backendai_device_cpu_util{agent_id="i-test",device="0"} 12.5',
+        'backendai_device_cpu_util{agent_id="i-test",device="1"} 50',
+        '# TYPE backendai_device_cpu_util_capacity gauge',
+        '# HELP backendai_device_cpu_util_capacity in percent',
+        'backendai_device_cpu_util_capacity{agent_id="i-test",device="0"} 100',
+        'backendai_device_cpu_util_capacity{agent_id="i-test",device="1"} 100',
+        '# TYPE backendai_kernel_mem gauge',
+        '# HELP backendai_kernel_mem in bytes',
+        'backendai_kernel_mem{agent_id="i-test",kernel_id="k1",session_id="s1",'
+        'image="index.docker.io/lablup/python:3.8"} 512',
+        'backendai_kernel_mem{agent_id="i-test",kernel_id="k2",session_id="",'
+        'image="index.docker.io/lablup/python:3.9"} 256',
+        '# EOF',
+    ]
+
+
+@pytest.mark.asyncio
+async def test_metric_exporter_render_kernel_creation_stages():
+    agent = SimpleNamespace(
+        local_config={
+            'agent': {'id': 'i-test'},
+            'debug': {'log-stats': False},
+            'stats': stats_defaults,
+        },
+        kernel_registry={},
+        computers={},
+    )
+    stat_ctx = StatContext(agent, mode=StatModes.DOCKER)
+    stat_ctx.kernel_creation_stages['image'] = Histogram([0.5, 1, 2.5])
+    stat_ctx.observe_kernel_creation({'image': 0.5, 'spawn': 0.25})
+    stat_ctx.observe_kernel_creation({'image': 3})
+    assert [*stat_ctx.kernel_creation_stages['spawn'].buckets] == [*kernel_creation_duration_buckets]
+
+    exporter = MetricExporter(stat_ctx, HostPortPair('127.0.0.1', 6011))
+    exporter.render()
+    response = await exporter.handle_metrics(None)
+    name = 'backendai_kernel_creation_stage_duration_seconds'
+    lines = response.body.decode('utf-8').splitlines()
+    assert lines[:9] == [
+        f'# TYPE {name} histogram',
+        f'# HELP {name} in seconds',
+        f'{name}_bucket{{agent_id="i-test",stage="image",le="0.5"}} 1',
+        f'{name}_bucket{{agent_id="i-test",stage="image",le="1.0"}} 1',
+        f'{name}_bucket{{agent_id="i-test",stage="image",le="2.5"}} 1',
+        f'{name}_bucket{{agent_id="i-test",stage="image",le="+Inf"}} 2',
+        f'{name}_sum{{agent_id="i-test",stage="image"}} 3.5',
+        f'{name}_count{{agent_id="i-test",stage="image"}} 2',
+        f'{name}_bucket{{agent_id="i-test",stage="spawn",le="0.05"}} 0',
+    ]
+    assert f'{name}_count{{agent_id="i-test",stage="spawn"}} 1' in lines
+    assert lines[-1] == '# EOF'
+
+
+@pytest.mark.asyncio
+async def test_metric_exporter_render_warm_pool():
+    agent = SimpleNamespace(
+        local_config={
+            'agent': {'id': 'i-test'},
+            'debug': {'log-stats': False},
+            'stats': stats_defaults,
+        },
+        kernel_registry={},
+        computers={},
+    )
+    stat_ctx = StatContext(agent, mode=StatModes.DOCKER)
+    stat_ctx.warm_pool = SimpleNamespace(
+        images=frozenset(['lablup/r:4', 'lablup/python:3.8']),
+        hits={'lablup/python:3.8': 3},
+        misses={'lablup/python:3.8': 1, 'lablup/r:4': 2},
+    )
+    exporter = MetricExporter(stat_ctx, HostPortPair('127.0.0.1', 6011))
+    exporter.render()
+    response = await exporter.handle_metrics(None)
+    assert response.body.decode('utf-8').splitlines() == [
+        '# TYPE backendai_warm_pool_hits counter',
+        'backendai_warm_pool_hits_total{agent_id="i-test",image="lablup/python:3.8"} 3',
+        'backendai_warm_pool_hits_total{agent_id="i-test",image="lablup/r:4"} 0',
+        '# TYPE backendai_warm_pool_misses counter',
+        'backendai_warm_pool_misses_total{agent_id="i-test",image="lablup/python:3.8"} 1',
+        'backendai_warm_pool_misses_total{agent_id="i-test",image="lablup/r:4"} 2',
+        '# EOF',
+    ]
@@ -0,0 +1,86 @@
+import os
+import stat
+
+import pytest
+
+from ai.backend.agent.fs import FileBatch, write_file_atomic
+
+
+def test_write_file_atomic(tmp_path):
+    path = tmp_path / 'resource.txt'
+    path.write_text('old')
+    write_file_atomic(path, b'new')
+    assert path.read_text() == 'new'
+    write_file_atomic(path, b'secret', mode=0o600, owner=(os.getuid(), os.getgid()))
+    assert stat.S_IMODE(path.stat().st_mode) == 0o600
+    # no temporary files are left
+    assert [*tmp_path.iterdir()] == [path]
+
+    with pytest.raises(IsADirectoryError):
+        write_file_atomic(tmp_path, b'data')
+    with pytest.raises(FileNotFoundError):
+        write_file_atomic(tmp_path / 'missing' / 'file', b'data')
+
+
+def test_write_file_atomic_errors(tmp_path, mocker):
+    path = tmp_path / 'resource.txt'
+
+    def replace_after_removal(src, dst):
+        os.unlink(src)
+        raise PermissionError(dst)
+
+    # The original error is not masked by the cleanup of the removed temporary file.
+    mocker.patch('os.replace', side_effect=replace_after_removal)
+    with pytest.raises(PermissionError):
+        write_file_atomic(path, b'data')
+    assert [*tmp_path.iterdir()] == []
+
+    mocker.patch('os.replace', side_effect=PermissionError)
+    with pytest.raises(PermissionError):
+        write_file_atomic(path, b'data')
+    assert [*tmp_path.iterdir()] == []
+
+
+def test_file_batch(tmp_path):
+    config_dir = tmp_path / 'config'
+    work_dir = tmp_path / 'work'
+    config_dir.mkdir()
+    work_dir.mkdir()
+    (config_dir / 'environ.txt').write_text('A=1\n')
+
+    batch = FileBatch()
+    batch.add_copy(config_dir / 'environ.txt', config_dir / 'environ_base.txt')
+    batch.add_file(config_dir / 'environ.txt', b'A=2\n')
+    batch.add_dir(work_dir / '.ssh', mode=0o700)
+    batch.add_file(work_dir / '.ssh' / 'authorized_keys', b'pubkey', mode=0o600)
+    batch.add_file(work_dir / '.config' / 'app' / 'rc', b'first')
+    batch.add_file(work_dir / '.config' / 'app' / 'rc', b'second')
+    # nothing is written until the batch is written
+    assert not (config_dir / 'environ_base.txt').exists()
+    batch.write()
+
+    assert (config_dir / 'environ_base.txt').read_text() == 'A=1\n'
+    assert (config_dir / 'environ.txt').read_text() == 'A=2\n'
+    assert stat.S_IMODE((work_dir / '.ssh').stat().st_mode) == 0o700
+    assert stat.S_IMODE((work_dir / '.ssh' / 'authorized_keys').stat().st_mode) == 0o600
+    assert (work_dir / '.config' / 'app' / 'rc').read_text() == 'second'
+    assert [*(work_dir / '.config' / 'app').iterdir()] == [work_dir / '.config' / 'app' / 'rc']
+
+
+def test_file_batch_errors(tmp_path, mocker):
+    # Only a missing parent directory is created and retried.
+    mocked_open = mocker.patch('os.open', side_effect=PermissionError)
+    batch = FileBatch()
+    batch.add_file(tmp_path / 'missing' / 'file', b'data')
+    with pytest.raises(PermissionError):
+        batch.write()
+    assert mocked_open.call_count == 1
+    assert not (tmp_path / 'missing').exists()
+
+    # A missing file in an existing directory is not retried.
+    mocked_open = mocker.patch('os.open', side_effect=FileNotFoundError)
+    batch = FileBatch()
+    batch.add_file(tmp_path / 'file', b'data')
+    with pytest.raises(FileNotFoundError):
+        batch.write()
+    assert mocked_open.call_count == 1
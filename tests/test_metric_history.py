@@ -0,0 +1,92 @@
+import pytest
+
+from ai.backend.agent.metric_history import (
+    MetricHistory,
+    MetricHistoryStore,
+    MetricHistoryTier,
+)
+
+
+def test_tier_averages_samples_per_bucket():
+    tier = MetricHistoryTier(5.0, 60.0)
+    assert tier.capacity == 12
+    assert tier.query(0) == []
+    tier.add(1000.0, 1.0)
+    tier.add(1002.0, 3.0)
+    tier.add(1005.0, 10.0)
+    tier.add(1017.0, 20.0)
+    assert tier.query(0) == [(1000.0, 2.0), (1005.0, 10.0), (1015.0, 20.0)]
+    assert tier.query(1005.0) == [(1005.0, 10.0), (1015.0, 20.0)]
+
+
+def test_tier_wraps_around():
+    tier = MetricHistoryTier(1.0, 3.0)
+    for t in range(10):
+        tier.add(float(t), float(t))
+    assert tier.query(0) == [(7.0, 7.0), (8.0, 8.0), (9.0, 9.0)]
+    # too old samples are ignored
+    tier.add(2.0, 100.0)
+    assert tier.query(0) == [(7.0, 7.0), (8.0, 8.0), (9.0, 9.0)]
+    # a long gap clears all slots
+    tier.add(100.0, 1.0)
+    assert tier.query(0) == [(100.0, 1.0)]
+
+
+def test_history_chooses_tier():
+    history = MetricHistory([(1.0, 10.0), (10.0, 100.0)])
+    for t in range(1000, 1100):
+        history.add(float(t), float(t % 10))
+    history.add(1100.0, float('nan'))
+    # The fine tier covers the recent range.
+    step, points = history.query(1095.0, 1.0)
+    assert step == 1.0
+    assert points == [(float(t), float(t % 10)) for t in range(1095, 1100)]
+    # The coarse tier is used for the older range.
+    step, points = history.query(1050.0, 1.0)
+    assert step == 10.0
+    assert points == [(float(t), 4.5) for t in range(1050, 1100, 10)]
+    # Re-aggregate the buckets when a coarser step is requested.
+    step, points = history.query(1000.0, 20.0)
+    assert step == 20.0
+    assert points == [(float(t), 4.5) for t in range(1000, 1100, 20)]
+
+
+def test_history_store():
+    store = MetricHistoryStore([(5.0, 60.0)])
+    store.record_kernel('k1', 'mem', 1000.0, 100.0)
+    store.record_node('mem', 1000.0, 1000.0)
+    assert store.query_kernel('k1', 'mem', 0, 5.0) == (5.0, [(1000.0, 100.0)])
+    assert store.query_kernel('k1', 'cpu_util', 0, 5.0) == (5.0, [])
+    assert store.query_node('mem', 0, 5.0) == (5.0, [(1000.0, 1000.0)])
+    store.forget_kernel('k1')
+    assert store.query_kernel('k1', 'mem', 0, 5.0) == (5.0, [])
+
+
+def test_history_store_max_size():
+    history_size = MetricHistory([(5.0, 60.0)]).nbytes
+    assert history_size == 12 * 12
+    store = MetricHistoryStore([(5.0, 60.0)], max_size=history_size * 2)
+    store.record_node('mem', 1000.0, 1000.0)
+    store.record_kernel('k1', 'mem', 1000.0, 100.0)
+    # No more histories are created beyond the maximum size.
+    store.record_kernel('k1', 'cpu_util', 1000.0, 10.0)
+    store.record_kernel('k2', 'mem', 1000.0, 200.0)
+    assert store.size == history_size * 2
+    assert store.query_kernel('k1', 'cpu_util', 0, 5.0) == (5.0, [])
+    assert store.query_kernel('k2', 'mem', 0, 5.0) == (5.0, [])
+    # The existing histories are still updated.
+    store.record_kernel('k1', 'mem', 1005.0, 200.0)
+    assert store.query_kernel('k1', 'mem', 0, 5.0) == (5.0, [(1000.0, 100.0), (1005.0, 200.0)])
+
+    store.forget_kernel('k1')
+    assert store.size == history_size
+    store.record_kernel('k2', 'mem', 1000.0, 200.0)
+    assert store.query_kernel('k2', 'mem', 0, 5.0) == (5.0, [(1000.0, 200.0)])
+
+
+@pytest.mark.parametrize('num_samples', [0, 1, 5000])
+def test_history_memory_is_bounded(num_samples):
+    history = MetricHistory([(5.0, 3600.0), (60.0, 21600.0)])
+    for t in range(num_samples):
+        history.add(t * 5.0, 1.0)
+    assert [len(tier._sums) for tier in history.tiers] == [720, 360]
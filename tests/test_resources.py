@@ -1,15 +1,69 @@
+from decimal import Decimal
 import json
+from pathlib import Path
 from unittest import mock
 
 import pytest
 
 from aioresponses import aioresponses
+from ai.backend.agent.resources import (
+    KernelResourceSpec,
+    Mount,
+    read_resource_spec,
+    resource_spec_binary_filename,
+)
 from ai.backend.agent.vendor import linux
-
-# TODO: write tests for KernelResourceSpec (read/write consistency)
-# from ai.backend.agent.resources import (
-#     KernelResourceSpec,
-# )
+from ai.backend.common import msgpack
+from ai.backend.common.types import (
+    DeviceId,
+    DeviceName,
+    MountPermission,
+    MountTypes,
+    ResourceSlot,
+    SlotName,
+)
+
+
+def create_resource_spec():
+    return KernelResourceSpec(
+        container_id='abcd',
+        slots=ResourceSlot({'cpu': '2', 'mem': '1073741824', 'cuda.shares': '0.5'}),
+        allocations={
+            DeviceName('cpu'): {SlotName('cpu'): {DeviceId('0'): Decimal(1), DeviceId('1'): Decimal(1)}},
+            DeviceName('mem'): {SlotName('mem'): {DeviceId('root'): Decimal(1073741824)}},
+            DeviceName('cuda'): {SlotName('cuda.shares'): {DeviceId('0'): Decimal('0.5')}},
+        },
+        scratch_disk_size=0,
+        mounts=[
+            Mount(MountTypes.BIND, Path('/data/vf1'), Path('/home/work/vf1'),
+                  MountPermission.READ_WRITE),
+            Mount(MountTypes.VOLUME, 'krunner-volume', Path('/opt/backend.ai'),
+                  MountPermission.READ_ONLY),
+        ],
+    )
+
+
+def test_resource_spec_binary_roundtrip():
+    spec = create_resource_spec()
+    restored = KernelResourceSpec.read_from_bytes(spec.write_to_bytes())
+    assert restored == spec
+    # It should be consistent with the text format read by older agents.
+    assert restored == KernelResourceSpec.read_from_string(spec.write_to_string())
+
+    with pytest.raises(ValueError):
+        KernelResourceSpec.read_from_bytes(msgpack.packb((999, 'abcd', 0, {}, {}, [])))
+
+
+def test_read_resource_spec_fallback(tmp_path):
+    spec = create_resource_spec()
+    (tmp_path / 'resource.txt').write_text(spec.write_to_string())
+    assert read_resource_spec(tmp_path) == spec
+    spec.container_id = 'efgh'
+    (tmp_path / resource_spec_binary_filename).write_bytes(spec.write_to_bytes())
+    assert read_resource_spec(tmp_path).container_id == 'efgh'
+    # Unreadable binary specs are ignored.
+    (tmp_path / resource_spec_binary_filename).write_bytes(b'\xc1')
+    assert read_resource_spec(tmp_path).container_id == 'abcd'
 
 # TODO: write tests for DiscretePropertyAllocMap, FractionAllocMap
 
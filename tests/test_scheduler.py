@@ -0,0 +1,103 @@
+import asyncio
+
+import pytest
+
+from ai.backend.agent.scheduler import PeriodicTask
+
+
+@pytest.mark.asyncio
+async def test_periodic_task_runs_periodically():
+    intervals = []
+
+    async def func(interval):
+        intervals.append(interval)
+
+    periodic_task = PeriodicTask(func, 0.02)
+    task = periodic_task.start()
+    await asyncio.sleep(0.09)
+    task.cancel()
+    await task
+    assert 3 <= len(intervals) <= 6
+    assert all(interval == 0.02 for interval in intervals)
+    assert periodic_task.get_stats()['overruns'] == 0
+
+
+@pytest.mark.asyncio
+async def test_periodic_task_skips_overrun_ticks():
+    running = 0
+    max_running = 0
+
+    async def func(interval):
+        nonlocal running, max_running
+        running += 1
+        max_running = max(max_running, running)
+        await asyncio.sleep(0.05)
+        running -= 1
+
+    periodic_task = PeriodicTask(func, 0.02)
+    task = periodic_task.start()
+    await asyncio.sleep(0.17)
+    task.cancel()
+    await task
+    stats = periodic_task.get_stats()
+    assert max_running == 1
+    assert stats['runs'] >= 2
+    assert stats['overruns'] >= stats['runs']
+
+
+@pytest.mark.asyncio
+async def test_periodic_task_adapts_interval():
+    delay = 0.03
+
+    async def func(interval):
+        await asyncio.sleep(delay)
+
+    periodic_task = PeriodicTask(func, 0.02, adaptive_threshold=0.5, max_interval=0.1)
+    task = periodic_task.start()
+    try:
+        await asyncio.sleep(0.25)
+        assert periodic_task.interval == 0.08
+        delay = 0.0
+        await asyncio.sleep(0.3)
+        assert periodic_task.interval == 0.02
+    finally:
+        task.cancel()
+        await task
+
+
+@pytest.mark.asyncio
+async def test_periodic_task_survives_errors():
+    num_calls = 0
+
+    async def func(interval):
+        nonlocal num_calls
+        num_calls += 1
+        raise ZeroDivisionError
+
+    periodic_task = PeriodicTask(func, 0.01)
+    task = periodic_task.start()
+    await asyncio.sleep(0.05)
+    task.cancel()
+    await task
+    assert num_calls >= 2
+
+
+@pytest.mark.asyncio
+async def test_periodic_task_adapts_interval_to_busy_time():
+    async def func(interval):
+        # mostly sleeps deliberately while being busy only shortly
+        await asyncio.sleep(interval * 0.8)
+        return 0.001
+
+    periodic_task = PeriodicTask(func, 0.02, adaptive_threshold=0.5, max_interval=0.1)
+    task = periodic_task.start()
+    try:
+        await asyncio.sleep(0.15)
+        assert periodic_task.interval == 0.02
+        stats = periodic_task.get_stats()
+        assert stats['runs'] >= 2
+        assert stats['last_busy_duration'] == 0.001
+        assert stats['last_duration'] >= 0.016
+    finally:
+        task.cancel()
+        await task
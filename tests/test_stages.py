@@ -0,0 +1,101 @@
+import asyncio
+
+import pytest
+
+from ai.backend.agent.agent import get_kernel_creation_stage_deps
+from ai.backend.agent.stages import StageGraph
+
+
+@pytest.mark.asyncio
+async def test_stage_graph_runs_independent_stages_concurrently():
+    stages = StageGraph()
+    events = []
+
+    def create_stage(name, delay):
+        async def _stage():
+            events.append(f'{name}-begin')
+            await asyncio.sleep(delay)
+            events.append(f'{name}-end')
+            return name
+        return _stage
+
+    a = stages.add('a', create_stage('a', 0.2))
+    b = stages.add('b', create_stage('b', 0.2))
+    c = stages.add('c', create_stage('c', 0.1), after=['a'])
+    d = stages.add('d', create_stage('d', 0.1), after=['b', 'c'])
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    await stages.wait()
+    elapsed = loop.time() - started
+
+    assert (a.result(), b.result(), c.result(), d.result()) == ('a', 'b', 'c', 'd')
+    # a and b overlap, c waits for a, and d waits for both b and c.
+    assert events[:2] == ['a-begin', 'b-begin']
+    assert events.index('c-begin') > events.index('a-end')
+    assert events.index('d-begin') > events.index('c-end')
+    assert events.index('d-begin') > events.index('b-end')
+    assert elapsed < 0.55
+    # the time waiting for the dependencies is excluded
+    assert set(stages.durations) == {'a', 'b', 'c', 'd'}
+    assert 0.09 <= stages.durations['c'] < 0.2
+    assert 0.09 <= stages.durations['d'] < 0.2
+
+
+@pytest.mark.asyncio
+async def test_stage_graph_measure():
+    stages = StageGraph()
+    with stages.measure('inline'):
+        await asyncio.sleep(0.05)
+    assert stages.durations['inline'] >= 0.04
+
+
+@pytest.mark.asyncio
+async def test_stage_graph_failure_cancels_other_stages():
+    stages = StageGraph()
+    finished = []
+
+    async def _fail():
+        await asyncio.sleep(0.05)
+        raise ZeroDivisionError
+
+    async def _slow():
+        await asyncio.sleep(10)
+        finished.append('slow')
+
+    async def _dependent():
+        finished.append('dependent')
+
+    slow = stages.add('slow', _slow)
+    stages.add('fail', _fail)
+    dependent = stages.add('dependent', _dependent, after=['fail'])
+    with pytest.raises(ZeroDivisionError):
+        await stages.wait()
+    assert slow.cancelled()
+    assert dependent.done()
+    assert finished == []
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('restarting', [False, True])
+async def test_kernel_creation_stage_order(restarting):
+    stages = StageGraph()
+    events = []
+
+    def create_stage(name):
+        async def _stage():
+            events.append(f'{name}-begin')
+            # the resource spec and the allocation take longer than the other stages
+            await asyncio.sleep(0.05 if name in ('resource_spec', 'allocation') else 0)
+            events.append(f'{name}-end')
+        return _stage
+
+    # The stages are added in the order of the dependencies as in create_kernel().
+    for name, after in get_kernel_creation_stage_deps(restarting).items():
+        stages.add(name, create_stage(name), after=after)
+    await stages.wait()
+
+    # The krunner mounts need the device allocations.
+    assert events.index('mounts-begin') > events.index('allocation-end')
+    assert events.index('process_mounts-begin') > events.index('mounts-end')
+    assert events.index('attached_devices-begin') > events.index('allocation-end')
+    assert events.index('ssh_keypair-begin') > events.index('scratch-end')
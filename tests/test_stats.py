@@ -1 +1,380 @@
-# currently empty
+import asyncio
+from decimal import Decimal
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from ai.backend.common import msgpack
+from ai.backend.common.types import MetricKey
+from ai.backend.agent.config import stats_defaults
+from ai.backend.agent.scheduler import PeriodicTask
+from ai.backend.agent.stats import (
+    ContainerMeasurement,
+    format_number,
+    Measurement,
+    Metric,
+    MetricTypes,
+    MovingStatistics,
+    StatContext,
+    StatModes,
+    StatPublisher,
+    to_number,
+)
+
+
+def test_to_number():
+    assert to_number(Decimal(10)) == 10
+    assert isinstance(to_number(Decimal(10)), int)
+    assert isinstance(to_number(Decimal('10.0')), int)
+    assert to_number(Decimal('0.25')) == 0.25
+    assert isinstance(to_number(Decimal('0.25')), float)
+    assert to_number(Decimal('inf')) == float('inf')
+    assert to_number(7) == 7
+    assert to_number(0.5) == 0.5
+
+
+def test_format_number():
+    assert format_number(0) == '0'
+    assert format_number(2 ** 70) == str(2 ** 70)
+    assert format_number(1.5) == '1.5'
+    assert format_number(2.0) == '2'
+    assert format_number(0.0004) == '0'
+    assert format_number(0.12345) == '0.123'
+    assert format_number(1e-7) == '0'
+    assert format_number(1e20) == '100000000000000000000'
+    assert format_number(467175449221885.8) == '467175449221885.8'
+    assert format_number(12.345678, 2) == '12.35'
+    assert format_number(float('inf')) == 'Infinity'
+    assert format_number(float('nan')) == 'NaN'
+
+
+def test_moving_statistics():
+    stats = MovingStatistics()
+    assert stats.diff == 0
+    assert stats.rate == 0
+    stats.update(Decimal(10))
+    assert stats.diff == 0
+    stats.update(Decimal(15))
+    stats.update(Decimal(12))
+    assert stats.min == 10
+    assert stats.max == 15
+    assert stats.sum == 37
+    assert stats.diff == -3
+    assert stats.rate != 0
+    serialized = stats.to_serializable_dict()
+    assert serialized['min'] == '10'
+    assert serialized['max'] == '15'
+    assert serialized['sum'] == '37'
+    assert serialized['avg'] == '12.333'
+    assert serialized['diff'] == '-3'
+    assert serialized['version'] == 2
+
+
+def test_moving_statistics_window():
+    stats = MovingStatistics(Decimal(1), window=4)
+    for value in range(2, 10):
+        stats.update(value)
+        assert stats.diff == 1
+    assert stats.min == 1
+    assert stats.max == 9
+    assert stats.sum == 45
+
+
+def test_metric_serialization():
+    metric = Metric(
+        'mem', MetricTypes.USAGE,
+        current=Decimal(512),
+        capacity=Decimal(2048),
+        stats=MovingStatistics(Decimal(512)),
+        stats_filter=frozenset({'max'}),
+        unit_hint='bytes',
+    )
+    metric.update(Measurement(Decimal(1024), Decimal(4096)))
+    assert metric.to_serializable_dict() == {
+        'current': '1024',
+        'capacity': '4096',
+        'pct': '25',
+        'unit_hint': 'bytes',
+        'stats.max': '1024',
+    }
+
+
+def test_metric_current_hook():
+    metric = Metric(
+        'cpu_used', MetricTypes.USAGE,
+        current=Decimal('1000.5'),
+        stats=MovingStatistics(Decimal('1000.5')),
+        stats_filter=frozenset(),
+        current_hook=lambda metric: metric.stats.diff,
+    )
+    metric.update(Measurement(Decimal('1250.75')))
+    assert metric.current == 250.25
+    serialized = metric.to_serializable_dict()
+    assert serialized['current'] == '250.25'
+    assert serialized['capacity'] is None
+    assert serialized['pct'] is None
+
+
+class DummyPipeline:
+
+    def __init__(self, redis):
+        self.redis = redis
+        self.commands = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        pass
+
+    def __len__(self):
+        return len(self.commands)
+
+    def set(self, key, value, ex=None):
+        self.commands.append(('set', key, value, ex))
+
+    def hset(self, key, field, value):
+        self.commands.append(('hset', key, field, value))
+
+    def hdel(self, key, *fields):
+        self.commands.append(('hdel', key, *fields))
+
+    def expire(self, key, seconds):
+        self.commands.append(('expire', key, seconds))
+
+    async def execute(self):
+        self.redis.batches.append(self.commands)
+        self.commands = []
+
+
+class DummyRedis:
+
+    def __init__(self):
+        self.batches = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        pass
+
+    def pipeline(self, transaction=True):
+        return DummyPipeline(self)
+
+
+@pytest.mark.asyncio
+async def test_stat_publisher_skips_unchanged():
+    r = DummyRedis()
+    publisher = StatPublisher('i-test', cache_lifespan=120)
+    kernel_stats = {
+        'k1': {'cpu_used': {'current': '10'}},
+        'k2': {'cpu_used': {'current': '20'}},
+    }
+    node_stat = {'node': {}, 'devices': {}}
+    assert await publisher.publish(r, node_stat=node_stat, kernel_stats=kernel_stats) == 3
+    assert len(r.batches) == 1
+    assert [cmd[:2] for cmd in r.batches[0]] == [('set', 'i-test'), ('set', 'k1'), ('set', 'k2')]
+    assert all(cmd[3] == 120 for cmd in r.batches[0])
+    assert msgpack.unpackb(r.batches[0][1][2]) == kernel_stats['k1']
+
+    assert await publisher.publish(r, node_stat=node_stat, kernel_stats=kernel_stats) == 0
+    assert len(r.batches) == 1
+
+    kernel_stats['k2'] = {'cpu_used': {'current': '25'}}
+    assert await publisher.publish(r, node_stat=node_stat, kernel_stats=kernel_stats) == 1
+    assert [cmd[:2] for cmd in r.batches[1]] == [('set', 'k2')]
+
+
+@pytest.mark.asyncio
+async def test_stat_publisher_refreshes_before_expiration():
+    r = DummyRedis()
+    publisher = StatPublisher('i-test', cache_lifespan=120)
+    assert await publisher.publish(r, kernel_stats={'k1': {'mem': 1}}) == 1
+    assert await publisher.publish(r, kernel_stats={'k1': {'mem': 1}}) == 0
+    # Pretend that a half of the lifespan has passed.
+    payload, timestamp = publisher._published['k1']
+    publisher._published['k1'] = (payload, timestamp - 60)
+    assert await publisher.publish(r, kernel_stats={'k1': {'mem': 1}}) == 1
+
+
+@pytest.mark.asyncio
+async def test_stat_publisher_batches_and_agent_hash():
+    r = DummyRedis()
+    publisher = StatPublisher('i-test', max_batch_size=4, agent_hash=True)
+    kernel_stats = {f'k{idx}': {'mem': idx} for idx in range(3)}
+    assert await publisher.publish(r, kernel_stats=kernel_stats) == 3
+    assert [len(batch) for batch in r.batches] == [4, 3]
+    commands = [cmd for batch in r.batches for cmd in batch]
+    assert [cmd[:3] for cmd in commands if cmd[0] == 'hset'] == [
+        ('hset', 'agent:i-test', f'k{idx}') for idx in range(3)
+    ]
+    assert commands[-1] == ('expire', 'agent:i-test', 120)
+
+    r.batches.clear()
+    publisher.forget_kernel('k1')
+    del kernel_stats['k1']
+    assert await publisher.publish(r, kernel_stats=kernel_stats) == 0
+    assert r.batches == [[
+        ('hdel', 'agent:i-test', 'k1'),
+        ('expire', 'agent:i-test', 120),
+    ]]
+
+
+class DummyComputePlugin:
+
+    def __init__(self, metric_keys=('mem', 'io_scratch_size')):
+        self.metric_keys = metric_keys
+        self.sampled_container_ids = []
+        self.value = 0
+
+    async def gather_node_measures(self, ctx):
+        return []
+
+    async def gather_container_measures(self, ctx, container_ids):
+        self.sampled_container_ids.append([*container_ids])
+        self.value += 1
+        return [
+            ContainerMeasurement(
+                MetricKey(key),
+                MetricTypes.USAGE,
+                per_container={
+                    cid: Measurement(Decimal(self.value))
+                    for cid in container_ids
+                },
+            )
+            for key in self.metric_keys
+        ]
+
+
+def create_dummy_agent(stats_config):
+    plugin = DummyComputePlugin()
+    return SimpleNamespace(
+        local_config={
+            'agent': {'id': 'i-test'},
+            'debug': {'log-stats': False},
+            'stats': stats_config,
+        },
+        kernel_registry={
+            'k1': {'container_id': 'c1'},
+            'k2': {'container_id': 'c2'},
+        },
+        computers={'dummy': SimpleNamespace(instance=plugin)},
+        redis_stat_pool=DummyRedis(),
+    ), plugin
+
+
+@pytest.mark.asyncio
+async def test_collect_container_stat_publishes_all_kernels():
+    agent, plugin = create_dummy_agent(stats_defaults)
+    # The history is disabled by default.
+    assert StatContext(agent, mode=StatModes.DOCKER).history is None
+    agent, plugin = create_dummy_agent({
+        **stats_defaults,
+        'history': {**stats_defaults['history'], 'enabled': True},
+    })
+    stat_ctx = StatContext(agent, mode=StatModes.DOCKER)
+    updated_metrics = await stat_ctx.collect_container_stat(['c1', 'c2'])
+    assert set(updated_metrics.keys()) == {'k1', 'k2'}
+    assert plugin.sampled_container_ids == [['c1', 'c2']]
+    published_keys = [cmd[1] for batch in agent.redis_stat_pool.batches for cmd in batch]
+    assert published_keys == ['k1', 'k2']
+    step, points = stat_ctx.history.query_kernel('k1', 'mem', time.time() - 60, 5.0)
+    assert step == 5.0
+    assert [value for _, value in points] == [1.0]
+
+
+@pytest.mark.asyncio
+async def test_collect_container_stat_per_metric_intervals():
+    agent, plugin = create_dummy_agent({
+        **stats_defaults,
+        'interval': 2.0,
+        'metric-intervals': {'io_scratch_size': 60.0},
+    })
+    stat_ctx = StatContext(agent, mode=StatModes.DOCKER)
+    await stat_ctx.collect_container_stat(['c1', 'c2'])
+    await stat_ctx.collect_container_stat(['c1', 'c2'])
+    metrics = stat_ctx.kernel_metrics['k1']
+    assert metrics['mem'].current == 2
+    assert metrics['io_scratch_size'].current == 1
+    assert stat_ctx.is_metric_due('mem', 'c1')
+    assert not stat_ctx.is_metric_due('io_scratch_size', 'c1')
+    # Pretend that the scratch size interval has passed.
+    for key, timestamp in [*stat_ctx._metric_timestamps.items()]:
+        stat_ctx._metric_timestamps[key] = timestamp - 59.0
+    await stat_ctx.collect_container_stat(['c1', 'c2'])
+    assert metrics['mem'].current == 3
+    assert metrics['io_scratch_size'].current == 3
+
+
+@pytest.mark.asyncio
+async def test_collect_container_stat_skips_plugins_not_due():
+    agent, plugin = create_dummy_agent({
+        **stats_defaults,
+        'interval': 2.0,
+        'metric-intervals': {'gpu_util': 60.0},
+    })
+    slow_plugin = DummyComputePlugin(metric_keys=('gpu_util',))
+    agent.computers['slow'] = SimpleNamespace(instance=slow_plugin)
+    stat_ctx = StatContext(agent, mode=StatModes.DOCKER)
+    await stat_ctx.collect_container_stat(['c1'])
+    await stat_ctx.collect_container_stat(['c1'])
+    assert plugin.sampled_container_ids == [['c1'], ['c1']]
+    # The plugin whose metrics are all not due is not sampled at all.
+    assert slow_plugin.sampled_container_ids == [['c1']]
+    # The due-state is kept per kernel, so a new kernel is sampled right away.
+    await stat_ctx.collect_container_stat(['c1', 'c2'])
+    assert plugin.sampled_container_ids[-1] == ['c1', 'c2']
+    assert slow_plugin.sampled_container_ids == [['c1'], ['c2']]
+    assert stat_ctx.kernel_metrics['k1']['gpu_util'].current == 1
+    assert stat_ctx.kernel_metrics['k2']['gpu_util'].current == 2
+
+
+@pytest.mark.asyncio
+async def test_collect_container_stat_spreads_batches():
+    agent, plugin = create_dummy_agent({
+        **stats_defaults,
+        'sample-batch-size': 1,
+    })
+    stat_ctx = StatContext(agent, mode=StatModes.DOCKER)
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    updated_metrics = await stat_ctx.collect_container_stat(['c1', 'c2'], spread=0.2)
+    assert loop.time() - started >= 0.1
+    assert set(updated_metrics.keys()) == {'k1', 'k2'}
+    assert plugin.sampled_container_ids == [['c1'], ['c2']]
+    # All kernels are published at once after sampling.
+    assert len(agent.redis_stat_pool.batches) == 1
+
+
+@pytest.mark.asyncio
+async def test_spread_delay_does_not_grow_adaptive_interval():
+    agent, plugin = create_dummy_agent({
+        **stats_defaults,
+        'sample-batch-size': 1,
+    })
+    stat_ctx = StatContext(agent, mode=StatModes.DOCKER)
+    loop = asyncio.get_running_loop()
+    spread_delays = []
+
+    async def collect_stat(interval):
+        # the same busy time reporting as AbstractAgent.collect_stat()
+        started = loop.time()
+        await stat_ctx.collect_container_stat(['c1', 'c2'], spread=interval)
+        spread_delays.append(stat_ctx.last_spread_delay)
+        return loop.time() - started - stat_ctx.last_spread_delay
+
+    periodic_task = PeriodicTask(collect_stat, 0.1, adaptive_threshold=0.5, max_interval=0.4)
+    task = periodic_task.start()
+    try:
+        await asyncio.sleep(0.35)
+    finally:
+        task.cancel()
+        await task
+    stats = periodic_task.get_stats()
+    assert stats['runs'] >= 2
+    # the whole duration including the spread sleeps exceeds the threshold (0.05s)
+    assert all(delay > 0 for delay in spread_delays)
+    assert stats['last_duration'] > 0.05
+    assert stats['last_busy_duration'] < 0.05
+    assert periodic_task.interval == 0.1